@@ -162,6 +162,63 @@ class AccountingCLI(CLI):
     except BaseException:
       self.showTraceback()
 
+  def do_createRollup(self, args):
+    """
+    Create an empty rollup of a type, summed over the keys not given
+      Usage : createRollup <typeName> <rollupName> [<keyName> ...]
+    """
+    try:
+      argList = args.split()
+      if len(argList) < 2:
+        gLogger.error("No type name or rollup name specified")
+        return
+      acClient = DataStoreClient()
+      retVal = acClient.createRollup(argList[0], argList[1], argList[2:])
+      if retVal['OK']:
+        gLogger.info("Rollup created, fill it once all the services have loaded it")
+      else:
+        gLogger.error("Error: %s" % retVal['Message'])
+    except BaseException:
+      self.showTraceback()
+
+  def do_fillRollup(self, args):
+    """
+    Fill a rollup with the buckets of its type, so that it is queried. Can take a while.
+      Usage : fillRollup <typeName> <rollupName>
+    """
+    try:
+      argList = args.split()
+      if len(argList) < 2:
+        gLogger.error("No type name or rollup name specified")
+        return
+      acClient = DataStoreClient()
+      retVal = acClient.fillRollup(argList[0], argList[1])
+      if retVal['OK']:
+        gLogger.info("Rollup filled!")
+      else:
+        gLogger.error("Error: %s" % retVal['Message'])
+    except BaseException:
+      self.showTraceback()
+
+  def do_deleteRollup(self, args):
+    """
+    Remove a rollup of a type. Its table has to be dropped once all the services have stopped writing it
+      Usage : deleteRollup <typeName> <rollupName>
+    """
+    try:
+      argList = args.split()
+      if len(argList) < 2:
+        gLogger.error("No type name or rollup name specified")
+        return
+      acClient = DataStoreClient()
+      retVal = acClient.deleteRollup(argList[0], argList[1])
+      if retVal['OK']:
+        gLogger.info("Rollup deleted")
+      else:
+        gLogger.error("Error: %s" % retVal['Message'])
+    except BaseException:
+      self.showTraceback()
+
   def do_showRegisteredTypes(self, args):
     """
     Get a list of registered types
@@ -3,6 +3,7 @@
 
 __RCSID__ = "$Id$"
 
+import re
 import six
 import datetime
 import time
@@ -18,6 +19,10 @@ from DIRAC.Core.Utilities.ThreadPool import ThreadPool
 
 gSynchro = ThreadSafe.Synchronizer()
 
+# Placeholder of the value fields when checking that a query only sums them
+_VALUE_FIELD_MARK = "__VALUE__"
+_SUMMED_VALUE_FIELD_RE = re.compile(r"SUM\(\s*%s\s*\)" % _VALUE_FIELD_MARK, re.IGNORECASE)
+
 
 class AccountingDB(DB):
 
@@ -35,10 +40,13 @@ class AccountingDB(DB):
     self.dbCatalog = {}
     self.dbBucketsLength = {}
     self.__keysCache = {}
+    self.__rollupsRefreshTime = int(self.getCSOption("RollupsRefreshTime", 300))
+    self.__rollupsLoadTime = 0
     maxParallelInsertions = self.getCSOption("ParallelRecordInsertions", 10)
     self.__threadPool = ThreadPool(1, maxParallelInsertions)
     self.__threadPool.daemonize()
     self.catalogTableName = _getTableName("catalog", "Types")
+    self.rollupsCatalogTableName = _getTableName("catalog", "Rollups")
     self._createTables({
         self.catalogTableName: {
             'Fields': {
@@ -48,6 +56,16 @@ class AccountingDB(DB):
                 'bucketsLength': "VARCHAR(255) NOT NULL",
             },
             'PrimaryKey': 'name'
+        },
+        self.rollupsCatalogTableName: {
+            'Fields': {
+                'typeName': "VARCHAR(64) NOT NULL",
+                'name': "VARCHAR(64) NOT NULL",
+                'keyFields': "VARCHAR(255) NOT NULL",
+                'ready': "TINYINT(1) DEFAULT 0 NOT NULL",
+                'creationTime': "DATETIME NOT NULL",
+            },
+            'PrimaryKey': ['typeName', 'name']
         }
     })
     self.__loadCatalogFromDB()
@@ -66,6 +84,21 @@ class AccountingDB(DB):
                               "Accounting",
                               "seconds",
                               gMonitor.OP_MEAN)
+    gMonitor.registerActivity("bulkrecords",
+                              "Records inserted in bulk",
+                              "Accounting",
+                              "records",
+                              gMonitor.OP_RATE)
+    gMonitor.registerActivity("bulkbuckets",
+                              "Buckets written in bulk",
+                              "Accounting",
+                              "buckets",
+                              gMonitor.OP_RATE)
+    gMonitor.registerActivity("bulkinsertiontime",
+                              "Bulk insertion time",
+                              "Accounting",
+                              "seconds",
+                              gMonitor.OP_MEAN)
 
     self.__compactTime = datetime.time(hour=2,
                                        minute=random.randint(0, 59),
@@ -160,6 +193,34 @@ class AccountingDB(DB):
       valueFields = List.fromChar(typesEntry[2], ",")
       bucketsLength = DEncode.decode(typesEntry[3])[0]
       self.__addToCatalog(typeName, keyFields, valueFields, bucketsLength)
+    retVal = self.__loadRollupsFromDB()
+    if not retVal['OK']:
+      raise Exception(retVal['Message'])
+
+  def __loadRollupsFromDB(self):
+    """
+    Load the rollups of the types from the catalog in the DB, which all the instances share
+    """
+    retVal = self._query("SELECT `typeName`, `name`, `keyFields`, `ready` FROM `%s`" % self.rollupsCatalogTableName)
+    if not retVal['OK']:
+      self.log.error("Can't load the rollups", retVal['Message'])
+      return retVal
+    rollupsByType = {}
+    for typeName, rollupName, keyFields, ready in retVal['Value']:
+      rollupsByType.setdefault(typeName, {})[rollupName] = {'keys': List.fromChar(keyFields, ","),
+                                                            'ready': bool(ready)}
+    for typeName in self.dbCatalog:
+      self.dbCatalog[typeName]['rollups'] = rollupsByType.get(typeName, {})
+    self.__rollupsLoadTime = time.time()
+    return S_OK()
+
+  def __refreshRollups(self):
+    """
+    Load the rollups again if they have not been loaded for RollupsRefreshTime, so that the rollups
+    created or filled by another instance are written and queried
+    """
+    if time.time() - self.__rollupsLoadTime > self.__rollupsRefreshTime:
+      self.__loadRollupsFromDB()
 
   def getWaitingRecordsLifeTime(self):
     """
@@ -255,7 +316,7 @@ class AccountingDB(DB):
     """
     self.log.verbose("Adding to catalog type %s" % typeName, "with length %s" % str(bucketsLength))
     self.dbCatalog[typeName] = {'keys': keyFields, 'values': valueFields,
-                                'typeFields': [], 'bucketFields': [], 'dataTimespan': 0}
+                                'typeFields': [], 'bucketFields': [], 'dataTimespan': 0, 'rollups': {}}
     self.dbCatalog[typeName]['typeFields'].extend(keyFields)
     self.dbCatalog[typeName]['typeFields'].extend(valueFields)
     self.dbCatalog[typeName]['bucketFields'] = list(self.dbCatalog[typeName]['typeFields'])
@@ -476,13 +537,150 @@ class AccountingDB(DB):
     tablesToDelete.insert(0, "`%s`" % _getTableName("type", typeName))
     tablesToDelete.insert(0, "`%s`" % _getTableName("bucket", typeName))
     tablesToDelete.insert(0, "`%s`" % _getTableName("in", typeName))
+    self.__loadRollupsFromDB()
+    for rollupName in self.dbCatalog[typeName]['rollups']:
+      tablesToDelete.append("`%s`" % _getTableName("rollup", typeName, rollupName))
     retVal = self._query("DROP TABLE %s" % ", ".join(tablesToDelete))
     if not retVal['OK']:
       return retVal
     retVal = self._update("DELETE FROM `%s` WHERE name='%s'" % (_getTableName("catalog", "Types"), typeName))
+    retVal = self._update("DELETE FROM `%s` WHERE typeName='%s'" % (self.rollupsCatalogTableName, typeName))
     del self.dbCatalog[typeName]
     return S_OK()
 
+  @gSynchro
+  def createRollup(self, typeName, rollupName, rollupKeys):
+    """
+    Create an empty rollup of a type. All the instances write it once they have loaded the rollups
+    again, and it is only queried after fillRollup
+
+    :param str typeName: type of the rollup
+    :param str rollupName: name of the rollup
+    :param list rollupKeys: keys of the type kept in the rollup, possibly none
+    """
+    if self.__readOnly:
+      return S_ERROR("ReadOnly mode enabled. No modification allowed")
+    if typeName not in self.dbCatalog:
+      return S_ERROR("Type %s does not exist" % typeName)
+    if not re.match(r"^\w+$", rollupName):
+      return S_ERROR("Invalid rollup name %s" % rollupName)
+    typeKeys = self.dbCatalog[typeName]['keys']
+    missing = [keyField for keyField in rollupKeys if keyField not in typeKeys]
+    if missing:
+      return S_ERROR("Keys %s are not defined for type %s" % (", ".join(missing), typeName))
+    # The key fields are kept in the order of the type
+    rollupKeys = [keyField for keyField in typeKeys if keyField in rollupKeys]
+    retVal = self.__loadTablesCreated()
+    if not retVal['OK']:
+      return retVal
+    tableName = _getTableName("rollup", typeName, rollupName)
+    if tableName in retVal['Value']:
+      return S_ERROR("Table %s already exists" % tableName)
+    self.log.info("Creating rollup %s of %s" % (rollupName, typeName), "by %s" % ", ".join(rollupKeys))
+    fieldsDict = {'startTime': "INT UNSIGNED NOT NULL",
+                  'bucketLength': "MEDIUMINT UNSIGNED NOT NULL",
+                  'entriesInBucket': "DECIMAL(30,10) NOT NULL"}
+    for keyField in rollupKeys:
+      fieldsDict[keyField] = "INTEGER NOT NULL"
+    for valueField in self.dbCatalog[typeName]['values']:
+      fieldsDict[valueField] = "DECIMAL(30,10) NOT NULL"
+    retVal = self._createTables({tableName: {'Fields': fieldsDict,
+                                             'UniqueIndexes': {'UniqueConstraint': ['startTime'] + rollupKeys +
+                                                               ['bucketLength']}
+                                             }
+                                 })
+    if not retVal['OK']:
+      return retVal
+    retVal = self._update("INSERT INTO `%s` ( `typeName`, `name`, `keyFields`, `ready`, `creationTime` ) \
+VALUES ( '%s', '%s', '%s', 0, UTC_TIMESTAMP() )" % (self.rollupsCatalogTableName, typeName, rollupName,
+                                                    ",".join(rollupKeys)))
+    if not retVal['OK']:
+      return retVal
+    return self.__loadRollupsFromDB()
+
+  def fillRollup(self, typeName, rollupName):
+    """
+    Fill a rollup again with the buckets of its type, and let it be queried. A new rollup can only be
+    filled once all the instances have had the time to load it, so that none of them writes the buckets
+    without it afterwards. The rollup is emptied and filled in one transaction, like the buckets and the
+    rollups are written together, so that the records inserted meanwhile are neither lost nor counted twice
+
+    :param str typeName: type of the rollup
+    :param str rollupName: name of the rollup
+    """
+    if self.__readOnly:
+      return S_ERROR("ReadOnly mode enabled. No modification allowed")
+    if typeName not in self.dbCatalog:
+      return S_ERROR("Type %s does not exist" % typeName)
+    retVal = self._query("SELECT `keyFields`, TIMESTAMPDIFF( SECOND, `creationTime`, UTC_TIMESTAMP() ) \
+FROM `%s` WHERE typeName='%s' AND name='%s'" % (self.rollupsCatalogTableName, typeName, rollupName))
+    if not retVal['OK']:
+      return retVal
+    if not retVal['Value']:
+      return S_ERROR("Rollup %s of %s does not exist" % (rollupName, typeName))
+    keyFields, rollupAge = retVal['Value'][0]
+    loadDelay = 2 * self.__rollupsRefreshTime
+    if rollupAge <= loadDelay:
+      return S_ERROR("Rollup %s of %s can only be filled %s seconds after its creation, once all the instances \
+write it" % (rollupName, typeName, loadDelay))
+    tableName = _getTableName("rollup", typeName, rollupName)
+    groupFields = ["`%s`" % field for field in ['startTime', 'bucketLength'] + List.fromChar(keyFields, ",")]
+    sumFields = ["`%s`" % field for field in self.dbCatalog[typeName]['values'] + ['entriesInBucket']]
+    retVal = self._getConnection()
+    if not retVal['OK']:
+      return retVal
+    connObj = retVal['Value']
+    try:
+      retVal = self.__startTransaction(connObj)
+      if not retVal['OK']:
+        return retVal
+      retVal = self._update("DELETE FROM `%s`" % tableName, conn=connObj)
+      if not retVal['OK']:
+        self.__rollbackTransaction(connObj)
+        return retVal
+      retVal = self._update("INSERT INTO `%s` ( %s ) SELECT %s FROM `%s` GROUP BY %s" % (
+          tableName,
+          ", ".join(groupFields + sumFields),
+          ", ".join(groupFields + ["SUM( %s )" % field for field in sumFields]),
+          _getTableName("bucket", typeName),
+          ", ".join(groupFields)), conn=connObj)
+      if not retVal['OK']:
+        self.__rollbackTransaction(connObj)
+        return retVal
+      self.log.info("Filled rollup %s of %s" % (rollupName, typeName), "with %s buckets" % retVal['Value'])
+      retVal = self._update("UPDATE `%s` SET ready=1 WHERE typeName='%s' AND name='%s'" % (
+          self.rollupsCatalogTableName, typeName, rollupName), conn=connObj)
+      if not retVal['OK']:
+        self.__rollbackTransaction(connObj)
+        return retVal
+      retVal = self.__commitTransaction(connObj)
+      if not retVal['OK']:
+        return retVal
+    finally:
+      connObj.close()
+    return self.__loadRollupsFromDB()
+
+  @gSynchro
+  def deleteRollup(self, typeName, rollupName):
+    """
+    Remove a rollup from the catalog. Its table is kept, as the instances write it until they load the
+    rollups again: it has to be dropped afterwards
+
+    :param str typeName: type of the rollup
+    :param str rollupName: name of the rollup
+    """
+    if self.__readOnly:
+      return S_ERROR("ReadOnly mode enabled. No modification allowed")
+    retVal = self._update("DELETE FROM `%s` WHERE typeName='%s' AND name='%s'" % (
+        self.rollupsCatalogTableName, typeName, rollupName))
+    if not retVal['OK']:
+      return retVal
+    if not retVal['Value']:
+      return S_ERROR("Rollup %s of %s does not exist" % (rollupName, typeName))
+    self.log.info("Deleted rollup %s of %s" % (rollupName, typeName),
+                  "its table can be dropped in %s seconds" % (2 * self.__rollupsRefreshTime))
+    return self.__loadRollupsFromDB()
+
   def __getIdForKeyValue(self, typeName, keyName, keyValue, conn=False):
     """
       Finds id number for value in a key table
@@ -503,12 +701,7 @@ class AccountingDB(DB):
     """
       Adds a key value to a key table if not existant
     """
-    # Cast to string just in case
-    if not isinstance(keyValue, six.string_types):
-      keyValue = str(keyValue)
-    # No more than 64 chars for keys
-    if len(keyValue) > 64:
-      keyValue = keyValue[:64]
+    keyValue = _normalizeKeyValue(keyValue)
 
     # Look into the cache
     if typeName not in self.__keysCache:
@@ -540,6 +733,36 @@ class AccountingDB(DB):
     keyCache[keyValue] = result['Value']
     return result
 
+  def __addKeyValues(self, typeName, keyName, keyValues):
+    """
+      Get the ids of several values of a key, looking up in one query the ones not in the cache
+      and adding the values not in the key table
+
+      :return: S_OK( { key value : id } )
+    """
+    typeCache = self.__keysCache.setdefault(typeName, {})
+    keyCache = typeCache.setdefault(keyName, {})
+    missing = set(keyValue for keyValue in keyValues if keyValue not in keyCache)
+    if missing:
+      retVal = self._escapeValues(sorted(missing))
+      if not retVal['OK']:
+        return retVal
+      retVal = self._query("SELECT `id`, `value` FROM `%s` WHERE `value` IN ( %s )" % (
+          _getTableName("key", typeName, keyName),
+          ", ".join(retVal['Value'])))
+      if not retVal['OK']:
+        return retVal
+      for keyId, keyValue in retVal['Value']:
+        # The DB may match values differing in case or trailing spaces
+        if keyValue in missing:
+          keyCache[keyValue] = keyId
+      for keyValue in sorted(missing):
+        if keyValue not in keyCache:
+          retVal = self.__addKeyValue(typeName, keyName, keyValue)
+          if not retVal['OK']:
+            return retVal
+    return S_OK(dict((keyValue, keyCache[keyValue]) for keyValue in keyValues))
+
   def calculateBucketLengthForTime(self, typeName, now, when):
     """
     Get the expected bucket time for a moment in time
@@ -632,10 +855,32 @@ class AccountingDB(DB):
 
   def __insertFromINTable(self, recordTuples):
     """
-    Do the real insert and delete from the in buffer table
+    Do the real insert and delete from the in buffer table. The records of each type are inserted
+    in bulk, and one by one if that fails
     """
     self.log.verbose("Received bundle to process", "of %s elements" % len(recordTuples))
+    recordsByType = {}
     for record in recordTuples:
+      recordsByType.setdefault(record[1], []).append(record)
+    failedRecords = []
+    for typeName in sorted(recordsByType):
+      typeRecords = recordsByType[typeName]
+      result = self.insertRecordsDirectly(typeName, [(startTime, endTime, valuesList)
+                                                     for _iD, _typeName, startTime, endTime, valuesList, _epoch
+                                                     in typeRecords])
+      if not result['OK']:
+        self.log.warn("Can't insert records in bulk, inserting them one by one",
+                      "for %s: %s" % (typeName, result['Message']))
+        failedRecords.extend(typeRecords)
+        continue
+      result = self._update("DELETE FROM `%s` WHERE id in (%s)" % (_getTableName("in", typeName),
+                                                                   ", ".join(str(record[0])
+                                                                             for record in typeRecords)))
+      if not result['OK']:
+        self.log.error("Can't delete rows from the IN table", result['Message'])
+      for record in typeRecords:
+        gMonitor.addMark("insertiontime", Time.toEpoch() - record[-1])
+    for record in failedRecords:
       iD, typeName, startTime, endTime, valuesList, insertionEpoch = record
       result = self.insertRecordDirectly(typeName, startTime, endTime, valuesList)
       if not result['OK']:
@@ -676,6 +921,10 @@ class AccountingDB(DB):
       return retVal
     connObj = retVal['Value']
     try:
+      # The record is inserted with its buckets, so that it can be inserted again if they fail
+      retVal = self.__startTransaction(connObj)
+      if not retVal['OK']:
+        return retVal
       retVal = self.insertFields(
           _getTableName("type", typeName),
           self.dbCatalog[typeName]['typeFields'],
@@ -683,20 +932,107 @@ class AccountingDB(DB):
           conn=connObj
       )
       if not retVal['OK']:
+        self.__rollbackTransaction(connObj)
         return retVal
       # HACK: One more record to split in the buckets to be able to count total entries
       valuesList.append(1)
+      retVal = self.__splitInBuckets(typeName, startTime, endTime, valuesList, connObj=connObj)
+      if not retVal['OK']:
+        self.__rollbackTransaction(connObj)
+        return retVal
+      return self.__commitTransaction(connObj)
+    finally:
+      connObj.close()
+
+  def insertRecordsDirectly(self, typeName, records):
+    """
+    Add several entries of a type to its contents in one transaction. The entries are summed
+    in memory per bucket and keys, and each table is written with a single statement. Any error,
+    a dead lock included, rolls back the whole transaction and is returned
+
+    :param str typeName: type of the records
+    :param list records: list of ( startTime, endTime, valuesList )
+    :return: S_OK( number of buckets written ) / S_ERROR
+    """
+    if self.__readOnly:
+      return S_ERROR("ReadOnly mode enabled. No modification allowed")
+    if typeName not in self.dbCatalog:
+      return S_ERROR("Type %s has not been defined in the db" % typeName)
+    if not records:
+      return S_OK(0)
+    startInsertionEpoch = time.time()
+    keyFields = self.dbCatalog[typeName]['keys']
+    numFields = len(keyFields) + len(self.dbCatalog[typeName]['values'])
+    for _startTime, _endTime, valuesList in records:
+      if len(valuesList) != numFields:
+        return S_ERROR("Fields mismatch for record %s. %s fields and %s expected" % (typeName,
+                                                                                     len(valuesList),
+                                                                                     numFields))
+    # Discover key indexes
+    keyIdsList = [[] for _record in records]
+    for keyPos, keyName in enumerate(keyFields):
+      keyValues = [_normalizeKeyValue(valuesList[keyPos]) for _startTime, _endTime, valuesList in records]
+      retVal = self.__addKeyValues(typeName, keyName, keyValues)
+      if not retVal['OK']:
+        return retVal
+      for keyIds, keyValue in zip(keyIdsList, keyValues):
+        keyIds.append(retVal['Value'][keyValue])
+
+    # Sum the records per bucket and keys
+    typeRows = []
+    mergedBuckets = {}
+    nowEpoch = int(Time.toEpoch(Time.dateTime()))
+    for keyIds, (startTime, endTime, valuesList) in zip(keyIdsList, records):
+      retVal = self._escapeValues(keyIds + list(valuesList[len(keyFields):]) + [startTime, endTime])
+      if not retVal['OK']:
+        return retVal
+      typeRows.append("( %s )" % ", ".join(retVal['Value']))
+      # HACK: One more record to split in the buckets to be able to count total entries
+      try:
+        bucketValues = [value if isinstance(value, six.integer_types) else float(value)
+                        for value in valuesList[len(keyFields):]] + [1]
+      except (TypeError, ValueError) as e:
+        return S_ERROR("Invalid value for record %s: %s" % (typeName, repr(e)))
+      for bStartTime, bProportion, bLength in self.calculateBuckets(typeName, startTime, endTime, nowEpoch):
+        summedValues = mergedBuckets.setdefault((bStartTime, bLength, tuple(keyIds)), [0] * len(bucketValues))
+        for valPos, value in enumerate(bucketValues):
+          summedValues[valPos] += value if bProportion == 1 else value * bProportion
+
+    retVal = self._getConnection()
+    if not retVal['OK']:
+      return retVal
+    connObj = retVal['Value']
+    try:
       retVal = self.__startTransaction(connObj)
       if not retVal['OK']:
         return retVal
-      retVal = self.__splitInBuckets(typeName, startTime, endTime, valuesList, connObj=connObj)
+      retVal = self._update("INSERT INTO `%s` ( %s ) VALUES %s" % (
+          _getTableName("type", typeName),
+          ", ".join("`%s`" % field for field in self.dbCatalog[typeName]['typeFields']),
+          ", ".join(typeRows)), conn=connObj)
       if not retVal['OK']:
         self.__rollbackTransaction(connObj)
         return retVal
-      return self.__commitTransaction(connObj)
+      retVal = self.__writeMergedBuckets(typeName, mergedBuckets, connObj=connObj)
+      if not retVal['OK']:
+        self.__rollbackTransaction(connObj)
+        return retVal
+      retVal = self.__commitTransaction(connObj)
+      if not retVal['OK']:
+        return retVal
     finally:
       connObj.close()
 
+    insertionTime = time.time() - startInsertionEpoch
+    gMonitor.addMark("registeradded", len(records))
+    gMonitor.addMark("registeradded:%s" % typeName, len(records))
+    gMonitor.addMark("bulkrecords", len(records))
+    gMonitor.addMark("bulkbuckets", len(mergedBuckets))
+    gMonitor.addMark("bulkinsertiontime", insertionTime)
+    self.log.info("Inserted records in bulk", "%s records of %s in %s buckets (%.2f secs, %.1f records/s)" % (
+        len(records), typeName, len(mergedBuckets), insertionTime, len(records) / max(insertionTime, 0.001)))
+    return S_OK(len(mergedBuckets))
+
   def deleteRecord(self, typeName, startTime, endTime, valuesList):
     """
     Add an entry to the type contents
@@ -793,42 +1129,51 @@ class AccountingDB(DB):
     keyValues = valuesList[:numKeys]
     valuesList = valuesList[numKeys:]
     self.log.verbose("Deleting bucketed entry", "from %s buckets" % len(buckets))
+    self.__refreshRollups()
     for bucketInfo in buckets:
       bucketStartTime = bucketInfo[0]
       bucketProportion = bucketInfo[1]
       bucketLength = bucketInfo[2]
-      for _i in range(max(1, self.__deadLockRetries)):
-        retVal = self.__extractFromBucket(typeName,
-                                          bucketStartTime,
-                                          bucketLength,
-                                          keyValues,
-                                          valuesList, bucketProportion * numInsertions, connObj=connObj)
+      # The rollups hold the same buckets as the type
+      for rollupName in [None] + sorted(self.dbCatalog[typeName]['rollups']):
+        for _i in range(max(1, self.__deadLockRetries)):
+          retVal = self.__extractFromBucket(typeName,
+                                            bucketStartTime,
+                                            bucketLength,
+                                            keyValues,
+                                            valuesList, bucketProportion * numInsertions, connObj=connObj,
+                                            rollupName=rollupName)
+          # In a transaction, a dead lock rolls back all its statements: only the caller can replay them
+          if retVal['OK'] or connObj or not _isDeadLock(retVal['Message']):
+            break
         if not retVal['OK']:
-          # If failed because of dead lock try restarting
-          if retVal['Message'].find("try restarting transaction"):
-            continue
           return retVal
-        # If OK, break loop
-        if retVal['OK']:
-          break
     return S_OK()
 
   def getBucketsDef(self, typeName):
     return self.dbBucketsLength[typeName]
 
-  def __generateSQLConditionForKeys(self, typeName, keyValues):
+  def __getBucketsTable(self, typeName, rollupName=None):
+    """
+    Get the name of the buckets table of a type, or of one of its rollups, and its key fields
+    """
+    if rollupName:
+      return _getTableName("rollup", typeName, rollupName), self.dbCatalog[typeName]['rollups'][rollupName]['keys']
+    return _getTableName("bucket", typeName), self.dbCatalog[typeName]['keys']
+
+  def __generateSQLConditionForKeys(self, typeName, keyValues, rollupName=None):
     """
     Generate sql condition for buckets, values are indexes to real values
     """
+    tableName, keyFields = self.__getBucketsTable(typeName, rollupName)
     realCondList = []
-    for keyPos in range(len(self.dbCatalog[typeName]['keys'])):
-      keyField = self.dbCatalog[typeName]['keys'][keyPos]
-      keyValue = keyValues[keyPos]
+    for keyField in keyFields:
+      keyValue = keyValues[self.dbCatalog[typeName]['keys'].index(keyField)]
       retVal = self._escapeString(keyValue)
       if not retVal['OK']:
         return retVal
       keyValue = retVal['Value']
-      realCondList.append("`%s`.`%s` = %s" % (_getTableName("bucket", typeName), keyField, keyValue))
+      realCondList.append("`%s`.`%s` = %s" % (tableName, keyField, keyValue))
     return " AND ".join(realCondList)
 
   def __getBucketFromDB(self, typeName, startTime, bucketLength, keyValues, connObj=False):
@@ -850,11 +1195,12 @@ class AccountingDB(DB):
     cmd += self.__generateSQLConditionForKeys(typeName, keyValues)
     return self._query(cmd, conn=connObj)
 
-  def __extractFromBucket(self, typeName, startTime, bucketLength, keyValues, bucketValues, proportion, connObj=False):
+  def __extractFromBucket(self, typeName, startTime, bucketLength, keyValues, bucketValues, proportion, connObj=False,
+                          rollupName=None):
     """
     Update a bucket when coming from the raw insert
     """
-    tableName = _getTableName("bucket", typeName)
+    tableName = self.__getBucketsTable(typeName, rollupName)[0]
     cmd = "UPDATE `%s` SET " % tableName
     sqlValList = []
     for pos in range(len(self.dbCatalog[typeName]['values'])):
@@ -869,54 +1215,106 @@ class AccountingDB(DB):
         proportion
     ))
     cmd += ", ".join(sqlValList)
-    cmd += " WHERE `%s`.`startTime`='%s' AND `%s`.`bucketLength`='%s' AND " % (
+    cmd += " WHERE `%s`.`startTime`='%s' AND `%s`.`bucketLength`='%s'" % (
         tableName,
         startTime,
         tableName,
         bucketLength
     )
-    cmd += self.__generateSQLConditionForKeys(typeName, keyValues)
+    # A rollup may have no key
+    keysCond = self.__generateSQLConditionForKeys(typeName, keyValues, rollupName)
+    if keysCond:
+      cmd += " AND %s" % keysCond
     return self._update(cmd, conn=connObj)
 
   def __writeBuckets(self, typeName, buckets, keyValues, valuesList, connObj=False):
-    """ Insert or update a bucket
+    """ Insert or update a bucket, and the same bucket of the rollups of the type
+    """
+    self.__refreshRollups()
+    for rollupName in [None] + sorted(self.dbCatalog[typeName]['rollups']):
+      tableName, keyFields = self.__getBucketsTable(typeName, rollupName)
+      valuesGroups = []
+      for bucketInfo in buckets:
+        bStartTime = bucketInfo[0]
+        bProportion = bucketInfo[1]
+        bLength = bucketInfo[2]
+        sqlValues = [bStartTime, bLength, "(%s*%s)" % (valuesList[-1], bProportion)]
+        for keyField in keyFields:
+          sqlValues.append(keyValues[self.dbCatalog[typeName]['keys'].index(keyField)])
+        for valPos in range(len(self.dbCatalog[typeName]['values'])):
+          #         value = valuesList[ valPos ]
+          sqlValues.append("(%s*%s)" % (valuesList[valPos], bProportion))
+        valuesGroups.append("( %s )" % ",".join(str(val) for val in sqlValues))
+
+      result = self.__updateBuckets(self.__getWriteBucketsCommand(typeName, tableName, keyFields, valuesGroups),
+                                    connObj=connObj)
+      if not result['OK']:
+        return result
+    return result
+
+  def __writeMergedBuckets(self, typeName, mergedBuckets, connObj=False):
+    """ Insert or update buckets, and the same buckets of the rollups of the type, with one statement per table
+
+        :param dict mergedBuckets: { ( startTime, bucketLength, key ids ) : [ value1, ..., valueN, entries ] }
+    """
+    self.__refreshRollups()
+    typeKeys = self.dbCatalog[typeName]['keys']
+    for rollupName in [None] + sorted(self.dbCatalog[typeName]['rollups']):
+      tableName, keyFields = self.__getBucketsTable(typeName, rollupName)
+      tableBuckets = mergedBuckets
+      if rollupName:
+        # Sum again the buckets with the same keys of the rollup
+        keyPositions = [typeKeys.index(keyField) for keyField in keyFields]
+        tableBuckets = {}
+        for (bStartTime, bLength, keyIds), bucketValues in mergedBuckets.items():
+          rollupBucket = (bStartTime, bLength, tuple(keyIds[keyPos] for keyPos in keyPositions))
+          if rollupBucket in tableBuckets:
+            tableBuckets[rollupBucket] = [summed + value
+                                          for summed, value in zip(tableBuckets[rollupBucket], bucketValues)]
+          else:
+            tableBuckets[rollupBucket] = bucketValues
+      # Always the same order of the rows, so that concurrent insertions lock them in the same order
+      valuesGroups = []
+      for bucket in sorted(tableBuckets):
+        bStartTime, bLength, keyIds = bucket
+        bucketValues = tableBuckets[bucket]
+        sqlValues = [bStartTime, bLength, bucketValues[-1]] + list(keyIds) + bucketValues[:-1]
+        valuesGroups.append("( %s )" % ",".join(_sqlNumber(val) for val in sqlValues))
+
+      result = self.__updateBuckets(self.__getWriteBucketsCommand(typeName, tableName, keyFields, valuesGroups),
+                                    connObj=connObj)
+      if not result['OK']:
+        return result
+    return S_OK()
+
+  def __getWriteBucketsCommand(self, typeName, tableName, keyFields, valuesGroups):
+    """ Generate the statement adding rows to the buckets of a table
+
+        :param list valuesGroups: rows "( startTime, bucketLength, entries, key ids, values )"
     """
-#     tableName = _getTableName( "bucket", typeName )
     # INSERT PART OF THE QUERY
     sqlFields = ['`startTime`', '`bucketLength`', '`entriesInBucket`']
-    for keyPos in range(len(self.dbCatalog[typeName]['keys'])):
-      sqlFields.append("`%s`" % self.dbCatalog[typeName]['keys'][keyPos])
+    for keyField in keyFields:
+      sqlFields.append("`%s`" % keyField)
     sqlUpData = ["`entriesInBucket`=`entriesInBucket`+VALUES(`entriesInBucket`)"]
     for valPos in range(len(self.dbCatalog[typeName]['values'])):
       valueField = "`%s`" % self.dbCatalog[typeName]['values'][valPos]
       sqlFields.append(valueField)
       sqlUpData.append("%s=%s+VALUES(%s)" % (valueField, valueField, valueField))
-    valuesGroups = []
-    for bucketInfo in buckets:
-      bStartTime = bucketInfo[0]
-      bProportion = bucketInfo[1]
-      bLength = bucketInfo[2]
-      sqlValues = [bStartTime, bLength, "(%s*%s)" % (valuesList[-1], bProportion)]
-      for keyPos in range(len(self.dbCatalog[typeName]['keys'])):
-        sqlValues.append(keyValues[keyPos])
-      for valPos in range(len(self.dbCatalog[typeName]['values'])):
-        #         value = valuesList[ valPos ]
-        sqlValues.append("(%s*%s)" % (valuesList[valPos], bProportion))
-      valuesGroups.append("( %s )" % ",".join(str(val) for val in sqlValues))
-
-    cmd = "INSERT INTO `%s` ( %s ) " % (_getTableName("bucket", typeName), ", ".join(sqlFields))
+
+    cmd = "INSERT INTO `%s` ( %s ) " % (tableName, ", ".join(sqlFields))
     cmd += "VALUES %s " % ", ".join(valuesGroups)
     cmd += "ON DUPLICATE KEY UPDATE %s" % ", ".join(sqlUpData)
+    return cmd
 
+  def __updateBuckets(self, cmd, connObj=False):
+    """ Execute a bucket update, retrying on dead locks out of a transaction. In a transaction, given by
+        connObj, a dead lock rolls back all its statements, so the error is returned for the caller to
+        roll it back
+    """
     for _i in range(max(1, self.__deadLockRetries)):
       result = self._update(cmd, conn=connObj)
-      if not result['OK']:
-        # If failed because of dead lock try restarting
-        if result['Message'].find("try restarting transaction"):
-          continue
-        return result
-      # If OK, break loopo
-      if result['OK']:
+      if result['OK'] or connObj or not _isDeadLock(result['Message']):
         return result
 
     return S_ERROR("Cannot update bucket: %s" % result['Message'])
@@ -1003,6 +1401,10 @@ class AccountingDB(DB):
     nowEpoch = Time.toEpoch(Time.dateTime())
     bucketTimeLength = self.calculateBucketLengthForTime(typeName, nowEpoch, startTime)
     startTime = startTime - startTime % bucketTimeLength
+    self.__refreshRollups()
+    rollupName = self.__selectRollup(typeName, selectFields, condDict, groupFields, orderFields)
+    if rollupName:
+      self.log.verbose("Querying rollup", "%s of %s" % (rollupName, typeName))
     result = self.__queryType(
         typeName,
         startTime,
@@ -1012,11 +1414,45 @@ class AccountingDB(DB):
         groupFields,
         orderFields,
         "bucket",
-        connObj=connObj
+        connObj=connObj,
+        rollupName=rollupName
     )
     gMonitor.addMark("querytime", Time.toEpoch() - startQueryEpoch)
     return result
 
+  def __selectRollup(self, typeName, selectFields, condDict, groupFields, orderFields):
+    """
+    Select the rollup of a type with the fewest keys that gives the same result as the buckets for a query.
+    The query has to group the buckets, to only sum the values and to use only keys of the rollup
+
+    :return: name of the rollup or None
+    """
+    # The rollups not filled yet may not be written by all the instances
+    rollups = dict((rollupName, rollup) for rollupName, rollup in self.dbCatalog[typeName]['rollups'].items()
+                   if rollup['ready'])
+    if not rollups or not groupFields:
+      return None
+    typeKeys = self.dbCatalog[typeName]['keys']
+    valueFields = self.dbCatalog[typeName]['values'] + ['entriesInBucket']
+    try:
+      markedSelect = selectFields[0] % tuple(_VALUE_FIELD_MARK if field in valueFields else "field"
+                                             for field in selectFields[1])
+    except TypeError:
+      return None
+    if _VALUE_FIELD_MARK in _SUMMED_VALUE_FIELD_RE.sub("", markedSelect):
+      return None
+    if [field for field in condDict if field not in typeKeys]:
+      return None
+    preGenFields = list(groupFields[1]) + (list(orderFields[1]) if orderFields else [])
+    if [field for field in preGenFields if field in valueFields]:
+      return None
+    usedKeys = set(field for field in list(selectFields[1]) + list(condDict) + preGenFields if field in typeKeys)
+    candidates = [(len(rollups[rollupName]['keys']), rollupName) for rollupName in rollups
+                  if usedKeys.issubset(rollups[rollupName]['keys'])]
+    if not candidates:
+      return None
+    return min(candidates)[1]
+
   def __queryType(
           self,
           typeName,
@@ -1027,12 +1463,16 @@ class AccountingDB(DB):
           groupFields,
           orderFields,
           tableType,
-          connObj=False):
+          connObj=False,
+          rollupName=None):
     """
-    Execute a query over a main table
+    Execute a query over a main table, or over the table of a rollup of the buckets
     """
 
-    tableName = _getTableName(tableType, typeName)
+    if rollupName:
+      tableName = _getTableName("rollup", typeName, rollupName)
+    else:
+      tableName = _getTableName(tableType, typeName)
     cmd = "SELECT"
     sqlLinkList = []
     # Check if groupFields and orderFields are in ( "%s", ( field1, ) ) form
@@ -1222,6 +1662,19 @@ class AccountingDB(DB):
     deleteSQL += "`%s`.`bucketLength` = %s" % (tableName, bucketLength)
     return self._update(deleteSQL, conn=connObj)
 
+  def __deleteForCompactRollups(self, typeName, timeLimit, bucketLength):
+    """
+    Delete the compacted buckets from the rollups. The compacted data has already been added to the
+    longer buckets of the rollups when splitting it again
+    """
+    for rollupName in sorted(self.dbCatalog[typeName]['rollups']):
+      tableName = _getTableName("rollup", typeName, rollupName)
+      result = self._update("DELETE FROM `%s` WHERE `startTime` < '%s' AND `bucketLength` = %s" % (tableName,
+                                                                                                   timeLimit,
+                                                                                                   bucketLength))
+      if not result['OK']:
+        self.log.error("[COMPACT] Cannot delete compacted buckets of rollup", "%s: %s" % (tableName, result['Message']))
+
   def __compactBucketsForType(self, typeName):
     """
     Compact all buckets for a given type
@@ -1264,6 +1717,7 @@ class AccountingDB(DB):
         if not retVal['OK']:
           #self.__rollbackTransaction( connObj )
           self.log.error("[COMPACT] Error while compacting data for record", "%s: %s" % (typeName, retVal['Value']))
+      self.__deleteForCompactRollups(typeName, timeLimit, bucketLength)
       self.log.info("[COMPACT] Finished compaction %d of %d" % (bPos, len(self.dbBucketsLength[typeName]) - 1))
     # return self.__commitTransaction( connObj )
     return S_OK()
@@ -1325,6 +1779,7 @@ class AccountingDB(DB):
         insertElapsedTime = time.time() - deleteEndTime
         self.log.info("[COMPACT] Records compacted (took %.2f secs, %.2f secs/bucket)" %
                       (insertElapsedTime, insertElapsedTime / len(bucketsData)))
+      self.__deleteForCompactRollups(typeName, timeLimit, bucketLength)
       self.log.info("[COMPACT] Finised compaction %d of %d" % (bPos, len(self.dbBucketsLength[typeName]) - 1))
     # return self.__commitTransaction( connObj )
     return S_OK()
@@ -1385,8 +1840,11 @@ class AccountingDB(DB):
     dataTimespan = self.dbCatalog[typeName]['dataTimespan'] + self.dbBucketsLength[typeName][-1][1]
     if dataTimespan < 86400 * 30:
       return
-    for table, field in ((_getTableName("type", typeName), 'endTime'),
-                         (_getTableName("bucket", typeName), 'startTime')):
+    tablesToClean = [(_getTableName("type", typeName), 'endTime'),
+                     (_getTableName("bucket", typeName), 'startTime')]
+    for rollupName in sorted(self.dbCatalog[typeName]['rollups']):
+      tablesToClean.append((_getTableName("rollup", typeName, rollupName), 'startTime'))
+    for table, field in tablesToClean:
       self.log.info("[COMPACT] Deleting old records for table %s" % table)
       deleteLimit = 100000
       deleted = deleteLimit
@@ -1420,6 +1878,11 @@ class AccountingDB(DB):
     retVal = self._update("DELETE FROM `%s`" % _getTableName("bucket", typeName))
     if not retVal['OK']:
       return retVal
+    # The rollups are filled again with the buckets
+    for rollupName in sorted(self.dbCatalog[typeName]['rollups']):
+      retVal = self._update("DELETE FROM `%s`" % _getTableName("rollup", typeName, rollupName))
+      if not retVal['OK']:
+        return retVal
     # Generate the common part of the query
     # SELECT fields
     startTimeTableField = "`%s`.startTime" % rawTableName
@@ -1544,6 +2007,35 @@ class AccountingDB(DB):
     return self._query("ROLLBACK", conn=connObj)
 
 
+def _normalizeKeyValue(keyValue):
+  """
+  Key value as stored in a key table
+  """
+  # Cast to string just in case
+  if not isinstance(keyValue, six.string_types):
+    keyValue = str(keyValue)
+  # No more than 64 chars for keys
+  if len(keyValue) > 64:
+    keyValue = keyValue[:64]
+  return keyValue
+
+
+def _isDeadLock(message):
+  """
+  Whether an error comes from a dead lock, after which the transaction can be restarted
+  """
+  return "try restarting transaction" in message
+
+
+def _sqlNumber(value):
+  """
+  Number as written in a SQL statement, without losing precision
+  """
+  if isinstance(value, six.integer_types):
+    return str(value)
+  return repr(float(value))
+
+
 def _bucketizeDataField(dataField, bucketLength):
   return "%s - ( %s %% %s )" % (dataField, dataField, bucketLength)
 
@@ -1554,7 +2046,7 @@ def _getTableName(tableType, typeName, keyName=None):
   """
   if not keyName:
     return "ac_%s_%s" % (tableType, typeName)
-  elif tableType == "key":
+  elif tableType in ("key", "rollup"):
     return "ac_%s_%s_%s" % (tableType, typeName, keyName)
   else:
-    raise Exception("Call to _getTableName with tableType as key but with no keyName")
+    raise Exception("Call to _getTableName with a keyName but with tableType %s instead of key or rollup" % tableType)
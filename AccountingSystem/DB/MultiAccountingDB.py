@@ -48,7 +48,7 @@ class MultiAccountingDB(object):
 
   def __registerMethods(self):
     for methodName in ('registerType', 'changeBucketsLength', 'regenerateBuckets',
-                       'deleteType', 'insertRecordThroughQueue',
+                       'createRollup', 'fillRollup', 'deleteRollup', 'deleteType', 'insertRecordThroughQueue',
                        'deleteRecord', 'getKeyValues', 'retrieveBucketedData',
                        'calculateBuckets', 'calculateBucketLengthForTime'):
       (lambda closure: setattr(self,
@@ -4,8 +4,9 @@
 # pylint: disable=protected-access
 
 # imports
+import time
 import unittest
-from mock import MagicMock
+from mock import MagicMock, patch
 
 import DIRAC.AccountingSystem.DB.AccountingDB as moduleTested
 
@@ -389,6 +390,329 @@ ORDER BY startTime" % (expectedStartTime, expectedEndTime)
     self.assertTrue(retVal)
     self.assertEqual(retVal, expectedQuery)
 
+
+class Rollups(TestCase):
+  """ testing the rollups of the buckets
+  """
+
+  typeName = "LHCb-Certification_DataOperation"
+
+  def setUp(self):
+    super(Rollups, self).setUp()
+    self.commands = []
+    self.module = self.testClass()
+    self.module.dbCatalog = {self.typeName: {
+        'keys': ['OperationType', 'User', 'ExecutionSite', 'Source',
+                 'Destination', 'Protocol', 'FinalStatus'],
+        'values': ['TransferSize', 'TransferTime', 'RegistrationTime',
+                   'TransferOK', 'TransferTotal', 'RegistrationOK', 'RegistrationTotal'],
+        'rollups': {'BySource': {'keys': ['Source'], 'ready': True},
+                    'BySourceDestination': {'keys': ['Source', 'Destination'], 'ready': True},
+                    'Total': {'keys': [], 'ready': True}},
+        'dataTimespan': 0}}
+    self.module.dbBucketsLength[self.typeName] = [
+        (259200, 900), (691200, 3600), (15552000, 86400), (31104000, 604800)]
+    self.module._AccountingDB__rollupsLoadTime = time.time()
+    self.module._query = self.query
+    self.module._update = self.update
+    self.module._escapeString = lambda value: {'OK': True, 'Value': "'%s'" % value}
+
+  def query(self, cmd, conn):  # pylint: disable=no-self-use,unused-argument
+    """Because we are not able to execute the query, the method returns the query"""
+    return cmd
+
+  def update(self, cmd, conn=False):  # pylint: disable=unused-argument
+    """Keep the updates instead of executing them"""
+    self.commands.append(cmd)
+    return {'OK': True, 'Value': 1}
+
+  def mockQuery(self, answers):
+    """Answer each query with the rows of the first prefix it starts with, and no row otherwise"""
+    self.module._query = MagicMock(side_effect=lambda cmd, conn=False: {'OK': True, 'Value': next(
+        (rows for prefix, rows in answers if cmd.startswith(prefix)), ())})
+
+  def selectRollup(self, selectFields, condDict, groupFields, orderFields):
+    return self.module._AccountingDB__selectRollup(self.typeName,  # pylint: disable=no-member
+                                                   selectFields, condDict, groupFields, orderFields)
+
+  def test_selectRollup(self):
+    """Test the choice of the rollup answering a query"""
+    selectFields = ('%s, %s, %s, SUM(%s), SUM(%s)-SUM(%s)',
+                    ['Source', 'startTime', 'bucketLength', 'TransferOK', 'TransferTotal', 'TransferOK'])
+    groupFields = ('%s, %s', ['startTime', 'Source'])
+    orderFields = ('%s', ['startTime'])
+    self.assertEqual(self.selectRollup(selectFields, {}, groupFields, orderFields), 'BySource')
+    self.assertEqual(self.selectRollup(selectFields, {'Destination': ['CERN-USER']}, groupFields, orderFields),
+                     'BySourceDestination')
+    self.assertEqual(self.selectRollup(("'Total', %s, %s, SUM(%s)", ['startTime', 'bucketLength', 'TransferOK']),
+                                       {}, ('%s', ['startTime']), orderFields),
+                     'Total')
+
+    # Keys not in any rollup
+    self.assertIsNone(self.selectRollup(selectFields, {'User': ['someone']}, groupFields, orderFields))
+    # Values not summed
+    self.assertIsNone(self.selectRollup(('%s, %s, %s, MAX(%s)', ['Source', 'startTime', 'bucketLength', 'TransferOK']),
+                                        {}, groupFields, orderFields))
+    self.assertIsNone(self.selectRollup(('%s, %s, %s, SUM(%s/%s)',
+                                         ['Source', 'startTime', 'bucketLength', 'TransferOK', 'TransferTotal']),
+                                        {}, groupFields, orderFields))
+    # Buckets not grouped
+    self.assertIsNone(self.selectRollup(selectFields, {}, False, orderFields))
+    # Rollup not filled yet
+    self.module.dbCatalog[self.typeName]['rollups']['BySource']['ready'] = False
+    self.assertEqual(self.selectRollup(selectFields, {}, groupFields, orderFields), 'BySourceDestination')
+    # No rollup
+    self.module.dbCatalog[self.typeName]['rollups'] = {}
+    self.assertIsNone(self.selectRollup(selectFields, {}, groupFields, orderFields))
+
+  def test_queryTypeRollup(self):
+    """Test the query of a rollup"""
+    retVal = self.module._AccountingDB__queryType(self.typeName,  # pylint: disable=no-member
+                                                  0,
+                                                  0,
+                                                  ('%s, %s, %s, SUM(%s)',
+                                                   ['Source', 'startTime', 'bucketLength', 'TransferOK']),
+                                                  {},
+                                                  ('%s, %s', ['startTime', 'Source']),
+                                                  ('%s', ['startTime']),
+                                                  'bucket',
+                                                  rollupName='BySource')
+    self.assertTrue(retVal.startswith("SELECT `ac_key_LHCb-Certification_DataOperation_Source`.`value`, \
+`ac_rollup_LHCb-Certification_DataOperation_BySource`.`startTime`, \
+`ac_rollup_LHCb-Certification_DataOperation_BySource`.`bucketLength`, \
+SUM(`ac_rollup_LHCb-Certification_DataOperation_BySource`.`TransferOK`) \
+FROM `ac_rollup_LHCb-Certification_DataOperation_BySource`, \
+`ac_key_LHCb-Certification_DataOperation_Source` WHERE "))
+    self.assertIn("`ac_rollup_LHCb-Certification_DataOperation_BySource`.`Source` = \
+`ac_key_LHCb-Certification_DataOperation_Source`.`id`", retVal)
+    self.assertNotIn("ac_bucket", retVal)
+
+  def test_writeBuckets(self):
+    """Test that the buckets of the rollups are written with the buckets of the type"""
+    retVal = self.module._AccountingDB__writeBuckets(self.typeName,  # pylint: disable=no-member
+                                                     [(1495324800, 1.0, 900)],
+                                                     [1, 2, 3, 4, 5, 6, 7],
+                                                     [10, 11, 12, 13, 14, 15, 16, 1])
+    self.assertTrue(retVal['OK'])
+    self.assertEqual(len(self.commands), 4)
+    self.assertTrue(self.commands[0].startswith("INSERT INTO `ac_bucket_LHCb-Certification_DataOperation` "))
+    self.assertIn("VALUES ( 1495324800,900,(1*1.0),1,2,3,4,5,6,7,(10*1.0),", self.commands[0])
+    self.assertTrue(self.commands[1].startswith("INSERT INTO `ac_rollup_LHCb-Certification_DataOperation_BySource` \
+( `startTime`, `bucketLength`, `entriesInBucket`, `Source`, `TransferSize`"))
+    self.assertIn("VALUES ( 1495324800,900,(1*1.0),4,(10*1.0),", self.commands[1])
+    self.assertIn("VALUES ( 1495324800,900,(1*1.0),4,5,(10*1.0),", self.commands[2])
+    self.assertIn("VALUES ( 1495324800,900,(1*1.0),(10*1.0),", self.commands[3])
+
+  def test_writeBucketsDeadLock(self):
+    """Test that a dead lock is only retried out of a transaction, as it rolls back the whole transaction"""
+    deadLock = {'OK': False, 'Message': "Deadlock found when trying to get lock; try restarting transaction"}
+    bucket = ([(1495324800, 1.0, 900)], [1, 2, 3, 4, 5, 6, 7], [10, 11, 12, 13, 14, 15, 16, 1])
+    self.module._update = MagicMock(side_effect=[{'OK': True, 'Value': 1}, deadLock] + [{'OK': True, 'Value': 1}] * 3)
+    retVal = self.module._AccountingDB__writeBuckets(self.typeName, *bucket)  # pylint: disable=no-member
+    self.assertTrue(retVal['OK'])
+    self.assertEqual(self.module._update.call_count, 5)
+
+    self.module._update = MagicMock(side_effect=[{'OK': True, 'Value': 1}, deadLock] + [{'OK': True, 'Value': 1}] * 3)
+    retVal = self.module._AccountingDB__writeBuckets(self.typeName, *bucket,  # pylint: disable=no-member
+                                                     connObj=MagicMock())
+    self.assertFalse(retVal['OK'])
+    self.assertEqual(self.module._update.call_count, 2)
+
+    # Other errors are not retried
+    self.module._update = MagicMock(return_value={'OK': False, 'Message': "Table doesn't exist"})
+    retVal = self.module._AccountingDB__writeBuckets(self.typeName, *bucket)  # pylint: disable=no-member
+    self.assertFalse(retVal['OK'])
+    self.assertEqual(self.module._update.call_count, 1)
+
+  def test_loadRollups(self):
+    """Test the loading of the rollups from the catalog in the DB"""
+    self.module._query = MagicMock(return_value={'OK': True, 'Value': [
+        (self.typeName, 'BySource', 'Source', 1),
+        (self.typeName, 'Total', '', 0),
+        ('LHCb-Certification_Job', 'BySite', 'Site', 1)]})
+    self.module._AccountingDB__rollupsLoadTime = 0
+    self.module._AccountingDB__refreshRollups()  # pylint: disable=no-member
+
+    self.assertEqual(self.module.dbCatalog[self.typeName]['rollups'], {'BySource': {'keys': ['Source'], 'ready': True},
+                                                                       'Total': {'keys': [], 'ready': False}})
+    # Not loaded again before RollupsRefreshTime
+    self.module._AccountingDB__refreshRollups()  # pylint: disable=no-member
+    self.assertEqual(self.module._query.call_count, 1)
+
+  def test_createRollup(self):
+    """Test the creation of an empty rollup"""
+    self.mockQuery([("show tables", [('ac_bucket_LHCb-Certification_DataOperation',),
+                                     ('ac_rollup_LHCb-Certification_DataOperation_BySource',)]),
+                    ("SELECT `typeName`", [(self.typeName, 'ByProtocol', 'Source,Protocol', 0)])])
+    retVal = self.module.createRollup(self.typeName, 'ByProtocol', ['Protocol', 'Source'])
+    self.assertTrue(retVal['OK'])
+
+    createdTables = self.module._createTables.call_args[0][0]
+    self.assertEqual(list(createdTables), ['ac_rollup_LHCb-Certification_DataOperation_ByProtocol'])
+    # The keys are kept in the order of the type
+    self.assertEqual(createdTables['ac_rollup_LHCb-Certification_DataOperation_ByProtocol']['UniqueIndexes'],
+                     {'UniqueConstraint': ['startTime', 'Source', 'Protocol', 'bucketLength']})
+    self.assertEqual(self.commands, ["INSERT INTO `ac_catalog_Rollups` \
+( `typeName`, `name`, `keyFields`, `ready`, `creationTime` ) \
+VALUES ( 'LHCb-Certification_DataOperation', 'ByProtocol', 'Source,Protocol', 0, UTC_TIMESTAMP() )"])
+    # The instance writes it at once
+    self.assertEqual(self.module.dbCatalog[self.typeName]['rollups'],
+                     {'ByProtocol': {'keys': ['Source', 'Protocol'], 'ready': False}})
+
+    self.assertFalse(self.module.createRollup(self.typeName, 'BySource', ['Source'])['OK'])
+    self.assertFalse(self.module.createRollup(self.typeName, 'BySite', ['Site'])['OK'])
+    self.assertFalse(self.module.createRollup(self.typeName, 'By`Site', ['Source'])['OK'])
+    self.assertEqual(len(self.commands), 1)
+
+  def test_fillRollup(self):
+    """Test the filling of a rollup with the buckets, in one transaction"""
+    self.module._getConnection = MagicMock(return_value={'OK': True, 'Value': MagicMock()})
+    self.mockQuery([("SELECT `keyFields`", [('Source', 10)])])
+    retVal = self.module.fillRollup(self.typeName, 'BySource')
+    # Not all the instances may write it yet
+    self.assertFalse(retVal['OK'])
+    self.assertEqual(self.commands, [])
+
+    self.mockQuery([("SELECT `keyFields`", [('Source', 3600)])])
+    retVal = self.module.fillRollup(self.typeName, 'BySource')
+    self.assertTrue(retVal['OK'])
+    self.assertEqual(len(self.commands), 3)
+    self.assertEqual(self.commands[0], "DELETE FROM `ac_rollup_LHCb-Certification_DataOperation_BySource`")
+    self.assertTrue(self.commands[1].startswith("INSERT INTO `ac_rollup_LHCb-Certification_DataOperation_BySource` \
+( `startTime`, `bucketLength`, `Source`, `TransferSize`"))
+    self.assertTrue(self.commands[1].endswith("FROM `ac_bucket_LHCb-Certification_DataOperation` \
+GROUP BY `startTime`, `bucketLength`, `Source`"))
+    self.assertEqual(self.commands[2], "UPDATE `ac_catalog_Rollups` SET ready=1 \
+WHERE typeName='LHCb-Certification_DataOperation' AND name='BySource'")
+    queries = [call[0][0] for call in self.module._query.call_args_list]
+    self.assertEqual(queries[1:3], ["START TRANSACTION", "COMMIT"])
+
+  def test_extractFromRollup(self):
+    """Test the deletion of a record from the buckets of a rollup"""
+    retVal = self.module._AccountingDB__extractFromBucket(self.typeName,  # pylint: disable=no-member
+                                                          1495324800, 900,
+                                                          [1, 2, 3, 4, 5, 6, 7],
+                                                          [10, 11, 12, 13, 14, 15, 16, 1], 0.5,
+                                                          rollupName='BySource')
+    self.assertTrue(retVal['OK'])
+    self.assertTrue(self.commands[0].endswith("WHERE `ac_rollup_LHCb-Certification_DataOperation_BySource`.\
+`startTime`='1495324800' AND `ac_rollup_LHCb-Certification_DataOperation_BySource`.`bucketLength`='900' \
+AND `ac_rollup_LHCb-Certification_DataOperation_BySource`.`Source` = '4'"))
+    self.module._AccountingDB__extractFromBucket(self.typeName,  # pylint: disable=no-member
+                                                 1495324800, 900,
+                                                 [1, 2, 3, 4, 5, 6, 7],
+                                                 [10, 11, 12, 13, 14, 15, 16, 1], 0.5,
+                                                 rollupName='Total')
+    self.assertTrue(self.commands[1].endswith(
+        "`ac_rollup_LHCb-Certification_DataOperation_Total`.`bucketLength`='900'"))
+
+
+class BulkInsertion(TestCase):
+  """ testing the insertion of records in bulk
+  """
+
+  typeName = "LHCb-Certification_DataOperation"
+  keyIds = {'OperationType': {'putAndRegister': 1},
+            'User': {'someone': 1, 'another': 2},
+            'ExecutionSite': {'LCG.CERN.cern': 1},
+            'Source': {'CERN-USER': 1},
+            'Destination': {'CERN-DST': 1},
+            'Protocol': {'srm': 1},
+            'FinalStatus': {'Successful': 1}}
+
+  def setUp(self):
+    super(BulkInsertion, self).setUp()
+    self.commands = []
+    self.keyQueries = []
+    self.module = self.testClass()
+    self.module.dbCatalog = {self.typeName: {
+        'keys': ['OperationType', 'User', 'ExecutionSite', 'Source',
+                 'Destination', 'Protocol', 'FinalStatus'],
+        'values': ['TransferSize', 'TransferTime', 'RegistrationTime',
+                   'TransferOK', 'TransferTotal', 'RegistrationOK', 'RegistrationTotal'],
+        'typeFields': ['OperationType', 'User', 'ExecutionSite',
+                       'Source', 'Destination', 'Protocol', 'FinalStatus',
+                       'TransferSize', 'TransferTime', 'RegistrationTime',
+                       'TransferOK', 'TransferTotal', 'RegistrationOK',
+                       'RegistrationTotal', 'startTime', 'endTime'],
+        'rollups': {'BySource': {'keys': ['Source'], 'ready': True}},
+        'dataTimespan': 0}}
+    self.module.dbBucketsLength[self.typeName] = [
+        (259200, 900), (691200, 3600), (15552000, 86400), (31104000, 604800)]
+    self.module._AccountingDB__rollupsLoadTime = time.time()
+    self.module._query = self.query
+    self.module._update = self.update
+    self.module._escapeValues = lambda values: {'OK': True, 'Value': ["'%s'" % value for value in values]}
+    self.module._getConnection = MagicMock(return_value={'OK': True, 'Value': MagicMock()})
+
+  def query(self, cmd, conn=False):  # pylint: disable=unused-argument
+    """Return the ids of the key values"""
+    if cmd.startswith("SELECT `id`, `value`"):
+      keyName = cmd.split('`')[5].split('_')[-1]
+      self.keyQueries.append(keyName)
+      return {'OK': True, 'Value': [(keyId, keyValue) for keyValue, keyId in self.keyIds[keyName].items()
+                                    if "'%s'" % keyValue in cmd]}
+    return {'OK': True, 'Value': ()}
+
+  def update(self, cmd, conn=False):  # pylint: disable=unused-argument
+    """Keep the updates instead of executing them"""
+    self.commands.append(cmd)
+    return {'OK': True, 'Value': 1}
+
+  def test_insertRecordsDirectly(self):
+    """Test that the records are summed per bucket and keys, and written with one statement per table"""
+    now = int(time.time())
+    startTime = now - now % 900 - 1800
+    keys = ['putAndRegister', 'someone', 'LCG.CERN.cern', 'CERN-USER', 'CERN-DST', 'srm', 'Successful']
+    otherKeys = list(keys)
+    otherKeys[1] = 'another'
+    records = [(startTime, startTime + 100, keys + [1000, 1.5, 0.5, 1, 1, 1, 1]),
+               (startTime + 200, startTime + 300, keys + [2000, 2.5, 0.5, 1, 1, 1, 1]),
+               (startTime + 400, startTime + 500, otherKeys + [4000, 1., 0., 0, 1, 0, 1])]
+    retVal = self.module.insertRecordsDirectly(self.typeName, records)
+    self.assertTrue(retVal['OK'])
+    self.assertEqual(retVal['Value'], 2)
+    self.assertEqual(sorted(self.keyQueries), sorted(self.keyIds))
+
+    self.assertEqual(len(self.commands), 3)
+    self.assertTrue(self.commands[0].startswith("INSERT INTO `ac_type_LHCb-Certification_DataOperation` "))
+    self.assertEqual(self.commands[0].count("( '"), 3)
+    self.assertTrue(self.commands[1].startswith("INSERT INTO `ac_bucket_LHCb-Certification_DataOperation` "))
+    self.assertIn("VALUES ( %s,900,2,1,1,1,1,1,1,1,3000,4.0,1.0,2,2,2,2 ), "
+                  "( %s,900,1,1,2,1,1,1,1,1,4000,1.0,0.0,0,1,0,1 ) ON DUPLICATE KEY" % (startTime, startTime),
+                  self.commands[1])
+    self.assertTrue(self.commands[2].startswith("INSERT INTO `ac_rollup_LHCb-Certification_DataOperation_BySource` "))
+    self.assertIn("VALUES ( %s,900,3,1,7000,5.0,1.0,2,3,2,3 ) ON DUPLICATE KEY" % startTime, self.commands[2])
+
+    # The ids of the keys are now cached
+    self.keyQueries = []
+    retVal = self.module.insertRecordsDirectly(self.typeName, records)
+    self.assertTrue(retVal['OK'])
+    self.assertEqual(self.keyQueries, [])
+
+  def test_insertRecordsDirectlyErrors(self):
+    """Test the records which cannot be inserted in bulk"""
+    retVal = self.module.insertRecordsDirectly(self.typeName, [(0, 100, ['putAndRegister', 1000])])
+    self.assertFalse(retVal['OK'])
+    retVal = self.module.insertRecordsDirectly("Unknown", [(0, 100, [])])
+    self.assertFalse(retVal['OK'])
+    self.assertEqual(self.commands, [])
+
+  def test_insertRecordsDirectlyDeadLock(self):
+    """Test that a dead lock aborts the whole bulk insertion, which rolls back the raw records too"""
+    now = int(time.time())
+    keys = ['putAndRegister', 'someone', 'LCG.CERN.cern', 'CERN-USER', 'CERN-DST', 'srm', 'Successful']
+    deadLock = {'OK': False, 'Message': "Deadlock found when trying to get lock; try restarting transaction"}
+    updates = [{'OK': True, 'Value': 1}, {'OK': True, 'Value': 1}, deadLock, {'OK': True, 'Value': 1}]
+    self.module._update = MagicMock(side_effect=lambda cmd, conn=False: updates.pop(0))
+    self.module._query = MagicMock(side_effect=self.query)
+    retVal = self.module.insertRecordsDirectly(self.typeName, [(now - 1000, now - 900, keys + [1, 2, 3, 4, 5, 6, 7])])
+    self.assertFalse(retVal['OK'])
+    # The rollup is not written again, and the transaction is rolled back
+    self.assertEqual(len(updates), 1)
+    self.assertEqual([call[0][0] for call in self.module._query.call_args_list][-2:],
+                     ["START TRANSACTION", "ROLLBACK"])
+
 #############################################################################
 # Test Suite run
 #############################################################################
@@ -397,4 +721,6 @@ ORDER BY startTime" % (expectedStartTime, expectedEndTime)
 if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestCase)
   suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(MakeQuery))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(Rollups))
+  suite.addTest(unittest.defaultTestLoader.loadTestsFromTestCase(BulkInsertion))
   testResult = unittest.TextTestRunner(verbosity=2).run(suite)
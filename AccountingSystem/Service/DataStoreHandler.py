@@ -107,6 +107,63 @@ class DataStoreHandler(RequestHandler):
       return S_ERROR("Error while recalculating buckets for type:\n %s" % "\n ".join(errorsList))
     return S_OK()
 
+  types_createRollup = [basestring, basestring, list]
+
+  def export_createRollup(self, typeName, rollupName, rollupKeys):
+    """
+      Create an empty rollup of a type, to be filled with fillRollup. (Only for all powerful admins)
+      (Bow before me for I am admin! :)
+    """
+    retVal = gConfig.getSections("/DIRAC/Setups")
+    if not retVal['OK']:
+      return retVal
+    errorsList = []
+    for setup in retVal['Value']:
+      retVal = self.__acDB.createRollup(setup, typeName, rollupName, rollupKeys)  # pylint: disable=no-member
+      if not retVal['OK']:
+        errorsList.append(retVal['Message'])
+    if errorsList:
+      return S_ERROR("Error while creating rollup:\n %s" % "\n ".join(errorsList))
+    return S_OK()
+
+  types_fillRollup = [basestring, basestring]
+
+  def export_fillRollup(self, typeName, rollupName):
+    """
+      Fill a rollup with the buckets of its type. (Only for all powerful admins)
+      (Bow before me for I am admin! :)
+    """
+    retVal = gConfig.getSections("/DIRAC/Setups")
+    if not retVal['OK']:
+      return retVal
+    errorsList = []
+    for setup in retVal['Value']:
+      retVal = self.__acDB.fillRollup(setup, typeName, rollupName)  # pylint: disable=no-member
+      if not retVal['OK']:
+        errorsList.append(retVal['Message'])
+    if errorsList:
+      return S_ERROR("Error while filling rollup:\n %s" % "\n ".join(errorsList))
+    return S_OK()
+
+  types_deleteRollup = [basestring, basestring]
+
+  def export_deleteRollup(self, typeName, rollupName):
+    """
+      Remove a rollup of a type from the catalog. (Only for all powerful admins)
+      (Bow before me for I am admin! :)
+    """
+    retVal = gConfig.getSections("/DIRAC/Setups")
+    if not retVal['OK']:
+      return retVal
+    errorsList = []
+    for setup in retVal['Value']:
+      retVal = self.__acDB.deleteRollup(setup, typeName, rollupName)  # pylint: disable=no-member
+      if not retVal['OK']:
+        errorsList.append(retVal['Message'])
+    if errorsList:
+      return S_ERROR("Error while deleting rollup:\n %s" % "\n ".join(errorsList))
+    return S_OK()
+
   types_getRegisteredTypes = []
 
   def export_getRegisteredTypes(self):
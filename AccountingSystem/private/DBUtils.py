@@ -2,6 +2,7 @@
 """
 
 from DIRAC.Core.Utilities import Time
+from DIRAC.AccountingSystem.private.TimeSeries import TimeSeries
 
 
 class DBUtils(object):
@@ -166,8 +167,10 @@ class DBUtils(object):
   def _fillWithZero(self, granularity, startEpoch, endEpoch, dataDict):
     """
     Fill with zeros missing buckets
-      - dataDict = { 'key' : { time1 : value,  time2 : value... }, 'key2'.. }
+      - dataDict = { 'key' : { time1 : value,  time2 : value... }, 'key2'.. } or TimeSeries
     """
+    if isinstance(dataDict, TimeSeries):
+      return dataDict.fillWithZero(granularity, startEpoch, endEpoch)
     startBucketEpoch = startEpoch - startEpoch % granularity
     for key in dataDict:
       currentDict = dataDict[key]
@@ -179,8 +182,10 @@ class DBUtils(object):
   def _getAccumulationMaxValue(self, dataDict):
     """
     Divide by factor the values and get the maximum value
-      - dataDict = { 'key' : { time1 : value,  time2 : value... }, 'key2'.. }
+      - dataDict = { 'key' : { time1 : value,  time2 : value... }, 'key2'.. } or TimeSeries
     """
+    if isinstance(dataDict, TimeSeries):
+      return dataDict.getAccumulationMaxValue()
     maxValue = 0
     maxEpoch = 0
     for key in dataDict:
@@ -213,8 +218,10 @@ class DBUtils(object):
   def _divideByFactor(self, dataDict, factor):
     """
     Divide by factor the values and get the maximum value
-      - dataDict = { 'key' : { time1 : value,  time2 : value... }, 'key2'.. }
+      - dataDict = { 'key' : { time1 : value,  time2 : value... }, 'key2'.. } or TimeSeries
     """
+    if isinstance(dataDict, TimeSeries):
+      return dataDict.divideByFactor(factor)
     maxValue = 0.0
     for key in dataDict:
       currentDict = dataDict[key]
@@ -226,8 +233,10 @@ class DBUtils(object):
   def _accumulate(self, granularity, startEpoch, endEpoch, dataDict):
     """
     Accumulate all the values.
-      - dataDict = { 'key' : { time1 : value,  time2 : value... }, 'key2'.. }
+      - dataDict = { 'key' : { time1 : value,  time2 : value... }, 'key2'.. } or TimeSeries
     """
+    if isinstance(dataDict, TimeSeries):
+      return dataDict.accumulate(granularity, startEpoch, endEpoch)
     startBucketEpoch = startEpoch - startEpoch % granularity
     for key in dataDict:
       currentDict = dataDict[key]
@@ -265,7 +274,10 @@ class DBUtils(object):
 
     :rtype: python:list
 
+    The dataDict can also be a TimeSeries, modified in the same way.
     """
+    if isinstance(dataDict, TimeSeries):
+      return dataDict.stripField(fieldId)
     remainingData = [{}]  # Hack for empty data
     for key in dataDict:
       for timestamp in dataDict[key]:
@@ -296,6 +308,8 @@ class DBUtils(object):
     """
     Get a dict with more than one entry per bucket and list
     """
+    if isinstance(dataDict, TimeSeries):
+      return dataDict.calculateProportionalGauges()
     bucketSums = {}
     # Calculate total sums in buckets
     for key in dataDict:
@@ -1,8 +1,11 @@
 import time
 import copy
 
+import numpy
+
 from DIRAC import S_OK, S_ERROR, gLogger
 from DIRAC.AccountingSystem.private.DBUtils import DBUtils
+from DIRAC.AccountingSystem.private.TimeSeries import TimeSeries
 from DIRAC.Core.Utilities.Plotting import gDataCache
 from DIRAC.Core.Utilities.Plotting.Plots import generateNoDataPlot,\
     generateTimedStackedBarPlot,\
@@ -20,6 +23,9 @@ class BaseReporter(DBUtils):
   _PARAM_CONVERT_TO_GRANULARITY = 'convertToGranularity'
   _VALID_PARAM_CONVERT_TO_GRANULARITY = ('sum', 'average')
   _PARAM_CONSOLIDATION_FUNCTION = "consolidationFunction"
+  # _getTimedData returns a TimeSeries instead of a dictionary, converted to a dictionary with the report data.
+  # Only for the plotters assigning whole keys of the data: the buckets read from a TimeSeries are copies
+  _TIMED_DATA_AS_SERIES = False
 
   _EA_THUMBNAIL = 'thumbnail'
   _EA_WIDTH = 'width'
@@ -155,6 +161,24 @@ class BaseReporter(DBUtils):
     else:
       return (float(total) / float(count)) * 100.0
 
+  @staticmethod
+  def _averageArrayConsolidation(total, count):
+    return numpy.where(count == 0, 0., total / numpy.where(count == 0, 1., count))
+
+  @staticmethod
+  def _efficiencyArrayConsolidation(total, count):
+    return numpy.where(count == 0, 0., (total / numpy.where(count == 0, 1., count)) * 100.0)
+
+  def _getArrayConsolidation(self, functor):
+    """ Get the version applied to arrays of a consolidation function of this class, None for other functions
+    """
+    for funcName, arrayFunc in (('_averageConsolidation', self._averageArrayConsolidation),
+                                ('_efficiencyConsolidation', self._efficiencyArrayConsolidation)):
+      # Not for the functions overridden by the derived classes
+      if getattr(functor, '__func__', None) is BaseReporter.__dict__[funcName]:
+        return arrayFunc
+    return None
+
   def generate(self, reportRequest):
     reportRequest['groupingFields'] = self._translateGrouping(reportRequest['grouping'])
     reportHash = reportRequest['hash']
@@ -197,7 +221,17 @@ class BaseReporter(DBUtils):
       funcObj = getattr(self, funcName)
     except Exception:
       return S_ERROR("Report %s is not defined" % reportRequest['reportName'])
-    return gDataCache.getReportData(reportRequest, reportHash, funcObj)
+
+    def reportFunc(reportRequest):
+      """ Convert the TimeSeries of the report data to dictionaries, which are cached and plotted """
+      result = funcObj(reportRequest)
+      if result['OK'] and isinstance(result['Value'], dict):
+        for key, value in result['Value'].items():
+          if isinstance(value, TimeSeries):
+            result['Value'][key] = value.toDict()
+      return result
+
+    return gDataCache.getReportData(reportRequest, reportHash, reportFunc)
 
   def __generatePlotForReport(self, reportRequest, reportHash, reportData):
     funcName = "_plot%s" % reportRequest['reportName']
@@ -238,8 +272,17 @@ class BaseReporter(DBUtils):
                                         )
     if not retVal['OK']:
       return retVal
-    dataDict = self._groupByField(0, retVal['Value'])
     coarsestGranularity = self._getBucketLengthForTime(self._typeName, startTime)
+    if self._TIMED_DATA_AS_SERIES:
+      # Transform all the buckets at once, None values count as 0 in any case
+      dataDict = TimeSeries.fromBuckets(retVal['Value'], coarsestGranularity,
+                                        average=metadataDict[self._PARAM_CONVERT_TO_GRANULARITY] == "average")
+      if self._PARAM_CONSOLIDATION_FUNCTION in metadataDict:
+        dataDict = self._executeConsolidation(metadataDict[self._PARAM_CONSOLIDATION_FUNCTION], dataDict)
+      if metadataDict[self._PARAM_CALCULATE_PROPORTIONAL_GAUGES]:
+        dataDict = self._calculateProportionalGauges(dataDict)
+      return S_OK((dataDict, coarsestGranularity))
+    dataDict = self._groupByField(0, retVal['Value'])
     # Transform!
     for keyField in dataDict:
       if metadataDict[self._PARAM_CHECK_FOR_NONE]:
@@ -256,6 +299,8 @@ class BaseReporter(DBUtils):
     return S_OK((dataDict, coarsestGranularity))
 
   def _executeConsolidation(self, functor, dataDict):
+    if isinstance(dataDict, TimeSeries):
+      return dataDict.consolidate(functor, self._getArrayConsolidation(functor))
     for timeKey in dataDict:
       dataDict[timeKey] = [functor(*dataDict[timeKey])]
     return dataDict
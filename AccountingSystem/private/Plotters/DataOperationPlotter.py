@@ -8,6 +8,7 @@ class DataOperationPlotter(BaseReporter):
 
   _typeName = "DataOperation"
   _typeKeyFields = [dF[0] for dF in DataOperation().definitionKeyFields]
+  _TIMED_DATA_AS_SERIES = True
 
   def _translateGrouping(self, grouping):
     if grouping == "Channel":
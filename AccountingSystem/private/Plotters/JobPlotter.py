@@ -8,6 +8,7 @@ class JobPlotter(BaseReporter):
 
   _typeName = "Job"
   _typeKeyFields = [dF[0] for dF in Job().definitionKeyFields]
+  _TIMED_DATA_AS_SERIES = True
 
   def _translateGrouping(self, grouping):
     if grouping == "Country":
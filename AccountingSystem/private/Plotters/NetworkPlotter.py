@@ -20,6 +20,7 @@ class NetworkPlotter(BaseReporter):
 
   _typeName = "Network"
   _typeKeyFields = [dF[0] for dF in Network().definitionKeyFields]
+  _TIMED_DATA_AS_SERIES = True
 
   _reportPacketLossRateName = "Packet loss rate"
 
@@ -8,6 +8,7 @@ class PilotPlotter(BaseReporter):
 
   _typeName = "Pilot"
   _typeKeyFields = [dF[0] for dF in Pilot().definitionKeyFields]
+  _TIMED_DATA_AS_SERIES = True
 
   def _reportCumulativeNumberOfJobs(self, reportRequest):
     selectFields = (self._getSelectStringForGrouping(reportRequest['groupingFields']) + ", %s, %s, SUM(%s)",
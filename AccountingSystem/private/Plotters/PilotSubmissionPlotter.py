@@ -13,6 +13,7 @@ class PilotSubmissionPlotter(BaseReporter):
 
   _typeName = "PilotSubmission"
   _typeKeyFields = [dF[0] for dF in PilotSubmission().definitionKeyFields]
+  _TIMED_DATA_AS_SERIES = True
 
   def _reportSubmission(self, reportRequest):
     '''
@@ -18,6 +18,7 @@ class StorageOccupancyPlotter(BaseReporter):
 
   _typeName = "StorageOccupancy"
   _typeKeyFields = [dF[0] for dF in StorageOccupancy().definitionKeyFields]
+  _TIMED_DATA_AS_SERIES = True
 
   # .............................................................................
   # Generic Reporter
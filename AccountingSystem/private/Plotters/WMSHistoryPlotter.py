@@ -8,6 +8,7 @@ class WMSHistoryPlotter(BaseReporter):
 
   _typeName = "WMSHistory"
   _typeKeyFields = [dF[0] for dF in WMSHistory().definitionKeyFields]
+  _TIMED_DATA_AS_SERIES = True
 
   def _translateGrouping(self, grouping):
     if grouping == "Country":
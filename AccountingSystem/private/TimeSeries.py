@@ -0,0 +1,275 @@
+""" Columnar representation of the bucketed data of the accounting reports
+
+    The data of a timed report, { key : { bucket epoch : value or list of values } }, is held in arrays:
+    the keys, the sorted epochs of the buckets of all the keys, and for each key and bucket the values
+    of the fields and whether the bucket is present for the key. The values of the absent buckets are 0.
+
+    The rebinning of the buckets of the DB to the granularity of the report, the consolidation, the zero
+    filling, the accumulation and the scaling are then done on all the buckets at once. The TimeSeries
+    behaves as the dictionary of dictionaries for reading and assigning whole keys, and toDict() gives
+    the dictionary returned to the clients.
+"""
+
+import numpy
+
+__RCSID__ = "$Id$"
+
+
+class TimeSeries(object):
+  """ Values of one or several fields per key and per bucket of time
+  """
+
+  def __init__(self, keys=None, epochs=None, values=None, present=None, scalar=False):
+    """ c'tor
+
+        :param list keys: keys, e.g. the values of the grouping field
+        :param epochs: sorted numpy array of the epochs of the buckets
+        :param values: numpy array ( keys x buckets x fields ) of the values
+        :param present: boolean numpy array ( keys x buckets ), True for the buckets holding data
+        :param bool scalar: True if the buckets hold a single value instead of a list of values
+    """
+    self.__keys = list(keys or [])
+    self.__keyIndex = dict((key, iKey) for iKey, key in enumerate(self.__keys))
+    self.epochs = numpy.zeros(0, dtype=numpy.int64) if epochs is None else epochs
+    self.values = numpy.zeros((len(self.__keys), len(self.epochs), 0)) if values is None else values
+    if present is None:
+      present = numpy.zeros(self.values.shape[:2], dtype=bool)
+    self.present = present
+    self.scalar = scalar
+
+  @classmethod
+  def fromBuckets(cls, bucketsData, granularity, average=False):
+    """ Rebin buckets of any length to the granularity, as DBUtils._sumToGranularity and
+        DBUtils._averageToGranularity do for each key. None values count as 0.
+
+        :param list bucketsData: list of rows ( key, start epoch, bucket length, value1, ..., valueN )
+        :param int granularity: length of the buckets of the report
+        :param bool average: average the values of the buckets instead of summing them
+        :return: TimeSeries
+    """
+    if not bucketsData:
+      return cls()
+    data = numpy.array(bucketsData, dtype=object)
+    keyIndex = {}
+    keyCodes = numpy.array([keyIndex.setdefault(key, len(keyIndex)) for key in data[:, 0].tolist()],
+                           dtype=numpy.int64)
+    keys = sorted(keyIndex, key=keyIndex.get)
+    starts = data[:, 1].astype(numpy.int64)
+    lengths = data[:, 2].astype(numpy.int64)
+    rowValues = data[:, 3:]
+    rowValues[numpy.equal(rowValues, None)] = 0
+    rowValues = rowValues.astype(float)
+
+    # Each bucket is split in pieces, one per bucket of the report it overlaps. The buckets having
+    # the length of the granularity are kept as they are, even if they are not aligned
+    exact = lengths == granularity
+    single = exact | (lengths == 0)
+    spanStarts = numpy.where(exact, starts, starts - starts % granularity)
+    ends = starts + lengths
+    numPieces = numpy.where(single, 1, (ends - spanStarts + granularity - 1) // granularity)
+    numPieces = numpy.maximum(numPieces, 0)
+    rows = numpy.repeat(numpy.arange(len(starts)), numPieces)
+    pieces = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(numPieces) - numPieces, numPieces)
+    pieceEpochs = spanStarts[rows] + pieces * granularity
+    overlaps = numpy.minimum(pieceEpochs + granularity, ends[rows]) - numpy.maximum(pieceEpochs, starts[rows])
+    proportions = numpy.where(single[rows], 1., overlaps / numpy.maximum(lengths[rows], 1).astype(float))
+
+    epochs, epochIndex = numpy.unique(pieceEpochs, return_inverse=True)
+    numCells = len(keys) * len(epochs)
+    cells = keyCodes[rows] * len(epochs) + epochIndex
+    shape = (len(keys), len(epochs))
+    present = numpy.bincount(cells, minlength=numCells).reshape(shape) > 0
+    values = numpy.zeros(shape + (rowValues.shape[1],))
+    for iField in range(rowValues.shape[1]):
+      values[:, :, iField] = numpy.bincount(cells, weights=rowValues[rows, iField] * proportions,
+                                            minlength=numCells).reshape(shape)
+    if average:
+      weights = numpy.bincount(cells, weights=proportions, minlength=numCells).reshape(shape)
+      values[present] /= weights[present][:, numpy.newaxis]
+    return cls(keys, epochs, values, present)
+
+  @classmethod
+  def fromDict(cls, dataDict):
+    """ Build a TimeSeries from { key : { epoch : value or list of values } }
+    """
+    series = cls()
+    for key in dataDict:
+      series[key] = dataDict[key]
+    return series
+
+  def toDict(self):
+    """ :return: { key : { epoch : value or list of values } } for the present buckets
+    """
+    return dict((key, self[key]) for key in self.__keys)
+
+  # Dictionary interface, the buckets of a key are read and assigned as a whole
+
+  def __len__(self):
+    return len(self.__keys)
+
+  def __iter__(self):
+    return iter(list(self.__keys))
+
+  def __contains__(self, key):
+    return key in self.__keyIndex
+
+  def keys(self):
+    return list(self.__keys)
+
+  def items(self):
+    return [(key, self[key]) for key in self.__keys]
+
+  def __getitem__(self, key):
+    iKey = self.__keyIndex[key]
+    columns = numpy.nonzero(self.present[iKey])[0]
+    epochs = self.epochs[columns].tolist()
+    if self.scalar:
+      return dict(zip(epochs, self.values[iKey, columns, 0].tolist()))
+    return dict(zip(epochs, self.values[iKey, columns].tolist()))
+
+  def __setitem__(self, key, bucketsDict):
+    epochs = sorted(bucketsDict)
+    values = [bucketsDict[epoch] for epoch in epochs]
+    if not self.__keys and values:
+      # The shape of the values is given by the first assigned key
+      self.scalar = not isinstance(values[0], (list, tuple))
+      numFields = 1 if self.scalar else len(values[0])
+      self.values = numpy.zeros((0, len(self.epochs), numFields))
+    values = numpy.array(values, dtype=float).reshape((len(epochs), self.values.shape[2]))
+    epochs = numpy.array(epochs, dtype=numpy.int64)
+    self.__addEpochs(epochs)
+    if key not in self.__keyIndex:
+      self.__keyIndex[key] = len(self.__keys)
+      self.__keys.append(key)
+      self.values = numpy.concatenate((self.values, numpy.zeros((1,) + self.values.shape[1:])))
+      self.present = numpy.concatenate((self.present, numpy.zeros((1, len(self.epochs)), dtype=bool)))
+    iKey = self.__keyIndex[key]
+    columns = numpy.searchsorted(self.epochs, epochs)
+    self.values[iKey] = 0
+    self.values[iKey, columns] = values
+    self.present[iKey] = False
+    self.present[iKey, columns] = True
+
+  def __addEpochs(self, epochs):
+    """ Add buckets, absent for all the keys, to the ones of the series
+
+        :return: positions of the given epochs in the buckets of the series
+    """
+    newEpochs = numpy.union1d(self.epochs, epochs).astype(numpy.int64)
+    if len(newEpochs) != len(self.epochs):
+      columns = numpy.searchsorted(newEpochs, self.epochs)
+      values = numpy.zeros((len(self.__keys), len(newEpochs), self.values.shape[2]))
+      values[:, columns] = self.values
+      present = numpy.zeros((len(self.__keys), len(newEpochs)), dtype=bool)
+      present[:, columns] = self.present
+      self.epochs, self.values, self.present = newEpochs, values, present
+    return numpy.searchsorted(self.epochs, epochs)
+
+  # Transformations, as the methods of DBUtils with the same names
+
+  def consolidate(self, functor, arrayFunctor=None):
+    """ Replace the values of each bucket by [ functor( value1, ..., valueN ) ]
+
+        :param functor: function of the values of a bucket
+        :param arrayFunctor: same function applied to arrays of values, used if given
+        :return: self
+    """
+    if arrayFunctor is not None:
+      with numpy.errstate(divide='ignore', invalid='ignore'):
+        consolidated = arrayFunctor(*[self.values[:, :, iField] for iField in range(self.values.shape[2])])
+      consolidated = numpy.where(self.present, consolidated, 0.)
+    else:
+      consolidated = numpy.zeros(self.present.shape)
+      for iKey, iEpoch in zip(*numpy.nonzero(self.present)):
+        consolidated[iKey, iEpoch] = functor(*self.values[iKey, iEpoch].tolist())
+    self.values = consolidated[:, :, numpy.newaxis]
+    return self
+
+  def calculateProportionalGauges(self):
+    """ Same as DBUtils._calculateProportionalGauges
+
+        :return: self
+    """
+    ratios = numpy.zeros(self.present.shape)
+    if self.present.any():
+      if self.values.shape[2] < 2:
+        raise Exception(
+            "DataDict must be of the type { <key>:{ <timeKey> : [ field1, field2, ..] } }. With at least two fields")
+      with numpy.errstate(divide='raise', invalid='raise'):
+        ratios[self.present] = self.values[:, :, 0][self.present] / self.values[:, :, 1][self.present]
+      totals = self.values[:, :, 0].sum(axis=0)
+      counts = self.values[:, :, 1].sum(axis=0)
+      factors = numpy.zeros(len(self.epochs))
+      nonZero = totals != 0
+      factors[nonZero] = (totals[nonZero] / counts[nonZero]) / ratios.sum(axis=0)[nonZero]
+      ratios *= factors
+    self.values = ratios[:, :, numpy.newaxis]
+    return self
+
+  def stripField(self, fieldId):
+    """ Same as DBUtils.stripDataField: keep the field fieldId as single value of the buckets and
+        sum the other fields of all the keys
+
+        :return: list of { epoch : sum of a field }
+    """
+    if not self.present.any():
+      self.values = numpy.zeros(self.present.shape + (1,))
+      self.scalar = True
+      return [{}]
+    numFields = self.values.shape[2]
+    columns = numpy.nonzero(self.present.any(axis=0))[0]
+    epochs = self.epochs[columns].tolist()
+    remainingData = []
+    for iField in range(numFields):
+      if iField != fieldId:
+        remainingData.append(dict(zip(epochs, self.values[:, columns, iField].sum(axis=0).tolist())))
+    # As DBUtils.stripDataField, which leaves two empty dictionaries at the end
+    remainingData.extend([{}, {}])
+    self.values = self.values[:, :, fieldId:fieldId + 1]
+    self.scalar = True
+    return remainingData
+
+  def __bucketColumns(self, granularity, startEpoch, endEpoch):
+    """ Add the missing buckets of the report and return their positions
+    """
+    startBucketEpoch = startEpoch - startEpoch % granularity
+    return self.__addEpochs(numpy.arange(int(startBucketEpoch), int(endEpoch), granularity, dtype=numpy.int64))
+
+  def fillWithZero(self, granularity, startEpoch, endEpoch):
+    """ Same as DBUtils._fillWithZero
+
+        :return: self
+    """
+    columns = self.__bucketColumns(granularity, startEpoch, endEpoch)
+    self.present[:, columns] = True
+    return self
+
+  def accumulate(self, granularity, startEpoch, endEpoch):
+    """ Same as DBUtils._accumulate
+
+        :return: self
+    """
+    columns = self.__bucketColumns(granularity, startEpoch, endEpoch)
+    self.values[:, columns] = numpy.cumsum(self.values[:, columns], axis=1)
+    self.present[:, columns] = True
+    return self
+
+  def divideByFactor(self, factor):
+    """ Same as DBUtils._divideByFactor
+
+        :return: self, maximum value
+    """
+    self.values /= float(factor)
+    if not self.present.any():
+      return self, 0.0
+    return self, max(0.0, float(self.values[self.present].max()))
+
+  def getAccumulationMaxValue(self):
+    """ Same as DBUtils._getAccumulationMaxValue: sum of the values of the last bucket
+
+        :return: number
+    """
+    columns = numpy.nonzero(self.present.any(axis=0))[0]
+    if not len(columns) or self.epochs[columns[-1]] <= 0:
+      return 0
+    return float(self.values[:, columns[-1], 0].sum())
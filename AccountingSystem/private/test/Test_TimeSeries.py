@@ -0,0 +1,130 @@
+""" Test the TimeSeries of the accounting reports against the dictionaries of DBUtils
+"""
+
+# pylint: disable=protected-access
+
+import copy
+import random
+
+import pytest
+
+from DIRAC.AccountingSystem.private.DBUtils import DBUtils
+from DIRAC.AccountingSystem.private.TimeSeries import TimeSeries
+
+GRANULARITY = 3600
+START = 1500000000
+END = START + 48 * GRANULARITY
+
+
+def averageConsolidation(total, count):
+  return float(total) / float(count) if count else 0
+
+
+def makeRows(numKeys=5, numRows=300, numFields=2, seed=0):
+  """ Rows ( key, start, length, values ) with buckets aligned or not, longer or shorter than the granularity """
+  rand = random.Random(seed)
+  rows = []
+  for _ in range(numRows):
+    length = rand.choice([GRANULARITY, GRANULARITY, 900, 86400, 0, 5000])
+    start = START + rand.randrange(0, 40 * GRANULARITY, 300)
+    values = [rand.choice([None, rand.randint(0, 100), rand.random() * 1000]) for _ in range(numFields - 1)]
+    rows.append(['Site%d' % rand.randrange(numKeys), start, length] + values + [rand.randint(1, 20)])
+  return sorted(rows, key=lambda row: row[1])
+
+
+def dictTimedData(rows, average=False):
+  """ What BaseReporter._getTimedData does with dictionaries """
+  dbUtils = DBUtils(None, None)
+  dataDict = dbUtils._groupByField(0, copy.deepcopy(rows))
+  for key in dataDict:
+    if average:
+      dataDict[key] = dbUtils._averageToGranularity(GRANULARITY, dataDict[key])
+    else:
+      dataDict[key] = dbUtils._sumToGranularity(GRANULARITY, dataDict[key])
+  return dataDict
+
+
+def assertSameData(series, dataDict):
+  seriesDict = series.toDict() if isinstance(series, TimeSeries) else series
+  assert sorted(seriesDict) == sorted(dataDict)
+  for key in dataDict:
+    assert sorted(seriesDict[key]) == sorted(dataDict[key])
+    for epoch, value in dataDict[key].items():
+      assert seriesDict[key][epoch] == pytest.approx(value, rel=1e-12, abs=1e-12)
+
+
+@pytest.mark.parametrize("average", [False, True])
+def test_fromBuckets(average):
+  rows = makeRows()
+  assertSameData(TimeSeries.fromBuckets(rows, GRANULARITY, average=average), dictTimedData(rows, average=average))
+
+
+def test_empty():
+  dbUtils = DBUtils(None, None)
+  series = TimeSeries.fromBuckets([], GRANULARITY)
+  assert not series
+  assert dbUtils.stripDataField(series, 0) == [{}]
+  assert dbUtils._getAccumulationMaxValue(series) == 0
+  assert series.toDict() == {}
+
+
+def test_reportOperations():
+  """ The sequence of operations of most of the plotters, e.g. JobPlotter._reportCPUUsed """
+  dbUtils = DBUtils(None, None)
+  rows = makeRows(numFields=3)
+  series = TimeSeries.fromBuckets(rows, GRANULARITY)
+  dataDict = dictTimedData(rows)
+
+  strippedSeries = dbUtils.stripDataField(series, 0)
+  strippedDict = dbUtils.stripDataField(dataDict, 0)
+  assert len(strippedSeries) == len(strippedDict)
+  for remainingSeries, remainingDict in zip(strippedSeries, strippedDict):
+    assertSameData({'total': remainingSeries}, {'total': remainingDict})
+  assertSameData(series, dataDict)
+  for data in (series, dataDict):
+    dbUtils._fillWithZero(GRANULARITY, START + 100, END, data)
+    dbUtils._accumulate(GRANULARITY, START + 100, END, data)
+  assertSameData(series, dataDict)
+  assert dbUtils._getAccumulationMaxValue(series) == pytest.approx(dbUtils._getAccumulationMaxValue(dataDict))
+  graphSeries, maxSeries = dbUtils._divideByFactor(copy.deepcopy(series), 3600)
+  graphDict, maxDict = dbUtils._divideByFactor(copy.deepcopy(dataDict), 3600)
+  assert maxSeries == pytest.approx(maxDict)
+  assertSameData(graphSeries, graphDict)
+
+
+@pytest.mark.parametrize("arrayFunctor", [None,
+                                          lambda total, count: total / count])
+def test_consolidate(arrayFunctor):
+  rows = makeRows()
+  series = TimeSeries.fromBuckets(rows, GRANULARITY).consolidate(averageConsolidation, arrayFunctor)
+  dataDict = dictTimedData(rows)
+  for key in dataDict:
+    for epoch in dataDict[key]:
+      dataDict[key][epoch] = [averageConsolidation(*dataDict[key][epoch])]
+  assertSameData(series, dataDict)
+
+
+def test_calculateProportionalGauges():
+  dbUtils = DBUtils(None, None)
+  rows = makeRows()
+  series = dbUtils._calculateProportionalGauges(TimeSeries.fromBuckets(rows, GRANULARITY))
+  assertSameData(series, dbUtils._calculateProportionalGauges(dictTimedData(rows)))
+
+
+def test_dictionaryInterface():
+  """ The plotters add the total of the keys as another key """
+  dbUtils = DBUtils(None, None)
+  series = TimeSeries.fromBuckets(makeRows(), GRANULARITY)
+  dbUtils.stripDataField(series, 0)
+  totalSeries = TimeSeries.fromBuckets([['Total'] + row[1:] for row in makeRows()], GRANULARITY)
+  dbUtils.stripDataField(totalSeries, 0)
+  dataDict = series.toDict()
+  for key in totalSeries:
+    series[key] = totalSeries[key]
+    dataDict[key] = totalSeries[key]
+  assert len(series) == 6
+  assert 'Total' in series
+  assertSameData(series, dataDict)
+  series['Empty'] = {}
+  assert series['Empty'] == {}
+  assert TimeSeries.fromDict(dataDict).toDict() == dataDict
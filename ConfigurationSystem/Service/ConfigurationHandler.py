@@ -57,6 +57,24 @@ class ConfigurationHandler(RequestHandler):
       retDict['data'] = gServiceInterface.getCompressedConfigurationData()
     return S_OK(retDict)
 
+  types_getDataDeltasIfNewer = [basestring]
+
+  @classmethod
+  def export_getDataDeltasIfNewer(cls, sClientVersion):
+    """ Same as getCompressedDataIfNewer, but if the server knows the modifications done since
+        the client version, they are sent in 'deltas' instead of the whole configuration in 'data'
+    """
+    sVersion = gServiceInterface.getVersion()
+    retDict = {'newestVersion': sVersion}
+    if sClientVersion < sVersion:
+      versionDeltas = gServiceInterface.getVersionDeltas(sClientVersion)
+      if versionDeltas:
+        retDict['newestVersion'] = versionDeltas[-1][1]
+        retDict['deltas'] = versionDeltas
+      else:
+        retDict['data'] = gServiceInterface.getCompressedConfigurationData()
+    return S_OK(retDict)
+
   types_publishSlaveServer = [basestring]
 
   @classmethod
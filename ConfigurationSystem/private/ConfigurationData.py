@@ -1,4 +1,12 @@
 """ ConfigurationData module is the base for cfg files management
+
+    The lookups in the merged configuration, done by gConfig, are served by a flattened
+    index of the options and sections paths. The index is rebuilt by sync() for each new
+    merged configuration and replaced in one assignment, so reading it needs no lock.
+
+    The configuration servers keep the modifications of the remote configuration between its
+    last versions, so that the clients which are only a few versions behind can be updated with
+    them instead of downloading and parsing the whole configuration.
 """
 
 from __future__ import print_function
@@ -34,6 +42,12 @@ class ConfigurationData(object):
     self.localCFG = CFG()
     self.remoteCFG = CFG()
     self.mergedCFG = CFG()
+    # ( CFG, { option path: value }, { section path: CFG } ) of the merged configuration
+    self.__pathIndex = (None, {}, {})
+    # [ ( fromVersion, toVersion, modifications ) ] of the last versions of the remote configuration
+    self.__versionDeltas = []
+    # ( version, CFG ) copy of the remote configuration when its version was last changed
+    self.__versionSnapshot = None
     self.remoteServerList = []
     if loadDefaultCFG:
       defaultCFGFile = os.path.join(DIRAC.rootPath, "etc", "dirac.cfg")
@@ -49,6 +63,7 @@ class ConfigurationData(object):
   def sync(self):
     gLogger.debug("Updating configuration internals")
     self.mergedCFG = self.remoteCFG.mergeWith(self.localCFG)
+    self.__pathIndex = self.__buildPathIndex(self.mergedCFG)
     self.remoteServerList = []
     localServers = self.extractOptionFromCFG("%s/Servers" % self.configurationPath,
                                              self.localCFG,
@@ -62,6 +77,76 @@ class ConfigurationData(object):
       self.remoteServerList.extend(List.fromChar(remoteServers, ","))
     self.remoteServerList = List.uniqueElements(self.remoteServerList)
     self.__compressedConfigurationData = None
+    if self._isService:
+      self.__recordVersionDelta()
+
+  def __recordVersionDelta(self):
+    """ Keep the modifications of the remote configuration since the previous version
+        when its version has changed
+    """
+    maxDeltas = self.getMaxVersionDeltas()
+    if not maxDeltas:
+      self.__versionDeltas = []
+      self.__versionSnapshot = None
+      return
+    version = self.extractOptionFromCFG("%s/Version" % self.configurationPath,
+                                        self.remoteCFG,
+                                        disableDangerZones=True)
+    if not version:
+      return
+    if self.__versionSnapshot is not None:
+      previousVersion, previousCFG = self.__versionSnapshot
+      if previousVersion == version:
+        return
+      if previousVersion < version:
+        delta = (previousVersion, version, previousCFG.getModifications(self.remoteCFG))
+        self.__versionDeltas = (self.__versionDeltas + [delta])[-maxDeltas:]
+      else:
+        self.__versionDeltas = []
+    self.__versionSnapshot = (version, self.remoteCFG.clone())
+
+  def getVersionDeltas(self, sinceVersion):
+    """ Get the modifications of the remote configuration from sinceVersion to the current version
+
+        :param str sinceVersion: version of the remote configuration of the client
+        :return: list of ( fromVersion, toVersion, modifications ) to apply in order,
+                 or None if the modifications since this version are not known
+    """
+    versionDeltas = self.__versionDeltas
+    for i, delta in enumerate(versionDeltas):
+      if delta[0] == sinceVersion:
+        return versionDeltas[i:]
+    return None
+
+  def applyRemoteCFGDeltas(self, versionDeltas):
+    """ Update the remote configuration with the modifications received from a configuration server
+
+        :param list versionDeltas: ( fromVersion, toVersion, modifications ) as returned by getVersionDeltas
+        :return: S_OK/S_ERROR
+    """
+    self.dangerZoneStart()
+    try:
+      newRemoteCFG = self.remoteCFG.clone()
+    finally:
+      self.dangerZoneEnd()
+    version = self.getVersion(newRemoteCFG)
+    for fromVersion, toVersion, modList in versionDeltas:
+      if fromVersion != version:
+        return S_ERROR("Modifications are for version %s, configuration is at version %s" % (fromVersion, version))
+      try:
+        result = newRemoteCFG.applyModifications(modList)
+      except Exception as e:
+        result = S_ERROR(repr(e))
+      if not result['OK']:
+        return S_ERROR("Cannot apply modifications to version %s: %s" % (toVersion, result['Message']))
+      version = self.getVersion(newRemoteCFG)
+      if version != toVersion:
+        return S_ERROR("Modifications led to version %s instead of %s" % (version, toVersion))
+    self.lock()
+    self.remoteCFG = newRemoteCFG
+    self.unlock()
+    self.sync()
+    return S_OK()
 
   def loadFile(self, fileName):
     try:
@@ -108,9 +193,57 @@ class ConfigurationData(object):
     self.unlock()
     self.sync()
 
+  @staticmethod
+  def __normalizePath(path):
+    return "/" + "/".join([level.strip() for level in path.split("/") if level.strip() != ""])
+
+  @staticmethod
+  def __buildPathIndex(cfg):
+    """ Flatten the options and sections of a CFG
+
+        :return: ( cfg, { option path: value }, { section path: CFG } )
+    """
+    options = {}
+    sections = {"/": cfg}
+    toIndex = [("", cfg)]
+    while toIndex:
+      path, sectionCFG = toIndex.pop()
+      for option in sectionCFG.listOptions():
+        options["%s/%s" % (path, option)] = sectionCFG[option]
+      for section in sectionCFG.listSections():
+        sectionPath = "%s/%s" % (path, section)
+        sections[sectionPath] = sectionCFG[section]
+        toIndex.append((sectionPath, sectionCFG[section]))
+    return cfg, options, sections
+
+  def __getPathIndex(self):
+    """ Get the index of the merged configuration. It is rebuilt if the merged configuration
+        has been replaced without calling sync()
+    """
+    pathIndex = self.__pathIndex
+    if pathIndex[0] is not self.mergedCFG:
+      pathIndex = self.__buildPathIndex(self.mergedCFG)
+      self.__pathIndex = pathIndex
+    return pathIndex
+
+  def __getIndexedSection(self, path):
+    sections = self.__getPathIndex()[2]
+    if path in sections:
+      return sections[path]
+    return sections.get(self.__normalizePath(path))
+
   def getCommentFromCFG(self, path, cfg=False):
-    if not cfg:
-      cfg = self.mergedCFG
+    if not cfg or cfg is self.mergedCFG:
+      levelList = [level.strip() for level in path.split("/") if level.strip() != ""]
+      if not levelList:
+        return None
+      sectionCFG = self.__getIndexedSection("/" + "/".join(levelList[:-1]))
+      if sectionCFG is None:
+        return None
+      try:
+        return sectionCFG.getComment(levelList[-1])
+      except Exception:
+        return None
     self.dangerZoneStart()
     try:
       levelList = [level.strip() for level in path.split("/") if level.strip() != ""]
@@ -122,8 +255,11 @@ class ConfigurationData(object):
     return self.dangerZoneEnd(None)
 
   def getSectionsFromCFG(self, path, cfg=False, ordered=False):
-    if not cfg:
-      cfg = self.mergedCFG
+    if not cfg or cfg is self.mergedCFG:
+      sectionCFG = self.__getIndexedSection(path)
+      if sectionCFG is None:
+        return None
+      return sectionCFG.listSections(ordered)
     self.dangerZoneStart()
     try:
       levelList = [level.strip() for level in path.split("/") if level.strip() != ""]
@@ -135,8 +271,11 @@ class ConfigurationData(object):
     return self.dangerZoneEnd(None)
 
   def getOptionsFromCFG(self, path, cfg=False, ordered=False):
-    if not cfg:
-      cfg = self.mergedCFG
+    if not cfg or cfg is self.mergedCFG:
+      sectionCFG = self.__getIndexedSection(path)
+      if sectionCFG is None:
+        return None
+      return sectionCFG.listOptions(ordered)
     self.dangerZoneStart()
     try:
       levelList = [level.strip() for level in path.split("/") if level.strip() != ""]
@@ -148,8 +287,11 @@ class ConfigurationData(object):
     return self.dangerZoneEnd(None)
 
   def extractOptionFromCFG(self, path, cfg=False, disableDangerZones=False):
-    if not cfg:
-      cfg = self.mergedCFG
+    if not cfg or cfg is self.mergedCFG:
+      options = self.__getPathIndex()[1]
+      if path in options:
+        return options[path]
+      return options.get(self.__normalizePath(path))
     if not disableDangerZones:
       self.dangerZoneStart()
     try:
@@ -237,6 +379,12 @@ class ConfigurationData(object):
     except BaseException:
       return 600
 
+  def getMaxVersionDeltas(self):
+    try:
+      return int(self.extractOptionFromCFG("%s/VersionDeltas" % self.configurationPath, self.mergedCFG))
+    except BaseException:
+      return 10
+
   def mergingEnabled(self):
     try:
       val = self.extractOptionFromCFG("%s/EnableAutoMerge" % self.configurationPath, self.mergedCFG)
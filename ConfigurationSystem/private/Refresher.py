@@ -19,16 +19,29 @@ from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 def _updateFromRemoteLocation(serviceClient):
   gLogger.debug("", "Trying to refresh from %s" % serviceClient.serviceURL)
   localVersion = gConfigurationData.getVersion()
-  retVal = serviceClient.getCompressedDataIfNewer(localVersion)
-  if retVal['OK']:
-    dataDict = retVal['Value']
-    if localVersion < dataDict['newestVersion']:
-      gLogger.debug("New version available", "Updating to version %s..." % dataDict['newestVersion'])
+  retVal = serviceClient.getDataDeltasIfNewer(localVersion)
+  if not retVal['OK'] and retVal['Message'].startswith("Unknown method"):
+    # The server does not send the modifications between versions
+    retVal = serviceClient.getCompressedDataIfNewer(localVersion)
+  if not retVal['OK']:
+    return retVal
+  dataDict = retVal['Value']
+  if localVersion < dataDict['newestVersion']:
+    gLogger.debug("New version available", "Updating to version %s..." % dataDict['newestVersion'])
+    if 'deltas' in dataDict:
+      result = gConfigurationData.applyRemoteCFGDeltas(dataDict['deltas'])
+      if not result['OK']:
+        gLogger.warn("Cannot apply the configuration modifications, getting the whole configuration",
+                     result['Message'])
+        retVal = serviceClient.getCompressedDataIfNewer(localVersion)
+        if not retVal['OK']:
+          return retVal
+        dataDict = retVal['Value']
+    if 'data' in dataDict:
       gConfigurationData.loadRemoteCFGFromCompressedMem(dataDict['data'])
-      gLogger.debug("Updated to version %s" % gConfigurationData.getVersion())
-      gEventDispatcher.triggerEvent("CSNewVersion", dataDict['newestVersion'], threaded=True)
-    return S_OK()
-  return retVal
+    gLogger.debug("Updated to version %s" % gConfigurationData.getVersion())
+    gEventDispatcher.triggerEvent("CSNewVersion", dataDict['newestVersion'], threaded=True)
+  return S_OK()
 
 
 class Refresher(threading.Thread):
@@ -261,6 +261,9 @@ class ServiceInterface(threading.Thread):
   def getVersion(self):
     return gConfigurationData.getVersion()
 
+  def getVersionDeltas(self, sinceVersion):
+    return gConfigurationData.getVersionDeltas(sinceVersion)
+
   def getCommitHistory(self):
     files = self.__getCfgBackups(gConfigurationData.getBackupDir())
     backups = [".".join(fileName.split(".")[1:-1]).split("@") for fileName in files]
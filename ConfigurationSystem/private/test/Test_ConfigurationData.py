@@ -0,0 +1,116 @@
+""" Unit tests for the lookups in ConfigurationData
+"""
+
+from __future__ import absolute_import
+import pytest
+
+from diraccfg import CFG
+
+from DIRAC.ConfigurationSystem.private.ConfigurationData import ConfigurationData
+
+__RCSID__ = "$Id$"
+
+TEST_CFG = """
+DIRAC
+{
+  Setup = Test
+  Configuration
+  {
+    Servers = dips://cs1.example.org:9135/Configuration/Server
+  }
+}
+Systems
+{
+  WorkloadManagement
+  {
+    Test
+    {
+      # The matcher
+      Services
+      {
+        Matcher
+        {
+          Port = 9170
+        }
+      }
+    }
+  }
+}
+"""
+
+
+@pytest.fixture
+def confData():
+  """ ConfigurationData with TEST_CFG as local configuration """
+  cfgData = ConfigurationData(loadDefaultCFG=False)
+  cfgData.mergeWithLocal(CFG().loadFromBuffer(TEST_CFG))
+  return cfgData
+
+
+def test_extractOption(confData):
+  """ Options are found whatever the form of the path """
+  assert confData.extractOptionFromCFG("/DIRAC/Setup") == "Test"
+  assert confData.extractOptionFromCFG("DIRAC/Setup/") == "Test"
+  assert confData.extractOptionFromCFG("/Systems/WorkloadManagement//Test/Services/Matcher/Port") == "9170"
+  assert confData.extractOptionFromCFG("/DIRAC/Unknown") is None
+  assert confData.extractOptionFromCFG("/DIRAC/Configuration") is None
+  assert confData.extractOptionFromCFG("/") is None
+  assert confData.getServers() == ["dips://cs1.example.org:9135/Configuration/Server"]
+
+
+def test_sectionsAndOptions(confData):
+  """ Listing and comments of the merged configuration """
+  assert confData.getSectionsFromCFG("/") == ["DIRAC", "Systems"]
+  assert confData.getSectionsFromCFG("/DIRAC") == ["Configuration"]
+  assert confData.getOptionsFromCFG("/DIRAC") == ["Setup"]
+  assert confData.getOptionsFromCFG("/DIRAC/Setup") is None
+  assert confData.getSectionsFromCFG("/Unknown") is None
+  assert confData.getCommentFromCFG("/Systems/WorkloadManagement/Test/Services").strip() == "The matcher"
+
+
+def test_updates(confData):
+  """ The lookups follow the changes of the configuration """
+  confData.setOptionInCFG("/DIRAC/Setup", "Production")
+  assert confData.extractOptionFromCFG("/DIRAC/Setup") == "Production"
+  confData.deleteOptionInCFG("/DIRAC/Setup")
+  assert confData.extractOptionFromCFG("/DIRAC/Setup") is None
+  confData.loadRemoteCFGFromMem("Remote\n{\n  Option = value\n}\n")
+  assert confData.extractOptionFromCFG("/Remote/Option") == "value"
+  # Replacing the merged configuration directly is also taken into account
+  confData.mergedCFG = CFG()
+  assert confData.extractOptionFromCFG("/Remote/Option") is None
+
+
+def test_otherCFG(confData):
+  """ Lookups in another CFG do not use the index of the merged configuration """
+  assert confData.extractOptionFromCFG("/DIRAC/Setup", confData.localCFG) == "Test"
+  assert confData.extractOptionFromCFG("/DIRAC/Setup", confData.remoteCFG) is None
+
+
+def test_versionDeltas(confData):
+  """ The modifications between versions kept by a server bring a client up to date """
+  server = ConfigurationData(loadDefaultCFG=False)
+  server.setAsService()
+  server.setRemoteCFG(confData.mergedCFG)
+  server.setVersion("2020-01-01 00:00:00")
+  client = ConfigurationData(loadDefaultCFG=False)
+  client.setRemoteCFG(server.getRemoteCFG())
+  assert server.getVersionDeltas("2020-01-01 00:00:00") is None
+
+  server.setOptionInCFG("/DIRAC/Setup", "Production", server.remoteCFG)
+  server.setVersion("2020-01-02 00:00:00")
+  server.setOptionInCFG("/Systems/Framework/Test/URLs/Monitoring", "dips://mon.example.org:9142/Framework/Monitoring",
+                        server.remoteCFG)
+  server.setVersion("2020-01-03 00:00:00")
+  versionDeltas = server.getVersionDeltas("2020-01-01 00:00:00")
+  assert [delta[:2] for delta in versionDeltas] == [("2020-01-01 00:00:00", "2020-01-02 00:00:00"),
+                                                    ("2020-01-02 00:00:00", "2020-01-03 00:00:00")]
+  assert server.getVersionDeltas("2019-12-31 00:00:00") is None
+
+  assert client.applyRemoteCFGDeltas(versionDeltas)['OK']
+  assert client.getVersion() == "2020-01-03 00:00:00"
+  assert client.extractOptionFromCFG("/DIRAC/Setup") == "Production"
+  assert str(client.getRemoteCFG()) == str(server.getRemoteCFG())
+  # Modifications which do not start from the version of the client are refused
+  assert not client.applyRemoteCFGDeltas(versionDeltas[1:])['OK']
+  assert client.getVersion() == "2020-01-03 00:00:00"
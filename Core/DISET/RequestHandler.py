@@ -5,6 +5,7 @@ __RCSID__ = "$Id$"
 
 import os
 import time
+import types
 import psutil
 
 import DIRAC
@@ -55,6 +56,8 @@ class RequestHandler(object):
     handlerInitDict.update(self.__srvInfoDict)
     self.serviceInfoDict = handlerInitDict
     self.__trid = trid
+    # Set when the client accepts to receive the result of a streaming method chunk by chunk
+    self.__streamReply = False
 
   def initialize(self):
     """Initialize this instance of the handler (to be overwritten)
@@ -131,6 +134,8 @@ class RequestHandler(object):
     except RequestHandler.ConnectionError as excp:
       gLogger.error("ConnectionError", str(excp))
       return S_ERROR(excp)
+    if isinstance(retVal, types.GeneratorType):
+      retVal = self.__sendStream(retVal)
     if not isReturnStructure(retVal):
       message = "Method %s for action %s does not return a S_OK/S_ERROR!" % (actionTuple[1], actionTuple[0])
       gLogger.error(message)
@@ -162,11 +167,16 @@ class RequestHandler(object):
 
     # Reconvert to tuple
     fileInfo = tuple(retVal['Value'])
+    # Clients able to stream the data announce the window they want to use
+    transferWindow = FileHelper.negotiateTransferWindow(retVal.get('TransferWindow'))
     sDirection = "%s%s" % (sDirection[0].lower(), sDirection[1:])
     if "transfer_%s" % sDirection not in dir(self):
       self.__trPool.send(self.__trid, S_ERROR("Service can't transfer files %s" % sDirection))
       return
-    retVal = self.__trPool.send(self.__trid, S_OK("Accepted"))
+    retVal = S_OK("Accepted")
+    if transferWindow > 1:
+      retVal['TransferWindow'] = transferWindow
+    retVal = self.__trPool.send(self.__trid, retVal)
     if not retVal['OK']:
       return retVal
     self.__logRemoteQuery("FileTransfer/%s" % sDirection, fileInfo)
@@ -175,6 +185,7 @@ class RequestHandler(object):
     try:
       try:
         fileHelper = FileHelper(self.__trPool.get(self.__trid))
+        fileHelper.setTransferWindow(transferWindow)
         if sDirection == "fromClient":
           fileHelper.setDirection("fromClient")
           uRetVal = self.transfer_fromClient(fileInfo[0], fileInfo[1], fileInfo[2], fileHelper)
@@ -238,9 +249,45 @@ class RequestHandler(object):
       raise RequestHandler.ConnectionError("Error while receiving arguments %s %s" %
                                            (self.srv_getFormattedRemoteCredentials(), retVal['Message']))
     args = retVal['Value']
+    self.__streamReply = retVal.get('streamReply', False)
     self.__logRemoteQuery("RPC/%s" % method, args)
     return self.__RPCCallFunction(method, args)
 
+  def __sendStream(self, chunkGenerator):
+    """
+    Send the chunks yielded by a streaming method. If the client did not ask
+    for a streamed reply, all the chunks are returned at once as a list.
+
+    :type chunkGenerator: generator
+    :param chunkGenerator: chunks returned by the method, a S_ERROR interrupts the stream
+    :return: S_OK/S_ERROR to be sent as the last message
+    """
+    chunks = []
+    nChunks = 0
+    try:
+      for chunk in chunkGenerator:
+        if isReturnStructure(chunk) and not chunk['OK']:
+          retVal = chunk
+          break
+        nChunks += 1
+        if not self.__streamReply:
+          chunks.append(chunk)
+          continue
+        # The transport only returns once the chunk is sent, so the method
+        # is not asked for the next one before the client reads this one
+        chunkMsg = S_OK(chunk)
+        chunkMsg['streamChunk'] = True
+        retVal = self.__trPool.send(self.__trid, chunkMsg)
+        if not retVal['OK']:
+          break
+      else:
+        retVal = S_OK(nChunks if self.__streamReply else chunks)
+    finally:
+      chunkGenerator.close()
+    if self.__streamReply:
+      retVal['streamEnd'] = True
+    return retVal
+
   def __RPCCallFunction(self, method, args):
     """
       Check the arguments then call the RPC function
@@ -277,14 +324,20 @@ class RequestHandler(object):
     # self.__msgBroker.addTransportId(self.__trid,
     #                                 self.serviceInfoDict['serviceName'],
     #                                 idleRead=True)
+    isStream = False
     try:
       try:
         # Trying to execute the method
         uReturnValue = oMethod(*args)
+        # Streaming methods are generators, which only run while their chunks are sent
+        if isinstance(uReturnValue, types.GeneratorType):
+          isStream = True
+          return self.__lockedStream(method, uReturnValue)
         return uReturnValue
       finally:
         # Unlock method
-        self.__lockManager.unlock("RPC/%s" % method)
+        if not isStream:
+          self.__lockManager.unlock("RPC/%s" % method)
         # 18.02.19 WARNING CHRIS
         # See comment above
         # self.__msgBroker.removeTransport(self.__trid, closeTransport=False)
@@ -292,6 +345,25 @@ class RequestHandler(object):
       gLogger.exception("Uncaught exception when serving RPC", "Function %s" % method, lException=e)
       return S_ERROR("Server error while serving %s: %s" % (method, str(e)))
 
+  def __lockedStream(self, method, chunkGenerator):
+    """
+    Iterate over the chunks of a streaming method, holding the method lock until it is over
+
+    :type method: string
+    :param method: name of the method
+    :type chunkGenerator: generator
+    :param chunkGenerator: generator returned by the method
+    """
+    try:
+      for chunk in chunkGenerator:
+        yield chunk
+    except Exception as e:
+      gLogger.exception("Uncaught exception when serving RPC", "Function %s" % method, lException=e)
+      yield S_ERROR("Server error while serving %s: %s" % (method, str(e)))
+    finally:
+      chunkGenerator.close()
+      self.__lockManager.unlock("RPC/%s" % method)
+
   def __checkExpectedArgumentTypes(self, method, args):
     """
     Check that the arguments received match the ones expected
@@ -4,6 +4,7 @@
 __RCSID__ = "$Id$"
 
 import os
+import six
 
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Utilities import File
@@ -13,6 +14,9 @@ from DIRAC.Core.DISET.private.FileHelper import FileHelper
 
 class TransferClient(BaseClient):
 
+  # Actions whose data go through a FileHelper on both sides
+  __streamedActions = ("FromClient", "ToClient", "BulkFromClient", "BulkToClient")
+
   def _sendTransferHeader(self, actionName, fileInfo):
     """
     Send the header of the transfer
@@ -33,13 +37,19 @@ class TransferClient(BaseClient):
       if not retVal['OK']:
         return retVal
       # We need to convert to list
-      retVal = transport.sendData(S_OK(list(fileInfo)))
+      header = S_OK(list(fileInfo))
+      # Propose to stream the data, servers not supporting it will ignore the proposal
+      if actionName in self.__streamedActions:
+        header['TransferWindow'] = FileHelper.maxTransferWindow
+      retVal = transport.sendData(header)
       if not retVal['OK']:
         return retVal
       retVal = transport.receiveData()
       if not retVal['OK']:
         return retVal
-      return S_OK((trid, transport))
+      result = S_OK((trid, transport))
+      result['TransferWindow'] = FileHelper.negotiateTransferWindow(retVal.get('TransferWindow'))
+      return result
     except Exception as e:
       self._disconnect(trid)
       return S_ERROR("Cound not request transfer: %s" % str(e))
@@ -48,7 +58,7 @@ class TransferClient(BaseClient):
     """
     Send a file to server
 
-    :type filename: string / file descriptor / file object
+    :type filename: string / file descriptor / file object / object with a read method
     :param filename: File to send to server
     :type fileId: any
     :param fileId: Identification of the file being sent
@@ -59,17 +69,28 @@ class TransferClient(BaseClient):
     fileHelper = FileHelper()
     if "NoCheckSum" in token:
       fileHelper.disableCheckSum()
-    retVal = fileHelper.getFileDescriptor(filename, "r")
-    if not retVal['OK']:
-      return retVal
-    fd = retVal['Value']
-    retVal = self._sendTransferHeader("FromClient", (fileId, token, File.getSize(filename)))
+    if not isinstance(filename, (six.string_types, int, file)) and "read" in dir(filename):
+      # Data generated while being sent, its size is unknown
+      dataSource = filename
+      fileSize = -1
+    else:
+      dataSource = None
+      retVal = fileHelper.getFileDescriptor(filename, "r")
+      if not retVal['OK']:
+        return retVal
+      fd = retVal['Value']
+      fileSize = File.getSize(filename)
+    retVal = self._sendTransferHeader("FromClient", (fileId, token, fileSize))
     if not retVal['OK']:
       return retVal
     trid, transport = retVal['Value']
     try:
       fileHelper.setTransport(transport)
-      retVal = fileHelper.FDToNetwork(fd)
+      fileHelper.setTransferWindow(retVal['TransferWindow'])
+      if dataSource is not None:
+        retVal = fileHelper.DataSourceToNetwork(dataSource)
+      else:
+        retVal = fileHelper.FDToNetwork(fd)
       if not retVal['OK']:
         return retVal
       retVal = transport.receiveData()
@@ -103,6 +124,7 @@ class TransferClient(BaseClient):
     trid, transport = retVal['Value']
     try:
       fileHelper.setTransport(transport)
+      fileHelper.setTransferWindow(retVal['TransferWindow'])
       retVal = fileHelper.networkToDataSink(dS)
       if not retVal['OK']:
         return retVal
@@ -149,6 +171,7 @@ class TransferClient(BaseClient):
     trid, transport = retVal['Value']
     try:
       fileHelper = FileHelper(transport)
+      fileHelper.setTransferWindow(retVal['TransferWindow'])
       retVal = fileHelper.bulkToNetwork(fileList, compress, onthefly)
       if not retVal['OK']:
         return retVal
@@ -183,6 +206,7 @@ class TransferClient(BaseClient):
     trid, transport = retVal['Value']
     try:
       fileHelper = FileHelper(transport)
+      fileHelper.setTransferWindow(retVal['TransferWindow'])
       retVal = fileHelper.networkToBulk(destDir, compress)
       if not retVal['OK']:
         return retVal
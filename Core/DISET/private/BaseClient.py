@@ -4,9 +4,11 @@
 
 __RCSID__ = "$Id$"
 
+import os
 import six
 import time
 import thread
+from hashlib import md5
 import DIRAC
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -16,7 +18,9 @@ from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.PathFinder import getServiceURL, getServiceFailoverURL
 from DIRAC.ConfigurationSystem.Client.Helpers import Registry
 from DIRAC.ConfigurationSystem.Client.Helpers.CSGlobals import skipCACheck
+from DIRAC.Core.Security import Locations
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.ClientConnectionPool import getGlobalClientConnectionPool
 from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
 
 
@@ -40,6 +44,13 @@ class BaseClient(object):
   KW_PROXY_CHAIN = "proxyChain"
   KW_SKIP_CA_CHECK = "skipCACheck"
   KW_KEEP_ALIVE_LAPSE = "keepAliveLapse"
+  KW_KEEP_CONNECTION = "keepConnection"
+
+  # kwargs which are sent with each action and do not change the connection itself
+  __perActionKwargs = (KW_EXTRA_CREDENTIALS, KW_SETUP, KW_VO, KW_DELEGATED_DN, KW_DELEGATED_GROUP,
+                       KW_IGNORE_GATEWAYS, KW_KEEP_CONNECTION)
+  # kwargs giving the credentials of the connection, which are identified by __getCredentialsIdentity
+  __credentialsKwargs = (KW_PROXY_LOCATION, KW_PROXY_STRING, KW_PROXY_CHAIN)
 
   __threadConfig = ThreadConfig()
 
@@ -60,6 +71,7 @@ class BaseClient(object):
         :param proxyChain: Specify the proxy chain
         :param skipCACheck: Do not check the CA
         :param keepAliveLapse: Duration for keepAliveLapse (heartbeat like)
+        :param keepConnection: Reuse the connections to the service between RPC calls (default True)
     """
 
     if not isinstance(serviceName, six.string_types):
@@ -83,6 +95,8 @@ class BaseClient(object):
     self.__nbOfRetry = 3  # by default we try try times
     self.__retryCounter = 1
     self.__bannedUrls = []
+    # trid -> (connection pool key, creation time, reused) for the connections that may be reused
+    self.__connectionInfo = {}
     for initFunc in (self.__discoverSetup, self.__discoverVO, self.__discoverTimeout,
                      self.__discoverURL, self.__discoverCredentialsToUse,
                      self.__checkTransportSanity,
@@ -427,13 +441,53 @@ and this is thread %s
       gLogger.error("DISET client thread safety error", msgTxt)
       # raise Exception( msgTxt )
 
-  def _connect(self):
+  def __useConnectionPool(self):
+    """ Connections are reused unless KW_KEEP_CONNECTION is false
+    """
+    return str(self.kwargs.get(self.KW_KEEP_CONNECTION, True)).lower() not in ('false', 'no', '0')
+
+  def __getConnectionPoolKey(self):
+    """ Connections can only be reused for the same service URL and the same credentials
+
+        :return: tuple
+    """
+    connectionKwargs = sorted((key, value) for key, value in self.kwargs.items()
+                              if key not in self.__perActionKwargs + self.__credentialsKwargs)
+    return (self.serviceURL, self.__getCredentialsIdentity(), md5(repr(connectionKwargs)).hexdigest())
+
+  def __getCredentialsIdentity(self):
+    """ Identify the credentials the connection is established with. A proxy given in memory is
+        identified by its whole content, as proxies of the same DN can have different groups and
+        VOMS attributes. A proxy or certificate file is identified by its path, modification time
+        and size, so that a renewed or replaced file is not mistaken for the previous one.
+
+        :return: tuple
+    """
+    if self.KW_PROXY_CHAIN in self.kwargs:
+      retVal = self.kwargs[self.KW_PROXY_CHAIN].dumpAllToString()
+      return ('proxyString', md5(retVal['Value'] if retVal['OK'] else repr(retVal)).hexdigest())
+    if self.KW_PROXY_STRING in self.kwargs:
+      return ('proxyString', md5(self.kwargs[self.KW_PROXY_STRING]).hexdigest())
+    if self.__useCertificates:
+      credentialsFile = (Locations.getHostCertificateAndKeyLocation() or [None])[0]
+    else:
+      credentialsFile = self.kwargs.get(self.KW_PROXY_LOCATION) or Locations.getProxyLocation()
+    try:
+      fileStat = os.stat(credentialsFile)
+    except (OSError, TypeError):
+      return ('file', credentialsFile)
+    return ('file', credentialsFile, fileStat.st_mtime, fileStat.st_size)
+
+  def _connect(self, reuseConnection=False):
     """ Establish the connection.
         It uses the URL discovered in __discoverURL.
         In case the connection cannot be established, __discoverURL
         is called again, and _connect calls itself.
         We stop after trying self.__nbOfRetry * self.__nbOfUrls
 
+        :param bool reuseConnection: take a connection left open by a previous call if there is one,
+                                     and allow to give the new connection back with _releaseConnection
+
         :return: S_OK()/S_ERROR()
     """
     # Check if the useServerCertificate configuration changed
@@ -456,6 +510,16 @@ and this is thread %s
     if self.__enableThreadCheck:
       self.__checkThreadID()
 
+    poolKey = None
+    if reuseConnection and self.__useConnectionPool():
+      poolKey = self.__getConnectionPoolKey()
+      pooledConnection = getGlobalClientConnectionPool().get(poolKey)
+      if pooledConnection:
+        trid, transport, creationTime = pooledConnection
+        gLogger.debug("Reusing connection to: %s" % self.serviceURL)
+        self.__connectionInfo[trid] = (poolKey, creationTime, True)
+        return S_OK((trid, transport))
+
     gLogger.debug("Trying to connect to: %s" % self.serviceURL)
     try:
       # Calls the transport method of the apropriate protocol.
@@ -491,7 +555,7 @@ and this is thread %s
           # rediscover the URL
           self.__discoverURL()
           # try to reconnect
-          return self._connect()
+          return self._connect(reuseConnection)
         else:
           return retVal
     except Exception as e:
@@ -500,6 +564,9 @@ and this is thread %s
     # We add the connection to the transport pool
     gLogger.debug("Connected to: %s" % self.serviceURL)
     trid = getGlobalTransportPool().add(transport)
+    if poolKey:
+      getGlobalClientConnectionPool().connectionCreated()
+      self.__connectionInfo[trid] = (poolKey, time.time(), False)
 
     return S_OK((trid, transport))
 
@@ -508,8 +575,34 @@ and this is thread %s
 
         :param str trid: Transport ID in the transportPool
     """
+    self.__connectionInfo.pop(trid, None)
     getGlobalTransportPool().close(trid)
 
+  def _releaseConnection(self, trid, transport, reusable):
+    """ Give the connection back to the connection pool if it can be reused,
+        disconnect it otherwise.
+
+        :param str trid: Transport ID in the transportPool
+        :param transport: the Transport object returned by _connect
+        :param bool reusable: the service agreed to keep the connection open,
+                              and the call left nothing to read on it
+    """
+    connectionInfo = self.__connectionInfo.pop(trid, None)
+    if not reusable or not connectionInfo:
+      getGlobalTransportPool().close(trid)
+      return
+    poolKey, creationTime, _reused = connectionInfo
+    getGlobalClientConnectionPool().put(poolKey, trid, transport, creationTime)
+
+  def _isReusedConnection(self, trid):
+    """ Tell whether the connection was taken from the connection pool
+
+        :param str trid: Transport ID in the transportPool
+
+        :return: bool
+    """
+    return self.__connectionInfo.get(trid, (None, None, False))[2]
+
   @staticmethod
   def _serializeStConnectionInfo(stConnectionInfo):
     """ We want to send tuple but we need to convert
@@ -519,7 +612,7 @@ and this is thread %s
 
     return serializedTuple
 
-  def _proposeAction(self, transport, action):
+  def _proposeAction(self, transport, action, keepConnection=False):
     """ Proposes an action by sending a tuple containing
 
           * System/Component
@@ -527,6 +620,8 @@ and this is thread %s
           * VO
           * action
           * extraCredentials
+          * DIRAC version
+          * options of the connection, if any
 
         It is kind of a handshake.
 
@@ -537,6 +632,8 @@ and this is thread %s
         :param action: tuple (<action type>, <action name>). It depends on the
                        subclasses of BaseClient. <action type> can be for example
                        'RPC' or 'FileTransfer'
+        :param bool keepConnection: ask the server to keep the connection open after the action.
+                                    If it agrees, the returned structure has keepConnection set to True
 
         :return: whatever the server sent back
 
@@ -547,6 +644,9 @@ and this is thread %s
                         action,
                         self.__extraCredentials,
                         DIRAC.version)
+    if keepConnection and self.__useConnectionPool():
+      # Services which do not know about it just ignore it
+      stConnectionInfo += ({'keepConnection': True},)
 
     # Send the connection info and get the answer back
     retVal = transport.sendData(S_OK(BaseClient._serializeStConnectionInfo(stConnectionInfo)))
@@ -0,0 +1,188 @@
+""" Pool of the client connections kept open between RPC calls
+
+    Establishing a DISET connection is expensive: TCP connection, TLS handshake and
+    certificate chain verification on both sides. When the service agrees to keep the
+    connection open after an RPC call, the client puts it back in this pool, and the
+    next call to the same service with the same credentials takes it from there instead
+    of connecting again.
+
+    A connection is only used by one call at a time: it is removed from the pool while it
+    is used, and several threads calling the same service simply use several connections.
+    A forked process does not reuse the connections of its parent, which goes on using them.
+"""
+
+import os
+import select
+import threading
+import time
+
+from DIRAC import gLogger
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+
+__RCSID__ = "$Id$"
+
+
+class ClientConnectionPool(object):
+
+  def __init__(self, maxIdleTime=30, maxLifeTime=600, maxIdlePerKey=10):
+    """ c'tor
+
+        :param int maxIdleTime: seconds a connection can stay unused in the pool.
+                                It has to be lower than the idle time allowed by the services
+        :param int maxLifeTime: seconds after which a connection is not reused any more,
+                                so that renewed credentials are eventually used
+        :param int maxIdlePerKey: maximum number of unused connections kept per service and credentials
+    """
+    self.__maxIdleTime = maxIdleTime
+    self.__maxLifeTime = maxLifeTime
+    self.__maxIdlePerKey = maxIdlePerKey
+    self.__lock = threading.Lock()
+    # key -> list of [ trid, transport, creation time, last release time ], most recent last
+    self.__idle = {}
+    # process owning the connections
+    self.__pid = os.getpid()
+    self.__lastPurge = time.time()
+    self.__stats = {'created': 0, 'reused': 0, 'expired': 0, 'discarded': 0}
+
+  def __incStat(self, name, value=1):
+    self.__stats[name] += value
+
+  def __checkFork(self):
+    """ Forget the connections inherited from the parent process, without closing them
+        as the parent still uses them. The lock is replaced too, as it may have been held
+        by a thread of the parent which does not exist in this process
+    """
+    pid = os.getpid()
+    if pid != self.__pid:
+      self.__lock = threading.Lock()
+      self.__idle = {}
+      self.__pid = pid
+
+  def connectionCreated(self):
+    """ Count a connection established because none could be reused
+    """
+    with self.__lock:
+      self.__incStat('created')
+
+  def get(self, key):
+    """ Take an unused connection out of the pool
+
+        :param key: identifies the service and the credentials of the connection
+        :return: (trid, transport, creation time) or None if there is no usable connection
+    """
+    toClose = []
+    found = None
+    now = time.time()
+    self.__checkFork()
+    with self.__lock:
+      connList = self.__idle.get(key, [])
+      while connList:
+        trid, transport, created, released = connList.pop()
+        if now - released > self.__maxIdleTime or now - created > self.__maxLifeTime:
+          self.__incStat('expired')
+          toClose.append(trid)
+        elif not self.__isUsable(transport):
+          self.__incStat('discarded')
+          toClose.append(trid)
+        else:
+          self.__incStat('reused')
+          found = (trid, transport, created)
+          break
+      if not connList:
+        self.__idle.pop(key, None)
+    self.__close(toClose)
+    return found
+
+  def put(self, key, trid, transport, created):
+    """ Give back a connection that can be reused
+
+        :param key: identifies the service and the credentials of the connection
+        :param str trid: transport ID in the transport pool
+        :param transport: transport object
+        :param float created: time at which the connection was established
+    """
+    toClose = []
+    now = time.time()
+    self.__checkFork()
+    with self.__lock:
+      connList = self.__idle.setdefault(key, [])
+      connList.append([trid, transport, created, now])
+      if len(connList) > self.__maxIdlePerKey:
+        toClose.append(connList.pop(0)[0])
+        self.__incStat('discarded')
+      if now - self.__lastPurge > self.__maxIdleTime:
+        self.__lastPurge = now
+        toClose.extend(self.__purge(now))
+    self.__close(toClose)
+
+  def __purge(self, now):
+    """ Remove the connections unused for too long, the lock has to be held
+
+        :return: list of trids to close
+    """
+    expired = []
+    for key in list(self.__idle):
+      connList = self.__idle[key]
+      kept = [conn for conn in connList if now - conn[3] <= self.__maxIdleTime]
+      expired.extend(conn[0] for conn in connList if now - conn[3] > self.__maxIdleTime)
+      if kept:
+        self.__idle[key] = kept
+      else:
+        del self.__idle[key]
+    self.__incStat('expired', len(expired))
+    return expired
+
+  @staticmethod
+  def __isUsable(transport):
+    """ An unused connection should have nothing to read: if the socket is readable,
+        the service closed it or sent something unexpected, and it cannot be reused
+    """
+    if transport.byteStream:
+      return False
+    try:
+      readable = select.select([transport.getSocket()], [], [], 0)[0]
+    except Exception:  # pylint: disable=broad-except
+      return False
+    return not readable
+
+  @staticmethod
+  def __close(tridList):
+    trPool = getGlobalTransportPool()
+    for trid in tridList:
+      try:
+        trPool.close(trid)
+      except Exception as e:  # pylint: disable=broad-except
+        gLogger.debug("Error while closing pooled connection", "%s: %s" % (trid, repr(e)))
+
+  def closeAll(self):
+    """ Close all the unused connections
+    """
+    self.__checkFork()
+    with self.__lock:
+      tridList = [conn[0] for connList in self.__idle.values() for conn in connList]
+      self.__idle = {}
+    self.__close(tridList)
+
+  def getStats(self):
+    """ Get the counters of the pool
+
+        :return: dict with the number of connections created, reused, expired and discarded,
+                 the number of unused connections and the reuse rate
+    """
+    self.__checkFork()
+    with self.__lock:
+      stats = dict(self.__stats)
+      stats['idle'] = sum(len(connList) for connList in self.__idle.values())
+    total = stats['created'] + stats['reused']
+    stats['reuseRate'] = float(stats['reused']) / total if total else 0.
+    return stats
+
+
+gClientConnectionPool = None
+
+
+def getGlobalClientConnectionPool():
+  global gClientConnectionPool
+  if not gClientConnectionPool:
+    gClientConnectionPool = ClientConnectionPool()
+  return gClientConnectionPool
@@ -18,6 +18,9 @@ class FileHelper(object):
 
   __validDirections = ("toClient", "fromClient", 'receive', 'send')
   __directionsMapping = {'toClient': 'send', 'fromClient': 'receive'}
+  # Maximum number of packets sent before waiting for an acknowledgement.
+  # Peers not announcing a window during the transfer handshake use 1, that is one ack per packet
+  maxTransferWindow = 8
 
   def __init__(self, oTransport=None, checkSum=True):
     self.oTransport = oTransport
@@ -28,6 +31,10 @@ class FileHelper(object):
     self.direction = False
     self.packetSize = 1048576
     self.__fileBytes = 0
+    self.__transferWindow = 1
+    self.__sentPackets = 0
+    self.__pendingAcks = 0
+    self.__receivedPackets = 0
     self.__log = gLogger.getSubLogger("FileHelper")
 
   def disableCheckSum(self):
@@ -46,6 +53,31 @@ class FileHelper(object):
       else:
         self.direction = direction
 
+  def setTransferWindow(self, transferWindow):
+    """ Set the number of packets sent before waiting for an acknowledgement of the peer.
+        Both sides of the transfer must use the same window, so it has to be negotiated
+        in the transfer handshake (see negotiateTransferWindow). A window of 1 is the
+        historical stop-and-wait protocol.
+
+        :param int transferWindow: number of packets per acknowledgement
+    """
+    self.__transferWindow = max(1, int(transferWindow or 1))
+
+  def getTransferWindow(self):
+    return self.__transferWindow
+
+  @classmethod
+  def negotiateTransferWindow(cls, proposedWindow):
+    """ Get the transfer window to use given the one proposed by the peer
+
+        :param proposedWindow: window proposed by the peer, None if it does not support windows
+        :return: int
+    """
+    try:
+      return max(1, min(int(proposedWindow or 1), cls.maxTransferWindow))
+    except (TypeError, ValueError):
+      return 1
+
   def getHash(self):
     return self.__oMD5.hexdigest()
 
@@ -58,7 +90,35 @@ class FileHelper(object):
     retVal = self.oTransport.sendData(S_OK([True, sBuffer]))
     if not retVal['OK']:
       return retVal
+    if self.__transferWindow == 1:
+      retVal = self.oTransport.receiveData()
+      if retVal['OK'] and retVal.get('AbortTransfer'):
+        self.__finishedTransmission()
+      return retVal
+    # The peer acknowledges every window of packets. We only wait for the acknowledgement
+    # of a window once the next one has been sent, so the network is never idle
+    self.__sentPackets += 1
+    if self.__sentPackets % self.__transferWindow:
+      return S_OK()
+    self.__pendingAcks += 1
+    if self.__pendingAcks < 2:
+      return S_OK()
+    return self.__receiveAck()
+
+  def __receiveAck(self):
+    """ Receive one acknowledgement of a window of packets.
+        If the peer aborted the transfer, tell it that no more data will come.
+    """
     retVal = self.oTransport.receiveData()
+    self.__pendingAcks -= 1
+    if retVal['OK'] and retVal.get('AbortTransfer'):
+      # The peer does not acknowledge anything after aborting
+      self.__pendingAcks = 0
+      if not self.bFinishedTransmission:
+        result = self.oTransport.sendData(S_OK([False, ""]))
+        if not result['OK']:
+          return result
+        self.__finishedTransmission()
     return retVal
 
   def sendEOF(self):
@@ -66,6 +126,16 @@ class FileHelper(object):
     if not retVal['OK']:
       return retVal
     self.__finishedTransmission()
+    if self.__transferWindow == 1:
+      return S_OK()
+    # Wait for the windows not acknowledged yet and for the acknowledgement of the EOF, so that the next
+    # message read is the response of the peer. If the peer aborted, nothing comes after the abort
+    self.__pendingAcks += 1
+    while self.__pendingAcks > 0:
+      retVal = self.__receiveAck()
+      if not retVal['OK']:
+        self.__pendingAcks = 0
+        return retVal
     return S_OK()
 
   def sendError(self, errorMsg):
@@ -88,11 +158,16 @@ class FileHelper(object):
     if stBuffer[0]:
       if self.__checkMD5:
         self.__oMD5.update(stBuffer[1])
-      self.oTransport.sendData(S_OK())
+      self.__receivedPackets += 1
+      if not self.__receivedPackets % self.__transferWindow:
+        self.oTransport.sendData(S_OK())
     else:
       self.bReceivedEOF = True
       if self.__checkMD5 and not self.__oMD5.hexdigest() == stBuffer[1]:
         self.bErrorInMD5 = True
+      if self.__transferWindow > 1:
+        # The sender waits for the EOF to be acknowledged, since it may be followed by an abort otherwise
+        self.oTransport.sendData(S_OK())
       self.__finishedTransmission()
       return S_OK("")
     return S_OK(stBuffer[1])
@@ -103,17 +178,27 @@ class FileHelper(object):
   def markAsTransferred(self):
     if not self.bFinishedTransmission:
       if self.direction == "receive":
-        self.oTransport.receiveData()
+        if self.__transferWindow == 1:
+          self.oTransport.receiveData()
         abortTrans = S_OK()
         abortTrans['AbortTransfer'] = True
         self.oTransport.sendData(abortTrans)
+        if self.__transferWindow > 1:
+          # The sender does not wait for us, discard the packets until it acknowledges the abort
+          while True:
+            retVal = self.oTransport.receiveData()
+            if not retVal['OK'] or not retVal['Value'][0]:
+              break
       else:
         abortTrans = S_OK([False, ""])
         abortTrans['AbortTransfer'] = True
         retVal = self.oTransport.sendData(abortTrans)
         if not retVal['OK']:
           return retVal
-        self.oTransport.receiveData()
+        # Pending acknowledgements come before the answer to the abort
+        for _ in range(self.__pendingAcks + 1):
+          self.oTransport.receiveData()
+        self.__pendingAcks = 0
     self.__finishedTransmission()
 
   def __finishedTransmission(self):
@@ -151,6 +236,7 @@ class FileHelper(object):
     self.__oMD5 = hashlib.md5()
     self.bReceivedEOF = False
     self.bErrorInMD5 = False
+    self.__receivedPackets = 0
     receivedBytes = 0
     try:
       result = self.receiveData(maxBufferSize=maxFileSize)
@@ -182,6 +268,8 @@ class FileHelper(object):
     """
 
     stringIO = cStringIO.StringIO(stringVal)
+    self.__sentPackets = 0
+    self.__pendingAcks = 0
 
     iPacketSize = self.packetSize
     ioffset = 0
@@ -211,6 +299,8 @@ class FileHelper(object):
     self.__oMD5 = hashlib.md5()
     iPacketSize = self.packetSize
     self.__fileBytes = 0
+    self.__sentPackets = 0
+    self.__pendingAcks = 0
     sentBytes = 0
     try:
       sBuffer = os.read(iFD, iPacketSize)
@@ -243,6 +333,8 @@ class FileHelper(object):
     self.__oMD5 = hashlib.md5()
     iPacketSize = self.packetSize
     self.__fileBytes = 0
+    self.__sentPackets = 0
+    self.__pendingAcks = 0
     sentBytes = 0
     try:
       sBuffer = dataSource.read(iPacketSize)
@@ -232,9 +232,13 @@ class GatewayService(Service):
       return
     if actionType == "FileTransfer":
       gLogger.warn("Received a file transfer action from %s" % idString)
-      clientTransport.sendData(S_OK("Accepted"))
+      transferWindow = FileHelper.negotiateTransferWindow(retVal.get('TransferWindow'))
+      accepted = S_OK("Accepted")
+      if transferWindow > 1:
+        accepted['TransferWindow'] = transferWindow
+      clientTransport.sendData(accepted)
       retVal = self.__forwardFileTransferCall(targetService, clientInitArgs,
-                                              actionMethod, retVal['Value'], clientTransport)
+                                              actionMethod, retVal['Value'], clientTransport, transferWindow)
     elif actionType == "RPC":
       gLogger.info("Forwarding %s/%s action to %s for %s" % (actionType, actionMethod, targetService, idString))
       retVal = self.__forwardRPCCall(targetService, clientInitArgs, actionMethod, retVal['Value'])
@@ -260,16 +264,29 @@ class GatewayService(Service):
         if clientVersion < serviceVersion:
           retDict['data'] = gConfigurationData.getCompressedData()
         return S_OK(retDict)
+      if method == "getDataDeltasIfNewer":
+        serviceVersion = gConfigurationData.getVersion()
+        retDict = {'newestVersion': serviceVersion}
+        clientVersion = params[0]
+        if clientVersion < serviceVersion:
+          versionDeltas = gConfigurationData.getVersionDeltas(clientVersion)
+          if versionDeltas:
+            retDict['newestVersion'] = versionDeltas[-1][1]
+            retDict['deltas'] = versionDeltas
+          else:
+            retDict['data'] = gConfigurationData.getCompressedData()
+        return S_OK(retDict)
     # Default
     rpcClient = RPCClient(targetService, **clientInitArgs)
     methodObj = getattr(rpcClient, method)
     return methodObj(*params)
 
   def __forwardFileTransferCall(self, targetService, clientInitArgs, method,
-                                params, clientTransport):
+                                params, clientTransport, transferWindow=1):
     transferRelay = TransferRelay(targetService, **clientInitArgs)
     transferRelay.setTransferLimit(self.__transferBytesLimit)
     cliFH = FileHelper(clientTransport)
+    cliFH.setTransferWindow(transferWindow)
     # Check file size
     if method.find("ToClient") > -1:
       cliFH.setDirection("send")
@@ -340,6 +357,7 @@ class TransferRelay(TransferClient):
     _, srvTransport = result['Value']
     srvFileHelper = FileHelper(srvTransport)
     srvFileHelper.setDirection("send")
+    srvFileHelper.setTransferWindow(result['TransferWindow'])
     result = srvFileHelper.BufferToNetwork(data)
     if not result['OK']:
       self.errMsg("Could send data to server", result['Message'])
@@ -360,6 +378,7 @@ class TransferRelay(TransferClient):
     _, srvTransport = result['Value']
     srvFileHelper = FileHelper(srvTransport)
     srvFileHelper.setDirection("receive")
+    srvFileHelper.setTransferWindow(result['TransferWindow'])
     sIO = cStringIO.StringIO()
     result = srvFileHelper.networkToDataSink(sIO, self.__transferBytesLimit)
     if not result['OK']:
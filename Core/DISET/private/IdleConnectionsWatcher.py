@@ -0,0 +1,125 @@
+""" Watches the connections that a service keeps open between RPC calls
+
+    After an RPC call, the service can keep the connection open instead of closing it,
+    so that the client does not have to connect and do the handshake again for the next call.
+    While they wait for the next proposal, those connections do not hold any thread of the
+    service: they are all watched by a single thread, which gives them back to the service as
+    soon as there is something to read, and closes them when they are unused for too long.
+"""
+
+import os
+import select
+import threading
+import time
+
+from DIRAC import gLogger
+
+__RCSID__ = "$Id$"
+
+
+class IdleConnectionsWatcher(object):
+
+  def __init__(self, transportPool, readyCallback, maxIdleTime=60, maxConnections=200):
+    """ c'tor
+
+        :param transportPool: TransportPool holding the connections
+        :param readyCallback: function called with the trid of a connection that has something to read.
+                              The connection is not watched any more once it has been called
+        :param int maxIdleTime: seconds after which an unused connection is closed
+        :param int maxConnections: maximum number of connections watched at the same time
+    """
+    self.__trPool = transportPool
+    self.__readyCallback = readyCallback
+    self.__maxIdleTime = maxIdleTime
+    self.__maxConnections = maxConnections
+    self.__lock = threading.Lock()
+    # trid -> ( socket, time at which the connection became idle )
+    self.__idle = {}
+    self.__wakeUpPipe = None
+    self.__thread = None
+    self.__alive = True
+
+  def getNumConnections(self):
+    """ Number of connections watched
+    """
+    return len(self.__idle)
+
+  def add(self, trid):
+    """ Watch a connection until there is something to read on it
+
+        :param str trid: transport ID in the transport pool
+        :return: True if the connection is watched, False if it has to be closed by the caller
+    """
+    transport = self.__trPool.get(trid)
+    if not transport or not self.__alive:
+      return False
+    # Data already received cannot be seen by select: process it right away
+    if transport.byteStream:
+      self.__readyCallback(trid)
+      return True
+    with self.__lock:
+      if len(self.__idle) >= self.__maxConnections:
+        return False
+      if not self.__thread:
+        self.__wakeUpPipe = os.pipe()
+        self.__thread = threading.Thread(target=self.__watch, name="IdleConnectionsWatcher")
+        self.__thread.setDaemon(True)
+        self.__thread.start()
+      self.__idle[trid] = (transport.getSocket(), time.time())
+    self.__wakeUp()
+    return True
+
+  def stop(self):
+    """ Stop watching, and close all the connections
+    """
+    self.__alive = False
+    self.__wakeUp()
+
+  def __wakeUp(self):
+    """ Make the watching thread take into account the changes of the watched connections
+    """
+    if self.__wakeUpPipe:
+      os.write(self.__wakeUpPipe[1], b'w')
+
+  def __watch(self):
+    while self.__alive:
+      with self.__lock:
+        socketsDict = dict((sock, trid) for trid, (sock, _idleSince) in self.__idle.items())
+      try:
+        readable = select.select([self.__wakeUpPipe[0]] + list(socketsDict), [], [],
+                                 min(self.__maxIdleTime, 10))[0]
+      except Exception as e:  # pylint: disable=broad-except
+        # One of the sockets is broken: check them one by one
+        gLogger.debug("Error while waiting on idle connections", repr(e))
+        readable = [sock for sock in socketsDict if self.__isBroken(sock)]
+      if self.__wakeUpPipe[0] in readable:
+        os.read(self.__wakeUpPipe[0], 4096)
+        readable.remove(self.__wakeUpPipe[0])
+      now = time.time()
+      ready = []
+      expired = []
+      with self.__lock:
+        for sock in readable:
+          trid = socketsDict[sock]
+          if self.__idle.pop(trid, None):
+            ready.append(trid)
+        for trid, (_sock, idleSince) in list(self.__idle.items()):
+          if not self.__alive or now - idleSince > self.__maxIdleTime:
+            del self.__idle[trid]
+            expired.append(trid)
+      for trid in expired:
+        self.__trPool.close(trid)
+      for trid in ready:
+        try:
+          self.__readyCallback(trid)
+        except Exception:  # pylint: disable=broad-except
+          gLogger.exception("Error while handing back idle connection")
+          self.__trPool.close(trid)
+
+  @staticmethod
+  def __isBroken(sock):
+    try:
+      select.select([sock], [], [], 0)
+    except Exception:  # pylint: disable=broad-except
+      return True
+    return False
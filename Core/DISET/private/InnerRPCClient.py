@@ -12,11 +12,11 @@ class InnerRPCClient(BaseClient):
   """ This class instruments the BaseClient to perform RPC calls.
       At every RPC call, this class:
 
-        * connects
+        * connects, or reuses a connection kept open by the service
         * proposes the action
         * sends the method parameters
         * retrieve the result
-        * disconnect
+        * disconnect, or gives the connection back to the connection pool
   """
 
   # Number of times we retry the call.
@@ -25,6 +25,8 @@ class InnerRPCClient(BaseClient):
 
   def executeRPC(self, functionName, args):
     """ Perform the RPC call, connect before and disconnect after.
+        If the service agrees to keep the connection open, it is put back
+        in the connection pool instead of being closed.
 
         :param functionName: name of the function
         :param args: arguments to the function
@@ -34,7 +36,7 @@ class InnerRPCClient(BaseClient):
 
 
     """
-    retVal = self._connect()
+    retVal = self._connect(reuseConnection=True)
 
     # Generate the stub which contains all the connection and call options
     # JSON: cast args to list for serialization purposes
@@ -44,13 +46,17 @@ class InnerRPCClient(BaseClient):
       return retVal
     # Get the transport connection ID as well as the Transport object
     trid, transport = retVal['Value']
+    reusable = False
     try:
       # Handshake to perform the RPC call for functionName
-      retVal = self._proposeAction(transport, ("RPC", functionName))
+      retVal = self._proposeAction(transport, ("RPC", functionName), keepConnection=True)
       if not retVal['OK']:
         if cmpError(retVal, ENOAUTH):  # This query is unauthorized
           retVal['rpcStub'] = stub
           return retVal
+        elif self._isReusedConnection(trid):
+          # The service closed the connection while it was unused, try with another one
+          return self.executeRPC(functionName, args)
         else:  # we have network problem or the service is not responding
           if self.__retry < 3:
             self.__retry += 1
@@ -58,6 +64,7 @@ class InnerRPCClient(BaseClient):
           else:
             retVal['rpcStub'] = stub
             return retVal
+      keepConnection = retVal.get('keepConnection', False)
 
       # Send the arguments to the function
       # Note: we need to convert the arguments to list
@@ -70,7 +77,60 @@ class InnerRPCClient(BaseClient):
       # Get the result of the call and append the stub to it
       receivedData = transport.receiveData()
       if isinstance(receivedData, dict):
+        # Network errors cannot be told apart from errors of the service,
+        # so only a successful reply guarantees there is nothing left to read
+        reusable = keepConnection and receivedData.get('OK', False)
         receivedData['rpcStub'] = stub
       return receivedData
+    finally:
+      self._releaseConnection(trid, transport, reusable)
+
+  def executeStreamRPC(self, functionName, args):
+    """ Perform a RPC call to a streaming method, whose result is sent back in chunks.
+        The connection is kept open until all the chunks are read, or the iterator is closed.
+        Methods which are not streaming return their whole result as a single chunk.
+
+        :param functionName: name of the function
+        :param args: arguments to the function
+
+        :return: S_OK(iterator)/S_ERROR. The iterator yields S_OK(chunk) for every chunk,
+                 or a S_ERROR if the stream is interrupted.
+    """
+    retVal = self._connect()
+    if not retVal['OK']:
+      retVal['rpcStub'] = [self._getBaseStub(), functionName, list(args)]
+      return retVal
+    trid, transport = retVal['Value']
+    try:
+      retVal = self._proposeAction(transport, ("RPC", functionName))
+      if retVal['OK']:
+        argsMsg = S_OK(list(args))
+        # Tell the service we can read the chunks one by one
+        argsMsg['streamReply'] = True
+        retVal = transport.sendData(argsMsg)
+    except Exception:
+      self._disconnect(trid)
+      raise
+    if not retVal['OK']:
+      self._disconnect(trid)
+      return retVal
+    return S_OK(self.__receiveStream(trid, transport))
+
+  def __receiveStream(self, trid, transport):
+    """ Read the chunks sent by the service, one message at a time
+
+        :param trid: transport ID in the transportPool
+        :param transport: the Transport object returned by _connect
+    """
+    try:
+      while True:
+        receivedData = transport.receiveData()
+        if receivedData.get('streamChunk'):
+          yield S_OK(receivedData['Value'])
+          continue
+        # Either the end of the stream, or the whole result of a non streaming method
+        if not receivedData['OK'] or not receivedData.get('streamEnd'):
+          yield receivedData
+        return
     finally:
       self._disconnect(trid)
@@ -29,6 +29,7 @@ from DIRAC.Core.DISET.private.LockManager import LockManager
 from DIRAC.FrameworkSystem.Client.MonitoringClient import MonitoringClient
 from DIRAC.Core.DISET.private.ServiceConfiguration import ServiceConfiguration
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.IdleConnectionsWatcher import IdleConnectionsWatcher
 from DIRAC.Core.DISET.private.MessageBroker import MessageBroker, MessageSender
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC.Core.Utilities.ReturnValues import isReturnStructure
@@ -77,6 +78,7 @@ class Service(object):
     self._stats = {'queries': 0, 'connections': 0}
     self._authMgr = AuthManager("%s/Authorization" % PathFinder.getServiceSection(serviceData['loadName']))
     self._transportPool = getGlobalTransportPool()
+    self._idleConnections = None
     self.__cloneId = 0
     self.__maxFD = 0
 
@@ -112,6 +114,11 @@ class Service(object):
                                     max(0, self._cfg.getMaxThreads()),
                                     self._cfg.getMaxWaitingPetitions())
       self._threadPool.daemonize()
+    # Connections kept open between RPC calls wait for the next call here
+    if self._cfg.getMaxIdleConnectionTime() > 0:
+      self._idleConnections = IdleConnectionsWatcher(self._transportPool, self.__handleKeptConnection,
+                                                     self._cfg.getMaxIdleConnectionTime(),
+                                                     self._cfg.getMaxIdleConnections())
     self._msgBroker = MessageBroker("%sMSB" % self._name, threadPool=self._threadPool)
     # Create static dict
     self._serviceInfoDict = {'serviceName': self._name,
@@ -358,6 +365,20 @@ class Service(object):
       self._threadPool.generateJobAndQueueIt(self._processInThread,
                                              args=(clientTransport,))
 
+  def __handleKeptConnection(self, trid):
+    """
+      Called by the IdleConnectionsWatcher when the client of a connection
+      kept open after a RPC call sends its next proposal, or closes it.
+
+      :param str trid: transport ID
+    """
+    # TODO: remove later
+    if useThreadPoolExecutor:
+      self._threadPool.submit(self._processKeptConnection, trid)
+    else:
+      self._threadPool.generateJobAndQueueIt(self._processKeptConnection,
+                                             args=(trid,))
+
   # Threaded process function
   def _processInThread(self, clientTransport):
     """
@@ -381,7 +402,7 @@ class Service(object):
     :param clientTransport: Object who describe the opened connection (SSLTransport or PlainTransport)
 
     :return: S_OK with "closeTransport" a boolean to indicate if th connection have to be closed
-            e.g. after RPC, closeTransport=True
+            e.g. after RPC, closeTransport=True, unless the client asked to keep the connection
 
     """
     self.__maxFD = max(self.__maxFD, clientTransport.oSocket.fileno())
@@ -403,31 +424,74 @@ class Service(object):
       trid = self._transportPool.add(clientTransport)
       if not trid:
         return
-      # Receive and check proposal
-      result = self._receiveAndCheckProposal(trid)
-      if not result['OK']:
-        self._transportPool.sendAndClose(trid, result)
-        return
-      proposalTuple = result['Value']
-      # Instantiate handler
-      result = self._instantiateHandler(trid, proposalTuple)
-      if not result['OK']:
-        self._transportPool.sendAndClose(trid, result)
-        return
-      handlerObj = result['Value']
-      # Execute the action
-      result = self._processProposal(trid, proposalTuple, handlerObj)
-      # Close the connection if required
-      if result['closeTransport'] or not result['OK']:
-        if not result['OK']:
-          gLogger.error("Error processing proposal", result['Message'])
-        self._transportPool.close(trid)
-      return result
+      if self._idleConnections:
+        # Processing a proposal modifies the credentials, keep the original ones for the next proposals
+        self._transportPool.associateData(trid, 'handshakeCredentials',
+                                          dict(clientTransport.getConnectingCredentials()))
+      return self.__processNextProposal(trid)
+    finally:
+      self._lockManager.unlockGlobal()
+      if monReport:
+        self.__endReportToMonitoring(*monReport)
+
+  def _processKeptConnection(self, trid):
+    """
+    Process the next proposal received on a connection kept open after a RPC call.
+    It is the same as _processInThread, without the handshake.
+
+    :param str trid: transport ID
+
+    :return: same as _processInThread
+    """
+    clientTransport = self._transportPool.get(trid)
+    if not clientTransport:
+      return
+    clientTransport.peerCredentials = dict(self._transportPool.getAssociatedData(trid, 'handshakeCredentials') or {})
+    self._lockManager.lockGlobal()
+    try:
+      monReport = self.__startReportToMonitoring()
+    except Exception:
+      monReport = False
+    try:
+      return self.__processNextProposal(trid, keptConnection=True)
     finally:
       self._lockManager.unlockGlobal()
       if monReport:
         self.__endReportToMonitoring(*monReport)
 
+  def __processNextProposal(self, trid, keptConnection=False):
+    """
+    Receive a proposal on an established connection, and execute it
+
+    :param str trid: transport ID
+    :param bool keptConnection: the connection was kept open after a previous call
+
+    :return: same as _processInThread
+    """
+    # Receive and check proposal
+    result = self._receiveAndCheckProposal(trid, keptConnection)
+    if not result['OK']:
+      self._transportPool.sendAndClose(trid, result)
+      return
+    proposalTuple = result['Value']
+    # Instantiate handler
+    result = self._instantiateHandler(trid, proposalTuple)
+    if not result['OK']:
+      self._transportPool.sendAndClose(trid, result)
+      return
+    handlerObj = result['Value']
+    # Execute the action
+    result = self._processProposal(trid, proposalTuple, handlerObj)
+    # Wait for the next proposal if the client asked to keep the connection
+    if result.get('keepConnection') and self._idleConnections.add(trid):
+      return result
+    # Close the connection if required
+    if result['closeTransport'] or not result['OK']:
+      if not result['OK']:
+        gLogger.error("Error processing proposal", result['Message'])
+      self._transportPool.close(trid)
+    return result
+
   def _createIdentityString(self, credDict, clientTransport=None):
     if 'username' in credDict:
       if 'group' in credDict:
@@ -452,13 +516,17 @@ class Service(object):
     proposalTuple = tuple(tuple(x) if isinstance(x, list) else x for x in serializedProposal)
     return proposalTuple
 
-  def _receiveAndCheckProposal(self, trid):
+  def _receiveAndCheckProposal(self, trid, keptConnection=False):
     clientTransport = self._transportPool.get(trid)
     # Get the peer credentials
     credDict = clientTransport.getConnectingCredentials()
     # Receive the action proposal
     retVal = clientTransport.receiveData(1024)
     if not retVal['OK']:
+      if keptConnection:
+        # Clients close the connections they do not need any more
+        gLogger.debug("Kept connection closed by the client", retVal['Message'])
+        return S_ERROR("Connection closed")
       gLogger.error("Invalid action proposal", "%s %s" % (self._createIdentityString(credDict,
                                                                                      clientTransport),
                                                           retVal['Message']))
@@ -567,9 +635,23 @@ class Service(object):
       return S_ERROR("Server error while loading handler")
     return S_OK(handlerInstance)
 
+  def _keepConnectionRequested(self, proposalTuple):
+    """ Only RPC connections can be kept open, when the client asks for it
+
+        :param tuple proposalTuple: tuple describing the proposed action
+        :return: bool
+    """
+    if not self._idleConnections or proposalTuple[1][0] != 'RPC' or len(proposalTuple) < 5:
+      return False
+    return isinstance(proposalTuple[4], dict) and proposalTuple[4].get('keepConnection', False)
+
   def _processProposal(self, trid, proposalTuple, handlerObj):
     # Notify the client we're ready to execute the action
-    retVal = self._transportPool.send(trid, S_OK())
+    keepConnection = self._keepConnectionRequested(proposalTuple)
+    readyMsg = S_OK()
+    if keepConnection:
+      readyMsg['keepConnection'] = True
+    retVal = self._transportPool.send(trid, readyMsg)
     if not retVal['OK']:
       return retVal
 
@@ -598,6 +680,7 @@ class Service(object):
         self._msgBroker.removeTransport(trid)
 
     result['closeTransport'] = not messageConnection or not result['OK']
+    result['keepConnection'] = keepConnection and result['OK']
     return result
 
   def _mbConnect(self, trid, handlerObj=None):
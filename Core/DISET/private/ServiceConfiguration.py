@@ -79,6 +79,18 @@ class ServiceConfiguration:
     except BaseException:
       return 20
 
+  def getMaxIdleConnectionTime(self):
+    try:
+      return int(self.getOption("MaxIdleConnectionTime"))
+    except BaseException:
+      return 60
+
+  def getMaxIdleConnections(self):
+    try:
+      return int(self.getOption("MaxIdleConnections"))
+    except BaseException:
+      return 200
+
   def getMaxThreadsForMethod(self, actionType, method):
     try:
       return int(self.getOption("ThreadLimit/%s/%s" % (actionType, method)))
@@ -22,7 +22,6 @@ __RCSID__ = "$Id$"
 
 import time
 import select
-import cStringIO
 from hashlib import md5
 
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
@@ -159,22 +158,39 @@ class BaseTransport(object):
     except Exception as e:
       return S_ERROR("Exception while reading from peer: %s" % str(e))
 
+  def _readInto(self, view, skipReadyCheck=False):
+    """ Read at most len(view) bytes and store them in view.
+        Transports able to receive directly in a buffer should overwrite it.
+
+        :param view: writable memoryview
+        :param skipReadyCheck: passed to _read
+
+        :returns: S_OK(number of bytes read)
+    """
+    retVal = self._read(len(view), skipReadyCheck=skipReadyCheck)
+    if not retVal['OK']:
+      return retVal
+    data = retVal['Value']
+    view[:len(data)] = data
+    return S_OK(len(data))
+
   def _write(self, buf):
     return S_OK(self.oSocket.send(buf))
 
-  def sendData(self, uData, prefix=False):
-    self.__updateLastActionTimestamp()
-    sCodedData = MixedEncode.encode(uData)
-    if prefix:
-      dataToSend = "%s%s:%s" % (prefix, len(sCodedData), sCodedData)
-    else:
-      dataToSend = "%s:%s" % (len(sCodedData), sCodedData)
-    for index in range(0, len(dataToSend), self.packetSize):
-      bytesToSend = min(self.packetSize, len(dataToSend) - index)
+  def _writeBuffer(self, buf):
+    """ Send the whole buffer, packetSize bytes at a time
+
+        :param buf: string or memoryview to send
+
+        :returns: S_OK/S_ERROR
+    """
+    for index in range(0, len(buf), self.packetSize):
+      packet = buf[index:index + self.packetSize]
+      bytesToSend = len(packet)
       packSentBytes = 0
       while packSentBytes < bytesToSend:
         try:
-          result = self._write(dataToSend[index + packSentBytes: index + bytesToSend])
+          result = self._write(packet[packSentBytes:])
           if not result['OK']:
             return result
           sentBytes = result['Value']
@@ -183,9 +199,24 @@ class BaseTransport(object):
         if sentBytes == 0:
           return S_ERROR("Connection closed by peer")
         packSentBytes += sentBytes
+    return S_OK()
+
+  def sendData(self, uData, prefix=False):
+    self.__updateLastActionTimestamp()
+    sCodedData = MixedEncode.encode(uData)
+    if prefix:
+      header = "%s%s:" % (prefix, len(sCodedData))
+    else:
+      header = "%s:" % len(sCodedData)
+    # The header goes in the first packet together with the beginning of the data.
+    # The rest of the data is sent through a memoryview, so the message is never copied as a whole
+    firstPacketDataSize = max(self.packetSize - len(header), 0)
+    result = self._writeBuffer(header + sCodedData[:firstPacketDataSize])
+    if result['OK'] and len(sCodedData) > firstPacketDataSize:
+      result = self._writeBuffer(memoryview(sCodedData)[firstPacketDataSize:])
     del sCodedData
     sCodedData = None
-    return S_OK()
+    return result
 
   def receiveData(self, maxBufferSize=0, blockAfterKeepAlive=True, idleReceive=False):
     self.__updateLastActionTimestamp()
@@ -224,36 +255,31 @@ class BaseTransport(object):
       # From here it must be a real message!
       # Process the size and remove the msg length from the bytestream
       pkgSize = int(self.byteStream[:iSeparatorPosition])
-      pkgData = self.byteStream[iSeparatorPosition + 1:]
-      readSize = len(pkgData)
+      readSize = len(self.byteStream) - iSeparatorPosition - 1
       if readSize >= pkgSize:
         # If we already have all the data we need
-        data = pkgData[:pkgSize]
-        self.byteStream = pkgData[pkgSize:]
+        data = self.byteStream[iSeparatorPosition + 1:iSeparatorPosition + 1 + pkgSize]
+        self.byteStream = self.byteStream[iSeparatorPosition + 1 + pkgSize:]
       else:
-        # If we still need to read stuff
-        pkgMem = cStringIO.StringIO()
-        pkgMem.write(pkgData)
+        if maxBufferSize and pkgSize > maxBufferSize:
+          return S_ERROR("Read limit exceeded (%s chars)" % maxBufferSize)
+        # If we still need to read stuff, receive it directly in a buffer of the size of the message
+        pkgMem = bytearray(pkgSize)
+        pkgView = memoryview(pkgMem)
+        pkgView[:readSize] = self.byteStream[iSeparatorPosition + 1:]
+        self.byteStream = ""
         # Receive while there's still data to be received
         while readSize < pkgSize:
-          retVal = self._read(pkgSize - readSize, skipReadyCheck=True)
+          retVal = self._readInto(pkgView[readSize:], skipReadyCheck=True)
           if not retVal['OK']:
             return retVal
           if not retVal['Value']:
             return S_ERROR("Peer closed connection")
-          rcvData = retVal['Value']
-          readSize += len(rcvData)
-          pkgMem.write(rcvData)
-          if maxBufferSize and readSize > maxBufferSize:
-            return S_ERROR("Read limit exceeded (%s chars)" % maxBufferSize)
-        # Data is here! take it out from the bytestream, dencode and return
-        if readSize == pkgSize:
-          data = pkgMem.getvalue()
-          self.byteStream = ""
-        else:  # readSize > pkgSize:
-          pkgMem.seek(0, 0)
-          data = pkgMem.read(pkgSize)
-          self.byteStream = pkgMem.read()
+          readSize += retVal['Value']
+        # Data is here! It is decoded from the buffer, without copying it as a whole
+        del pkgView
+        data = pkgMem
+        del pkgMem
       try:
         data = MixedEncode.decode(data)[0]
       except Exception as e:
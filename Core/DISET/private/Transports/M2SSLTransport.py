@@ -315,6 +315,9 @@ class SSLTransport(BaseTransport):
 
         :returns: S_OK(number of bytes written)
     """
+    # BaseTransport sends large messages through a memoryview, one packet at a time
+    if isinstance(buf, memoryview):
+      buf = buf.tobytes()
     try:
       wrote = self.oSocket.write(buf)
       return S_OK(wrote)
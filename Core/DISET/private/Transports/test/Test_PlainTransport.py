@@ -0,0 +1,65 @@
+""" Test the message framing of BaseTransport through PlainTransport on a pair of connected sockets """
+
+import socket
+import threading
+
+from pytest import fixture
+
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+
+@fixture
+def transportPair():
+  """ Returns a (sender, receiver) pair of PlainTransport connected to each other """
+  sSock, rSock = socket.socketpair()
+  sender = PlainTransport(None)
+  sender.oSocket = sSock
+  receiver = PlainTransport(None)
+  receiver.oSocket = rSock
+  yield sender, receiver
+  sSock.close()
+  rSock.close()
+
+
+def sendInThread(transport, messages, packetSize=None):
+  """ Send the messages from a thread, so that large messages do not block on a full socket buffer """
+  if packetSize:
+    transport.packetSize = packetSize
+  results = []
+  thread = threading.Thread(target=lambda: results.extend(transport.sendData(msg) for msg in messages))
+  thread.start()
+  return thread, results
+
+
+def test_smallMessages(transportPair):
+  """ Several small messages end up in the same read, and are split correctly """
+  sender, receiver = transportPair
+  messages = [{'OK': True, 'Value': i} for i in range(10)]
+  thread, results = sendInThread(sender, messages)
+  thread.join()
+  assert all(res['OK'] for res in results)
+  for msg in messages:
+    assert receiver.receiveData() == msg
+  assert receiver.byteStream == ""
+
+
+def test_largeMessages(transportPair):
+  """ Messages bigger than a packet are received in a preallocated buffer """
+  sender, receiver = transportPair
+  messages = [{'OK': True, 'Value': 'x' * (3 * 1024 * 1024 + i)} for i in range(3)]
+  thread, results = sendInThread(sender, messages, packetSize=65536)
+  for msg in messages:
+    assert receiver.receiveData() == msg
+  thread.join()
+  assert all(res['OK'] for res in results)
+
+
+def test_readLimit(transportPair):
+  """ A message bigger than maxBufferSize is refused before being read """
+  sender, receiver = transportPair
+  thread, _results = sendInThread(sender, [{'OK': True, 'Value': 'x' * 100000}], packetSize=1024)
+  result = receiver.receiveData(maxBufferSize=50000)
+  assert not result['OK']
+  assert 'Read limit exceeded' in result['Message']
+  receiver.oSocket.close()
+  thread.join()
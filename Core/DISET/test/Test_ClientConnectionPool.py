@@ -0,0 +1,83 @@
+""" Unit tests for the pool of client connections kept open between RPC calls
+"""
+
+import os
+import socket
+import time
+
+from pytest import fixture
+
+from DIRAC.Core.DISET.private.ClientConnectionPool import ClientConnectionPool
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+__RCSID__ = "$Id$"
+
+
+@fixture
+def connection():
+  """ Returns (trid, client transport, server socket) for a connection registered in the transport pool
+  """
+  listenSock = socket.socket()
+  listenSock.bind(('127.0.0.1', 0))
+  listenSock.listen(1)
+  clientSock = socket.create_connection(listenSock.getsockname())
+  serverSock = listenSock.accept()[0]
+  listenSock.close()
+  transport = PlainTransport(None)
+  transport.oSocket = clientSock
+  transport.remoteAddress = clientSock.getpeername()
+  trid = getGlobalTransportPool().add(transport)
+  yield trid, transport, serverSock
+  getGlobalTransportPool().close(trid)
+  serverSock.close()
+
+
+def test_reuse(connection):
+  """ A connection given back is reused for the same key only """
+  trid, transport, _serverSock = connection
+  pool = ClientConnectionPool()
+  assert pool.get('key') is None
+  pool.connectionCreated()
+  created = time.time()
+  pool.put('key', trid, transport, created)
+  assert pool.get('otherKey') is None
+  assert pool.get('key') == (trid, transport, created)
+  # It is not available any more while it is used
+  assert pool.get('key') is None
+  stats = pool.getStats()
+  assert stats['created'] == 1
+  assert stats['reused'] == 1
+  assert stats['reuseRate'] == 0.5
+
+
+def test_closedByServer(connection):
+  """ A connection closed by the service is discarded """
+  trid, transport, serverSock = connection
+  pool = ClientConnectionPool()
+  pool.put('key', trid, transport, time.time())
+  serverSock.close()
+  assert pool.get('key') is None
+  assert pool.getStats()['discarded'] == 1
+  assert not getGlobalTransportPool().exists(trid)
+
+
+def test_expiration(connection):
+  """ Connections unused for too long, or too old, are closed """
+  trid, transport, _serverSock = connection
+  pool = ClientConnectionPool(maxIdleTime=30, maxLifeTime=600)
+  pool.put('key', trid, transport, time.time() - 1000)
+  assert pool.get('key') is None
+  assert pool.getStats()['expired'] == 1
+  assert not getGlobalTransportPool().exists(trid)
+
+
+def test_fork(connection, mocker):
+  """ A forked process does not reuse nor close the connections of its parent """
+  trid, transport, _serverSock = connection
+  pool = ClientConnectionPool()
+  pool.put('key', trid, transport, time.time())
+  mocker.patch('DIRAC.Core.DISET.private.ClientConnectionPool.os.getpid', return_value=os.getpid() + 1)
+  assert pool.get('key') is None
+  assert pool.getStats()['idle'] == 0
+  assert getGlobalTransportPool().exists(trid)
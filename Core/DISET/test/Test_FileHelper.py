@@ -0,0 +1,103 @@
+""" Unit tests for the data transmission of the FileHelper
+"""
+
+import io
+import threading
+import Queue
+
+import pytest
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.DISET.private.FileHelper import FileHelper
+
+__RCSID__ = "$Id$"
+
+
+class QueueTransport(object):
+  """ Transport exchanging the messages through queues instead of a socket """
+
+  def __init__(self, inQueue, outQueue):
+    self.inQueue = inQueue
+    self.outQueue = outQueue
+
+  def sendData(self, uData):
+    self.outQueue.put(uData)
+    return S_OK()
+
+  def receiveData(self, maxBufferSize=0):
+    try:
+      return self.inQueue.get(timeout=5)
+    except Queue.Empty:
+      return S_ERROR("Nothing received")
+
+
+def getFileHelpers(transferWindow):
+  """ Get a sending and a receiving FileHelper connected to each other """
+  toReceiver = Queue.Queue()
+  toSender = Queue.Queue()
+  sender = FileHelper(QueueTransport(toSender, toReceiver))
+  sender.setDirection("send")
+  receiver = FileHelper(QueueTransport(toReceiver, toSender))
+  receiver.setDirection("receive")
+  for fileHelper in (sender, receiver):
+    fileHelper.packetSize = 10
+    fileHelper.setTransferWindow(transferWindow)
+  return sender, receiver
+
+
+def sendInThread(sender, data):
+  """ Send the data in a thread, returns the thread and the list where its result will be """
+  results = []
+  thread = threading.Thread(target=lambda: results.append(sender.DataSourceToNetwork(io.BytesIO(data))))
+  thread.start()
+  return thread, results
+
+
+@pytest.mark.parametrize("transferWindow, dataSize", [(1, 1000), (4, 1000), (8, 1000), (8, 75), (8, 0)])
+def test_transfer(transferWindow, dataSize):
+  """ The data and the checksum arrive, and the next message exchanged is not an acknowledgement """
+  data = ''.join(chr(i % 256) for i in range(dataSize))
+  sender, receiver = getFileHelpers(transferWindow)
+
+  thread, results = sendInThread(sender, data)
+  dataSink = io.BytesIO()
+  res = receiver.networkToDataSink(dataSink)
+  thread.join()
+
+  assert res['OK'], res
+  assert results[0]['OK'], results[0]
+  assert dataSink.getvalue() == data
+  assert sender.finishedTransmission()
+  assert receiver.finishedTransmission()
+  assert sender.getTransferedBytes() == receiver.getTransferedBytes() == dataSize
+
+  receiver.oTransport.sendData(S_OK('Response'))
+  assert sender.oTransport.receiveData() == S_OK('Response')
+  assert sender.oTransport.inQueue.empty()
+  assert receiver.oTransport.inQueue.empty()
+
+
+@pytest.mark.parametrize("transferWindow, dataSize", [(1, 1000), (8, 1000), (8, 50), (8, 10)])
+def test_receiverAbort(transferWindow, dataSize):
+  """ The receiver can stop the transfer after the first packet, even if it is shorter than a window """
+  sender, receiver = getFileHelpers(transferWindow)
+
+  thread, results = sendInThread(sender, 'x' * dataSize)
+  res = receiver.receiveData()
+  assert res['OK'], res
+  receiver.markAsTransferred()
+  thread.join()
+
+  assert results[0]['OK'], results[0]
+  assert sender.finishedTransmission()
+  assert receiver.finishedTransmission()
+
+  receiver.oTransport.sendData(S_OK('Response'))
+  assert sender.oTransport.receiveData() == S_OK('Response')
+  assert sender.oTransport.inQueue.empty()
+  assert receiver.oTransport.inQueue.empty()
+
+
+@pytest.mark.parametrize("proposedWindow, transferWindow", [(None, 1), (0, 1), (4, 4), (1000, 8), ('bad', 1)])
+def test_negotiateTransferWindow(proposedWindow, transferWindow):
+  assert FileHelper.negotiateTransferWindow(proposedWindow) == transferWindow
@@ -0,0 +1,74 @@
+""" Unit tests for the watcher of the connections kept open by a service between RPC calls
+"""
+
+import socket
+import threading
+import time
+
+from pytest import fixture
+
+from DIRAC.Core.DISET.private.IdleConnectionsWatcher import IdleConnectionsWatcher
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.Transports.PlainTransport import PlainTransport
+
+__RCSID__ = "$Id$"
+
+
+@fixture
+def connection():
+  """ Returns (trid, client socket) for a server connection registered in the transport pool
+  """
+  listenSock = socket.socket()
+  listenSock.bind(('127.0.0.1', 0))
+  listenSock.listen(1)
+  clientSock = socket.create_connection(listenSock.getsockname())
+  serverSock = listenSock.accept()[0]
+  listenSock.close()
+  transport = PlainTransport(None, bServerMode=True)
+  transport.oSocket = serverSock
+  transport.remoteAddress = serverSock.getpeername()
+  trid = getGlobalTransportPool().add(transport)
+  yield trid, clientSock
+  getGlobalTransportPool().close(trid)
+  clientSock.close()
+
+
+def test_nextProposal(connection):
+  """ The connection is handed back as soon as the client sends something """
+  trid, clientSock = connection
+  readyEvent = threading.Event()
+  ready = []
+
+  def readyCallback(readyTrid):
+    ready.append(readyTrid)
+    readyEvent.set()
+
+  watcher = IdleConnectionsWatcher(getGlobalTransportPool(), readyCallback, maxIdleTime=10)
+  assert watcher.add(trid)
+  assert watcher.getNumConnections() == 1
+  clientSock.sendall(b'proposal')
+  assert readyEvent.wait(5)
+  assert ready == [trid]
+  assert watcher.getNumConnections() == 0
+  assert getGlobalTransportPool().exists(trid)
+  watcher.stop()
+
+
+def test_idleTimeout(connection):
+  """ Connections unused for too long are closed """
+  trid, _clientSock = connection
+  watcher = IdleConnectionsWatcher(getGlobalTransportPool(), lambda readyTrid: None, maxIdleTime=1)
+  assert watcher.add(trid)
+  for _ in range(50):
+    if not getGlobalTransportPool().exists(trid):
+      break
+    time.sleep(0.1)
+  assert not getGlobalTransportPool().exists(trid)
+  watcher.stop()
+
+
+def test_maxConnections(connection):
+  """ Above the limit, the caller has to close the connection """
+  trid, _clientSock = connection
+  watcher = IdleConnectionsWatcher(getGlobalTransportPool(), lambda readyTrid: None, maxConnections=0)
+  assert not watcher.add(trid)
@@ -0,0 +1,108 @@
+""" Unit tests for the streaming methods of RequestHandler
+"""
+
+from mock import MagicMock
+from pytest import fixture
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.DISET.RequestHandler import RequestHandler
+
+__RCSID__ = "$Id$"
+
+
+class StreamingHandler(RequestHandler):
+  """ Handler with a streaming and a normal method """
+
+  types_getChunks = [int]
+
+  def export_getChunks(self, nChunks):
+    for i in range(nChunks):
+      yield [i] * 3
+
+  types_getChunksWithError = []
+
+  def export_getChunksWithError(self):
+    yield 'first'
+    yield S_ERROR('Broken stream')
+    yield 'never sent'
+
+  types_getChunksWithException = []
+
+  def export_getChunksWithException(self):
+    yield 'first'
+    raise ValueError('Bad chunk')
+
+  types_getValue = []
+
+  def export_getValue(self):
+    return S_OK('value')
+
+
+@fixture
+def handler():
+  """ Instantiate the handler with a fake transport pool and lock manager """
+  trPool = MagicMock()
+  trPool.send.return_value = S_OK()
+  msgBroker = MagicMock()
+  msgBroker.getTransportPool.return_value = trPool
+  lockManager = MagicMock()
+  StreamingHandler._rh__initializeClass({'serviceName': 'Test/Streaming', 'csPaths': []},
+                                        lockManager, msgBroker, MagicMock())
+  return StreamingHandler({}, 'trid'), trPool, lockManager
+
+
+def callMethod(handler, method, args, streamReply):
+  """ Execute the RPC and return the list of messages sent to the client """
+  handlerObj, trPool, _lockManager = handler
+  argsMsg = S_OK(args)
+  if streamReply:
+    argsMsg['streamReply'] = True
+  trPool.receive.return_value = argsMsg
+  result = handlerObj._rh_executeAction(((), ('RPC', method)))
+  assert result['OK']
+  return [call[0][1] for call in trPool.send.call_args_list]
+
+
+def test_streamedReply(handler):
+  """ Chunks are sent one by one, followed by the end of stream """
+  sent = callMethod(handler, 'getChunks', [3], True)
+  assert [msg['Value'] for msg in sent[:-1]] == [[0] * 3, [1] * 3, [2] * 3]
+  assert all(msg['streamChunk'] for msg in sent[:-1])
+  assert sent[-1]['OK'] and sent[-1]['streamEnd']
+  assert sent[-1]['Value'] == 3
+  # The method lock is kept until the end of the stream
+  assert handler[2].unlock.call_count == 1
+
+
+def test_notStreamedReply(handler):
+  """ Clients not asking for a stream receive all the chunks at once """
+  sent = callMethod(handler, 'getChunks', [3], False)
+  assert len(sent) == 1
+  assert sent[0]['Value'] == [[0] * 3, [1] * 3, [2] * 3]
+  assert 'streamEnd' not in sent[0]
+
+
+def test_streamError(handler):
+  """ A S_ERROR yielded by the method interrupts the stream """
+  sent = callMethod(handler, 'getChunksWithError', [], True)
+  assert len(sent) == 2
+  assert sent[0]['Value'] == 'first'
+  assert not sent[1]['OK']
+  assert sent[1]['Message'] == 'Broken stream'
+  assert handler[2].unlock.call_count == 1
+
+
+def test_streamException(handler):
+  """ An exception in the method interrupts the stream with an error """
+  sent = callMethod(handler, 'getChunksWithException', [], False)
+  assert len(sent) == 1
+  assert not sent[0]['OK']
+  assert 'Bad chunk' in sent[0]['Message']
+  assert handler[2].unlock.call_count == 1
+
+
+def test_normalMethod(handler):
+  """ Non streaming methods are not affected """
+  sent = callMethod(handler, 'getValue', [], True)
+  assert len(sent) == 1
+  assert sent[0]['Value'] == 'value'
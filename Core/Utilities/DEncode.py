@@ -11,6 +11,11 @@ Encoding and decoding for dirac, Ids:
  l -> list
  t -> tuple
  d -> dictionary
+
+Two implementations of the same format are available: fastEncode/fastDecode,
+used by default, and dispatchEncode/dispatchDecode, which go through the per type
+functions of g_dEncodeFunctions and g_dDecodeFunctions. The latter is used when
+DIRAC_DEBUG_DENCODE_CALLSTACK is set.
 """
 from __future__ import print_function
 __RCSID__ = "$Id$"
@@ -479,28 +484,243 @@ g_dEncodeFunctions[types.DictType] = encodeDict
 g_dDecodeFunctions["d"] = decodeDict
 
 
-# Encode function
+def dispatchEncode(uObject):
+  """ Encoding function going through the per type functions of g_dEncodeFunctions.
+      It is slower than fastEncode, but it is the one used when debugging the call stack
+  """
+
+  eList = []
+  g_dEncodeFunctions[type(uObject)](uObject, eList)
+  return "".join(eList)
+
+
+def dispatchDecode(data):
+  """ Decoding function going through the per type functions of g_dDecodeFunctions.
+      It is slower than fastDecode, but it is the one used when debugging the call stack
+  """
+  if not data:
+    return data
+  return g_dDecodeFunctions[data[0]](data, 0)
+
+
+def _fastEncodeDateTime(oValue):
+  """ Encoding of the naive datetime types, producing the same output as encodeDateTime
+
+      :param oValue: datetime, date or time object without tzinfo
+
+      :returns: tuple of strings
+  """
+  oType = type(oValue)
+  if oType is _dateTimeType:
+    return ("zati", str(oValue.year), "ei", str(oValue.month), "ei", str(oValue.day),
+            "ei", str(oValue.hour), "ei", str(oValue.minute), "ei", str(oValue.second),
+            "ei", str(oValue.microsecond), "ene")
+  elif oType is _dateType:
+    return ("zdti", str(oValue.year), "ei", str(oValue.month), "ei", str(oValue.day), "ee")
+  return ("ztti", str(oValue.hour), "ei", str(oValue.minute), "ei", str(oValue.second),
+          "ei", str(oValue.microsecond), "ene")
+
+
+def _fastEncodeObject(uObject, extend):
+  """ Add the encoding of uObject to the output through the extend method.
+      The most common types are inlined, the rest is delegated to g_dEncodeFunctions,
+      which also makes sure that an unknown type raises the same KeyError as before.
+      Strings and ints inside containers are encoded without a recursive call, as they
+      make up most of the bulk replies.
+
+      :param uObject: object to encode
+      :param extend: extend method of the output list
+  """
+  oType = type(uObject)
+  if oType is str:
+    extend(("s", str(len(uObject)), ":", uObject))
+  elif oType is dict:
+    extend("d")
+    # keys are still sorted so that the output is byte to byte identical to dispatchEncode
+    for key in sorted(uObject):
+      value = uObject[key]
+      kType = type(key)
+      if kType is str:
+        extend(("s", str(len(key)), ":", key))
+      elif kType is int:
+        extend(("i", str(key), "e"))
+      else:
+        _fastEncodeObject(key, extend)
+      vType = type(value)
+      if vType is str:
+        extend(("s", str(len(value)), ":", value))
+      elif vType is int:
+        extend(("i", str(value), "e"))
+      else:
+        _fastEncodeObject(value, extend)
+    extend("e")
+  elif oType is list or oType is tuple:
+    extend("l" if oType is list else "t")
+    for item in uObject:
+      iType = type(item)
+      if iType is str:
+        extend(("s", str(len(item)), ":", item))
+      elif iType is int:
+        extend(("i", str(item), "e"))
+      else:
+        _fastEncodeObject(item, extend)
+    extend("e")
+  elif oType is int:
+    extend(("i", str(uObject), "e"))
+  elif oType is bool:
+    extend(("b1",) if uObject else ("b0",))
+  elif uObject is None:
+    extend("n")
+  elif oType is float:
+    extend(("f", str(uObject), "e"))
+  elif oType is unicode:
+    valueStr = uObject.encode('utf-8')
+    extend(("u", str(len(valueStr)), ":", valueStr))
+  elif oType is long:
+    extend(("I", str(uObject), "e"))
+  elif oType in _fastDateTimeTypes and (oType is _dateType or uObject.tzinfo is None):
+    extend(_fastEncodeDateTime(uObject))
+  else:
+    eList = []
+    g_dEncodeFunctions[oType](uObject, eList)
+    extend(eList)
+
+
+_fastDateTimeTypes = (_dateTimeType, _dateType, _timeType)
+
+
+def fastEncode(uObject):
+  """ Single pass encoding function. The output is identical to the one of dispatchEncode
+
+      :param uObject: object to encode
+
+      :returns: encoded string
+  """
+
+  eList = []
+  _fastEncodeObject(uObject, eList.extend)
+  return "".join(eList)
+
+
+# Marker of a dictionary waiting for its next key
+_noKey = object()
+# Tags of the data held in a bytearray, indexed by byte
+_bufferTags = [chr(byte) for byte in range(256)]
+
+
+def fastDecode(data):
+  """ Iterative decoding function. It understands the same format as dispatchDecode,
+      but walks the data with indexes and an explicit stack of the containers being built
+      instead of recursive calls through g_dDecodeFunctions.
+
+      The data can also be a bytearray, e.g. the buffer a message was received in, so that it is
+      not copied as a whole: only the decoded strings are. A buffer holding types decoded through
+      g_dDecodeFunctions, e.g. datetimes, is converted to a string the first time one is found.
+
+      :param data: encoded string or bytearray
+
+      :returns: tuple (decoded object, length of the data consumed)
+  """
+  if not data:
+    return data
+
+  isBuffer = isinstance(data, bytearray)
+  index = data.index
+  stack = []
+  # Container being filled, its tag and, for dictionaries, the key waiting for its value
+  container = None
+  containerTag = None
+  key = _noKey
+  i = 0
+  while True:
+    tag = _bufferTags[data[i]] if isBuffer else data[i]
+    if tag == "s":
+      colon = index(":", i + 1)
+      i = colon + 1 + int(data[i + 1:colon])
+      value = data[colon + 1:i]
+      if isBuffer:
+        value = str(value)
+    elif tag == "i":
+      end = index("e", i + 1)
+      value = int(data[i + 1:end])
+      i = end + 1
+    elif tag == "d":
+      stack.append((container, containerTag, key))
+      container = {}
+      containerTag = tag
+      key = _noKey
+      i += 1
+      continue
+    elif tag == "l" or tag == "t":
+      stack.append((container, containerTag, key))
+      container = []
+      containerTag = tag
+      i += 1
+      continue
+    elif tag == "e":
+      value = tuple(container) if containerTag == "t" else container
+      container, containerTag, key = stack.pop()
+      i += 1
+    elif tag == "b":
+      value = data[i + 1:i + 2] != "0"
+      i += 2
+    elif tag == "n":
+      value = None
+      i += 1
+    elif tag == "f":
+      end = index("e", i + 1)
+      if end + 1 < len(data) and data[end + 1:end + 2] in ('+', '-'):
+        eI = end
+        end = index("e", end + 1)
+        value = float(data[i + 1:eI]) * 10 ** int(data[eI + 1:end])
+      else:
+        value = float(data[i + 1:end])
+      i = end + 1
+    elif tag == "u":
+      colon = index(":", i + 1)
+      i = colon + 1 + int(data[i + 1:colon])
+      value = unicode(str(data[colon + 1:i]), 'utf-8')
+    elif tag == "I":
+      end = index("e", i + 1)
+      value = long(data[i + 1:end])
+      i = end + 1
+    else:
+      # datetimes and any other registered type
+      if isBuffer:
+        data = str(data)
+        index = data.index
+        isBuffer = False
+      value, i = g_dDecodeFunctions[tag](data, i)
+
+    if containerTag == "d":
+      if key is _noKey:
+        key = value
+      else:
+        container[key] = value
+        key = _noKey
+    elif container is None:
+      return (value, i)
+    else:
+      container.append(value)
+
+
 def encode(uObject):
   """ Generic encoding function """
 
-  try:
-    eList = []
-    # print "ENCODE FUNCTION : %s" % g_dEncodeFunctions[ type( uObject ) ]
-    g_dEncodeFunctions[type(uObject)](uObject, eList)
-    return "".join(eList)
-  except Exception:
-    raise
+  # The call stack debugging hooks only exist in the per type functions
+  if DIRAC_DEBUG_DENCODE_CALLSTACK:
+    return dispatchEncode(uObject)
+  return fastEncode(uObject)
 
 
 def decode(data):
   """ Generic decoding function """
-  if not data:
-    return data
-  try:
-    # print "DECODE FUNCTION : %s" % g_dDecodeFunctions[ sStream [ iIndex ] ]
-    return g_dDecodeFunctions[data[0]](data, 0)
-  except Exception:
-    raise
+
+  if DIRAC_DEBUG_DENCODE_CALLSTACK:
+    if isinstance(data, bytearray):
+      data = str(data)
+    return dispatchDecode(data)
+  return fastDecode(data)
 
 
 if __name__ == "__main__":
@@ -20,12 +20,14 @@ def encode(inData):
 def decode(encodedData):
   """ Decode the encoded string
 
-      :param encodedData: encoded string
+      :param encodedData: encoded string, or bytearray for DEncode
 
       :return: the decoded objects, encoded object length
 
   """
   if os.getenv('DIRAC_USE_JSON_DECODE', 'NO').lower() in ('yes', 'true'):
+    if isinstance(encodedData, bytearray):
+      encodedData = str(encodedData)
     try:
       # 'null' is a special case.
       # None is encoded as 'null' as JSON
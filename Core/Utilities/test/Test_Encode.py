@@ -14,6 +14,7 @@ import sys
 
 
 from DIRAC.Core.Utilities.DEncode import encode as disetEncode, decode as disetDecode, g_dEncodeFunctions
+from DIRAC.Core.Utilities.DEncode import dispatchEncode, dispatchDecode, fastEncode, fastDecode
 from DIRAC.Core.Utilities.JEncode import encode as jsonEncode, decode as jsonDecode, JSerializable
 from DIRAC.Core.Utilities.MixedEncode import encode as mixEncode, decode as mixDecode
 
@@ -30,20 +31,27 @@ parametrize = mark.parametrize
 # function, and add the tuple here
 
 disetTuple = (disetEncode, disetDecode)
+dispatchTuple = (dispatchEncode, dispatchDecode)
+fastTuple = (fastEncode, fastDecode)
 jsonTuple = (jsonEncode, jsonDecode)
 mixTuple = (mixEncode, mixDecode)
 
-enc_dec_imp = (disetTuple, jsonTuple, (mixTuple, 'No', 'No'), (mixTuple, 'Yes', 'No'), (mixTuple, 'Yes', 'Yes'))
+enc_dec_imp = (disetTuple, dispatchTuple, fastTuple, jsonTuple,
+               (mixTuple, 'No', 'No'), (mixTuple, 'Yes', 'No'), (mixTuple, 'Yes', 'Yes'))
 enc_dec_ids = (
     'disetTuple',
+    'dispatchTuple',
+    'fastTuple',
     'jsonTuple',
     'mixTuple',
     'mixTuple (DIRAC_USE_JSON_DECODE=Yes)',
     'mixTuple (DIRAC_USE_JSON_ENCODE=Yes')
 
-enc_dec_imp_without_json = (disetTuple, (mixTuple, 'No', 'No'), (mixTuple, 'Yes', 'No'))
+enc_dec_imp_without_json = (disetTuple, dispatchTuple, fastTuple, (mixTuple, 'No', 'No'), (mixTuple, 'Yes', 'No'))
 enc_dec_ids_without_json = (
     'disetTuple',
+    'dispatchTuple',
+    'fastTuple',
     'mixTuple',
     'mixTuple (DIRAC_USE_JSON_DECODE=Yes)')
 
@@ -231,6 +239,54 @@ def test_nestedStructure(enc_dec_without_json, data):
   agnosticTestFunction(enc_dec_without_json, data)
 
 
+@given(data=nestedStrategy)
+def test_fastAndDispatchAreIdentical(data):
+  """ The fast implementation must stay wire compatible with the per type dispatch one """
+
+  encodedData = fastEncode(data)
+  assert encodedData == dispatchEncode(data)
+  assert fastDecode(encodedData) == dispatchDecode(encodedData)
+
+
+@given(data=floats(allow_nan=False))
+def test_fastAndDispatchFloats(data):
+  """ Floats have their own exponent handling when decoding """
+
+  encodedData = fastEncode(data)
+  assert encodedData == dispatchEncode(data)
+  assert fastDecode(encodedData) == dispatchDecode(encodedData)
+
+
+@parametrize('data', [datetime.date(2020, 2, 29), datetime.time(23, 59, 1, 12),
+                      datetime.datetime(2020, 2, 29, 23, 59, 1, 12), [datetime.date(1999, 1, 1), 1, 2 ** 70]])
+def test_fastAndDispatchDates(data):
+  """ Dates and times are encoded without going through g_dEncodeFunctions by fastEncode """
+
+  encodedData = fastEncode(data)
+  assert encodedData == dispatchEncode(data)
+  assert fastDecode(encodedData) == dispatchDecode(encodedData) == (data, len(encodedData))
+
+
+@given(data=nestedStrategy)
+def test_decodeBuffer(data):
+  """ The data received in a bytearray is decoded without being converted to a string first """
+
+  encodedData = disetEncode(data)
+  assert disetDecode(bytearray(encodedData)) == disetDecode(encodedData)
+  assert mixDecode(bytearray(encodedData)) == mixDecode(encodedData)
+
+
+@parametrize('data', [[u'\xe9t\xe9', 1.5e-300, -2.5e+21, True, False, 'x' * 1000],
+                      {'date': datetime.datetime(2020, 2, 29, 23, 59, 1), 'after': ['s', 2 ** 70]}])
+def test_decodeBufferTypes(data):
+  """ The types decoded from a buffer with slices, and the ones decoded through g_dDecodeFunctions """
+
+  encodedData = disetEncode(data)
+  decodedData = fastDecode(bytearray(encodedData))
+  assert decodedData == fastDecode(encodedData) == (data, len(encodedData))
+  assert [type(item) for item in decodedData[0]] == [type(item) for item in data]
+
+
 # DEncode raises KeyError.....
 # Others raise TypeError
 # @parametrize('enc_dec', enc_dec_imp)
@@ -0,0 +1,113 @@
+""" DirectoryCache keeps in memory the directory paths and IDs resolved by a directory tree
+"""
+
+__RCSID__ = "$Id$"
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class DirectoryCache(object):
+  """ Size bounded LRU cache of the directory path <-> DirID mapping, shared by all the threads
+      of the service. Only existing directories are cached. The entries expire after a lifetime,
+      so that the directories removed through another service instance are eventually forgotten.
+  """
+
+  def __init__(self, maxSize=0, lifetime=0):
+    """ c'tor
+
+        :param int maxSize: maximum number of directories in the cache, 0 disables the cache
+        :param int lifetime: number of seconds an entry is valid
+    """
+    self.maxSize = maxSize
+    self.lifetime = lifetime
+    self.__lock = threading.Lock()
+    # { path: ( dirID, expiration time ) }, from the least to the most recently used
+    self.__paths = OrderedDict()
+    # { dirID: path }
+    self.__dirIDs = {}
+    self.__hits = 0
+    self.__misses = 0
+
+  def isEnabled(self):
+    return self.maxSize > 0
+
+  def getDirID(self, path):
+    """ Get the DirID of a directory path
+
+        :return: DirID or None if not in the cache
+    """
+    path = os.path.normpath(path)
+    with self.__lock:
+      entry = self.__paths.pop(path, None)
+      if entry is None or entry[1] < time.time():
+        if entry is not None:
+          self.__dirIDs.pop(entry[0], None)
+        self.__misses += 1
+        return None
+      self.__paths[path] = entry
+      self.__hits += 1
+      return entry[0]
+
+  def getPath(self, dirID):
+    """ Get the path of a DirID
+
+        :return: path or None if not in the cache
+    """
+    with self.__lock:
+      path = self.__dirIDs.get(dirID)
+    if path is None:
+      with self.__lock:
+        self.__misses += 1
+      return None
+    if self.getDirID(path) != dirID:
+      return None
+    return path
+
+  def add(self, path, dirID):
+    """ Add a directory to the cache, dropping the least recently used ones if it is full
+    """
+    if not self.isEnabled() or not dirID:
+      return
+    path = os.path.normpath(path)
+    with self.__lock:
+      oldEntry = self.__paths.pop(path, None)
+      if oldEntry is not None:
+        self.__dirIDs.pop(oldEntry[0], None)
+      self.__paths[path] = (dirID, time.time() + self.lifetime)
+      self.__dirIDs[dirID] = path
+      while len(self.__paths) > self.maxSize:
+        _oldPath, (oldDirID, _expiration) = self.__paths.popitem(last=False)
+        self.__dirIDs.pop(oldDirID, None)
+
+  def remove(self, path):
+    """ Remove a directory and its subdirectories from the cache
+    """
+    path = os.path.normpath(path)
+    prefix = path.rstrip('/') + '/'
+    with self.__lock:
+      for cachedPath in list(self.__paths):
+        if cachedPath == path or cachedPath.startswith(prefix):
+          dirID, _expiration = self.__paths.pop(cachedPath)
+          self.__dirIDs.pop(dirID, None)
+
+  def clear(self):
+    with self.__lock:
+      self.__paths.clear()
+      self.__dirIDs.clear()
+
+  def getStatistics(self):
+    """ Get the size and the hit rate of the cache
+
+        :return: dictionary with Size, MaxSize, Lifetime, Hits, Misses and HitRate in percent
+    """
+    with self.__lock:
+      lookups = self.__hits + self.__misses
+      return {'Size': len(self.__paths),
+              'MaxSize': self.maxSize,
+              'Lifetime': self.lifetime,
+              'Hits': self.__hits,
+              'Misses': self.__misses,
+              'HitRate': 100. * self.__hits / lookups if lookups else 0.}
@@ -31,8 +31,9 @@ class DirectoryClosure(DirectoryTreeBase):
     DirectoryTreeBase.__init__(self, database)
     self.directoryTable = 'FC_DirectoryList'
     self.closureTable = 'FC_DirectoryClosure'
+    self.dirInfoTable = self.directoryTable
 
-  def findDir(self, path, connection=False):
+  def _findDir(self, path, connection=False):
     """  Find directory ID for the given path
 
       :param path: path of the directory
@@ -52,7 +53,7 @@ class DirectoryClosure(DirectoryTreeBase):
     res['Level'] = result['Value'][1]
     return res
 
-  def findDirs(self, paths, connection=False):
+  def _findDirs(self, paths, connection=False):
     """ Find DirIDs for the given path list
 
         :param paths: list of path
@@ -97,6 +98,7 @@ class DirectoryClosure(DirectoryTreeBase):
     result = self.db.executeStoredProcedure('ps_remove_dir', (dirId, ), outputIds=[])
     if not result['OK']:
       return result
+    self.dirCache.remove(path)
 
     result['DirID'] = dirId
     return result
@@ -118,7 +120,7 @@ class DirectoryClosure(DirectoryTreeBase):
     else:
       return S_OK({"Exists": True, "DirID": result['Value']})
 
-  def getDirectoryPath(self, dirID):
+  def _getDirectoryPath(self, dirID):
     """ Get directory name by directory ID
 
         :param dirID: directory ID
@@ -138,7 +140,7 @@ class DirectoryClosure(DirectoryTreeBase):
 
     return S_OK(dirName)
 
-  def getDirectoryPaths(self, dirIDList):
+  def _getDirectoryPaths(self, dirIDList):
     """ Get directory names by directory ID list
 
         :param dirIDList: list of dirIds
@@ -335,8 +337,8 @@ class DirectoryClosure(DirectoryTreeBase):
     dpath = os.path.normpath(path)
     parentDir = os.path.dirname(dpath)
 
-    # Try to see if the dir exists
-    result = self.findDir(path)
+    # Try to see if the dir exists, not from the cache: it may have been removed by another service instance
+    result = self._findDir(path)
     if not result['OK']:
       return result
 
@@ -375,6 +377,7 @@ class DirectoryClosure(DirectoryTreeBase):
         return result
 
       dirId = result['Value'][0][0]
+      self.dirCache.add(dpath, dirId)
 
       result = S_OK(dirId)
       result['NewDirectory'] = True
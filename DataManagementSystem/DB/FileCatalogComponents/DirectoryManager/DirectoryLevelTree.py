@@ -28,7 +28,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
 
     return 'Directory'
 
-  def findDir(self, path, connection=False):
+  def _findDir(self, path, connection=False):
     """  Find directory ID for the given path
     """
 
@@ -48,7 +48,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     res['Level'] = result['Value'][0][1]
     return res
 
-  def findDirs(self, paths, connection=False):
+  def _findDirs(self, paths, connection=False):
     """ Find DirIDs for the given path list
     """
     dpathList = []
@@ -83,6 +83,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     dirID = result['Value']
     req = "DELETE FROM FC_DirectoryLevelTree WHERE DirID=%d" % dirID
     result = self.db._update(req)
+    self.dirCache.remove(path)
     result['DirID'] = dirID
     return result
 
@@ -110,7 +111,8 @@ class DirectoryLevelTree(DirectoryTreeBase):
   def makeDir(self, path):
     """ Create a new directory entry
     """
-    result = self.findDir(path)
+    # Not from the cache: the directory may have been removed by another service instance
+    result = self._findDir(path)
     if not result['OK']:
       return result
     dirID = result['Value']
@@ -190,6 +192,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     else:
       result = self.db._query("ROLLBACK;", conn)
 
+    self.dirCache.add(path, dirID)
     result = S_OK(dirID)
     result['NewDirectory'] = True
     return result
@@ -234,7 +237,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
 
     return S_OK(result['Value'][0][0])
 
-  def getDirectoryPath(self, dirID):
+  def _getDirectoryPath(self, dirID):
     """ Get directory name by directory ID
     """
     req = "SELECT DirName FROM FC_DirectoryLevelTree WHERE DirID=%d" % int(dirID)
@@ -246,7 +249,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
 
     return S_OK(result['Value'][0][0])
 
-  def getDirectoryPaths(self, dirIDList):
+  def _getDirectoryPaths(self, dirIDList):
     """ Get directory name by directory ID list
     """
     dirs = dirIDList
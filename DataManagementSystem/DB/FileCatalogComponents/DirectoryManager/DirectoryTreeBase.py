@@ -9,7 +9,9 @@ import os
 import stat
 
 from DIRAC import S_OK, S_ERROR, gLogger
+from DIRAC.Core.Utilities.List import intListToString
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities import getIDSelectString
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryManager.DirectoryCache import DirectoryCache
 
 DEBUG = 0
 
@@ -22,6 +24,9 @@ class DirectoryTreeBase(object):
     self.db = database
     self.lock = threading.Lock()
     self.treeTable = ''
+    self.dirInfoTable = 'FC_DirectoryInfo'
+    self.dirCache = DirectoryCache(getattr(database, 'directoryCacheSize', 0),
+                                   getattr(database, 'directoryCacheLifetime', 0))
 
 ############################################################################
 #
@@ -29,12 +34,12 @@ class DirectoryTreeBase(object):
 #
 ############################################################################
 
-  def findDir(self, path, connection=False):
+  def _findDir(self, path, connection=False):
     """  Find directory ID for the given path
     """
     return S_ERROR("To be implemented on derived class")
 
-  def findDirs(self, paths, connection=False):
+  def _findDirs(self, paths, connection=False):
     """ Find DirIDs for the given path list
     """
     return S_ERROR("To be implemented on derived class")
@@ -50,11 +55,16 @@ class DirectoryTreeBase(object):
   def getChildren(self, path, connection=False):
     return S_ERROR("To be implemented on derived class")
 
-  def getDirectoryPath(self, dirID):
+  def _getDirectoryPath(self, dirID):
     """ Get directory name by directory ID
     """
     return S_ERROR("To be implemented on derived class")
 
+  def _getDirectoryPaths(self, dirIDList):
+    """ Get directory names by directory ID list
+    """
+    return S_ERROR("To be implemented on derived class")
+
   def countSubdirectories(self, dirId, includeParent=True):
     return S_ERROR("To be implemented on derived class")
 
@@ -63,6 +73,85 @@ class DirectoryTreeBase(object):
     """
     return S_ERROR("To be implemented on derived class")
 
+##########################################################################
+#
+# Directory path resolution, served by the directory cache when possible
+#
+##########################################################################
+
+  def findDir(self, path, connection=False):
+    """  Find directory ID for the given path
+    """
+    if not self.dirCache.isEnabled():
+      return self._findDir(path, connection)
+    dirID = self.dirCache.getDirID(path)
+    if dirID is not None:
+      return S_OK(dirID)
+    result = self._findDir(path, connection)
+    if result['OK']:
+      self.dirCache.add(path, result['Value'])
+    return result
+
+  def findDirs(self, paths, connection=False):
+    """ Find DirIDs for the given path list
+    """
+    if not self.dirCache.isEnabled():
+      return self._findDirs(paths, connection)
+    dirDict = {}
+    notCachedPaths = []
+    for path in paths:
+      dirID = self.dirCache.getDirID(path)
+      if dirID is None:
+        notCachedPaths.append(path)
+      else:
+        dirDict[os.path.normpath(path)] = dirID
+    if notCachedPaths:
+      result = self._findDirs(notCachedPaths, connection)
+      if not result['OK']:
+        return result
+      for dirName, dirID in result['Value'].items():
+        self.dirCache.add(dirName, dirID)
+      dirDict.update(result['Value'])
+    return S_OK(dirDict)
+
+  def getDirectoryPath(self, dirID):
+    """ Get directory name by directory ID
+    """
+    if not self.dirCache.isEnabled():
+      return self._getDirectoryPath(dirID)
+    path = self.dirCache.getPath(dirID)
+    if path is not None:
+      return S_OK(path)
+    result = self._getDirectoryPath(dirID)
+    if result['OK']:
+      self.dirCache.add(result['Value'], dirID)
+    return result
+
+  def getDirectoryPaths(self, dirIDList):
+    """ Get directory names by directory ID list
+    """
+    if not self.dirCache.isEnabled():
+      return self._getDirectoryPaths(dirIDList)
+    dirs = dirIDList
+    if not isinstance(dirIDList, list):
+      dirs = [dirIDList]
+    dirDict = {}
+    notCachedIDs = []
+    for dirID in dirs:
+      path = self.dirCache.getPath(dirID)
+      if path is None:
+        notCachedIDs.append(dirID)
+      else:
+        dirDict[dirID] = path
+    if notCachedIDs:
+      result = self._getDirectoryPaths(notCachedIDs)
+      if not result['OK']:
+        return result
+      for dirID, path in result['Value'].items():
+        self.dirCache.add(path, dirID)
+      dirDict.update(result['Value'])
+    return S_OK(dirDict)
+
 ##########################################################################
 
   def _getConnection(self, connection):
@@ -335,6 +424,66 @@ class DirectoryTreeBase(object):
 
     return S_OK(dirDict)
 
+#####################################################################
+  def getDirectoriesParameters(self, paths):
+    """ Get the parameters of several directories with a single query
+
+        :param list paths: directory paths
+        :return: S_OK( { 'Successful': { path: parameters dictionary as returned by getDirectoryParameters },
+                         'Failed': { path: error message } } )
+    """
+    successful = {}
+    failed = {}
+    if not paths:
+      return S_OK({'Successful': successful, 'Failed': failed})
+
+    result = self.findDirs(paths)
+    if not result['OK']:
+      return result
+    dirIDPaths = {}
+    for path in paths:
+      dirID = result['Value'].get(os.path.normpath(path))
+      if dirID:
+        dirIDPaths.setdefault(dirID, []).append(path)
+      else:
+        failed[path] = 'Directory not found'
+    if not dirIDPaths:
+      return S_OK({'Successful': successful, 'Failed': failed})
+
+    query = "SELECT DirID,UID,GID,Status,Mode,CreationDate,ModificationDate FROM %s" % self.dirInfoTable
+    query += " WHERE DirID IN (%s)" % intListToString(dirIDPaths.keys())
+    resQuery = self.db._query(query)
+    if not resQuery['OK']:
+      return resQuery
+
+    userNames = {}
+    groupNames = {}
+    for dirID, uid, gid, status, mode, creationDate, modificationDate in resQuery['Value']:
+      if uid not in userNames:
+        result = self.db.ugManager.getUserName(uid)
+        userNames[uid] = result['Value'] if result['OK'] else 'unknown'
+      if gid not in groupNames:
+        result = self.db.ugManager.getGroupName(gid)
+        groupNames[gid] = result['Value'] if result['OK'] else 'unknown'
+      dirDict = {'DirID': int(dirID),
+                 'UID': int(uid),
+                 'Owner': userNames[uid],
+                 'GID': int(gid),
+                 'OwnerGroup': groupNames[gid],
+                 'Status': int(status),
+                 'Mode': int(mode),
+                 'CreationDate': creationDate,
+                 'ModificationDate': modificationDate}
+      for path in dirIDPaths.pop(dirID, []):
+        successful[path] = dict(dirDict)
+
+    # Directories removed since they were found
+    for dirPaths in dirIDPaths.values():
+      for path in dirPaths:
+        failed[path] = 'Directory not found'
+
+    return S_OK({'Successful': successful, 'Failed': failed})
+
 #####################################################################
   def _setDirectoryParameter(self, path, pname, pvalue):
     """ Set a numerical directory parameter
@@ -4,13 +4,13 @@
 __RCSID__ = "$Id$"
 
 import os
+import stat
 import datetime
 
 from DIRAC import S_OK, S_ERROR
 from DIRAC.ConfigurationSystem.Client.Helpers.Registry import getAllGroups, getGroupOption
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.SecurityManager.SecurityManagerBase \
     import SecurityManagerBase, _readMethods, _writeMethods
-from DIRAC.Core.Utilities.ReturnValues import returnSingleResult
 
 
 class VOMSSecurityManager(SecurityManagerBase):
@@ -85,56 +85,121 @@ class VOMSSecurityManager(SecurityManagerBase):
 
     return False
 
-  def __getFilePermission(self, path, credDict, noExistStrategy=None):
-    """ Checks POSIX permission for a file using the VOMS roles.
+  def __getPermissionsFromParameters(self, parameters, credDict):
+    """ Computes the POSIX permissions on a directory from its owner, owner group and mode.
+        If the owner group of the directory shares the same vomsRole as the requesting user,
+        the permissions are the ones of the owner group.
+
+        :param parameters : dictionary with the Owner, OwnerGroup and Mode of the directory
+        :param credDict : credential of the user
+
+        :returns dictionary ( Read/Write/Execute : True/False)
+    """
+    userGroup = credDict.get('group', 'anon')
+    owner = credDict.get('username', 'anon') == parameters['Owner']
+    group = (userGroup == parameters['OwnerGroup']) or bool(self.__shareVomsRole(userGroup, parameters['OwnerGroup']))
+    mode = parameters['Mode']
+
+    resultDict = {}
+    if self.db.globalReadAccess:
+      resultDict['Read'] = True
+    else:
+      resultDict['Read'] = (owner and mode & stat.S_IRUSR > 0)\
+          or (group and mode & stat.S_IRGRP > 0)\
+          or mode & stat.S_IROTH > 0
+
+    resultDict['Write'] = (owner and mode & stat.S_IWUSR > 0)\
+        or (group and mode & stat.S_IWGRP > 0)\
+        or mode & stat.S_IWOTH > 0
+
+    resultDict['Execute'] = (owner and mode & stat.S_IXUSR > 0)\
+        or (group and mode & stat.S_IXGRP > 0)\
+        or mode & stat.S_IXOTH > 0
+
+    return resultDict
+
+  def __getFilesPermissions(self, paths, credDict, noExistStrategy=None):
+    """ Checks POSIX permission for files using the VOMS roles.
         That is, if the owner group of the file shares the same vomsRole as the requesting user,
         we check the permission as if the request was done with the real owner group.
 
-        :param path : file path (string)
+        The metadata of all the files are fetched at once, and the permissions are then
+        fetched once per owner group.
+
+        :param paths : list of file paths
         :param credDict : credential of the user
-        :param noExistStrategy : If the directory does not exist, we can
+        :param noExistStrategy : If the file does not exist, we can
                                  * True : allow the access
                                  * False : forbid the access
                                  * None : return the error as is
 
-        :returns S_OK structure with a dictionary ( Read/Write/Execute : True/False)
+        :returns S_OK structure with a Successful dictionary ( path : { Read/Write/Execute : True/False } )
+                 and a Failed dictionary ( path : error message )
     """
 
-    if not path:
-      return S_ERROR('Empty path')
+    successful = {}
+    failed = {}
+    # Error message for each path, to which the noExistStrategy is applied
+    errors = {}
 
-    # We check what is the group stored in the DB for the given path
-    res = returnSingleResult(self.db.fileManager.getFileMetadata([path]))
+    paths = list(paths)
+    for path in paths:
+      if not path:
+        failed[path] = 'Empty path'
+    paths = [path for path in paths if path]
+    if not paths:
+      return S_OK({'Successful': successful, 'Failed': failed})
+
+    # We check what is the group stored in the DB for the given paths
+    res = self.db.fileManager.getFileMetadata(paths)
     if not res['OK']:
-      # If the error is not due to the directory not existing, we return
-      if not self.__isNotExistError(res['Message']):
-        return res
-
-      # From now on, we know that the error is due to the file not existing
-
-      # If we have no strategy regarding non existing files, then just return the error
-      if noExistStrategy is None:
-        return res
-
-      # Finally, follow the strategy
-      return S_OK(dict.fromkeys(['Read', 'Write', 'Execute'], noExistStrategy))
-
-    #===========================================================================
-    # # This does not seem necessary since we add the OwnerGroup in the query behind the scene
-    # origGrp = 'unknown'
-    # res = self.db.ugManager.getGroupName( res['Value']['GID'] )
-    # if res['OK']:
-    #   origGrp = res['Value']
-    #===========================================================================
-
-    origGrp = res['Value'].get('OwnerGroup', 'unknown')
-
-    # If the two group share the same voms role, we do the query like if we were
-    # the group stored in the DB
-    if self.__shareVomsRole(credDict.get('group', 'anon'), origGrp):
-      credDict = {'username': credDict.get('username', 'anon'), 'group': origGrp}
+      errors = dict.fromkeys(paths, res['Message'])
+      fileMetadata = {}
+    else:
+      errors.update(res['Value']['Failed'])
+      fileMetadata = res['Value']['Successful']
+
+    # The files are grouped by the group under which their permissions are checked
+    credDictGroups = {}
+    for path in paths:
+      if path in errors:
+        continue
+      if path not in fileMetadata:
+        errors[path] = 'No such file or directory'
+        continue
+      origGrp = fileMetadata[path].get('OwnerGroup', 'unknown')
+      # If the two group share the same voms role, we do the query like if we were
+      # the group stored in the DB
+      group = credDict.get('group', 'anon')
+      if self.__shareVomsRole(group, origGrp):
+        group = origGrp
+      credDictGroups.setdefault(group, []).append(path)
+
+    for group, groupPaths in credDictGroups.items():
+      groupCredDict = credDict
+      if group != credDict.get('group', 'anon'):
+        groupCredDict = {'username': credDict.get('username', 'anon'), 'group': group}
+      res = self.db.fileManager.getPathPermissions(groupPaths, groupCredDict)
+      if not res['OK']:
+        failed.update(dict.fromkeys(groupPaths, res['Message']))
+        continue
+      for path in groupPaths:
+        if path in res['Value']['Failed']:
+          failed[path] = res['Value']['Failed'][path]
+        elif path in res['Value']['Successful']:
+          successful[path] = res['Value']['Successful'][path]
+        else:
+          failed[path] = 'No permissions returned'
+
+    for path, errorMsg in errors.items():
+      # If the error is not due to the file not existing, or if we have no strategy
+      # regarding non existing files, then just return the error
+      if noExistStrategy is None or not self.__isNotExistError(errorMsg):
+        failed[path] = errorMsg
+      else:
+        successful[path] = dict.fromkeys(['Read', 'Write', 'Execute'], noExistStrategy)
 
-    return returnSingleResult(self.db.fileManager.getPathPermissions([path], credDict))
+    return S_OK({'Successful': successful, 'Failed': failed})
 
   def __testPermissionOnFile(self, paths, permission, credDict, noExistStrategy=None):
     """ Tests a permission on a list of files
@@ -150,26 +215,26 @@ class VOMSSecurityManager(SecurityManagerBase):
         :returns: Successful dictionary with True of False, and Failed.
     """
 
-    successful = {}
-    failed = {}
+    res = self.__getFilesPermissions(paths, credDict, noExistStrategy=noExistStrategy)
+    if not res['OK']:
+      return res
 
-    for filename in paths:
-      res = self.__getFilePermission(filename, credDict, noExistStrategy=noExistStrategy)
-      if not res['OK']:
-        failed[filename] = res['Message']
-      else:
-        successful[filename] = res['Value'].get(permission, False)
+    successful = dict((filename, permDict.get(permission, False))
+                      for filename, permDict in res['Value']['Successful'].items())
 
-    return S_OK({'Successful': successful, 'Failed': failed})
+    return S_OK({'Successful': successful, 'Failed': res['Value']['Failed']})
 
-  def __getDirectoryPermission(self, path, credDict, recursive=True, noExistStrategy=None):
-    """ Checks POSIX permission for a directory using the VOMS roles.
-        That is, if the owner group of the directory share the same vomsRole as the requesting user,
+  def __getDirectoriesPermissions(self, paths, credDict, recursive=True, noExistStrategy=None):
+    """ Checks POSIX permission for directories using the VOMS roles.
+        That is, if the owner group of a directory share the same vomsRole as the requesting user,
         we check the permission as if the request was done with the real owner group.
 
-        :param path : directory path (string)
+        The parameters of the directories are fetched with one query per level of non existing
+        directories, and each directory is fetched only once whatever the number of paths it applies to.
+
+        :param paths : list of directory paths
         :param credDict : credential of the user
-        :param recursive : if that directory does not exist, checks the parent one
+        :param recursive : if a directory does not exist, checks the parent one
         :param noExistStrategy : If the directory does not exist, we can
                                  * True : allow the access
                                  * False : forbid the access
@@ -177,48 +242,70 @@ class VOMSSecurityManager(SecurityManagerBase):
 
                noExistStrategy makes sense only if recursive is False
 
-        :returns S_OK structure with a dictionary ( Read/Write/Execute : True/False)
+        :returns S_OK structure with a Successful dictionary ( path : { Read/Write/Execute : True/False } )
+                 and a Failed dictionary ( path : error message )
     """
 
-    if not path:
-      return S_ERROR('Empty path')
-
-    # We check what is the group stored in the DB for the given path
-    res = self.db.dtree.getDirectoryParameters(path)
-    if not res['OK']:
-      # If the error is not due to the directory not existing, we return
-
-      if not self.__isNotExistError(res['Message']):
-        return res
-
-      # Very special case to allow creation of very first entry
-      if path == '/':
-        return S_OK({'Read': True, 'Write': True, 'Execute': True})
-
-      # From now on, we know that the error is due to the directory not existing
-
-      # If recursive, we try the parent directory
-      if recursive:
-        return self.__getDirectoryPermission(os.path.dirname(path), credDict,
-                                             recursive=recursive, noExistStrategy=noExistStrategy)
-      # From now on, we know we don't run recursive
-
-      # If we have no strategy regarding non existing directories, then just return the error
-      if noExistStrategy is None:
-        return res
-
-      # Finally, follow the strategy
-      return S_OK(dict.fromkeys(['Read', 'Write', 'Execute'], noExistStrategy))
-
-    # The directory exists.
-    origGrp = res['Value']['OwnerGroup']
+    successful = {}
+    failed = {}
 
-    # If the two group share the same voms role, we do the query like if we were
-    # the group stored in the DB
-    if self.__shareVomsRole(credDict.get('group', 'anon'), origGrp):
-      credDict = {'username': credDict.get('username', 'anon'), 'group': origGrp}
+    # Directory from which the permissions of each path are taken
+    lookupDirs = {}
+    for path in paths:
+      if not path:
+        failed[path] = 'Empty path'
+      else:
+        lookupDirs[path] = path
+
+    # Parameters or error message of the directories already fetched
+    dirParameters = {}
+    dirErrors = {}
+
+    while lookupDirs:
+      toFetch = set(lookupDirs.values()) - set(dirParameters) - set(dirErrors)
+      if toFetch:
+        res = self.db.dtree.getDirectoriesParameters(list(toFetch))
+        if not res['OK']:
+          return res
+        dirParameters.update(res['Value']['Successful'])
+        dirErrors.update(res['Value']['Failed'])
+
+      nextLookupDirs = {}
+      for path, dirName in lookupDirs.items():
+        if dirName in dirParameters:
+          successful[path] = self.__getPermissionsFromParameters(dirParameters[dirName], credDict)
+          continue
+
+        errorMsg = dirErrors.get(dirName, 'Directory not found')
+        # If the error is not due to the directory not existing, we return
+        if not self.__isNotExistError(errorMsg):
+          failed[path] = errorMsg
+
+        # Very special case to allow creation of very first entry
+        elif dirName == '/':
+          successful[path] = {'Read': True, 'Write': True, 'Execute': True}
+
+        # If recursive, we try the parent directory
+        elif recursive:
+          parentDir = os.path.dirname(dirName)
+          if not parentDir:
+            failed[path] = 'Empty path'
+          elif parentDir == dirName:
+            failed[path] = 'Bad Path (double /?)'
+          else:
+            nextLookupDirs[path] = parentDir
+
+        # If we have no strategy regarding non existing directories, then just return the error
+        elif noExistStrategy is None:
+          failed[path] = errorMsg
+
+        # Finally, follow the strategy
+        else:
+          successful[path] = dict.fromkeys(['Read', 'Write', 'Execute'], noExistStrategy)
+
+      lookupDirs = nextLookupDirs
 
-    return self.db.dtree.getDirectoryPermissions(path, credDict)
+    return S_OK({'Successful': successful, 'Failed': failed})
 
   def __testPermissionOnDirectory(self, paths, permission, credDict, recursive=True, noExistStrategy=None):
     """ Tests a permission on a list of directories
@@ -237,17 +324,14 @@ class VOMSSecurityManager(SecurityManagerBase):
         :returns: Successful dictionary with True of False, and Failed.
     """
 
-    successful = {}
-    failed = {}
+    res = self.__getDirectoriesPermissions(paths, credDict, recursive=recursive, noExistStrategy=noExistStrategy)
+    if not res['OK']:
+      return res
 
-    for dirName in paths:
-      res = self.__getDirectoryPermission(dirName, credDict, recursive=recursive, noExistStrategy=noExistStrategy)
-      if not res['OK']:
-        failed[dirName] = res['Message']
-      else:
-        successful[dirName] = res['Value'].get(permission, False)
+    successful = dict((dirName, permDict.get(permission, False))
+                      for dirName, permDict in res['Value']['Successful'].items())
 
-    return S_OK({'Successful': successful, 'Failed': failed})
+    return S_OK({'Successful': successful, 'Failed': res['Value']['Failed']})
 
   def __testPermissionOnParentDirectory(self, paths, permission, credDict, recursive=True, noExistStrategy=None):
     """ Tests a permission on the parents of a list of directories
@@ -287,43 +371,11 @@ class VOMSSecurityManager(SecurityManagerBase):
 
     return S_OK({'Successful': successful, 'Failed': failed})
 
-  def __getFileOrDirectoryPermission(self, path, credDict, recursive=False, noExistStrategy=None):
-    """ Checks POSIX permission for a directory or file using the VOMS roles.
-        That is, if the owner group of the directory or file shares the same vomsRole as the requesting user,
-        we check the permission as if the request was done with the real owner group.
-
-        We first consider the path as a file, and if it does not exist, we consider it as a directory.
-
-        :param path : directory or file path (string)
-        :param credDict : credential of the user
-        :param recursive : if that directory does not exist, checks the parent one
-        :param noExistStrategy : If the directory does not exist, we can
-                                 * True : allow the access
-                                 * False : forbid the access
-                                 * None : return the error as is
-
-               noExistStrategy makes sense only if recursive is False
-
-        :returns S_OK structure with a dictionary ( Read/Write/Execute : True/False)
-    """
-    # First consider it as File
-    # We want to know whether the file does not exist, so we force noExistStrategy to None
-    res = self.__getFilePermission(path, credDict, noExistStrategy=None)
-    if not res['OK']:
-      # If the error is not due to the directory not existing, we return
-      if not self.__isNotExistError(res['Message']):
-        return res
-
-      # From now on, we know that the error is due to the File not existing
-      # We Try then the directory method, since path can be a directory
-      # The noExistStrategy will be applied by __getDirectoryPermission, so we don't need to do it ourselves
-      res = self.__getDirectoryPermission(path, credDict, recursive=recursive, noExistStrategy=noExistStrategy)
-
-    return res
-
   def __testPermissionOnFileOrDirectory(self, paths, permission, credDict, recursive=False, noExistStrategy=None):
     """ Tests a permission on a list of files or directories.
 
+        We first consider the paths as files, and the ones which do not exist as directories.
+
         :param path : list/dict of directory or files paths
         :param permission : Read/Write/Execute string
         :param credDict : credential of the user
@@ -338,15 +390,32 @@ class VOMSSecurityManager(SecurityManagerBase):
         :returns: Successful dictionary with True of False, and Failed.
     """
 
-    successful = {}
+    # First consider them as Files
+    # We want to know whether the files do not exist, so we force noExistStrategy to None
+    res = self.__getFilesPermissions(paths, credDict, noExistStrategy=None)
+    if not res['OK']:
+      return res
+
+    permissions = res['Value']['Successful']
     failed = {}
+    notFiles = []
+    for path, errorMsg in res['Value']['Failed'].items():
+      # If the error is not due to the file not existing, we return
+      if self.__isNotExistError(errorMsg):
+        notFiles.append(path)
+      else:
+        failed[path] = errorMsg
 
-    for path in paths:
-      res = self.__getFileOrDirectoryPermission(path, credDict, recursive=recursive, noExistStrategy=noExistStrategy)
+    # We Try then the directory method, since the paths can be directories
+    # The noExistStrategy will be applied by __getDirectoriesPermissions, so we don't need to do it ourselves
+    if notFiles:
+      res = self.__getDirectoriesPermissions(notFiles, credDict, recursive=recursive, noExistStrategy=noExistStrategy)
       if not res['OK']:
-        failed[path] = res['Message']
-      else:
-        successful[path] = res['Value'].get(permission, False)
+        return res
+      permissions.update(res['Value']['Successful'])
+      failed.update(res['Value']['Failed'])
+
+    successful = dict((path, permDict.get(permission, False)) for path, permDict in permissions.items())
 
     return S_OK({'Successful': successful, 'Failed': failed})
 
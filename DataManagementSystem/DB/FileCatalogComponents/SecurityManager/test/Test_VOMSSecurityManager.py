@@ -107,6 +107,18 @@ class mock_DirectoryManager(object):
   def getDirectoryParameters(self, path):
     return S_OK(directoryTree[path]) if path in directoryTree else S_ERROR('Directory not found')
 
+  def getDirectoriesParameters(self, paths):
+    successful = {}
+    failed = {}
+    for path in paths:
+      if path in directoryTree:
+        successful[path] = {'Owner': directoryTree[path]['owner'],
+                            'OwnerGroup': directoryTree[path]['OwnerGroup'],
+                            'Mode': directoryTree[path]['mode']}
+      else:
+        failed[path] = 'Directory not found'
+    return S_OK({'Successful': successful, 'Failed': failed})
+
   def getDirectoryPermissions(self, path, credDict):
     if path not in directoryTree:
       return S_ERROR('Directory not found')
@@ -8,6 +8,7 @@ from mock import MagicMock
 
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryManager.DirectoryTreeBase import DirectoryTreeBase
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryManager.DirectoryLevelTree import DirectoryLevelTree
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryManager.DirectoryCache import DirectoryCache
 # from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectorySimpleTree import DirectorySimpleTree
 # from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryFlatTree import DirectoryFlatTree
 # from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryNodeTree import DirectoryNodeTree
@@ -44,6 +45,36 @@ def test_Level_makeDirectory():
   assert res['OK'] is True  # this will need to be implemented on a derived class
 
 
+def test_Level_directoryCache():
+  cachedDbMock = MagicMock()
+  cachedDbMock._escapeString.side_effect = lambda value: {'OK': True, 'Value': "'%s'" % value}
+  cachedDbMock._query.return_value = {'OK': True, 'Value': (('/vo/data', 12),)}
+  cdlt = DirectoryLevelTree()
+  cdlt.db = cachedDbMock
+  cdlt.dirCache = DirectoryCache(maxSize=2, lifetime=60)
+
+  assert cdlt.findDirs(['/vo/data'])['Value'] == {'/vo/data': 12}
+  # Resolved from the cache from now on, in both directions
+  assert cdlt.findDirs(['/vo/data/'])['Value'] == {'/vo/data': 12}
+  assert cdlt.findDir('/vo/data')['Value'] == 12
+  assert cdlt.getDirectoryPath(12)['Value'] == '/vo/data'
+  assert cachedDbMock._query.call_count == 1
+  assert cdlt.dirCache.getStatistics()['Hits'] == 3
+
+  # Removing a directory removes it and its subdirectories from the cache
+  cdlt.dirCache.add('/vo/data/run1', 13)
+  cdlt.removeDir('/vo/data')
+  assert cdlt.dirCache.getDirID('/vo/data') is None
+  assert cdlt.dirCache.getPath(13) is None
+
+  # The least recently used directory is dropped when the cache is full
+  for dirID, path in enumerate(['/vo/a', '/vo/b', '/vo/c']):
+    cdlt.dirCache.add(path, dirID + 1)
+  assert cdlt.dirCache.getDirID('/vo/a') is None
+  assert cdlt.dirCache.getDirID('/vo/c') == 3
+  assert cdlt.dirCache.getStatistics()['Size'] == 2
+
+
 ####################################################################################
 # SimpleTree
 # FIXME: this fails... is it a genuine failure?
@@ -57,6 +57,8 @@ class FileCatalogDB(DB):
     self.validReplicaStatus = databaseConfig['ValidReplicaStatus']
     self.visibleFileStatus = databaseConfig['VisibleFileStatus']
     self.visibleReplicaStatus = databaseConfig['VisibleReplicaStatus']
+    self.directoryCacheSize = databaseConfig.get('DirectoryCacheSize', 0)
+    self.directoryCacheLifetime = databaseConfig.get('DirectoryCacheLifetime', 0)
 
     # Obtain the plugins to be used for DB interaction
     self.objectLoader = ObjectLoader()
@@ -1141,6 +1143,14 @@ class FileCatalogDB(DB):
     counterDict.update(res['Value'])
     return S_OK(counterDict)
 
+  def getDirectoryCacheStatistics(self, credDict):
+    res = self._checkAdminPermission(credDict)
+    if not res['OK']:
+      return res
+    if not res['Value']:
+      return S_ERROR("Permission denied")
+    return S_OK(self.dtree.dirCache.getStatistics())
+
   ########################################################################
   #
   #  Security based methods
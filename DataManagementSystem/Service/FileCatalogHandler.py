@@ -63,7 +63,9 @@ def initializeFileCatalogHandler(serviceInfo):
                    'ValidFileStatus': ['AprioriGood', 'Trash', 'Removing', 'Probing'],
                    'ValidReplicaStatus': ['AprioriGood', 'Trash', 'Removing', 'Probing'],
                    'VisibleFileStatus': ['AprioriGood'],
-                   'VisibleReplicaStatus': ['AprioriGood']}
+                   'VisibleReplicaStatus': ['AprioriGood'],
+                   'DirectoryCacheSize': 10000,
+                   'DirectoryCacheLifetime': 60}
   for configKey in sorted(defaultConfig.keys()):
     defaultValue = defaultConfig[configKey]
     configValue = getServiceOption(serviceInfo, configKey, defaultValue)
@@ -438,6 +440,12 @@ class FileCatalogHandler(RequestHandler):
     """ Get the number of registered directories, files and replicas in various tables """
     return gFileCatalogDB.getCatalogCounters(self.getRemoteCredentials())
 
+  types_getDirectoryCacheStatistics = []
+
+  def export_getDirectoryCacheStatistics(self):
+    """ Get the size and the hit rate of the cache of the directory paths """
+    return gFileCatalogDB.getDirectoryCacheStatistics(self.getRemoteCredentials())
+
   types_rebuildDirectoryUsage = []
 
   @staticmethod
@@ -0,0 +1,146 @@
+"""
+Asynchronous Handler
+"""
+
+__RCSID__ = "$Id$"
+
+import logging
+import Queue
+import threading
+
+from DIRAC.FrameworkSystem.private.standardLogging.LogLevels import LogLevels
+
+
+class AsyncHandler(logging.Handler):
+  """
+  AsyncHandler is a custom handler from logging, wrapping the handler of a backend.
+
+  It puts the log records in a bounded queue, and a thread emits them with the wrapped handler,
+  so that the calling thread does not wait for the file, the network or the message queue.
+  The record is prepared before being queued: its message and its variable message are converted to
+  strings and its stack trace is formatted, so that the emission does not depend on objects which
+  can change meanwhile.
+
+  When the queue is full, depending on the policy, the calling thread either waits for a free slot ('Block')
+  or drops the record ('Drop'). The records of level ERROR and above are never dropped. The number of dropped
+  records is written by the wrapped handler with the next emitted record.
+
+  The queue is emptied when the handler is flushed or closed, which the logging library does at exit.
+  """
+
+  POLICIES = ('Block', 'Drop')
+
+  def __init__(self, handler, queueSize=10000, policy='Block'):
+    """
+    Initialization of the AsyncHandler, starting the emitting thread.
+
+    :params handler: handler object from 'logging' emitting the records
+    :params queueSize: integer, maximum number of records in the queue
+    :params policy: string, 'Block' or 'Drop', behaviour when the queue is full
+    """
+    super(AsyncHandler, self).__init__()
+    self.handler = handler
+    self.policy = policy if policy in self.POLICIES else 'Block'
+    self.__queue = Queue.Queue(max(1, queueSize))
+    self.__dropped = 0
+    # the records are dropped by the logging threads, and their count is reported by the emitting thread
+    self.__droppedLock = threading.Lock()
+    self.__alive = True
+    self.__thread = threading.Thread(target=self.__emitRecords, name='AsyncLogHandler')
+    self.__thread.daemon = True
+    self.__thread.start()
+
+  def setFormatter(self, fmt):
+    """
+    Give the formatter to the wrapped handler, which formats the records.
+    """
+    self.handler.setFormatter(fmt)
+
+  def emit(self, record):
+    """
+    Prepare the record and add it to the queue.
+
+    :params record: log record object
+    """
+    try:
+      self.__prepare(record)
+      if self.policy == 'Drop' and record.levelno < LogLevels.ERROR:
+        try:
+          self.__queue.put_nowait(record)
+        except Queue.Full:
+          with self.__droppedLock:
+            self.__dropped += 1
+      else:
+        self.__queue.put(record)
+    except Exception:  # pylint: disable=broad-except
+      self.handleError(record)
+
+  def __prepare(self, record):
+    """
+    Convert to strings the parts of the record which are formatted with the objects of the caller.
+    """
+    record.msg = record.getMessage()
+    record.args = None
+    varMessage = getattr(record, 'varmessage', None)
+    if varMessage is not None:
+      record.varmessage = str(varMessage)
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+
+  def __emitRecords(self):
+    """
+    Emit the queued records with the wrapped handler.
+    """
+    while self.__alive:
+      record = self.__queue.get()
+      try:
+        if record is not None:
+          if self.__dropped:
+            self.__emitDropped(record)
+          self.handler.handle(record)
+      except Exception:  # pylint: disable=broad-except
+        self.handler.handleError(record)
+      finally:
+        self.__queue.task_done()
+
+  def __emitDropped(self, record):
+    """
+    Emit a warning about the dropped records, with the attributes of the record following them.
+    """
+    with self.__droppedLock:
+      dropped = self.__dropped
+      self.__dropped = 0
+    warning = logging.makeLogRecord(record.__dict__)
+    warning.levelno = LogLevels.WARN
+    warning.levelname = logging.getLevelName(LogLevels.WARN)
+    warning.msg = "Log records dropped because the queue was full:"
+    warning.varmessage = str(dropped)
+    warning.spacer = ' '
+    self.handler.handle(warning)
+
+  def getDropped(self):
+    """
+    :return: the number of records dropped since the last emitted record
+    """
+    return self.__dropped
+
+  def flush(self):
+    """
+    Wait for the queued records to be emitted, and flush the wrapped handler.
+    """
+    if self.__thread.is_alive():
+      self.__queue.join()
+    self.handler.flush()
+
+  def close(self):
+    """
+    Emit the queued records, stop the thread and close the wrapped handler.
+    """
+    if self.__alive:
+      self.flush()
+      self.__alive = False
+      self.__queue.put(None)
+      self.__thread.join()
+    self.handler.close()
+    super(AsyncHandler, self).close()
@@ -41,6 +41,9 @@ class Logging(object):
   _lockRing = LockRing()
   # lock the configuration of the Logging
   _lockConfig = _lockRing.getLock("config")
+  # incremented at each change of a level or of the backends, to invalidate the lowest level
+  # below which each Logging drops the messages without creating log records
+  _configVersion = 0
 
   def __init__(self, father=None, fatherName='', name='', customName=''):
     """
@@ -82,6 +85,11 @@ class Logging(object):
     self._optionsModified = {'headerIsShown': False, 'threadIDIsShown': False}
     self._levelModified = False
 
+    # lowest level accepted by the Logging or one of the handlers receiving its log records,
+    # and version of the configuration for which it was computed
+    self._minLevel = None
+    self._minLevelVersion = -1
+
     self._backendsList = []
 
     # name of the Logging
@@ -192,6 +200,7 @@ class Logging(object):
                             example: {'FileName': '/tmp/log.txt'}
     """
     backend.createHandler(backendOptions)
+    backend.setAsync(backendOptions)
 
     # lock to prevent that the level change before adding the new backend in the backendsList
     # and to prevent a change of the backendsList during the reading of the
@@ -204,6 +213,7 @@ class Logging(object):
       self._logger.addHandler(backend.getHandler())
       self._addFilter(backend, backendOptions)
       self._backendsList.append(backend)
+      Logging._configVersion += 1
     finally:
       self._lockLevel.release()
       self._lockOptions.release()
@@ -258,6 +268,7 @@ class Logging(object):
       # propagate in the children
       for child in self._children.itervalues():
         child._setLevel(level, directCall=False)  # pylint: disable=protected-access
+      Logging._configVersion += 1
     finally:
       self._lockLevel.release()
 
@@ -403,27 +414,44 @@ class Logging(object):
 
     :return: boolean representing the result of the log record creation
     """
-
-    # lock to prevent a level change after that the log is sent.
-    self._lockLevel.acquire()
-    try:
-      # exc_info is only for exception to add the stack trace
-      # extra is a way to add extra attributes to the log record:
-      # - 'componentname': the system/component name
-      # - 'varmessage': the variable message
-      # - 'customname' : the name of the logger for the DIRAC usage: without 'root' and separated with '/'
-      # extras attributes are not camel case because log record attributes are
-      # not either.
-      extra = {'componentname': self._componentName,
-               'varmessage': str(sVarMsg),
-               'spacer': '' if not sVarMsg else ' ',
-               'customname': self._customName}
-      self._logger.log(level, "%s", sMsg, exc_info=exc_info, extra=extra)
-      # test to know if the message is displayed or not
-      isSent = self._level <= level
-      return isSent
-    finally:
-      self._lockLevel.release()
+    # fast path, without lock: nothing is created for the messages that neither the Logging nor
+    # any handler accept, as the debug messages of most components
+    if self._minLevelVersion != Logging._configVersion:
+      self._updateMinLevel()
+    if level < self._minLevel:
+      return False
+
+    # exc_info is only for exception to add the stack trace
+    # extra is a way to add extra attributes to the log record:
+    # - 'componentname': the system/component name
+    # - 'varmessage': the variable message
+    # - 'customname' : the name of the logger for the DIRAC usage: without 'root' and separated with '/'
+    # extras attributes are not camel case because log record attributes are
+    # not either.
+    extra = {'componentname': self._componentName,
+             'varmessage': str(sVarMsg),
+             'spacer': '' if not sVarMsg else ' ',
+             'customname': self._customName}
+    self._logger.log(level, "%s", sMsg, exc_info=exc_info, extra=extra)
+    # test to know if the message is displayed or not
+    return self._level <= level
+
+  def _updateMinLevel(self):
+    """
+    Compute the lowest level of the messages which can be displayed or sent by a handler.
+    The log records of a Logging are handled by the handlers of its logger and of the parent loggers.
+    """
+    version = Logging._configVersion
+    minLevel = self._level if self._level is not None else 0
+    logger = self._logger
+    while logger is not None:
+      for handler in logger.handlers:
+        minLevel = min(minLevel, handler.level)
+      if not logger.propagate:
+        break
+      logger = logger.parent
+    self._minLevel = minLevel
+    self._minLevelVersion = version
 
   def showStack(self):
     """
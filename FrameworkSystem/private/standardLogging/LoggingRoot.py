@@ -133,6 +133,7 @@ class LoggingRoot(Logging):
         # Remove the old backends
         for handler in handlersToRemove:
           self._logger.removeHandler(handler)
+        Logging._configVersion += 1
 
         levelName = gConfig.getValue("%s/LogLevel" % cfgPath, None)
         if levelName is not None:
@@ -0,0 +1,113 @@
+"""
+Test the AsyncHandler and the messages dropped without log record
+"""
+
+__RCSID__ = "$Id$"
+
+import unittest
+import logging
+import threading
+from StringIO import StringIO
+from mock import patch
+
+from DIRAC.FrameworkSystem.private.standardLogging.test.TestLoggingBase import Test_Logging, gLogger, cleaningLog
+from DIRAC.FrameworkSystem.private.standardLogging.Handler.AsyncHandler import AsyncHandler
+from DIRAC.FrameworkSystem.private.standardLogging.LogLevels import LogLevels
+
+
+class BlockingHandler(logging.StreamHandler):
+  """
+  StreamHandler waiting for an event before emitting, to fill the queue of the AsyncHandler.
+  """
+
+  def __init__(self, stream):
+    super(BlockingHandler, self).__init__(stream)
+    self.event = threading.Event()
+
+  def emit(self, record):
+    self.event.wait()
+    super(BlockingHandler, self).emit(record)
+
+
+class Test_AsyncHandler(Test_Logging):
+  """
+  Test the AsyncHandler and the messages dropped without log record.
+  """
+
+  def test_00emit(self):
+    """
+    The records are emitted by the wrapped handler, with their stack trace
+    """
+    stream = StringIO()
+    handler = AsyncHandler(logging.StreamHandler(stream))
+    handler.setFormatter(logging.Formatter('%(levelname)s:%(message)s %(varmessage)s'))
+    logger = logging.getLogger('asyncTest')
+    logger.addHandler(handler)
+    try:
+      logger.error("message %s", 'arg', extra={'varmessage': 'var'})
+      try:
+        raise ValueError('exception')
+      except ValueError:
+        logger.exception("exception", extra={'varmessage': ''})
+      handler.flush()
+      lines = stream.getvalue().splitlines()
+      self.assertEqual("ERROR:message arg var", lines[0])
+      self.assertEqual("ERROR:exception ", lines[1])
+      self.assertEqual("ValueError: exception", lines[-1])
+    finally:
+      logger.removeHandler(handler)
+      handler.close()
+
+  def test_01drop(self):
+    """
+    With the Drop policy, the records below ERROR are dropped when the queue is full, then reported
+    """
+    stream = StringIO()
+    wrappedHandler = BlockingHandler(stream)
+    handler = AsyncHandler(wrappedHandler, queueSize=1, policy='Drop')
+    handler.setFormatter(logging.Formatter('%(levelname)s:%(message)s %(varmessage)s'))
+    logger = logging.getLogger('asyncDropTest')
+    logger.addHandler(handler)
+    try:
+      # the first record is taken by the thread, the second one fills the queue
+      for i in xrange(10):
+        logger.warning("message", extra={'varmessage': i})
+      self.assertTrue(handler.getDropped() >= 7)
+      wrappedHandler.event.set()
+      # an error waits for a free slot
+      logger.error("last", extra={'varmessage': ''})
+      handler.flush()
+      lines = stream.getvalue().splitlines()
+      self.assertTrue("%s:message 0" % logging.getLevelName(LogLevels.WARN) in lines)
+      self.assertEqual(1, len([line for line in lines if "Log records dropped because the queue was full" in line]))
+      self.assertEqual("ERROR:last ", lines[-1])
+      self.assertEqual(0, handler.getDropped())
+    finally:
+      logger.removeHandler(handler)
+      handler.close()
+
+  def test_02noRecord(self):
+    """
+    The messages below the level of the Logging and of the handlers do not create log records
+    """
+    logger = self.log._logger  # pylint: disable=protected-access
+    with patch.object(logger, 'makeRecord', wraps=logger.makeRecord) as makeRecord:
+      # the level of the handlers, which also receive the records of the sub loggers
+      gLogger.setLevel('notice')
+      self.assertFalse(self.log.debug("message"))
+      self.assertEqual(0, makeRecord.call_count)
+      self.assertTrue(self.log.notice("message"))
+      self.assertEqual(1, makeRecord.call_count)
+      self.assertEqual("UTCFramework/logNOTICE:message\n", cleaningLog(self.buffer.getvalue()))
+
+      # a change of level is taken into account
+      gLogger.setLevel('debug')
+      self.assertTrue(self.log.debug("message"))
+      self.assertEqual(2, makeRecord.call_count)
+      self.assertEqual(LogLevels.DEBUG, makeRecord.call_args[0][1])
+    gLogger.setLevel('debug')
+
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase(Test_AsyncHandler)
+  testResult = unittest.TextTestRunner(verbosity=2).run(suite)
@@ -33,6 +33,7 @@ __RCSID__ = '$Id$'
 import sys
 import time
 import errno
+import threading
 
 # # from DIRAC
 from DIRAC import S_OK, S_ERROR, gConfig
@@ -96,6 +97,8 @@ class RequestExecutingAgent(AgentModule):
   __requestClient = None
   # # Size of the bulk if use of getRequests. If 0, use getRequest
   __bulkRequest = 0
+  # # keep the operation handlers, clients and proxies in the workers between the requests
+  __persistentWorkers = False
 
   def __init__(self, *args, **kwargs):
     """ c'tor """
@@ -116,6 +119,13 @@ class RequestExecutingAgent(AgentModule):
     self.log.info("ProcessPool sleep time = %d seconds" % self.__poolSleep)
     self.__bulkRequest = self.am_getOption("BulkRequest", self.__bulkRequest)
     self.log.info("Bulk request size = %d" % self.__bulkRequest)
+    self.__persistentWorkers = self.am_getOption("PersistentWorkers", self.__persistentWorkers)
+    self.log.info("Persistent workers = %s" % self.__persistentWorkers)
+    # # set by the callbacks when a worker is freed
+    self.__slotFreed = threading.Event()
+    # # operation type -> [ number of executions, seconds ] since the beginning of the cycle
+    self.__operationTimes = {}
+    self.__operationTimesLock = threading.Lock()
 
     # # keep config path and agent name
     self.agentName = self.am_getModuleParam("fullName")
@@ -164,6 +174,9 @@ class RequestExecutingAgent(AgentModule):
                               "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
     gMonitor.registerActivity("Done", "Request Completed",
                               "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
+    for opHandler in self.handlersDict:
+      gMonitor.registerActivity("%sTime" % opHandler, "%s operation execution time" % opHandler,
+                                "RequestExecutingAgent", "seconds", gMonitor.OP_MEAN)
     # # create request dict
     self.__requestCache = dict()
 
@@ -261,6 +274,7 @@ class RequestExecutingAgent(AgentModule):
   def execute(self):
     """ read requests from RequestClient and enqueue them into ProcessPool """
     gMonitor.addMark("Iteration", 1)
+    cycleStart = time.time()
     # # requests (and so tasks) counter
     taskCounter = 0
     while taskCounter < self.__requestsPerCycle:
@@ -302,20 +316,20 @@ class RequestExecutingAgent(AgentModule):
         self.log.info("processPool status", "tasks idle = %s working = %s" %
                       (self.processPool().getNumIdleProcesses(), self.processPool().getNumWorkingProcesses()))
 
-        looping = 0
+        waitStart = None
         while True:
+          # # cleared before checking, so that a worker freed meanwhile is not missed
+          self.__slotFreed.clear()
           if not self.processPool().getFreeSlots():
-            if not looping:
-              self.log.info(
-                  "No free slots available in processPool",
-                  "will wait %d seconds to proceed" %
-                  self.__poolSleep)
-            time.sleep(self.__poolSleep)
-            looping += 1
+            if waitStart is None:
+              self.log.info("No free slots available in processPool", "will wait for a worker to be freed")
+              waitStart = time.time()
+            # # woken up by the callbacks, the timeout only protects against a missed callback
+            self.__slotFreed.wait(self.__poolSleep)
           else:
-            if looping:
-              self.log.info("Free slot found", "after %d seconds" % looping * self.__poolSleep)
-            looping = 0
+            if waitStart is not None:
+              self.log.info("Free slot found", "after %.1f seconds" % (time.time() - waitStart))
+            waitStart = None
             # # save current request in cache
             res = self.cacheRequest(request)
             if not res['OK']:
@@ -342,7 +356,8 @@ class RequestExecutingAgent(AgentModule):
                                                             kwargs={"requestJSON": requestJSON,
                                                                     "handlersDict": self.handlersDict,
                                                                     "csPath": self.__configPath,
-                                                                    "agentName": self.agentName},
+                                                                    "agentName": self.agentName,
+                                                                    "persistentWorker": self.__persistentWorkers},
                                                             taskID=taskID,
                                                             blocking=True,
                                                             usePoolCallbacks=True,
@@ -355,8 +370,6 @@ class RequestExecutingAgent(AgentModule):
               gMonitor.addMark("Processed", 1)
               # # update request counter
               taskCounter += 1
-              # # task created, a little time kick to proceed
-              time.sleep(0.1)
               break
 
     self.log.info("Flushing callbacks", "(%d requests still in cache)" % len(self.__requestCache))
@@ -368,9 +381,37 @@ class RequestExecutingAgent(AgentModule):
     if processed < 0:
       self.log.fatal("Results queue is screwed up")
       sys.exit(1)
+    self.__reportThroughput(time.time() - cycleStart)
     # # clean return
     return S_OK()
 
+  def __reportThroughput(self, cycleTime):
+    """ log the number of operations executed per type during the cycle, and reset the counters
+
+    :param float cycleTime: duration of the cycle in seconds
+    """
+    with self.__operationTimesLock:
+      operationTimes = self.__operationTimes
+      self.__operationTimes = {}
+    for opType, (executions, seconds) in sorted(operationTimes.items()):
+      self.log.info("Operation throughput",
+                    "%s: %d executed, %.1f/min, %.2f s on average" % (opType, executions,
+                                                                      60. * executions / max(cycleTime, 1.),
+                                                                      seconds / executions))
+
+  def __recordOperationTimes(self, operationTimes):
+    """ add the execution times of the operations of a request to the counters of the cycle
+
+    :param dict operationTimes: operation type -> seconds spent executing it
+    """
+    with self.__operationTimesLock:
+      for opType, seconds in operationTimes.items():
+        counters = self.__operationTimes.setdefault(opType, [0, 0.])
+        counters[0] += 1
+        counters[1] += seconds
+        if opType in self.handlersDict:
+          gMonitor.addMark("%sTime" % opType, seconds)
+
   def getTimeout(self, request):
     """ get timeout for request """
     timeout = 0
@@ -399,6 +440,9 @@ class RequestExecutingAgent(AgentModule):
     :param str taskID: Request.RequestID
     :param dict taskResult: task result S_OK(Request)/S_ERROR(Message)
     """
+    # # a worker is free again
+    self.__slotFreed.set()
+    self.__recordOperationTimes(taskResult.get("OperationTimes", {}))
     # # clean cache
     res = self.putRequest(taskID, taskResult)
     self.log.info(
@@ -417,4 +461,5 @@ class RequestExecutingAgent(AgentModule):
     :param Exception taskException: Exception instance
     """
     self.log.error("exceptionCallback:", "%s was hit by exception %s" % (taskID, taskException))
+    self.__slotFreed.set()
     self.putRequest(taskID)
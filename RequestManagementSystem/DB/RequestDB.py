@@ -15,16 +15,21 @@
     :synopsis: db holding Requests
 
     db holding Request, Operation and File
+
+    The requests to execute are leased: they are claimed atomically by a single UPDATE setting
+    a random lease token on them, so that concurrent executors never get the same requests,
+    and they can be claimed again once their lease has expired.
 """
 import six
 import random
+import uuid
 
 import datetime
 
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.orm import relationship, backref, sessionmaker, joinedload, mapper
-from sqlalchemy.sql import update
-from sqlalchemy import create_engine, func, Table, Column, MetaData, ForeignKey, \
+from sqlalchemy.orm import relationship, backref, sessionmaker, joinedload, subqueryload, mapper
+from sqlalchemy.sql import update, text
+from sqlalchemy import create_engine, func, inspect, Table, Column, MetaData, ForeignKey, Index, \
     Integer, String, DateTime, Enum, BLOB, BigInteger, distinct
 
 # # from DIRAC
@@ -124,9 +129,15 @@ requestTable = Table('Request', metadata,
                      Column('RequestID', Integer, primary_key=True),
                      Column('SourceComponent', BLOB),
                      Column('NotBefore', DateTime),
+                     Column('LeaseToken', String(32)),
+                     Column('LeaseExpiration', DateTime),
                      mysql_engine='InnoDB')
 
+# Index used to claim the requests
+requestStatusIndex = Index('RequestStatusLastUpdate', requestTable.c.Status, requestTable.c.LastUpdate)
+
 # Map the Request object to the requestTable, with a few special attributes
+# The lease columns are only handled by the RequestDB, not by the Request objects
 
 mapper(Request, requestTable, properties={'_CreationTime': requestTable.c.CreationTime,
                                           '_Status': requestTable.c.Status,
@@ -139,7 +150,14 @@ mapper(Request, requestTable, properties={'_CreationTime': requestTable.c.Creati
                                                                          order_by=operationTable.c.Order,
                                                                          lazy='immediate',
                                                                          passive_deletes=True,
-                                                                         cascade="all, delete-orphan")})
+                                                                         cascade="all, delete-orphan")},
+       exclude_properties=['LeaseToken', 'LeaseExpiration'])
+
+# Columns added to the Request table after its creation, with their SQL type
+upgradeColumns = [('LeaseToken', 'VARCHAR(32)'), ('LeaseExpiration', 'DATETIME')]
+
+# Number of seconds during which a claimed request cannot be claimed again
+REQUEST_LEASE_TIME = 3600
 
 
 ########################################################################
@@ -186,13 +204,55 @@ class RequestDB(object):
     self.DBSession = sessionmaker(bind=self.engine)
 
   def createTables(self):
-    """ create tables """
+    """ create tables, and add to the existing ones what they miss """
     try:
       metadata.create_all(self.engine)
+      self.__upgradeTables()
     except Exception as e:
       return S_ERROR(e)
     return S_OK()
 
+  def __upgradeTables(self):
+    """ add the columns and the index introduced after the creation of the Request table """
+    inspector = inspect(self.engine)
+    columns = set(column['name'] for column in inspector.get_columns('Request'))
+    for columnName, columnType in upgradeColumns:
+      if columnName not in columns:
+        self.log.info("Adding column to the Request table", columnName)
+        self.engine.execute('ALTER TABLE `Request` ADD COLUMN `%s` %s' % (columnName, columnType))
+    if requestStatusIndex.name not in set(index['name'] for index in inspector.get_indexes('Request')):
+      self.log.info("Adding index to the Request table", requestStatusIndex.name)
+      requestStatusIndex.create(self.engine)
+
+  @staticmethod
+  def __claimRequests(session, numberOfRequest, leaseTime):
+    """ assign at most numberOfRequest requests to a new lease, in a single statement
+
+    The requests Waiting for execution and the Assigned ones whose lease has expired are
+    claimed, the least recently updated first. Concurrent claims lock the same rows one
+    after the other and never return the same requests.
+
+    :param session: session to use, committed
+    :param int numberOfRequest: maximum number of requests to claim
+    :param int leaseTime: duration of the lease in seconds
+    :returns: list of claimed RequestIDs
+    """
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    leaseToken = uuid.uuid4().hex
+    session.execute(text("UPDATE `Request` SET `Status` = 'Assigned', `LastUpdate` = :now,"
+                         " `LeaseToken` = :leaseToken, `LeaseExpiration` = :leaseExpiration"
+                         " WHERE ( `Status` = 'Waiting' AND `NotBefore` < :now )"
+                         " OR ( `Status` = 'Assigned' AND `LeaseExpiration` < :now )"
+                         " ORDER BY `LastUpdate` LIMIT :limit"),
+                    {'now': now,
+                     'leaseToken': leaseToken,
+                     'leaseExpiration': now + datetime.timedelta(seconds=leaseTime),
+                     'limit': int(numberOfRequest)})
+    session.commit()
+    return [row[0] for row in session.query(requestTable.c.RequestID)
+            .filter(requestTable.c.LeaseToken == leaseToken)
+            .all()]
+
   def cancelRequest(self, requestID):
     session = self.DBSession()
     try:
@@ -283,10 +343,12 @@ class RequestDB(object):
 #     finally:
 #       session.close()
 
-  def getRequest(self, reqID=0, assigned=True):
+  def getRequest(self, reqID=0, assigned=True, leaseTime=REQUEST_LEASE_TIME):
     """ read request for execution
 
-    :param reqID: request's ID (default 0) If 0, take a pseudo random one
+    :param reqID: request's ID (default 0) If 0, take a pseudo random one,
+                  or the least recently updated one if it is assigned
+    :param int leaseTime: number of seconds during which an assigned request cannot be assigned again
 
     """
 
@@ -313,6 +375,12 @@ class RequestDB(object):
         if status and status == "Assigned" and assigned:
           return S_ERROR("getRequest: status of request '%s' is 'Assigned', request cannot be selected" % reqID)
 
+      elif assigned:
+        reqIDs = self.__claimRequests(session, 1, leaseTime)
+        if not reqIDs:
+          return S_OK()
+        requestID = reqIDs[0]
+
       else:
         now = datetime.datetime.utcnow().replace(microsecond=0)
         reqIDs = set()
@@ -359,12 +427,14 @@ class RequestDB(object):
              request.RequestName,
              ' (Assigned)' if assigned else ''))
 
-      if assigned:
-        session.execute(update(Request)
-                        .where(Request.RequestID == requestID)
-                        .values({Request._Status: 'Assigned',
-                                 Request._LastUpdate: datetime.datetime.utcnow()
-                                 .strftime(Request._datetimeFormat)})
+      if assigned and reqID:
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        session.execute(update(requestTable)
+                        .where(requestTable.c.RequestID == requestID)
+                        .values({requestTable.c.Status: 'Assigned',
+                                 requestTable.c.LastUpdate: now,
+                                 requestTable.c.LeaseToken: None,
+                                 requestTable.c.LeaseExpiration: now + datetime.timedelta(seconds=leaseTime)})
                         )
         session.commit()
 
@@ -378,11 +448,12 @@ class RequestDB(object):
     finally:
       session.close()
 
-  def getBulkRequests(self, numberOfRequest=10, assigned=True):
+  def getBulkRequests(self, numberOfRequest=10, assigned=True, leaseTime=REQUEST_LEASE_TIME):
     """ read as many requests as requested for execution
 
     :param int numberOfRequest: Number of Request we want (default 10)
-    :param bool assigned: if True, the status of the selected requests are set to assign
+    :param bool assigned: if True, the selected requests are claimed and their status set to Assigned
+    :param int leaseTime: number of seconds during which the assigned requests cannot be assigned again
 
     :returns: a dictionary of Request objects indexed on the RequestID
 
@@ -398,35 +469,32 @@ class RequestDB(object):
       # If we are here, the request MUST exist, so no try catch
       # the joinedload is to force the non-lazy loading of all the attributes, especially _parent
       try:
-        now = datetime.datetime.utcnow().replace(microsecond=0)
-        requestIDs = session.query(Request.RequestID)\
-            .with_for_update()\
-            .filter(Request._Status == 'Waiting')\
-            .filter(Request._NotBefore < now)\
-            .order_by(Request._LastUpdate)\
-            .limit(numberOfRequest)\
-            .all()
-
-        requestIDs = [ridTuple[0] for ridTuple in requestIDs]
+        if assigned:
+          requestIDs = self.__claimRequests(session, numberOfRequest, leaseTime)
+        else:
+          now = datetime.datetime.utcnow().replace(microsecond=0)
+          requestIDs = session.query(Request.RequestID)\
+              .filter(Request._Status == 'Waiting')\
+              .filter(Request._NotBefore < now)\
+              .order_by(Request._LastUpdate)\
+              .limit(numberOfRequest)\
+              .all()
+          requestIDs = [ridTuple[0] for ridTuple in requestIDs]
         log.debug("Got request ids %s" % requestIDs)
 
-        requests = session.query(Request) \
-                          .options(joinedload('__operations__').joinedload('__files__')) \
-                          .filter(Request.RequestID.in_(requestIDs))\
-                          .all()
-        log.debug("Got %s Request objects " % len(requests))
-        requestDict = dict((req.RequestID, req) for req in requests)
+        if requestIDs:
+          # subqueries load all the operations, then all the files, of all the requests at once,
+          # without repeating the request and operation columns for every file as a join would
+          requests = session.query(Request) \
+                            .options(subqueryload('__operations__').subqueryload('__files__')) \
+                            .filter(Request.RequestID.in_(requestIDs))\
+                            .all()
+          log.debug("Got %s Request objects " % len(requests))
+          requestDict = dict((req.RequestID, req) for req in requests)
       # No Waiting requests
       except NoResultFound as e:
         pass
 
-      if assigned and requestDict:
-        session.execute(update(Request)
-                        .where(Request.RequestID.in_(requestDict.keys()))
-                        .values({Request._Status: 'Assigned',
-                                 Request._LastUpdate: datetime.datetime.utcnow()
-                                 .strftime(Request._datetimeFormat)})
-                        )
       session.commit()
 
       session.expunge_all()
@@ -53,6 +53,8 @@ class ReqManagerHandler(RequestHandler):
 
     # If there is a constant delay to be applied to each request
     cls.constantRequestDelay = getServiceOption(serviceInfoDict, 'ConstantRequestDelay', 0)
+    # Number of seconds after which the requests assigned for execution can be assigned again
+    cls.requestLeaseTime = getServiceOption(serviceInfoDict, 'RequestLeaseTime', 3600)
 
     # # create tables for empty db
     return cls.__requestDB.createTables()
@@ -178,7 +180,7 @@ class ReqManagerHandler(RequestHandler):
   @classmethod
   def export_getRequest(cls, requestID=0):
     """ Get a request of given type from the database """
-    getRequest = cls.__requestDB.getRequest(requestID)
+    getRequest = cls.__requestDB.getRequest(requestID, leaseTime=cls.requestLeaseTime)
     if not getRequest["OK"]:
       gLogger.error("getRequest: %s" % getRequest["Message"])
       return getRequest
@@ -204,7 +206,7 @@ class ReqManagerHandler(RequestHandler):
         :return: S_OK( {Failed : message, Successful : list of Request.toJSON()} )
     """
     getRequests = cls.__requestDB.getBulkRequests(
-        numberOfRequest=numberOfRequest, assigned=assigned)
+        numberOfRequest=numberOfRequest, assigned=assigned, leaseTime=cls.requestLeaseTime)
     if not getRequests["OK"]:
       gLogger.error("getRequests: %s" % getRequests["Message"])
       return getRequests
@@ -46,7 +46,19 @@ class RequestTask(object):
   .. class:: RequestTask
 
   request's processing task
+
+  A persistent worker, i.e. a process executing many tasks, keeps the operation handlers of each
+  owner group, the request client and the shifter proxies of the previous tasks in the class caches below.
   """
+  # # seconds during which the shifter proxies are reused by a persistent worker,
+  # # they are downloaded with at least 1200 seconds left
+  SHIFTER_PROXIES_LIFETIME = 600
+
+  # # per process caches used when persistentWorker is set
+  __handlersCache = {}
+  __managersCache = {}
+  __requestClientCache = None
+  __monitorInitialized = False
 
   def __init__(
           self,
@@ -55,12 +67,14 @@ class RequestTask(object):
           csPath,
           agentName,
           standalone=False,
-          requestClient=None):
+          requestClient=None,
+          persistentWorker=False):
     """c'tor
 
     :param self: self reference
     :param str requestJSON: request serialized to JSON
     :param dict opHandlers: operation handlers
+    :param bool persistentWorker: reuse the handlers, clients and proxies of the previous tasks of the process
     """
     self.request = Request(requestJSON)
     # # csPath
@@ -71,36 +85,63 @@ class RequestTask(object):
     self.standalone = standalone
     # # handlers dict
     self.handlersDict = handlersDict
-    # # handlers class def
+    # # persistent worker flag
+    self.persistentWorker = persistentWorker
+    # # handlers class def, the handlers bind the data manager and the catalogs of the VO of the owner group
     self.handlers = {}
+    if persistentWorker:
+      self.handlers = RequestTask.__handlersCache.setdefault((csPath, self.request.OwnerGroup), {})
+    # # seconds spent executing each operation type
+    self.operationTimes = {}
     # # own sublogger
     self.log = gLogger.getSubLogger("pid_%s/%s" % (os.getpid(), self.request.RequestName))
     # # get shifters info
     self.__managersDict = {}
-    shifterProxies = self.__setupManagerProxies()
-    if not shifterProxies["OK"]:
-      self.log.error("Cannot setup shifter proxies", shifterProxies["Message"])
-
-    # # initialize gMonitor
-    gMonitor.setComponentType(gMonitor.COMPONENT_AGENT)
-    gMonitor.setComponentName(self.agentName)
-    gMonitor.initialize()
-
-    # # own gMonitor activities
-    gMonitor.registerActivity("RequestAtt", "Requests processed",
-                              "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
-    gMonitor.registerActivity("RequestFail", "Requests failed",
-                              "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
-    gMonitor.registerActivity("RequestOK", "Requests done",
-                              "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
-
-    if requestClient is None:
+    if not persistentWorker:
+      shifterProxies = self.__setupManagerProxies()
+      if not shifterProxies["OK"]:
+        self.log.error("Cannot setup shifter proxies", shifterProxies["Message"])
+
+    if not persistentWorker or not RequestTask.__monitorInitialized:
+      # # initialize gMonitor
+      gMonitor.setComponentType(gMonitor.COMPONENT_AGENT)
+      gMonitor.setComponentName(self.agentName)
+      gMonitor.initialize()
+
+      # # own gMonitor activities
+      gMonitor.registerActivity("RequestAtt", "Requests processed",
+                                "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
+      gMonitor.registerActivity("RequestFail", "Requests failed",
+                                "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
+      gMonitor.registerActivity("RequestOK", "Requests done",
+                                "RequestExecutingAgent", "Requests/min", gMonitor.OP_SUM)
+      RequestTask.__monitorInitialized = persistentWorker
+
+    if requestClient is not None:
+      self.requestClient = requestClient
+    elif not persistentWorker:
       self.requestClient = ReqClient()
     else:
-      self.requestClient = requestClient
+      if RequestTask.__requestClientCache is None:
+        RequestTask.__requestClientCache = ReqClient()
+      self.requestClient = RequestTask.__requestClientCache
 
   def __setupManagerProxies(self):
     """ setup grid proxy for all defined managers """
+    if self.persistentWorker:
+      expiration, managersDict = RequestTask.__managersCache.get(self.agentName, (0, {}))
+      if expiration > time.time():
+        self.__managersDict = dict(managersDict)
+        return S_OK()
+      result = self.__downloadManagerProxies()
+      if result["OK"]:
+        RequestTask.__managersCache[self.agentName] = (time.time() + self.SHIFTER_PROXIES_LIFETIME,
+                                                       dict(self.__managersDict))
+      return result
+    return self.__downloadManagerProxies()
+
+  def __downloadManagerProxies(self):
+    """ download the grid proxies of all defined managers """
     oHelper = Operations()
     shifters = oHelper.getSections("Shifter")
     if not shifters["OK"]:
@@ -315,7 +356,9 @@ class RequestTask(object):
         # Always use request owner proxy
         if useServerCertificate:
           gConfigurationData.setOptionInCFG('/DIRAC/Security/UseServerCertificate', 'false')
+        startTime = time.time()
         exe = handler()
+        self.operationTimes[operation.Type] = self.operationTimes.get(operation.Type, 0.) + time.time() - startTime
         if useServerCertificate:
           gConfigurationData.setOptionInCFG('/DIRAC/Security/UseServerCertificate', 'true')
         if not exe["OK"]:
@@ -399,4 +442,7 @@ class RequestTask(object):
 
     # Request will be updated by the callBack method
     self.log.verbose("RequestTasks exiting", "request %s" % self.request.Status)
-    return S_OK(self.request)
+    result = S_OK(self.request)
+    # # for the throughput report of the agent
+    result["OperationTimes"] = self.operationTimes
+    return result
@@ -0,0 +1,74 @@
+""" Test the caches of the RequestTask kept by a persistent worker
+"""
+
+# pylint: disable=protected-access,redefined-outer-name
+
+import pytest
+from mock import MagicMock
+
+from DIRAC.RequestManagementSystem.Client.Request import Request
+from DIRAC.RequestManagementSystem.Client.Operation import Operation
+from DIRAC.RequestManagementSystem.private.RequestTask import RequestTask
+
+__RCSID__ = "$Id$"
+
+HANDLERS_DICT = {"ForwardDISET": "DIRAC/RequestManagementSystem/private/ForwardDISET"}
+AGENT_NAME = 'RequestManagement/RequestExecutingAgent'
+
+
+def requestJSON(ownerGroup):
+  """ Serialized request of a user of a group """
+  req = Request()
+  req.RequestName = "foobarbaz"
+  req.OwnerGroup = ownerGroup
+  req.OwnerDN = "/DC=ch/DC=cern/OU=Organic Units/OU=Users/CN=chaen/CN=705305/CN=Christophe Haen"
+  req.addOperation(Operation({"Type": "ForwardDISET", "Arguments": "tts10:helloWorldee"}))
+  return req.toJSON()["Value"]
+
+
+@pytest.fixture
+def proxyManager(mocker):
+  """ Mock the services used to get the proxies, with two shifters, and empty the caches of the tasks """
+  rtModule = 'DIRAC.RequestManagementSystem.private.RequestTask'
+  mocker.patch(rtModule + '.gMonitor')
+  operations = mocker.patch(rtModule + '.Operations')
+  operations.return_value.getSections.return_value = {'OK': True, 'Value': ['DataProcessing', 'DataManager']}
+  operations.return_value.getOptionsDict.return_value = {'OK': True,
+                                                         'Value': {'Group': 'lhcb_prod', 'User': 'fstagni'}}
+  registry = mocker.patch(rtModule + '.Registry')
+  registry.getDNForUsername.return_value = {'OK': True, 'Value': ['/DN/fstagni']}
+  registry.getVOMSAttributeForGroup.return_value = None
+  gProxyManager = mocker.patch(rtModule + '.gProxyManager')
+  gProxyManager.downloadProxyToFile.return_value = {'OK': True, 'Value': '/tmp/shifterProxy', 'chain': None}
+  gProxyManager.downloadVOMSProxyToFile.return_value = {'OK': True, 'Value': '/tmp/ownerProxy'}
+  mocker.patch.object(RequestTask, '_RequestTask__handlersCache', {})
+  mocker.patch.object(RequestTask, '_RequestTask__managersCache', {})
+  mocker.patch.dict('os.environ')
+  return gProxyManager
+
+
+def test_persistentWorker(proxyManager):
+  """ The handlers and the shifter proxies are kept between the tasks of a persistent worker """
+  tasks = [RequestTask(requestJSON('lhcb_user'), HANDLERS_DICT, 'csPath', AGENT_NAME,
+                       requestClient=MagicMock(), persistentWorker=True) for _i in range(2)]
+  assert tasks[0].handlers is tasks[1].handlers
+  for task in tasks:
+    res = task.setupProxy()
+    assert res['OK'], res
+    assert res['Value']['ProxyFile'] == '/tmp/ownerProxy'
+  # One download per shifter, for the first task only
+  assert proxyManager.downloadProxyToFile.call_count == 2
+
+  # A non persistent task downloads them again
+  task = RequestTask(requestJSON('lhcb_user'), HANDLERS_DICT, 'csPath', AGENT_NAME, requestClient=MagicMock())
+  assert task.handlers is not tasks[0].handlers
+  assert proxyManager.downloadProxyToFile.call_count == 4
+
+
+def test_handlersPerGroup(proxyManager):  # pylint: disable=unused-argument
+  """ The handlers are not shared by the requests of different groups, which may be of different VOs """
+  task = RequestTask(requestJSON('lhcb_user'), HANDLERS_DICT, 'csPath', AGENT_NAME,
+                     requestClient=MagicMock(), persistentWorker=True)
+  otherTask = RequestTask(requestJSON('dteam_user'), HANDLERS_DICT, 'csPath', AGENT_NAME,
+                          requestClient=MagicMock(), persistentWorker=True)
+  assert task.handlers is not otherTask.handlers
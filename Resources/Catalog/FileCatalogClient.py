@@ -92,7 +92,7 @@ class FileCatalogClient(FileCatalogClientBase):
       'rebuildDirectoryUsage']
 
   ADMIN_METHODS = ['addUser', 'deleteUser', 'addGroup', 'deleteGroup', 'getUsers', 'getGroups',
-                   'getCatalogCounters', 'repairCatalog', 'rebuildDirectoryUsage']
+                   'getCatalogCounters', 'getDirectoryCacheStatistics', 'repairCatalog', 'rebuildDirectoryUsage']
 
   def __init__(self, url=None, **kwargs):
     """ Constructor function.
@@ -506,6 +506,10 @@ class FileCatalogClient(FileCatalogClientBase):
     """ Get the number of registered directories, files and replicas in various tables """
     return self._getRPC(timeout=timeout).getCatalogCounters()
 
+  def getDirectoryCacheStatistics(self, timeout=120):
+    """ Get the size and the hit rate of the cache of the directory paths """
+    return self._getRPC(timeout=timeout).getDirectoryCacheStatistics()
+
   def rebuildDirectoryUsage(self, timeout=120):
     """ Rebuild DirectoryUsage table from scratch """
     return self._getRPC(timeout=timeout).rebuildDirectoryUsage()
@@ -4,6 +4,8 @@ Backend wrapper
 
 __RCSID__ = "$Id$"
 
+from DIRAC.FrameworkSystem.private.standardLogging.Handler.AsyncHandler import AsyncHandler
+
 
 class AbstractBackend(object):
   """
@@ -47,6 +49,24 @@ class AbstractBackend(object):
     """
     raise NotImplementedError("setParameter not implemented")
 
+  def setAsync(self, parameters=None):
+    """
+    Wrap the handler in an AsyncHandler if the backend is asynchronous, so that the records are
+    emitted by a thread instead of the calling one. Common to all the backends.
+
+    :params parameters: dictionary of parameters.
+                        ex: {'Async': 'yes', 'AsyncQueueSize': 10000, 'AsyncPolicy': 'Drop'}
+    """
+    if not isinstance(parameters, dict) or str(parameters.get('Async', False)).lower() not in ('true', 'yes', 'y', '1'):
+      return
+    if self._handler is None or isinstance(self._handler, AsyncHandler):
+      return
+    handler = AsyncHandler(self._handler,
+                           queueSize=int(parameters.get('AsyncQueueSize', 10000)),
+                           policy=parameters.get('AsyncPolicy', 'Block'))
+    handler.setLevel(self._handler.level)
+    self._handler = handler
+
   def getHandler(self):
     """
     :return: the handler
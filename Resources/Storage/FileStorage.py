@@ -69,10 +69,7 @@ class FileStorage(StorageBase):
     urls = res['Value']
     self.log.debug("FileStorage.exists: Checking the existence of %s path(s)" % len(urls))
 
-    successful = dict((url, os.path.exists(url)) for url in urls)
-
-    resDict = {'Failed': {}, 'Successful': successful}
-    return S_OK(resDict)
+    return self._executeForEachURL(lambda url: S_OK(os.path.exists(url)), urls)
 
   #############################################################
   #
@@ -93,17 +90,13 @@ class FileStorage(StorageBase):
     urls = res['Value']
 
     self.log.debug("FileStorage.isFile: Determining whether %s paths are files." % len(urls))
-    successful = {}
-    failed = {}
-
-    for url in urls:
-      if os.path.exists(url):
-        successful[url] = os.path.isfile(url)
-      else:
-        failed[url] = "No such file or directory"
+    return self._executeForEachURL(self.__isSingleFile, urls)
 
-    resDict = {'Failed': failed, 'Successful': successful}
-    return S_OK(resDict)
+  @staticmethod
+  def __isSingleFile(url):
+    if os.path.exists(url):
+      return S_OK(os.path.isfile(url))
+    return S_ERROR("No such file or directory")
 
   def getFile(self, path, localPath=False):
     """ make a local copy of a storage :path:
@@ -195,24 +188,19 @@ class FileStorage(StorageBase):
       return res
     urls = res['Value']
     gLogger.debug("FileStorage.removeFile: Attempting to remove %s files." % len(urls))
+    return self._executeForEachURL(self.__removeSingleFile, urls)
 
-    failed = {}
-    successful = {}
-
-    for url in urls:
-      try:
-        os.unlink(url)
-        successful[url] = True
-      except OSError as ose:
-        # Removing a non existing file is a success
-        if ose.errno == errno.ENOENT:
-          successful[url] = True
-        else:
-          failed[url] = str(ose)
-      except Exception as e:
-        failed[url] = str(e)
-
-    return S_OK({'Failed': failed, 'Successful': successful})
+  @staticmethod
+  def __removeSingleFile(url):
+    try:
+      os.unlink(url)
+    except OSError as ose:
+      # Removing a non existing file is a success
+      if ose.errno != errno.ENOENT:
+        return S_ERROR(str(ose))
+    except Exception as e:
+      return S_ERROR(str(e))
+    return S_OK(True)
 
   @staticmethod
   def __stat(path):
@@ -266,18 +254,14 @@ class FileStorage(StorageBase):
       return res
     urls = res['Value']
 
-    failed = {}
-    successful = {}
-    for url in urls:
-      res = self.__stat(url)
-      if not res['OK']:
-        failed[url] = res['Message']
-      elif not res['Value']['File']:
-        failed[url] = os.strerror(errno.EISDIR)
-      else:
-        successful[url] = res['Value']
+    return self._executeForEachURL(self.__getSingleFileMetadata, urls)
 
-    return S_OK({'Failed': failed, 'Successful': successful})
+  @staticmethod
+  def __getSingleFileMetadata(url):
+    res = FileStorage.__stat(url)
+    if res['OK'] and not res['Value']['File']:
+      return S_ERROR(os.strerror(errno.EISDIR))
+    return res
 
   def getFileSize(self, path):
     """Get the physical size of the given file
@@ -293,22 +277,19 @@ class FileStorage(StorageBase):
       return res
     urls = res['Value']
 
-    failed = {}
-    successful = {}
-
-    for url in urls:
-      try:
-        # We check the filesize first because if it does not exist
-        # it raises an exception, while os.path.isfile just return False
-        filesize = os.path.getsize(url)
-        if os.path.isfile(url):
-          successful[url] = filesize
-        else:
-          failed[url] = os.strerror(errno.EISDIR)
-      except OSError as ose:
-        failed[url] = str(ose)
+    return self._executeForEachURL(self.__getSingleFileSize, urls)
 
-    return S_OK({'Failed': failed, 'Successful': successful})
+  @staticmethod
+  def __getSingleFileSize(url):
+    try:
+      # We check the filesize first because if it does not exist
+      # it raises an exception, while os.path.isfile just return False
+      filesize = os.path.getsize(url)
+    except OSError as ose:
+      return S_ERROR(str(ose))
+    if not os.path.isfile(url):
+      return S_ERROR(os.strerror(errno.EISDIR))
+    return S_OK(filesize)
 
   #############################################################
   #
@@ -137,19 +137,7 @@ class GFAL2_StorageBase(StorageBase):
 
     self.log.debug("GFAL2_StorageBase.exists: Checking the existence of %s path(s)" % len(urls))
 
-    successful = {}
-    failed = {}
-
-    for url in urls:
-      res = self.__singleExists(url)
-
-      if res['OK']:
-        successful[url] = res['Value']
-      else:  # something went wrong with the query
-        failed[url] = res['Message']
-
-    resDict = {'Failed': failed, 'Successful': successful}
-    return S_OK(resDict)
+    return self._executeForEachURL(self.__singleExists, urls)
 
   def _estimateTransferTimeout(self, fileSize):
     """ Dark magic to estimate the timeout for a transfer
@@ -203,18 +191,7 @@ class GFAL2_StorageBase(StorageBase):
 
     self.log.debug("GFAL2_StorageBase.isFile: checking whether %s path(s) are file(s)." % len(urls))
 
-    successful = {}
-    failed = {}
-
-    for url in urls:
-      res = self.__isSingleFile(url)
-
-      if res['OK']:
-        successful[url] = res['Value']
-      else:
-        failed[url] = res['Message']
-
-    return S_OK({'Failed': failed, 'Successful': successful})
+    return self._executeForEachURL(self.__isSingleFile, urls)
 
   def __isSingleFile(self, path):
     """ Checking if :path: exists and is a file
@@ -513,18 +490,7 @@ class GFAL2_StorageBase(StorageBase):
 
     self.log.debug("GFAL2_StorageBase.removeFile: Attempting to remove %s files" % len(urls))
 
-    failed = {}
-    successful = {}
-
-    for url in urls:
-      res = self.__removeSingleFile(url)
-
-      if res['OK']:
-        successful[url] = res['Value']
-      else:
-        failed[url] = res['Message']
-
-    return S_OK({'Failed': failed, 'Successful': successful})
+    return self._executeForEachURL(self.__removeSingleFile, urls)
 
   def __removeSingleFile(self, path):
     """ Physically remove the file specified by path
@@ -575,18 +541,7 @@ class GFAL2_StorageBase(StorageBase):
 
     self.log.debug("GFAL2_StorageBase.getFileSize: Trying to determine file size of %s files" % len(urls))
 
-    failed = {}
-    successful = {}
-
-    for url in urls:
-      res = self.__getSingleFileSize(url)
-
-      if not res['OK']:
-        failed[url] = res['Message']
-      else:
-        successful[url] = res['Value']
-
-    return S_OK({'Failed': failed, 'Successful': successful})
+    return self._executeForEachURL(self.__getSingleFileSize, urls)
 
   def __getSingleFileSize(self, path):
     """ Get the physical size of the given file
@@ -631,18 +586,7 @@ class GFAL2_StorageBase(StorageBase):
 
     self.log.debug('GFAL2_StorageBase.getFileMetadata: trying to read metadata for %s paths' % len(urls))
 
-    failed = {}
-    successful = {}
-
-    for url in urls:
-      res = self._getSingleFileMetadata(url)
-
-      if not res['OK']:
-        failed[url] = res['Message']
-      else:
-        successful[url] = res['Value']
-
-    return S_OK({'Failed': failed, 'Successful': successful})
+    return self._executeForEachURL(self._getSingleFileMetadata, urls)
 
   def _getSingleFileMetadata(self, path):
     """  Fetch the metadata associated to the file
@@ -1126,18 +1070,7 @@ class GFAL2_StorageBase(StorageBase):
 
     self.log.debug("GFAL2_StorageBase.isDirectory: checking whether %s path(s) are directory(ies)." % len(urls))
 
-    successful = {}
-    failed = {}
-
-    for url in urls:
-      res = self.__isSingleDirectory(url)
-      if res['OK']:
-        successful[url] = res['Value']
-      else:
-        failed[url] = res['Message']
-
-    resDict = {'Failed': failed, 'Successful': successful}
-    return S_OK(resDict)
+    return self._executeForEachURL(self.__isSingleDirectory, urls)
 
   def __isSingleDirectory(self, path):
     """ Checking if :path: exists and is a directory
@@ -1736,18 +1669,7 @@ class GFAL2_StorageBase(StorageBase):
 
     self.log.debug("GFAL2_StorageBase.getDirectoryMetadata: Attempting to fetch metadata.")
 
-    failed = {}
-    successful = {}
-
-    for url in urls:
-      res = self.__getSingleDirectoryMetadata(url)
-
-      if not res['OK']:
-        failed[url] = res['Message']
-      else:
-        successful[url] = res['Value']
-
-    return S_OK({'Failed': failed, 'Successful': successful})
+    return self._executeForEachURL(self.__getSingleDirectoryMetadata, urls)
 
   def __getSingleDirectoryMetadata(self, path):
     """ Fetch the metadata of the provided path
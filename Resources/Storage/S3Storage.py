@@ -230,26 +230,19 @@ class S3Storage(StorageBase):
               S_ERROR in case of argument problems
     """
 
-    successful = {}
-    failed = {}
-
     # the @_extractKeyFromS3Path transformed URL into keys
-    keys = urls
-
-    for key in keys:
-      try:
-        self.s3_client.head_object(Bucket=self.bucketName, Key=key)
-        successful[key] = True
-      except ClientError as exp:
-        if exp.response['Error']['Code'] == '404':
-          successful[key] = False
-        else:
-          failed[key] = repr(exp)
-      except Exception as exp:
-        failed[key] = repr(exp)
-
-    resDict = {'Failed': failed, 'Successful': successful}
-    return S_OK(resDict)
+    return self._executeForEachURL(self.__singleDirectExists, urls)
+
+  def __singleDirectExists(self, key):
+    try:
+      self.s3_client.head_object(Bucket=self.bucketName, Key=key)
+      return S_OK(True)
+    except ClientError as exp:
+      if exp.response['Error']['Code'] == '404':
+        return S_OK(False)
+      return S_ERROR(repr(exp))
+    except Exception as exp:
+      return S_ERROR(repr(exp))
 
   def _presigned_exists(self, urls):
     """ Check if the URLs exists on the storage
@@ -272,21 +265,25 @@ class S3Storage(StorageBase):
 
     # Otherwise, ask the gw for a presigned URL,
     # and perform it with requests
-    for url, presignedURL in presignedURLs.items():
-      try:
-        response = requests.get(presignedURL)
-        if response.status_code == 200:
-          successful[url] = True
-        elif response.status_code == 404:  # not found
-          successful[url] = False
-        else:
-          failed[url] = response.reason
-      except Exception as e:
-        failed[url] = repr(e)
+    res = self._executeForEachURL(lambda url: self.__singlePresignedExists(presignedURLs[url]), presignedURLs)
+    successful.update(res['Value']['Successful'])
+    failed.update(res['Value']['Failed'])
 
     resDict = {'Failed': failed, 'Successful': successful}
     return S_OK(resDict)
 
+  @staticmethod
+  def __singlePresignedExists(presignedURL):
+    try:
+      response = requests.get(presignedURL)
+      if response.status_code == 200:
+        return S_OK(True)
+      elif response.status_code == 404:  # not found
+        return S_OK(False)
+      return S_ERROR(response.reason)
+    except Exception as e:
+      return S_ERROR(repr(e))
+
   def isFile(self, urls):
     """ Check if the urls provided are a file or not
 
@@ -535,26 +532,21 @@ class S3Storage(StorageBase):
     """
 
     # the @_extractKeyFromS3Path transformed URL into keys
-    keys = urls
-
-    failed = {}
-    successful = {}
-
-    for key in keys:
-      try:
-        response = self.s3_client.head_object(Bucket=self.bucketName, Key=key)
-        responseMetadata = response['ResponseMetadata']['HTTPHeaders']
+    return self._executeForEachURL(self.__getSingleDirectFileMetadata, urls)
 
-        metadataDict = self._addCommonMetadata(responseMetadata)
-        metadataDict['File'] = True
-        metadataDict['Size'] = int(metadataDict['content-length'])
-        metadataDict['Checksum'] = metadataDict.get('x-amz-meta-checksum', '')
+  def __getSingleDirectFileMetadata(self, key):
+    try:
+      response = self.s3_client.head_object(Bucket=self.bucketName, Key=key)
+      responseMetadata = response['ResponseMetadata']['HTTPHeaders']
 
-        successful[key] = metadataDict
-      except Exception as exp:
-        failed[key] = repr(exp)
+      metadataDict = self._addCommonMetadata(responseMetadata)
+      metadataDict['File'] = True
+      metadataDict['Size'] = int(metadataDict['content-length'])
+      metadataDict['Checksum'] = metadataDict.get('x-amz-meta-checksum', '')
 
-    return S_OK({'Failed': failed, 'Successful': successful})
+      return S_OK(metadataDict)
+    except Exception as exp:
+      return S_ERROR(repr(exp))
 
   def _presigned_getFileMetadata(self, urls):
     """ Get metadata associated to the file(s)
@@ -576,26 +568,31 @@ class S3Storage(StorageBase):
 
     presignedURLs = res['Value']['Successful']
 
-    for url, presignedURL in presignedURLs.items():
-      try:
-        response = requests.head(presignedURL)
-        if not response.ok:
-          raise Exception(response.reason)
+    res = self._executeForEachURL(lambda url: self.__getSinglePresignedFileMetadata(presignedURLs[url]),
+                                  presignedURLs)
+    successful.update(res['Value']['Successful'])
+    failed.update(res['Value']['Failed'])
+
+    return S_OK({'Failed': failed, 'Successful': successful})
 
-        # Although the interesting fields are the same as when doing the query directly
-        # the case is not quite the same, so make it lower everywhere
-        responseMetadata = {headerKey.lower(): headerVal for headerKey, headerVal in response.headers.items()}
+  def __getSinglePresignedFileMetadata(self, presignedURL):
+    try:
+      response = requests.head(presignedURL)
+      if not response.ok:
+        raise Exception(response.reason)
 
-        metadataDict = self._addCommonMetadata(responseMetadata)
-        metadataDict['File'] = True
-        metadataDict['Size'] = int(metadataDict['content-length'])
-        metadataDict['Checksum'] = metadataDict.get('x-amz-meta-checksum', '')
+      # Although the interesting fields are the same as when doing the query directly
+      # the case is not quite the same, so make it lower everywhere
+      responseMetadata = {headerKey.lower(): headerVal for headerKey, headerVal in response.headers.items()}
 
-        successful[url] = metadataDict
-      except Exception as exp:
-        failed[url] = repr(exp)
+      metadataDict = self._addCommonMetadata(responseMetadata)
+      metadataDict['File'] = True
+      metadataDict['Size'] = int(metadataDict['content-length'])
+      metadataDict['Checksum'] = metadataDict.get('x-amz-meta-checksum', '')
 
-    return S_OK({'Failed': failed, 'Successful': successful})
+      return S_OK(metadataDict)
+    except Exception as exp:
+      return S_ERROR(repr(exp))
 
   def removeFile(self, urls):
     """ Physically remove the file specified by keys
@@ -624,20 +621,15 @@ class S3Storage(StorageBase):
               * S_ERROR in case of argument problems
     """
 
-    failed = {}
-    successful = {}
-
     # the @_extractKeyFromS3Path transformed URL into keys
-    keys = urls
-
-    for key in keys:
-      try:
-        self.s3_client.delete_object(Bucket=self.bucketName, Key=key)
-        successful[key] = True
-      except Exception as exp:
-        failed[key] = repr(exp)
+    return self._executeForEachURL(self.__removeSingleDirectFile, urls)
 
-    return S_OK({'Failed': failed, 'Successful': successful})
+  def __removeSingleDirectFile(self, key):
+    try:
+      self.s3_client.delete_object(Bucket=self.bucketName, Key=key)
+      return S_OK(True)
+    except Exception as exp:
+      return S_ERROR(repr(exp))
 
   def _presigned_removeFile(self, urls):
     """ Physically remove the file specified by keys
@@ -661,18 +653,22 @@ class S3Storage(StorageBase):
 
     presignedURLs = res['Value']['Successful']
 
-    for url, presignedURL in presignedURLs.items():
-      try:
-        response = requests.delete(presignedURL)
-        if not response.ok:
-          raise Exception(response.reason)
-
-        successful[url] = True
-      except Exception as exp:
-        failed[url] = repr(exp)
+    res = self._executeForEachURL(lambda url: self.__removeSinglePresignedFile(presignedURLs[url]), presignedURLs)
+    successful.update(res['Value']['Successful'])
+    failed.update(res['Value']['Failed'])
 
     return S_OK({'Failed': failed, 'Successful': successful})
 
+  @staticmethod
+  def __removeSinglePresignedFile(presignedURL):
+    try:
+      response = requests.delete(presignedURL)
+      if not response.ok:
+        raise Exception(response.reason)
+      return S_OK(True)
+    except Exception as exp:
+      return S_ERROR(repr(exp))
+
   def getFileSize(self, urls):
     """Get the physical size of the given file
 
@@ -32,6 +32,10 @@ These are the methods for manipulating the client:
 These are the methods for getting information about the Storage:
       getOccupancy()
 
+Plugins treating the URLs one by one can use _executeForEachURL to treat them concurrently,
+up to the MaxConcurrency option of the protocol section of the storage element, which defaults
+to /Resources/StorageElements/MaxConcurrency, itself 1 by default.
+
 """
 __RCSID__ = "$Id$"
 
@@ -41,7 +45,9 @@ import os
 import shutil
 import tempfile
 
-from DIRAC import S_OK, S_ERROR
+from concurrent.futures import ThreadPoolExecutor
+
+from DIRAC import S_OK, S_ERROR, gConfig
 from DIRAC.Core.Utilities.Pfn import pfnparse, pfnunparse
 from DIRAC.Core.Utilities.ReturnValues import returnSingleResult
 from DIRAC.Resources.Storage.Utilities import checkArgumentFormat
@@ -92,6 +98,13 @@ class StorageBase(object):
     # use True for backward compatibility
     self.srmSpecificParse = True
 
+    # Maximum number of URLs treated at the same time by _executeForEachURL
+    try:
+      self.maxConcurrency = max(1, int(parameterDict.get('MaxConcurrency') or
+                                       gConfig.getValue('/Resources/StorageElements/MaxConcurrency', 1)))
+    except ValueError:
+      self.maxConcurrency = 1
+
   def setStorageElement(self, se):
     self.se = se
 
@@ -445,6 +458,31 @@ class StorageBase(object):
 
     return S_OK(urlDict['Protocol'] == self.protocolParameters['Protocol'])
 
+  def _executeForEachURL(self, singleMethod, urls, *args):
+    """ Execute a method treating a single URL for each of the given URLs, with at most
+        maxConcurrency of them at the same time. The method must be thread safe.
+
+    :param singleMethod: method called as singleMethod( url, *args ), returning S_OK/S_ERROR
+    :param urls: list or dictionary of URLs
+    :returns: S_OK( { 'Successful' : { url : value }, 'Failed' : { url : error message } } )
+    """
+    urls = list(urls)
+    numThreads = min(self.maxConcurrency, len(urls))
+    if numThreads > 1:
+      with ThreadPoolExecutor(max_workers=numThreads) as executor:
+        results = list(executor.map(lambda url: singleMethod(url, *args), urls))
+    else:
+      results = [singleMethod(url, *args) for url in urls]
+
+    successful = {}
+    failed = {}
+    for url, res in zip(urls, results):
+      if res['OK']:
+        successful[url] = res['Value']
+      else:
+        failed[url] = res['Message']
+    return S_OK({'Failed': failed, 'Successful': successful})
+
   #############################################################
   #
   # These are the methods for getting information about the Storage element:
@@ -0,0 +1,58 @@
+""" Unit tests of the concurrent execution of the storage plugins
+"""
+
+# pylint: disable=missing-docstring, invalid-name
+
+import threading
+import time
+
+import pytest
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.Resources.Storage.StorageBase import StorageBase
+
+
+def getStorage(maxConcurrency):
+  return StorageBase('FAKE', {'Protocol': 'file', 'Path': '/tmp', 'MaxConcurrency': maxConcurrency})
+
+
+class SingleMethod(object):
+  """ Method treating a URL, recording the maximum number of concurrent calls """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.running = 0
+    self.maxRunning = 0
+
+  def __call__(self, url, suffix):
+    with self.lock:
+      self.running += 1
+      self.maxRunning = max(self.maxRunning, self.running)
+    time.sleep(0.01)
+    with self.lock:
+      self.running -= 1
+    if url.endswith('bad'):
+      return S_ERROR('Bad URL %s' % url)
+    return S_OK(url + suffix)
+
+
+@pytest.mark.parametrize("maxConcurrency, expected", [('', 1), ('1', 1), ('4', 4), ('100', 10), ('wrong', 1)])
+def test_executeForEachURL(maxConcurrency, expected):
+  storage = getStorage(maxConcurrency)
+  singleMethod = SingleMethod()
+  urls = dict(('url%d%s' % (i, 'bad' if i % 3 == 0 else ''), False) for i in range(10))
+
+  res = storage._executeForEachURL(singleMethod, urls, '_done')
+  assert res['OK'], res
+  assert sorted(res['Value']['Successful']) == sorted(url for url in urls if not url.endswith('bad'))
+  assert sorted(res['Value']['Failed']) == sorted(url for url in urls if url.endswith('bad'))
+  assert res['Value']['Successful']['url1'] == 'url1_done'
+  assert singleMethod.maxRunning == expected
+
+
+def test_executeForEachURLException():
+  """ Exceptions are raised as without concurrency """
+  def failingMethod(url):
+    raise RuntimeError(url)
+  with pytest.raises(RuntimeError):
+    getStorage('4')._executeForEachURL(failingMethod, ['url1', 'url2'])
@@ -14,7 +14,6 @@ import time
 import Queue
 import os
 import datetime
-import pickle
 
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Base.AgentModule import AgentModule
@@ -24,6 +23,7 @@ from DIRAC.Core.Utilities.List import breakListIntoChunks, randomize
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.TransformationSystem.Client.TransformationClient import TransformationClient
 from DIRAC.TransformationSystem.Agent.TransformationAgentsUtilities import TransformationAgentsUtilities
+from DIRAC.TransformationSystem.Utilities.ReplicaCache import ReplicaCache
 from DIRAC.DataManagementSystem.Client.DataManager import DataManager
 
 __RCSID__ = "$Id$"
@@ -64,8 +64,6 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
     # Validity of the cache
     self.replicaCache = None
     self.replicaCacheValidity = None
-    self.writingCache = False
-    self.removedFromCache = 0
 
     self.noUnusedDelay = 0
     self.unusedFiles = {}
@@ -96,7 +94,7 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
     # clients
     self.transfClient = TransformationClient()
 
-    # for caching using a pickle file
+    # for caching using a journal file per transformation
     self.workDirectory = self.am_getWorkDirectory()
     self.cacheFile = os.path.join(self.workDirectory, 'ReplicaCache.pkl')
     self.controlDirectory = self.am_getControlDirectory()
@@ -105,6 +103,7 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
     self.lastFileOffset = {}
 
     # Validity of the cache
+    # transID -> ReplicaCache
     self.replicaCache = {}
     self.replicaCacheValidity = self.am_getOption('ReplicaCacheValidity', 2)
 
@@ -458,18 +457,11 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
     dataReplicas = {}
     nLfns = len(lfns)
     self._logVerbose("Getting replicas for %d files" % nLfns, method=method, transID=transID)
-    cachedReplicaSets = self.replicaCache.get(transID, {})
-    cachedReplicas = {}
-    # Merge all sets of replicas
-    for replicas in cachedReplicaSets.itervalues():
-      cachedReplicas.update(replicas)
-    self._logInfo("Number of cached replicas: %d" % len(cachedReplicas), method=method, transID=transID)
-    setCached = set(cachedReplicas)
-    setLfns = set(lfns)
-    for lfn in setLfns & setCached:
-      dataReplicas[lfn] = cachedReplicas[lfn]
-    newLFNs = setLfns - setCached
-    self._logInfo("ReplicaCache hit for %d out of %d LFNs" % (len(dataReplicas), nLfns),
+    replicaCache = self.__getCache(transID)
+    self._logInfo("Number of cached replicas: %d" % len(replicaCache), method=method, transID=transID)
+    dataReplicas, newLFNs = replicaCache.getReplicas(set(lfns))
+    self._logInfo("ReplicaCache hit for %d out of %d LFNs (hit rate %.1f%%)" %
+                  (len(dataReplicas), nLfns, 100. * replicaCache.getStatistics()['HitRate']),
                   method=method, transID=transID)
     if newLFNs:
       startTime = time.time()
@@ -481,7 +473,7 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
         if res['OK']:
           reps = dict((lfn, ses) for lfn, ses in res['Value'].iteritems() if ses)
           newReplicas.update(reps)
-          self.__updateCache(transID, reps)
+          replicaCache.addReplicas(reps)
         else:
           self._logWarn("Failed to get replicas for %d files" % len(chunk), res['Message'],
                         method=method, transID=transID)
@@ -557,45 +549,40 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
                          method=method, transID=transID)
     return S_OK(dataReplicas)
 
-  def __updateCache(self, transID, newReplicas):
-    """ Add replicas to the cache
+  def __getCache(self, transID):
+    """ Get the replica cache of a transformation, loading it if needed
     """
-    self.replicaCache.setdefault(transID, {})[datetime.datetime.utcnow()] = newReplicas
-#    if len( newReplicas ) > 5000:
-#      self.__writeCache( transID )
+    if transID not in self.replicaCache:
+      self.__readCache(transID)
+    return self.replicaCache[transID]
 
   def __clearCacheForTrans(self, transID):
-    """ Remove all replicas for a transformation
+    """ Remove all replicas for a transformation, without reading them
     """
-    self.replicaCache.pop(transID, None)
+    replicaCache = self.replicaCache.setdefault(transID, ReplicaCache(self.__cacheFile(transID),
+                                                                      legacyFile=self.__legacyCacheFile(transID)))
+    replicaCache.clear()
 
   def __cleanReplicas(self, transID, lfns):
     """ Remove cached replicas that are not in a list
     """
-    cachedReplicas = set()
-    for replicas in self.replicaCache.get(transID, {}).itervalues():
-      cachedReplicas.update(replicas)
-    toRemove = cachedReplicas - set(lfns)
+    replicaCache = self.__getCache(transID)
+    toRemove = replicaCache.getLFNs() - set(lfns)
     if toRemove:
       self._logInfo("Remove %d files from cache" % len(toRemove), method='__cleanReplicas', transID=transID)
-      self.__removeFromCache(transID, toRemove)
+      replicaCache.removeReplicas(toRemove)
 
   def __cleanCache(self, transID):
     """ Cleans the cache
     """
     try:
       if transID in self.replicaCache:
-        timeLimit = datetime.datetime.utcnow() - datetime.timedelta(days=self.replicaCacheValidity)
-        for updateTime in set(self.replicaCache[transID]):
-          nCache = len(self.replicaCache[transID][updateTime])
-          if updateTime < timeLimit or not nCache:
-            self._logInfo("Clear %s replicas for transformation %s, time %s" %
-                          ('%d cached' % nCache if nCache else 'empty cache', str(transID), str(updateTime)),
-                          transID=transID, method='__cleanCache')
-            del self.replicaCache[transID][updateTime]
-        # Remove empty transformations
-        if not self.replicaCache[transID]:
-          del self.replicaCache[transID]
+        timeLimit = time.time() - self.replicaCacheValidity * 86400
+        for updateTime, nCache in self.replicaCache[transID].expire(timeLimit):
+          self._logInfo("Clear %s replicas for transformation %s, time %s" %
+                        ('%d cached' % nCache if nCache else 'empty cache', str(transID),
+                         time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(updateTime))),
+                        transID=transID, method='__cleanCache')
     except Exception as x:
       self._logException("Exception when cleaning replica cache:", lException=x)
 
@@ -607,16 +594,13 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
 
   def __removeFromCache(self, transID, lfns):
     if transID not in self.replicaCache:
-      return
-    removed = 0
-    if self.replicaCache[transID] and lfns:
-      for lfn in lfns:
-        for timeKey in self.replicaCache[transID]:
-          if self.replicaCache[transID][timeKey].pop(lfn, None):
-            removed += 1
-    return removed
+      return 0
+    return self.replicaCache[transID].removeReplicas(lfns)
 
   def __cacheFile(self, transID):
+    return self.cacheFile.replace('.pkl', '_%s.journal' % str(transID))
+
+  def __legacyCacheFile(self, transID):
     return self.cacheFile.replace('.pkl', '_%s.pkl' % str(transID))
 
   @gSynchro
@@ -625,49 +609,46 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
     """
     if transID in self.replicaCache:
       return
+    method = '__readCache'
+    replicaCache = ReplicaCache(self.__cacheFile(transID), legacyFile=self.__legacyCacheFile(transID))
     try:
-      method = '__readCache'
-      fileName = self.__cacheFile(transID)
-      if not os.path.exists(fileName):
-        self.replicaCache[transID] = {}
-      else:
-        with open(fileName, 'r') as cacheFile:
-          self.replicaCache[transID] = pickle.load(cacheFile)
-        self._logInfo("Successfully loaded replica cache from file %s (%d files)" %
-                      (fileName, self.__filesInCache(transID)),
+      startTime = time.time()
+      replicaCache.load()
+      if len(replicaCache):
+        self._logInfo("Successfully loaded replica cache from file %s (%d files) in %.1f seconds" %
+                      (replicaCache.journalFile, len(replicaCache), time.time() - startTime),
                       method=method, transID=transID)
     except Exception as x:
-      self._logException("Failed to load replica cache from file %s" % fileName, lException=x,
+      self._logException("Failed to load replica cache from file %s" % replicaCache.journalFile, lException=x,
                          method=method, transID=transID)
-      self.replicaCache[transID] = {}
-
-  def __filesInCache(self, transID):
-    cache = self.replicaCache.get(transID, {})
-    return sum(len(lfns) for lfns in cache.itervalues())
+      replicaCache.clear()
+    self.replicaCache[transID] = replicaCache
 
   @gSynchro
   def __writeCache(self, transID=None):
-    """ Writes the cache
+    """ Writes the changes of the cache to its journal
     """
     method = '__writeCache'
+    t_id = transID
+    cacheFile = None
     try:
       startTime = time.time()
-      transList = [transID] if transID else set(self.replicaCache)
+      transList = [transID] if transID else list(self.replicaCache)
       filesInCache = 0
       nCache = 0
+      nCompacted = 0
       for t_id in transList:
-        # Protect the copy of the cache
-        filesInCache += self.__filesInCache(t_id)
-        # write to a temporary file in order to avoid corrupted files
-        cacheFile = self.__cacheFile(t_id)
-        tmpFile = cacheFile + '.tmp'
-        with open(tmpFile, 'w') as fd:
-          pickle.dump(self.replicaCache.get(t_id, {}), fd)
-        # Now rename the file as it shold
-        os.rename(tmpFile, cacheFile)
+        replicaCache = self.replicaCache.get(t_id)
+        if replicaCache is None:
+          continue
+        cacheFile = replicaCache.journalFile
+        filesInCache += len(replicaCache)
+        if replicaCache.write():
+          nCompacted += 1
         nCache += 1
-      self._logInfo("Successfully wrote %d replica cache file(s) (%d files) in %.1f seconds"
-                    % (nCache, filesInCache, time.time() - startTime),
+        self._logVerbose("Replica cache statistics", str(replicaCache.getStatistics()), method=method, transID=t_id)
+      self._logInfo("Successfully wrote %d replica cache file(s) (%d files, %d compacted) in %.1f seconds"
+                    % (nCache, filesInCache, nCompacted, time.time() - startTime),
                     method=method, transID=transID if transID else None)
     except Exception as x:
       self._logException("Could not write replica cache file %s" % cacheFile, lException=x,
@@ -700,7 +681,7 @@ class TransformationAgent(AgentModule, TransformationAgentsUtilities):
       try:
         if transID in self.replicaCache:
           self._logInfo("Removed cached replicas for transformation", method='pluginCallBack', transID=transID)
-          self.replicaCache.pop(transID)
+          self.replicaCache[transID].clear()
           self.__writeCache(transID)
       except BaseException:
         pass
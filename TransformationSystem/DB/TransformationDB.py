@@ -23,11 +23,28 @@ from DIRAC.Core.Utilities.List import stringListToString, intListToString, break
 from DIRAC.Core.Utilities.Shifter import setupShifterProxyInEnv
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.Core.Utilities.Subprocess import pythonCall
-from DIRAC.DataManagementSystem.Client.MetaQuery import MetaQuery
+from DIRAC.TransformationSystem.Utilities.MetaQueryIndex import MetaQueryIndex, ACTIVE_STATUSES
 
 __RCSID__ = "$Id$"
 
 MAX_ERROR_COUNT = 10
+# Number of seconds after which the input meta queries are reloaded, to see the changes made by other instances
+FILTER_QUERIES_CACHE_TIME = 60
+# Number of seconds after which the metadata types are asked again to the catalog
+METADATA_TYPES_CACHE_TIME = 600
+
+
+def _parseMetaQueryValue(parameterValue, parameterType):
+  """ Convert a value of the TransformationMetaQueries table to its type """
+  if re.search(';;;', str(parameterValue)):
+    parameterValue = parameterValue.split(';;;')
+    if parameterType == 'Integer':
+      parameterValue = [int(x) for x in parameterValue]
+  elif parameterType == 'Integer':
+    parameterValue = int(parameterValue)
+  elif parameterType == 'Dict':
+    parameterValue = eval(parameterValue)
+  return parameterValue
 
 #############################################################################
 
@@ -112,7 +129,10 @@ class TransformationDB(DB):
                                  ]
 
     # Intialize filter Queries with Input Meta Queries
-    self.filterQueries = []
+    self.filterQueries = MetaQueryIndex()
+    self.__filterQueriesLock = threading.Lock()
+    self.__filterQueriesTime = 0
+    self.__metadataTypesTime = 0
     res = self.__updateFilterQueries()
     if not res['OK']:
       gLogger.fatal("Failed to create filter queries")
@@ -194,10 +214,6 @@ class TransformationDB(DB):
         gLogger.error("Failed to add output meta query to the transformation", res['Message'])
         return self.deleteTransformation(transID, connection=connection)
 
-    # If the transformation has an input data specification
-    if inputMetaQuery:
-      self.filterQueries.append((transID, inputMetaQuery))
-
     if inheritedFrom:
       res = self._getTransformationID(inheritedFrom, connection=connection)
       if not res['OK']:
@@ -366,7 +382,10 @@ class TransformationDB(DB):
     req = "UPDATE Transformations SET %s='%s', LastUpdate=UTC_TIMESTAMP() WHERE TransformationID=%d" % (paramName,
                                                                                                         paramValue,
                                                                                                         transID)
-    return self._update(req, connection)
+    res = self._update(req, connection)
+    if res['OK'] and paramName == 'Status':
+      self.__invalidateFilterQueries()
+    return res
 
   def _getTransformationID(self, transName, connection=False):
     """ Method returns ID of transformation with the name=<name> """
@@ -391,23 +410,49 @@ class TransformationDB(DB):
     return self._update(req, connection)
 
   def __updateFilterQueries(self, connection=False):
-    """ Get filters for all defined input streams in all the transformations.
+    """ Get filters for all defined input streams in all the active transformations, in a single query.
     """
-    resultList = []
-    res = self.getTransformations(condDict={'Status': {'in': ['New', 'Active', 'Stopped', 'Flush', 'Completing']}},
-                                  connection=connection)
+    req = "SELECT q.TransformationID, t.Status, q.MetaDataName, q.MetaDataValue, q.MetaDataType"
+    req += " FROM TransformationMetaQueries AS q JOIN Transformations AS t USING (TransformationID)"
+    req += " WHERE q.QueryType = 'Input' AND t.Status IN (%s);" % stringListToString(ACTIVE_STATUSES)
+    res = self._query(req, connection)
     if not res['OK']:
       return res
 
-    transIDs = res['Value']
-    for transID in transIDs:
-      res = self.getTransformationMetaQuery(transID, 'Input')
-      if not res['OK']:
-        return res
-      resultList.append(transID, res['Value'])
+    queries = {}
+    for transID, status, parameterName, parameterValue, parameterType in res['Value']:
+      queries.setdefault(transID, ({}, status))[0][parameterName] = _parseMetaQueryValue(parameterValue,
+                                                                                         parameterType)
+
+    self.filterQueries.setQueries(queries)
+    self.__filterQueriesTime = time.time()
+    return S_OK(queries)
+
+  def __invalidateFilterQueries(self):
+    """ Reload the filters before using them next time """
+    self.__filterQueriesTime = 0
 
-    self.filterQueries = resultList
-    return S_OK(resultList)
+  def __getFilterQueries(self):
+    """ Get the index of the filters, reloading them and the metadata types when they are too old
+    """
+    with self.__filterQueriesLock:
+      if time.time() - self.__filterQueriesTime > FILTER_QUERIES_CACHE_TIME:
+        res = self.__updateFilterQueries()
+        if not res['OK']:
+          return res
+      if time.time() - self.__metadataTypesTime > METADATA_TYPES_CACHE_TIME:
+        res = FileCatalog().getMetadataFields()
+        if not res['OK']:
+          gLogger.error("Error in getMetadataFields: %s" % res['Message'])
+          return res
+        if not res['Value']:
+          gLogger.error("Error: no metadata fields defined")
+          return S_ERROR("No metadata fields defined")
+        typeDict = dict(res['Value']['FileMetaFields'])
+        typeDict.update(res['Value']['DirectoryMetaFields'])
+        self.filterQueries.setTypes(typeDict)
+        self.__metadataTypesTime = time.time()
+    return S_OK(self.filterQueries)
 
   ###########################################################################
   #
@@ -1007,7 +1052,10 @@ class TransformationDB(DB):
       return res
     connection = res['Value']['Connection']
     transID = res['Value']['TransformationID']
-    return self.__addMetaQuery(transID, queryDict, queryType, author=author, connection=connection)
+    res = self.__addMetaQuery(transID, queryDict, queryType, author=author, connection=connection)
+    if queryType == 'Input':
+      self.__invalidateFilterQueries()
+    return res
 
   def __addMetaQuery(self, transID, queryDict, queryType, author='', connection=False):
     """ Insert the Meta Query into the TransformationMetaQuery table """
@@ -1055,6 +1103,8 @@ class TransformationDB(DB):
       return res
     connection = res['Value']['Connection']
     transID = res['Value']['TransformationID']
+    if queryType == 'Input':
+      self.filterQueries.removeQuery(transID)
     res = self._escapeString(queryType)
     if not res['OK']:
       return S_ERROR("Failed to parse the transformation query type")
@@ -1094,15 +1144,7 @@ class TransformationDB(DB):
       return res
     queryDict = {}
     for parameterName, parameterValue, parameterType in res['Value']:
-      if re.search(';;;', str(parameterValue)):
-        parameterValue = parameterValue.split(';;;')
-        if parameterType == 'Integer':
-          parameterValue = [int(x) for x in parameterValue]
-      elif parameterType == 'Integer':
-        parameterValue = int(parameterValue)
-      elif parameterType == 'Dict':
-        parameterValue = eval(parameterValue)
-      queryDict[parameterName] = parameterValue
+      queryDict[parameterName] = _parseMetaQueryValue(parameterValue, parameterType)
     if not queryDict:
       return S_ERROR(ENOENT, "No MetaQuery found for transformation")
     return S_OK(queryDict)
@@ -1407,9 +1449,7 @@ class TransformationDB(DB):
     res = self.__deleteTransformation(transID, connection=connection)
     if not res['OK']:
       return res
-    res = self.__updateFilterQueries(connection=connection)
-    if not res['OK']:
-      return res
+    self.filterQueries.removeQuery(transID)
     return S_OK()
 
   def __removeTransformationTask(self, transID, taskID, connection=False):
@@ -1483,6 +1523,7 @@ class TransformationDB(DB):
     filesToAdd = []
     catalog = FileCatalog()
 
+    metadataDicts = {}
     for lfn in fileDicts:
       gLogger.info("addFile: Attempting to add file %s" % lfn)
       res = catalog.getFileUserMetadata(lfn)
@@ -1490,11 +1531,15 @@ class TransformationDB(DB):
         gLogger.error("Failed to getFileUserMetadata for file", "%s: %s" % (lfn, res['Message']))
         failed[lfn] = res['Message']
         continue
-      else:
-        metadatadict = res['Value']
-      gLogger.info('Filter file with metadata', metadatadict)
-      transIDs = self._filterFileByMetadata(metadatadict)
-      gLogger.info('Transformations passing the filter: %s' % transIDs)
+      metadataDicts[lfn] = res['Value']
+
+    # All the files are filtered at once
+    res = self._filterFilesByMetadata(metadataDicts)
+    if not res['OK']:
+      return res
+    failed.update(res['Value']['Failed'])
+    for lfn, transIDs in res['Value']['Successful'].iteritems():
+      gLogger.info('Transformations passing the filter for %s: %s' % (lfn, transIDs))
       if not (transIDs or force):  # not clear how force should be used for
         successful[lfn] = False  # True -> False bug fix: otherwise it is set to True even if transIDs is empty.
       else:
@@ -1504,17 +1549,17 @@ class TransformationDB(DB):
             transFiles[trans] = []
           transFiles[trans].append(lfn)
 
-      # Add the files to the transformations
-      gLogger.info('Files to add to transformations:', filesToAdd)
-      if filesToAdd:
-        for transID, lfns in transFiles.iteritems():
-          res = self.addFilesToTransformation(transID, lfns)
-          if not res['OK']:
-            gLogger.error("Failed to add files to transformation", "%s %s" % (transID, res['Message']))
-            return res
-          else:
-            for lfn in lfns:
-              successful[lfn] = True
+    # Add the files to the transformations
+    gLogger.info('Files to add to transformations:', filesToAdd)
+    if filesToAdd:
+      for transID, lfns in transFiles.iteritems():
+        res = self.addFilesToTransformation(transID, lfns)
+        if not res['OK']:
+          gLogger.error("Failed to add files to transformation", "%s %s" % (transID, res['Message']))
+          return res
+        else:
+          for lfn in lfns:
+            successful[lfn] = True
 
     res = S_OK({'Successful': successful, 'Failed': failed})
     return res
@@ -1645,37 +1690,24 @@ class TransformationDB(DB):
 
   def _filterFileByMetadata(self, metadatadict):
     """Pass the input metadatadict through those currently active"""
-    transIDs = []
-    queries = self.filterQueries
+    res = self._filterFilesByMetadata({'': metadatadict})
+    if not res['OK']:
+      return []
+    if '' in res['Value']['Failed']:
+      gLogger.error("Error in applying query: %s" % res['Value']['Failed'][''])
+      return []
+    return res['Value']['Successful']['']
 
-    catalog = FileCatalog()
-    gLogger.info('Filter file by queries', queries)
-    res = catalog.getMetadataFields()
+  def _filterFilesByMetadata(self, metadataDicts):
+    """Pass the metadata of several files through the input meta queries of the active transformations
 
+    :param dict metadataDicts: { lfn : metadata dictionary of the file }
+    :returns: S_OK( { 'Successful' : { lfn : list of transIDs }, 'Failed' : { lfn : error message } } )
+    """
+    res = self.__getFilterQueries()
     if not res['OK']:
-      gLogger.error("Error in getMetadataFields: %s" % res['Message'])
-      return res
-    if not res['Value']:
-      gLogger.error("Error: no metadata fields defined")
       return res
-    typeDict = res['Value']['FileMetaFields']
-    typeDict.update(res['Value']['DirectoryMetaFields'])
-
-    for transID, query in queries:
-      gLogger.info("Check the transformation status")
-      res = self.getTransformationParameters(transID, 'Status')
-      if res['Value'] not in ['New', 'Active', 'Stopped', 'Completing', 'Flush']:
-        continue
-      mq = MetaQuery(query, typeDict)
-      gLogger.info("Apply query %s to metadata %s" % (mq.getMetaQuery(), metadatadict))
-      res = mq.applyQuery(metadatadict)
-      if not res['OK']:
-        gLogger.error("Error in applying query: %s" % res['Message'])
-        return res
-      elif res['Value']:
-        gLogger.info("Apply query result is True")
-        transIDs.append(transID)
-      else:
-        gLogger.info("Apply query result is False")
-
-    return transIDs
+    res = res['Value'].matchBulk(metadataDicts)
+    for lfn, error in res['Value']['Failed'].iteritems():
+      gLogger.error("Error in applying query", "to %s: %s" % (lfn, error))
+    return res
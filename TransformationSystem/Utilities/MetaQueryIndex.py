@@ -0,0 +1,137 @@
+""" Index of the input meta queries of the transformations, used to find the transformations
+    a file should be added to, given its metadata.
+
+    The queries of the active transformations are compiled once into MetaQuery objects, and
+    grouped by the set of metadata they require, i.e. all the ones they constrain except with
+    Missing: a file is only checked against the groups whose required metadata it has. The files
+    of a batch having the same metadata, as the files of a directory, are checked only once.
+
+    The index is recompiled when a query, a status or the metadata types change.
+"""
+
+import threading
+
+from DIRAC import S_OK, S_ERROR, gLogger
+from DIRAC.DataManagementSystem.Client.MetaQuery import MetaQuery
+
+__RCSID__ = "$Id$"
+
+# Status of the transformations to which new files can be added
+ACTIVE_STATUSES = ('New', 'Active', 'Stopped', 'Flush', 'Completing')
+
+
+class MetaQueryIndex(object):
+  """ Compiled input meta queries of the transformations
+  """
+
+  def __init__(self):
+    self.log = gLogger.getSubLogger('MetaQueryIndex')
+    self.__lock = threading.Lock()
+    # transID -> ( query dictionary, transformation status )
+    self.__queries = {}
+    # metadata name -> metadata type, as given by the catalog
+    self.__typeDict = {}
+    # list of ( frozenset of required metadata, list of ( transID, MetaQuery ) ), None if to be compiled
+    self.__groups = None
+
+  def setQueries(self, queries):
+    """ Replace all the queries
+
+        :param dict queries: { transID : ( query dictionary, transformation status ) }
+    """
+    with self.__lock:
+      if queries != self.__queries:
+        self.__queries = dict(queries)
+        self.__groups = None
+
+  def setQuery(self, transID, queryDict, status):
+    """ Add or replace the query of a transformation
+    """
+    with self.__lock:
+      self.__queries[transID] = (queryDict, status)
+      self.__groups = None
+
+  def removeQuery(self, transID):
+    """ Remove the query of a transformation
+    """
+    with self.__lock:
+      if self.__queries.pop(transID, None) is not None:
+        self.__groups = None
+
+  def setTypes(self, typeDict):
+    """ Set the types of the metadata
+
+        :param dict typeDict: { metadata name : type }
+    """
+    with self.__lock:
+      if typeDict != self.__typeDict:
+        self.__typeDict = dict(typeDict)
+        self.__groups = None
+
+  def getQueries(self):
+    """ Get the query and the status of the indexed transformations
+
+        :return: { transID : ( query dictionary, transformation status ) }
+    """
+    return dict(self.__queries)
+
+  def __getGroups(self):
+    """ Get the compiled queries of the active transformations, compiling them if needed
+    """
+    with self.__lock:
+      if self.__groups is None:
+        groups = {}
+        for transID, (queryDict, status) in self.__queries.items():
+          if status not in ACTIVE_STATUSES:
+            continue
+          # Only the metadata equal to Missing can be absent from the file metadata
+          required = frozenset(meta for meta, value in queryDict.items() if str(value).lower() != 'missing')
+          groups.setdefault(required, []).append((transID, MetaQuery(queryDict, self.__typeDict)))
+        self.__groups = sorted(groups.items(), key=lambda group: len(group[0]))
+        self.log.verbose("Compiled meta queries", "of %d transformations in %d groups" %
+                         (sum(len(entries) for entries in groups.values()), len(groups)))
+      return self.__groups
+
+  def match(self, metadataDict):
+    """ Get the transformations whose query is satisfied by the metadata of a file
+
+        :param dict metadataDict: metadata of the file
+        :return: S_OK(sorted list of transIDs)/S_ERROR
+    """
+    groups = self.__getGroups()
+    present = frozenset(meta for meta, value in metadataDict.items() if value is not None)
+    transIDs = []
+    for required, entries in groups:
+      if not required <= present:
+        continue
+      for transID, metaQuery in entries:
+        try:
+          res = metaQuery.applyQuery(metadataDict)
+        except KeyError as e:
+          res = S_ERROR("Metadata field %s not defined" % e)
+        if not res['OK']:
+          return S_ERROR("Failed to apply the query of transformation %s: %s" % (transID, res['Message']))
+        if res['Value']:
+          transIDs.append(transID)
+    return S_OK(sorted(transIDs))
+
+  def matchBulk(self, metadataDicts):
+    """ Get the transformations whose query is satisfied by the metadata of each file
+
+        :param dict metadataDicts: { lfn : metadata of the file }
+        :return: S_OK( { 'Successful' : { lfn : sorted list of transIDs }, 'Failed' : { lfn : message } } )
+    """
+    successful = {}
+    failed = {}
+    # Result of the files already matched, per metadata
+    matched = {}
+    for lfn, metadataDict in metadataDicts.items():
+      key = repr(sorted(metadataDict.items()))
+      if key not in matched:
+        matched[key] = self.match(metadataDict)
+      res = matched[key]
+      if res['OK']:
+        successful[lfn] = res['Value']
+      else:
+        failed[lfn] = res['Message']
+    return S_OK({'Successful': successful, 'Failed': failed})
@@ -0,0 +1,299 @@
+""" Compact cache of the replicas of the files of a transformation, used by the TransformationAgent
+
+    In memory, the SEs and the sets of SEs holding the replicas are interned and numbered, so that
+    each file only costs its interned LFN and a single integer, packing the number of its replica set
+    and the number of the batch in which it was added. The batches keep the time of the additions,
+    after which the replicas expire.
+
+    On disk, the changes are appended to a journal, one tab separated record per line:
+
+      - S <SE number> <SE name>: definition of an SE
+      - B <batch number> <time stamp>: new batch
+      - A <batch number> <comma separated SE numbers> <LFN>: addition of the replicas of a file
+      - R <LFN>: removal of a file
+
+    When the journal holds too many obsolete records, it is compacted, i.e. rewritten with the
+    records of the current content only. A truncated last record, from an interrupted write, is ignored.
+"""
+
+import os
+import pickle
+import time
+import calendar
+
+from six.moves import intern
+
+from DIRAC import gLogger
+
+__RCSID__ = "$Id$"
+
+# Number of bits of the packed entry of a file used by the replica set number
+SET_BITS = 20
+SET_MASK = (1 << SET_BITS) - 1
+
+# The journal is compacted when it has more than COMPACTION_RATIO times as many records as
+# the current content, and at least COMPACTION_MIN_RECORDS records
+COMPACTION_RATIO = 2
+COMPACTION_MIN_RECORDS = 10000
+
+
+class ReplicaCache(object):
+  """ Cache of the replicas of the files of one transformation
+  """
+
+  def __init__(self, journalFile, legacyFile=None):
+    """ c'tor
+
+        :param str journalFile: path of the journal of the cache
+        :param str legacyFile: path of a pickled cache of the previous format, imported
+                               when there is no journal yet, and removed at the next write
+    """
+    self.journalFile = journalFile
+    self.legacyFile = legacyFile
+    self.log = gLogger.getSubLogger('ReplicaCache')
+    self.__clearContent()
+    self.__hits = 0
+    self.__misses = 0
+    # Records not yet written to the journal, and number of records in it
+    self.__pending = []
+    self.__journalRecords = 0
+    self.__rewrite = False
+
+  def __clearContent(self):
+    # SE name <-> SE number
+    self.__ses = []
+    self.__seNumbers = {}
+    # replica set number <-> tuple of SE numbers, and list of SE names of each set
+    self.__sets = []
+    self.__setNumbers = {}
+    self.__setNames = []
+    # batch number -> time stamp of the addition
+    self.__batches = {}
+    self.__nextBatch = 0
+    # LFN -> ( batch number << SET_BITS ) | replica set number
+    self.__files = {}
+
+  def __len__(self):
+    return len(self.__files)
+
+  def __seNumber(self, se):
+    seNumber = self.__seNumbers.get(se)
+    if seNumber is None:
+      seNumber = len(self.__ses)
+      se = intern(str(se))
+      self.__ses.append(se)
+      self.__seNumbers[se] = seNumber
+      self.__pending.append('S\t%d\t%s' % (seNumber, se))
+    return seNumber
+
+  def __setNumber(self, seNumbers):
+    setNumber = self.__setNumbers.get(seNumbers)
+    if setNumber is None:
+      setNumber = len(self.__sets)
+      if setNumber > SET_MASK:
+        raise ValueError("Too many different replica sets")
+      self.__sets.append(seNumbers)
+      self.__setNumbers[seNumbers] = setNumber
+      self.__setNames.append([self.__ses[seNumber] for seNumber in seNumbers])
+    return setNumber
+
+  def __newBatch(self, timeStamp):
+    batch = self.__nextBatch
+    self.__nextBatch += 1
+    self.__batches[batch] = timeStamp
+    self.__pending.append('B\t%d\t%d' % (batch, timeStamp))
+    return batch
+
+  def addReplicas(self, replicas, timeStamp=None):
+    """ Add the replicas of files to the cache, in a new batch
+
+        :param dict replicas: { lfn : list of SEs }
+        :param int timeStamp: time of the addition, in seconds since the epoch, now by default
+    """
+    if not replicas:
+      return
+    batch = self.__newBatch(int(time.time()) if timeStamp is None else int(timeStamp))
+    for lfn, ses in replicas.items():
+      seNumbers = tuple(self.__seNumber(se) for se in ses)
+      lfn = intern(str(lfn))
+      self.__files[lfn] = (batch << SET_BITS) | self.__setNumber(seNumbers)
+      self.__pending.append('A\t%d\t%s\t%s' % (batch, ','.join(str(seNumber) for seNumber in seNumbers), lfn))
+
+  def getReplicas(self, lfns):
+    """ Get the cached replicas of files, and count the hits and misses
+
+        :param list lfns: LFNs
+        :return: tuple ( { lfn : list of SEs } for the cached LFNs, set of LFNs not in the cache )
+    """
+    replicas = {}
+    missing = set()
+    for lfn in lfns:
+      entry = self.__files.get(lfn)
+      if entry is None:
+        missing.add(lfn)
+      else:
+        replicas[lfn] = list(self.__setNames[entry & SET_MASK])
+    self.__hits += len(replicas)
+    self.__misses += len(missing)
+    return replicas, missing
+
+  def getLFNs(self):
+    """ Get the cached LFNs
+    """
+    return set(self.__files)
+
+  def removeReplicas(self, lfns):
+    """ Remove files from the cache
+
+        :param list lfns: LFNs
+        :return: number of removed files
+    """
+    removed = 0
+    for lfn in lfns:
+      if self.__files.pop(lfn, None) is not None:
+        self.__pending.append('R\t%s' % lfn)
+        removed += 1
+    return removed
+
+  def expire(self, timeLimit):
+    """ Remove the files added before a given time
+
+        :param int timeLimit: time in seconds since the epoch
+        :return: list of ( time stamp, number of files ) of the removed batches
+    """
+    expired = set(batch for batch, timeStamp in self.__batches.items() if timeStamp < timeLimit)
+    if not expired:
+      return []
+    counts = dict.fromkeys(expired, 0)
+    for lfn, entry in list(self.__files.items()):
+      batch = entry >> SET_BITS
+      if batch in expired:
+        counts[batch] += 1
+        del self.__files[lfn]
+    removedBatches = sorted((self.__batches.pop(batch), count) for batch, count in counts.items())
+    # The removal of a whole batch is not journaled, the journal is rewritten without it
+    self.__rewrite = True
+    return removedBatches
+
+  def clear(self):
+    """ Remove everything from the cache, the journal is emptied at the next write
+    """
+    self.__clearContent()
+    self.__pending = []
+    self.__rewrite = True
+
+  def getStatistics(self):
+    """ Get the size and the hit rate of the cache
+
+        :return: dictionary
+    """
+    lookups = self.__hits + self.__misses
+    return {'Files': len(self.__files),
+            'SEs': len(self.__ses),
+            'ReplicaSets': len(self.__sets),
+            'Batches': len(self.__batches),
+            'Hits': self.__hits,
+            'Misses': self.__misses,
+            'HitRate': float(self.__hits) / lookups if lookups else 0.,
+            'JournalRecords': self.__journalRecords + len(self.__pending)}
+
+  def load(self):
+    """ Load the cache from its journal, or from the legacy file if there is no journal
+    """
+    self.__clearContent()
+    self.__pending = []
+    self.__journalRecords = 0
+    self.__rewrite = False
+    if os.path.exists(self.journalFile):
+      self.__loadJournal()
+    elif self.legacyFile and os.path.exists(self.legacyFile):
+      self.__loadLegacy()
+
+  def __loadJournal(self):
+    seNames = {}
+    badRecords = 0
+    with open(self.journalFile, 'r') as fd:
+      for line in fd:
+        self.__journalRecords += 1
+        fields = line.rstrip('\n').split('\t')
+        try:
+          if not line.endswith('\n'):
+            raise ValueError('Truncated record')
+          if fields[0] == 'A':
+            seNumbers = tuple(self.__seNumber(seNames[int(seNumber)]) for seNumber in fields[2].split(',') if seNumber)
+            batch = int(fields[1])
+            if batch not in self.__batches:
+              raise KeyError(batch)
+            self.__files[intern(fields[3])] = (batch << SET_BITS) | self.__setNumber(seNumbers)
+          elif fields[0] == 'R':
+            self.__files.pop(fields[1], None)
+          elif fields[0] == 'S':
+            seNames[int(fields[1])] = fields[2]
+          elif fields[0] == 'B':
+            batch = int(fields[1])
+            self.__batches[batch] = int(fields[2])
+            self.__nextBatch = max(self.__nextBatch, batch + 1)
+          else:
+            raise ValueError('Unknown record')
+        except (ValueError, IndexError, KeyError):
+          badRecords += 1
+    # The records created by the loading are already in the journal
+    self.__pending = []
+    if badRecords:
+      self.log.warn("Ignored invalid records of the replica cache journal", "%d in %s" % (badRecords, self.journalFile))
+      self.__rewrite = True
+    # The next records must use the SE numbers of the journal
+    if any(self.__seNumbers.get(se, seNumber) != seNumber for seNumber, se in seNames.items()):
+      self.__rewrite = True
+
+  def __loadLegacy(self):
+    """ Import a pickled { datetime : { lfn : list of SEs } } dictionary
+    """
+    with open(self.legacyFile, 'r') as fd:
+      legacyCache = pickle.load(fd)
+    for updateTime in sorted(legacyCache):
+      self.addReplicas(legacyCache[updateTime], timeStamp=calendar.timegm(updateTime.utctimetuple()))
+    self.__rewrite = True
+
+  def write(self):
+    """ Write the changes to the journal, compacting it if needed
+
+        :return: True if the journal was compacted
+    """
+    records = self.__journalRecords + len(self.__pending)
+    compact = self.__rewrite or \
+        (records > COMPACTION_MIN_RECORDS and records > COMPACTION_RATIO * (len(self.__files) + len(self.__batches)))
+    if compact:
+      self.__compact()
+    elif self.__pending:
+      with open(self.journalFile, 'a') as fd:
+        fd.write(''.join(record + '\n' for record in self.__pending))
+      self.__journalRecords = records
+      self.__pending = []
+    if self.legacyFile and os.path.exists(self.legacyFile):
+      os.remove(self.legacyFile)
+    return compact
+
+  def __compact(self):
+    """ Rewrite the journal with the records of the current content
+    """
+    # The batches whose files were all removed or replaced are dropped
+    usedBatches = set(entry >> SET_BITS for entry in self.__files.values())
+    self.__batches = dict((batch, self.__batches[batch]) for batch in usedBatches)
+    # write to a temporary file in order to avoid corrupted files
+    tmpFile = self.journalFile + '.tmp'
+    records = 0
+    with open(tmpFile, 'w') as fd:
+      for seNumber, se in enumerate(self.__ses):
+        fd.write('S\t%d\t%s\n' % (seNumber, se))
+      for batch, timeStamp in sorted(self.__batches.items()):
+        fd.write('B\t%d\t%d\n' % (batch, timeStamp))
+      records += len(self.__ses) + len(self.__batches)
+      setStrings = [','.join(str(seNumber) for seNumber in seNumbers) for seNumbers in self.__sets]
+      for lfn, entry in self.__files.items():
+        fd.write('A\t%d\t%s\t%s\n' % (entry >> SET_BITS, setStrings[entry & SET_MASK], lfn))
+      records += len(self.__files)
+    os.rename(tmpFile, self.journalFile)
+    self.__journalRecords = records
+    self.__pending = []
+    self.__rewrite = False
@@ -0,0 +1,69 @@
+""" Test the index of the input meta queries of the transformations """
+
+# pylint: disable=invalid-name,protected-access
+
+from DIRAC.DataManagementSystem.Client.MetaQuery import MetaQuery
+from DIRAC.TransformationSystem.Utilities.MetaQueryIndex import MetaQueryIndex
+
+__RCSID__ = "$Id$"
+
+TYPES = {'Run': 'INT', 'Energy': 'VARCHAR(32)', 'Quality': 'VARCHAR(32)', 'Size': 'INT'}
+
+QUERIES = {1: ({'Run': 10, 'Energy': '10TeV'}, 'Active'),
+           2: ({'Run': {'>': 5}}, 'Active'),
+           3: ({'Energy': ['10TeV', '20TeV'], 'Quality': 'Missing'}, 'New'),
+           4: ({'Run': 10}, 'Completed'),
+           5: ({'Size': {'<=': 100}, 'Quality': 'Any'}, 'Flush')}
+
+
+def getIndex():
+  index = MetaQueryIndex()
+  index.setTypes(TYPES)
+  index.setQueries(QUERIES)
+  return index
+
+
+def test_match():
+  """ The index gives the same result as applying all the queries of the active transformations """
+  index = getIndex()
+  files = [{'Run': 10, 'Energy': '10TeV'},
+           {'Run': '10', 'Energy': '20TeV', 'Quality': 'Good'},
+           {'Run': 3},
+           {'Size': 50, 'Quality': 'Bad'},
+           {'Size': 50},
+           {}]
+  for metadataDict in files:
+    expected = sorted(transID for transID, (queryDict, status) in QUERIES.items()
+                      if status != 'Completed' and MetaQuery(queryDict, TYPES).applyQuery(metadataDict)['Value'])
+    res = index.match(metadataDict)
+    assert res['OK'], res
+    assert res['Value'] == expected, metadataDict
+
+  assert index.match({'Run': 10, 'Energy': '10TeV'})['Value'] == [1, 2, 3]
+
+
+def test_matchBulk():
+  """ Files with the same metadata are matched once, errors are reported per file """
+  index = getIndex()
+  res = index.matchBulk({'/a/1': {'Run': 10, 'Energy': '10TeV'},
+                         '/a/2': {'Run': 10, 'Energy': '10TeV'},
+                         '/a/3': {'Run': 'NotAnInt'}})
+  assert res['OK'], res
+  assert res['Value']['Successful'] == {'/a/1': [1, 2, 3], '/a/2': [1, 2, 3]}
+  assert list(res['Value']['Failed']) == ['/a/3']
+
+
+def test_changes():
+  """ The index follows the changes of queries and statuses """
+  index = getIndex()
+  assert index.match({'Run': 10})['Value'] == [2]
+
+  queries = dict(QUERIES)
+  queries[4] = (queries[4][0], 'Active')
+  index.setQueries(queries)
+  assert index.match({'Run': 10})['Value'] == [2, 4]
+
+  index.removeQuery(2)
+  index.setQuery(6, {'Run': [9, 10]}, 'Active')
+  assert index.match({'Run': 10})['Value'] == [4, 6]
+  assert sorted(index.getQueries()) == [1, 3, 4, 5, 6]
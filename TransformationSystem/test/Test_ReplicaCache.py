@@ -0,0 +1,120 @@
+""" Test the replica cache of the TransformationAgent """
+
+# pylint: disable=invalid-name,redefined-outer-name
+
+import datetime
+import pickle
+
+import pytest
+
+from DIRAC.TransformationSystem.Utilities import ReplicaCache as moduleTested
+from DIRAC.TransformationSystem.Utilities.ReplicaCache import ReplicaCache
+
+__RCSID__ = "$Id$"
+
+REPLICAS = {'/lfn/1': ['SE1', 'SE2'],
+            '/lfn/2': ['SE1', 'SE2'],
+            '/lfn/3': ['SE3']}
+
+
+@pytest.fixture
+def journal(tmpdir):
+  return str(tmpdir.join('ReplicaCache_1.journal'))
+
+
+def test_getReplicas(journal):
+  """ The cached replicas are returned, and the hits and misses counted """
+  cache = ReplicaCache(journal)
+  cache.addReplicas(REPLICAS)
+  replicas, missing = cache.getReplicas(['/lfn/1', '/lfn/3', '/lfn/4'])
+  assert replicas == {'/lfn/1': ['SE1', 'SE2'], '/lfn/3': ['SE3']}
+  assert missing == set(['/lfn/4'])
+
+  stats = cache.getStatistics()
+  assert stats['Files'] == 3
+  assert stats['SEs'] == 3
+  assert stats['ReplicaSets'] == 2
+  assert stats['Hits'] == 2
+  assert stats['Misses'] == 1
+
+  assert cache.removeReplicas(['/lfn/1', '/lfn/4']) == 1
+  assert cache.getLFNs() == set(['/lfn/2', '/lfn/3'])
+
+
+def test_journal(journal):
+  """ The journal restores the content of the cache """
+  cache = ReplicaCache(journal)
+  cache.addReplicas(REPLICAS)
+  assert not cache.write()
+  cache.removeReplicas(['/lfn/2'])
+  cache.addReplicas({'/lfn/4': ['SE4', 'SE1']})
+  assert not cache.write()
+
+  loaded = ReplicaCache(journal)
+  loaded.load()
+  assert len(loaded) == 3
+  assert loaded.getReplicas(['/lfn/1', '/lfn/3', '/lfn/4'])[0] == {'/lfn/1': ['SE1', 'SE2'],
+                                                                   '/lfn/3': ['SE3'],
+                                                                   '/lfn/4': ['SE4', 'SE1']}
+
+  # The loaded cache appends to the same journal
+  loaded.addReplicas({'/lfn/5': ['SE4']})
+  loaded.write()
+  # An interrupted write leaves a truncated record, which is ignored
+  with open(journal, 'a') as fd:
+    fd.write('A\t0\t0')
+  reloaded = ReplicaCache(journal)
+  reloaded.load()
+  assert reloaded.getReplicas(['/lfn/5'])[0] == {'/lfn/5': ['SE4']}
+  assert len(reloaded) == 4
+  # and the journal is rewritten at the next write
+  assert reloaded.write()
+
+
+def test_expireAndCompact(journal, monkeypatch):
+  """ The expired batches are removed, and the journal is compacted """
+  monkeypatch.setattr(moduleTested, 'COMPACTION_MIN_RECORDS', 10)
+  cache = ReplicaCache(journal)
+  cache.addReplicas(REPLICAS, timeStamp=1000)
+  cache.addReplicas({'/lfn/4': ['SE1']}, timeStamp=2000)
+  cache.write()
+  assert cache.expire(500) == []
+  assert cache.expire(1500) == [(1000, 3)]
+  assert cache.getLFNs() == set(['/lfn/4'])
+  assert cache.write()
+  # The SEs stay defined
+  assert cache.getStatistics()['JournalRecords'] == 5
+
+  for _i in range(20):
+    cache.addReplicas({'/lfn/x': ['SE1']})
+    cache.removeReplicas(['/lfn/x'])
+  cache.addReplicas({'/lfn/y': ['SE2']})
+  assert cache.write()
+  assert cache.getStatistics()['Batches'] == 2
+
+  loaded = ReplicaCache(journal)
+  loaded.load()
+  assert loaded.getLFNs() == set(['/lfn/4', '/lfn/y'])
+  assert loaded.getReplicas(['/lfn/y'])[0] == {'/lfn/y': ['SE2']}
+
+  loaded.clear()
+  loaded.write()
+  loaded.load()
+  assert not len(loaded)
+
+
+def test_legacy(journal, tmpdir):
+  """ A pickled cache of the previous format is imported, then removed """
+  legacyFile = tmpdir.join('ReplicaCache_1.pkl')
+  with open(str(legacyFile), 'w') as fd:
+    pickle.dump({datetime.datetime(2019, 1, 1): REPLICAS}, fd)
+  cache = ReplicaCache(journal, legacyFile=str(legacyFile))
+  cache.load()
+  assert cache.getReplicas(list(REPLICAS))[0] == REPLICAS
+  cache.write()
+  assert not legacyFile.check()
+
+  loaded = ReplicaCache(journal)
+  loaded.load()
+  assert loaded.getReplicas(list(REPLICAS))[0] == REPLICAS
+  assert loaded.expire(1546300801) == [(1546300800, 3)]
@@ -21,8 +21,10 @@ import sys
 import random
 import socket
 import hashlib
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import DIRAC
 from DIRAC import S_OK, gConfig
@@ -64,6 +66,9 @@ FINAL_PILOT_STATUS = ['Aborted', 'Failed', 'Done']
 MAX_PILOTS_TO_SUBMIT = 100
 MAX_JOBS_IN_FILLMODE = 5
 
+# Seconds between two checks of the submission timeouts of the CEs
+SUBMISSION_POLLING_TIME = 10
+
 
 def getSubmitPools(group=None, vo=None):
   """ This method gets submit pools
@@ -103,6 +108,25 @@ class SiteDirector(AgentModule):
     self.firstPass = True
     self.maxJobsInFillMode = MAX_JOBS_IN_FILLMODE
     self.maxPilotsToSubmit = MAX_PILOTS_TO_SUBMIT
+    # Maximum number of pilots submitted to all the queues in a cycle, 0 for no limit
+    self.maxPilotsToSubmitPerCycle = 0
+    self.pilotsLeftInCycle = None
+    # Number of pilots submitted, or being submitted, in this cycle for each task queue,
+    # missing from the counts of waiting pilots
+    self.pilotsSubmittedToTQs = defaultdict(int)
+
+    # Number of threads submitting pilots, in total and to a same CE
+    self.maxSubmissionThreads = 10
+    self.maxSubmissionThreadsPerCE = 1
+    # Seconds after which the SiteDirector stops waiting for the submission to a CE, 0 for no limit
+    self.ceSubmissionTimeout = 900
+    # Number of consecutive failures of a CE after which it is skipped for failedQueueCycleFactor cycles
+    self.ceFailureThreshold = 3
+    self.failedCEs = defaultdict(int)
+    self.ceCyclesToSkip = defaultdict(int)
+    # Number of threads still submitting to each CE, possibly since a previous cycle
+    self.submittingCEs = defaultdict(int)
+    self.submissionLock = threading.RLock()
 
     self.gridEnv = ''
     self.vo = ''
@@ -219,6 +243,11 @@ class SiteDirector(AgentModule):
     self.pilotLogLevel = self.am_getOption('PilotLogLevel', self.pilotLogLevel)
     self.maxJobsInFillMode = self.am_getOption('MaxJobsInFillMode', self.maxJobsInFillMode)
     self.maxPilotsToSubmit = self.am_getOption('MaxPilotsToSubmit', self.maxPilotsToSubmit)
+    self.maxPilotsToSubmitPerCycle = self.am_getOption('MaxPilotsToSubmitPerCycle', self.maxPilotsToSubmitPerCycle)
+    self.maxSubmissionThreads = self.am_getOption('MaxSubmissionThreads', self.maxSubmissionThreads)
+    self.maxSubmissionThreadsPerCE = self.am_getOption('MaxSubmissionThreadsPerCE', self.maxSubmissionThreadsPerCE)
+    self.ceSubmissionTimeout = self.am_getOption('CESubmissionTimeout', self.ceSubmissionTimeout)
+    self.ceFailureThreshold = self.am_getOption('CEFailureThreshold', self.ceFailureThreshold)
     self.pilotWaitingFlag = self.am_getOption('PilotWaitingFlag', self.pilotWaitingFlag)
     self.failedQueueCycleFactor = self.am_getOption('FailedQueueCycleFactor', self.failedQueueCycleFactor)
     self.pilotStatusUpdateCycleFactor = self.am_getOption('PilotStatusUpdateCycleFactor',
@@ -502,14 +531,24 @@ class SiteDirector(AgentModule):
     self.log.verbose("Queues treated", ','.join(self.queueDict))
 
     self.totalSubmittedPilots = 0
+    self.pilotsLeftInCycle = self.maxPilotsToSubmitPerCycle if self.maxPilotsToSubmitPerCycle > 0 else None
+    self.pilotsSubmittedToTQs = defaultdict(int)
 
     queueDictItems = list(self.queueDict.items())
     random.shuffle(queueDictItems)
 
+    # CEs failing repeatedly, or still busy with a submission of a previous cycle, are skipped
+    skippedCEs = set(ceName for ceName in set(queue['CEName'] for queue in self.queueDict.itervalues())
+                     if not self._allowedToSubmitToCE(ceName))
+
+    # Select the queues we may submit to
+    queuesToEvaluate = []
     for queueName, queueDictionary in queueDictItems:
-      # now submitting to the single queues
       self.log.verbose("Evaluating queue", queueName)
 
+      if queueDictionary['CEName'] in skippedCEs:
+        continue
+
       # are we going to submit pilots to this specific queue?
       if not self._allowedToSubmit(queueName, anySite, jobSites, testSites):
         continue
@@ -524,18 +563,32 @@ class SiteDirector(AgentModule):
         queueCPUTime = self.maxQueueLength
 
       ce, ceDict = self._getCE(queueName)
-
-      # additionalInfo is normally taskQueueDict
-      pilotsWeMayWantToSubmit, additionalInfo = self._getPilotsWeMayWantToSubmit(ceDict)
+      queuesToEvaluate.append((queueName, queueCPUTime, ce, ceDict))
+
+    # Match all these queues at once with the task queues, unless a VO implements its own matching
+    bulkMatches = {}
+    if self._useBulkMatching():
+      bulkMatches = self._getPilotsWeMayWantToSubmitBulk(dict((queueName, ceDict)
+                                                              for queueName, _, _, ceDict in queuesToEvaluate))
+
+    submissions = []
+    for queueName, queueCPUTime, ce, ceDict in queuesToEvaluate:
+      totalWaitingPilots = None
+      if queueName in bulkMatches:
+        pilotsWeMayWantToSubmit, additionalInfo, totalWaitingPilots = bulkMatches[queueName]
+      else:
+        # additionalInfo is normally taskQueueDict
+        pilotsWeMayWantToSubmit, additionalInfo = self._getPilotsWeMayWantToSubmit(ceDict)
       self.log.debug('%d pilotsWeMayWantToSubmit are eligible for %s queue' % (pilotsWeMayWantToSubmit, queueName))
       if not pilotsWeMayWantToSubmit:
         self.log.debug('...so skipping %s' % queueName)
         continue
 
       # Get the number of already waiting pilots for the queue
-      totalWaitingPilots = 0
       manyWaitingPilotsFlag = False
-      if self.pilotWaitingFlag:
+      if not self.pilotWaitingFlag:
+        totalWaitingPilots = 0
+      elif totalWaitingPilots is None:
         tqIDList = additionalInfo.keys()
         result = pilotAgentsDB.countPilots({'TaskQueueID': tqIDList,
                                             'Status': WAITING_PILOT_STATUS},
@@ -555,23 +608,164 @@ class SiteDirector(AgentModule):
       self.log.debug("%d waiting pilots for the total of %d eligible pilots for %s" %
                      (totalWaitingPilots, pilotsWeMayWantToSubmit, queueName))
 
-      # Get the number of available slots on the target site/queue
-      totalSlots = self.getQueueSlots(queueName, manyWaitingPilotsFlag)
-      if totalSlots == 0:
-        self.log.debug('%s: No slots available' % queueName)
+      submissions.append((queueName, queueCPUTime, ce, additionalInfo,
+                          pilotsWeMayWantToSubmit, totalWaitingPilots, manyWaitingPilotsFlag))
+
+    # now submitting to the single queues, the CEs in parallel
+    result = self._submitPilotsToCEs(submissions)
+
+    self.log.info("Total number of pilots submitted in this cycle", '%d' % self.totalSubmittedPilots)
+
+    return result
+
+  def _submitPilotsToCEs(self, submissions):
+    """ Submit the pilots to the queues, with up to maxSubmissionThreads threads in total and
+        maxSubmissionThreadsPerCE threads per CE. The SiteDirector stops waiting for a CE after
+        ceSubmissionTimeout seconds: its remaining queues are treated in a next cycle, and the CE is
+        skipped until its submission thread returns.
+
+        :param list submissions: arguments of _submitPilotsPerQueue for each queue
+
+        :return: S_OK/S_ERROR, the first error met
+    """
+    submissionsPerCE = defaultdict(deque)
+    for submission in submissions:
+      submissionsPerCE[self.queueDict[submission[0]]['CEName']].append(submission)
+    # ceName -> time at which the submission to the CE started
+    startTimes = {}
+
+    if self.maxSubmissionThreads <= 1:
+      results = [self._submitPilotsToCE(ceName, ceSubmissions, startTimes)
+                 for ceName, ceSubmissions in submissionsPerCE.iteritems()]
+    else:
+      executor = ThreadPoolExecutor(max_workers=self.maxSubmissionThreads)
+      futures = {}
+      for ceName, ceSubmissions in submissionsPerCE.iteritems():
+        for _i in range(max(1, min(self.maxSubmissionThreadsPerCE, len(ceSubmissions)))):
+          futures[executor.submit(self._submitPilotsToCE, ceName, ceSubmissions, startTimes)] = ceName
+      try:
+        self._waitForSubmissions(futures, startTimes)
+      finally:
+        # The threads of the CEs timed out are not waited for
+        executor.shutdown(wait=False)
+      results = []
+      for future, ceName in futures.iteritems():
+        if not future.done() or future.cancelled():
+          continue
+        if future.exception() is not None:
+          self.log.exception("Submission thread failed", ceName, lException=future.exception())
+          continue
+        results.append(future.result())
+
+    for result in results:
+      if not result['OK']:
+        return result
+    return S_OK()
+
+  def _waitForSubmissions(self, futures, startTimes):
+    """ Wait for the submission threads, until they are all done or the ones still running have timed out
+
+        :param dict futures: {future of _submitPilotsToCE: ceName}
+        :param dict startTimes: {ceName: time at which the submission to the CE started}
+    """
+    pending = set(futures)
+    while pending:
+      _done, pending = wait(pending, timeout=SUBMISSION_POLLING_TIME, return_when=FIRST_COMPLETED)
+      if not pending or not self.ceSubmissionTimeout:
         continue
+      now = time.time()
+      with self.submissionLock:
+        timedOutCEs = set(ceName for ceName, startTime in startTimes.iteritems()
+                          if now - startTime > self.ceSubmissionTimeout)
+      running = set(future for future in pending if future.running())
+      timedOut = set(future for future in running if futures[future] in timedOutCEs)
+      if timedOut != running:
+        continue
+      # The submissions not started yet can start if some threads are free
+      if pending - running and len(running) < self.maxSubmissionThreads:
+        continue
+      for future in pending - running:
+        future.cancel()
+      for ceName in set(futures[future] for future in timedOut):
+        self.log.warn("Submission to the CE timed out, not waiting for it any more",
+                      "%s after %d s" % (ceName, self.ceSubmissionTimeout))
+        self._recordCESubmission(ceName, False)
+      return
 
-      if manyWaitingPilotsFlag:
-        # Throttle submission of extra pilots to empty sites
-        pilotsToSubmit = self.maxPilotsToSubmit / 10 + 1
-      else:
-        pilotsToSubmit = max(0, min(totalSlots, pilotsWeMayWantToSubmit - totalWaitingPilots))
-        self.log.info('%s: Slots=%d, TQ jobs(pilotsWeMayWantToSubmit)=%d, Pilots: waiting %d, to submit=%d' %
-                      (queueName, totalSlots, pilotsWeMayWantToSubmit, totalWaitingPilots, pilotsToSubmit))
+  def _submitPilotsToCE(self, ceName, ceSubmissions, startTimes):
+    """ Submit the pilots to the queues of a CE, one after the other. The threads submitting to
+        the same CE share the submissions left.
 
-      # Limit the number of pilots to submit to MAX_PILOTS_TO_SUBMIT
-      pilotsToSubmit = min(self.maxPilotsToSubmit, pilotsToSubmit)
+        :param str ceName: CE name
+        :param deque ceSubmissions: arguments of _submitPilotsPerQueue for the queues of the CE not yet treated
+        :param dict startTimes: {ceName: time at which the submission to the CE started}
 
+        :return: S_OK/S_ERROR, the first error met
+    """
+    with self.submissionLock:
+      startTime = startTimes.setdefault(ceName, time.time())
+      self.submittingCEs[ceName] += 1
+    try:
+      result = S_OK()
+      while ceSubmissions:
+        try:
+          submission = ceSubmissions.popleft()
+        except IndexError:
+          break
+        if self.ceSubmissionTimeout and time.time() - startTime > self.ceSubmissionTimeout:
+          self.log.warn("Submission to the CE too long, the next queues will be treated in a next cycle",
+                        "%s: %d queues left" % (ceName, len(ceSubmissions) + 1))
+          break
+        res = self._submitPilotsPerQueue(*submission)
+        if not res['OK'] and result['OK']:
+          result = res
+      return result
+    finally:
+      with self.submissionLock:
+        self.submittingCEs[ceName] -= 1
+
+  def _submitPilotsPerQueue(self, queueName, queueCPUTime, ce, taskQueueDict,
+                            pilotsWeMayWantToSubmit, totalWaitingPilots, manyWaitingPilotsFlag):
+    """ Submit the pilots to a queue, according to its available slots
+
+        :param str queueName: queue name
+        :param int queueCPUTime: CPU time of the queue
+        :param ce: computing element object of the queue
+        :param dict taskQueueDict: task queues eligible for the queue
+        :param int pilotsWeMayWantToSubmit: number of jobs of the eligible task queues
+        :param int totalWaitingPilots: number of pilots waiting for the eligible task queues
+        :param bool manyWaitingPilotsFlag: True if there are enough pilots waiting already
+
+        :return: S_OK(number of submitted pilots)/S_ERROR
+    """
+    # Get the number of available slots on the target site/queue
+    totalSlots = self.getQueueSlots(queueName, manyWaitingPilotsFlag)
+    if totalSlots == 0:
+      self.log.debug('%s: No slots available' % queueName)
+      return S_OK(0)
+
+    if manyWaitingPilotsFlag:
+      # Throttle submission of extra pilots to empty sites
+      pilotsToSubmit = self.maxPilotsToSubmit / 10 + 1
+      pilotsNeeded = None
+    else:
+      pilotsToSubmit = totalSlots
+      pilotsNeeded = pilotsWeMayWantToSubmit - totalWaitingPilots
+
+    # Limit the number of pilots to submit to MAX_PILOTS_TO_SUBMIT, to the ones left in this cycle,
+    # and to the ones the TQs still need once the other queues of this cycle are served
+    tqPilots = self._reserveTQPilots(taskQueueDict, min(self.maxPilotsToSubmit, pilotsToSubmit), pilotsNeeded)
+    pilotsToSubmit = sum(tqPilots.itervalues())
+    if not manyWaitingPilotsFlag:
+      self.log.info('%s: Slots=%d, TQ jobs(pilotsWeMayWantToSubmit)=%d, Pilots: waiting %d, to submit=%d' %
+                    (queueName, totalSlots, pilotsWeMayWantToSubmit, totalWaitingPilots, pilotsToSubmit))
+    if not pilotsToSubmit:
+      self.log.verbose('No more pilots to submit in this cycle', 'for %s' % queueName)
+      return S_OK(0)
+    reservedPilots = pilotsToSubmit
+    submittedPilots = 0
+
+    try:
       # Get the working proxy
       cpuTime = queueCPUTime + 86400
       self.log.verbose("Getting pilot proxy",
@@ -590,6 +784,7 @@ class SiteDirector(AgentModule):
       # now really submitting
       while pilotsToSubmit:  # a cycle because pilots are submitted in chunks
         res = self._submitPilotsToQueue(pilotsToSubmit, ce, queueName)
+        self._recordCESubmission(self.queueDict[queueName]['CEName'], res['OK'])
         if not res['OK']:
           self.log.info("Won't try further because of failures", "Queue: %s" % queueName)
           pilotsToSubmit = 0
@@ -597,13 +792,108 @@ class SiteDirector(AgentModule):
           stampDict = {}
         else:
           pilotsToSubmit, pilotList, stampDict = res['Value']
+        submittedPilots += len(pilotList)
 
         # updating the pilotAgentsDB... done by default but maybe not strictly necessary
-        res = self._addPilotTQReference(queueName, additionalInfo, pilotList, stampDict)
+        res = self._addPilotTQReference(queueName, taskQueueDict, pilotList, stampDict)
+    finally:
+      # The pilots not submitted can be submitted to other queues
+      self._releasePilots(reservedPilots - submittedPilots, tqPilots)
 
-    self.log.info("Total number of pilots submitted in this cycle", '%d' % self.totalSubmittedPilots)
+    return S_OK(submittedPilots)
 
-    return S_OK()
+  def _reservePilots(self, pilotsToSubmit):
+    """ Take pilots from the ones which can still be submitted in this cycle
+
+        :param int pilotsToSubmit: number of pilots wanted
+        :return: number of pilots granted
+    """
+    with self.submissionLock:
+      if self.pilotsLeftInCycle is None:
+        return pilotsToSubmit
+      pilotsToSubmit = max(0, min(pilotsToSubmit, self.pilotsLeftInCycle))
+      self.pilotsLeftInCycle -= pilotsToSubmit
+      return pilotsToSubmit
+
+  def _releasePilots(self, pilots, tqPilots=None):
+    """ Give back reserved pilots which were not submitted
+
+        :param int pilots: number of pilots not submitted
+        :param dict tqPilots: pilots reserved for each task queue by _reserveTQPilots
+    """
+    if pilots <= 0:
+      return
+    with self.submissionLock:
+      if self.pilotsLeftInCycle is not None:
+        self.pilotsLeftInCycle += pilots
+      for tqID, reserved in (tqPilots or {}).iteritems():
+        released = min(pilots, reserved)
+        self.pilotsSubmittedToTQs[tqID] -= released
+        pilots -= released
+
+  def _reserveTQPilots(self, taskQueueDict, pilotsToSubmit, pilotsNeeded=None):
+    """ Reserve pilots for the task queues of a queue, as _reservePilots. The waiting pilots are counted
+        at the beginning of the cycle, so the pilots reserved for the same task queues by the other queues
+        of the cycle are taken out of the ones needed.
+
+        :param dict taskQueueDict: task queues eligible for the queue
+        :param int pilotsToSubmit: number of pilots wanted
+        :param pilotsNeeded: number of pilots needed by the task queues at the beginning of the cycle,
+                             None if they are not limited
+        :return: dict, number of pilots granted for each task queue
+    """
+    if not taskQueueDict:
+      return {}
+    with self.submissionLock:
+      if pilotsNeeded is not None:
+        pilotsNeeded -= sum(self.pilotsSubmittedToTQs[tqID] for tqID in taskQueueDict)
+        pilotsToSubmit = min(pilotsToSubmit, pilotsNeeded)
+      pilotsLeft = self._reservePilots(max(0, pilotsToSubmit))
+      # The pilots go to the jobs not served yet, the others to any of the task queues
+      tqPilots = {}
+      for tqID, tq in taskQueueDict.iteritems():
+        tqPilots[tqID] = max(0, min(pilotsLeft, tq.get('Jobs', 0) - self.pilotsSubmittedToTQs[tqID]))
+        pilotsLeft -= tqPilots[tqID]
+      tqPilots[tqID] += pilotsLeft
+      for tqID, pilots in tqPilots.iteritems():
+        self.pilotsSubmittedToTQs[tqID] += pilots
+      return tqPilots
+
+  def _allowedToSubmitToCE(self, ceName):
+    """ Check, once per cycle, that the CE is not skipped because of its recent failures, and that
+        there is no submission to it still running since a previous cycle
+
+        :param str ceName: CE name
+        :return: True/False
+    """
+    with self.submissionLock:
+      if self.submittingCEs[ceName]:
+        self.log.warn("Submission to the CE still running since a previous cycle, skipping it", ceName)
+        return False
+      if self.ceCyclesToSkip[ceName]:
+        self.log.verbose("CE failed repeatedly ==> number of cycles skipped",
+                         "%s ==> %d" % (ceName, self.ceCyclesToSkip[ceName]))
+        self.ceCyclesToSkip[ceName] -= 1
+        return False
+    return True
+
+  def _recordCESubmission(self, ceName, succeeded):
+    """ Follow the consecutive failures of a CE. After ceFailureThreshold failures, the CE is skipped
+        for failedQueueCycleFactor cycles, then skipped again at its first new failure.
+
+        :param str ceName: CE name
+        :param bool succeeded: result of the submission
+    """
+    with self.submissionLock:
+      if succeeded:
+        self.failedCEs[ceName] = 0
+        return
+      self.failedCEs[ceName] += 1
+      if self.failedCEs[ceName] >= self.ceFailureThreshold:
+        self.log.warn("CE failed repeatedly, skipping it",
+                      "%s for %d cycles" % (ceName, self.failedQueueCycleFactor))
+        self.ceCyclesToSkip[ceName] = self.failedQueueCycleFactor
+        self.failedCEs[ceName] = max(0, self.ceFailureThreshold - 1)
 
   def _ifAndWhereToSubmit(self):
     """ Return a tuple that says if and where to submit pilots:
@@ -832,6 +1122,52 @@ class SiteDirector(AgentModule):
 
     return pilotsWeMayWantToSubmit, taskQueueDict
 
+  def _getPilotsWeMayWantToSubmitBulk(self, ceDicts):
+    """ Returns the number of pilots that we may want to submit to each of the queues described in ceDicts,
+        as _getPilotsWeMayWantToSubmit, with the number of pilots already waiting for their eligible TQs.
+
+        All the queues are matched with a single call to the Matcher. The queues missing from the result,
+        e.g. if the Matcher does not support the bulk matching, are evaluated one by one.
+        It is not used for the VOs overriding _getPilotsWeMayWantToSubmit, unless they also override this method.
+
+        :param dict ceDicts: { queue name : ceDict }
+
+        :return: { queue name : ( pilotsWeMayWantToSubmit (int), taskQueueDict (dict), waitingPilots (int) ) }
+        :rType: dict
+    """
+    if not ceDicts:
+      return {}
+    result = self.matcherClient.getMatchingTaskQueuesBulk(ceDicts,
+                                                          WAITING_PILOT_STATUS if self.pilotWaitingFlag else [])
+    if not result['OK']:
+      self.log.warn('Could not match the queues in bulk, matching them one by one', result['Message'])
+      return {}
+    taskQueues = result['Value']['TaskQueues']
+    waitingPilots = result['Value']['Pilots']
+
+    pilotsPerQueue = {}
+    for queueName, message in result['Value']['Failed'].items():
+      self.log.error('Could not retrieve TaskQueues from TaskQueueDB', '%s: %s' % (queueName, message))
+      pilotsPerQueue[queueName] = (0, {}, 0)
+    for queueName, tqIDList in result['Value']['Matches'].items():
+      taskQueueDict = dict((tqID, taskQueues[tqID]) for tqID in tqIDList)
+      if not taskQueueDict:
+        self.log.verbose('No matching TQs found', 'for %s' % ceDicts[queueName])
+      pilotsWeMayWantToSubmit = sum(tq['Jobs'] for tq in taskQueueDict.itervalues())
+      pilotsPerQueue[queueName] = (pilotsWeMayWantToSubmit, taskQueueDict, waitingPilots.get(queueName, 0))
+    return pilotsPerQueue
+
+  def _useBulkMatching(self):
+    """ Whether the queues are matched by _getPilotsWeMayWantToSubmitBulk, which reproduces the default
+        _getPilotsWeMayWantToSubmit: not if a VO overrides the latter without overriding the former
+
+        :return: bool
+    """
+    cls = type(self)
+    if cls._getPilotsWeMayWantToSubmit.__func__ is SiteDirector._getPilotsWeMayWantToSubmit.__func__:
+      return True
+    return cls._getPilotsWeMayWantToSubmitBulk.__func__ is not SiteDirector._getPilotsWeMayWantToSubmitBulk.__func__
+
   def _submitPilotsToQueue(self, pilotsToSubmit, ce, queue):
     """ Method that really submits the pilots to the ComputingElements' queue
 
@@ -894,7 +1230,8 @@ class SiteDirector(AgentModule):
     pilotList = submitResult['Value']
     self.queueSlots[queue]['AvailableSlots'] -= len(pilotList)
 
-    self.totalSubmittedPilots += len(pilotList)
+    with self.submissionLock:
+      self.totalSubmittedPilots += len(pilotList)
     self.log.info('Submitted %d pilots to %s@%s' % (len(pilotList),
                                                     self.queueDict[queue]['QueueName'],
                                                     self.queueDict[queue]['CEName']))
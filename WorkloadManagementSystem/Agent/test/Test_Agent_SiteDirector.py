@@ -5,6 +5,8 @@
 
 # imports
 import datetime
+import threading
+import time
 import pytest
 from mock import MagicMock
 
@@ -210,3 +212,209 @@ def test__updatePilotStatus(mocker, pilotRefs, pilotDict, pilotCEDict, expected)
   sd.rssClient = MagicMock()
   res = sd._updatePilotStatus(pilotRefs, pilotDict, pilotCEDict)
   assert res == expected
+
+
+@pytest.mark.parametrize("mockMatcherReturnValue, expected", [
+    ({'OK': False, 'Message': 'Unknown method'},
+     {}),
+    ({'OK': True, 'Value': {'Matches': {'aQueue': [1, 2], 'anotherQueue': []},
+                            'TaskQueues': {1: {'Jobs': 10}, 2: {'Jobs': 20}},
+                            'Pilots': {'aQueue': 5, 'anotherQueue': 0},
+                            'Failed': {'failingQueue': 'boh'}}},
+     {'aQueue': (30, {1: {'Jobs': 10}, 2: {'Jobs': 20}}, 5),
+      'anotherQueue': (0, {}, 0),
+      'failingQueue': (0, {}, 0)}),
+])
+def test__getPilotsWeMayWantToSubmitBulk(mocker, mockMatcherReturnValue, expected):
+  """ Testing SiteDirector()._getPilotsWeMayWantToSubmitBulk()
+  """
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule.__init__")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule", side_effect=mockAM)
+  sd = SiteDirector()
+  sd.log = gLogger
+  sd.am_getOption = mockAM
+  sd.matcherClient = MagicMock()
+  sd.matcherClient.getMatchingTaskQueuesBulk.return_value = mockMatcherReturnValue
+  ceDicts = {'aQueue': {'Site': 'Site1'}, 'anotherQueue': {'Site': 'Site2'}, 'failingQueue': {'Site': 'Site3'}}
+  res = sd._getPilotsWeMayWantToSubmitBulk(ceDicts)
+  assert res == expected
+  assert sd._getPilotsWeMayWantToSubmitBulk({}) == {}
+
+
+def test__useBulkMatching(mocker):
+  """ Testing SiteDirector()._useBulkMatching()
+  """
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule.__init__")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule", side_effect=mockAM)
+
+  class VOSiteDirector(SiteDirector):
+    def _getPilotsWeMayWantToSubmit(self, ceDict):
+      return 0, {}
+
+  class VOBulkSiteDirector(VOSiteDirector):
+    def _getPilotsWeMayWantToSubmitBulk(self, ceDicts):
+      return {}
+
+  assert SiteDirector()._useBulkMatching() is True
+  # The bulk matching would ignore the matching of the VO
+  assert VOSiteDirector()._useBulkMatching() is False
+  assert VOBulkSiteDirector()._useBulkMatching() is True
+
+
+def test__recordCESubmission(mocker):
+  """ Testing SiteDirector()._recordCESubmission() and SiteDirector()._allowedToSubmitToCE()
+  """
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule.__init__")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule", side_effect=mockAM)
+  sd = SiteDirector()
+  sd.log = gLogger
+  sd.ceFailureThreshold = 2
+  sd.failedQueueCycleFactor = 3
+
+  sd._recordCESubmission('aCE', False)
+  sd._recordCESubmission('aCE', True)
+  sd._recordCESubmission('aCE', False)
+  assert sd._allowedToSubmitToCE('aCE') is True
+
+  # The CE is skipped after consecutive failures, then at its first new failure
+  sd._recordCESubmission('aCE', False)
+  assert [sd._allowedToSubmitToCE('aCE') for _i in range(4)] == [False, False, False, True]
+  sd._recordCESubmission('aCE', False)
+  assert sd._allowedToSubmitToCE('aCE') is False
+  assert sd._allowedToSubmitToCE('anotherCE') is True
+
+  # A CE still busy with a previous submission is skipped
+  sd.submittingCEs['anotherCE'] += 1
+  assert sd._allowedToSubmitToCE('anotherCE') is False
+
+
+def test__reservePilots(mocker):
+  """ Testing SiteDirector()._reservePilots() and SiteDirector()._releasePilots()
+  """
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule.__init__")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule", side_effect=mockAM)
+  sd = SiteDirector()
+  assert sd._reservePilots(50) == 50
+
+  sd.pilotsLeftInCycle = 30
+  assert sd._reservePilots(20) == 20
+  assert sd._reservePilots(20) == 10
+  assert sd._reservePilots(20) == 0
+  sd._releasePilots(5)
+  assert sd._reservePilots(20) == 5
+
+
+@pytest.mark.parametrize("maxSubmissionThreads", [1, 4])
+def test__submitPilotsToCEs(mocker, maxSubmissionThreads):
+  """ Testing SiteDirector()._submitPilotsToCEs()
+  """
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule.__init__")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule", side_effect=mockAM)
+  sd = SiteDirector()
+  sd.log = gLogger
+  sd.maxSubmissionThreads = maxSubmissionThreads
+  sd.maxSubmissionThreadsPerCE = 2
+  sd.queueDict = {'queue1': {'CEName': 'CE1'},
+                  'queue2': {'CEName': 'CE1'},
+                  'queue3': {'CEName': 'CE1'},
+                  'queue4': {'CEName': 'CE2'}}
+  submitted = []
+
+  def submitPilotsPerQueue(queueName, *_args):
+    submitted.append(queueName)
+    if queueName == 'queue4':
+      return {'OK': False, 'Message': 'No proxy'}
+    return {'OK': True, 'Value': 1}
+
+  sd._submitPilotsPerQueue = submitPilotsPerQueue
+  res = sd._submitPilotsToCEs([(queue, 3600, None, {}, 10, 0, False) for queue in sorted(sd.queueDict)])
+  assert res['OK'] is False
+  assert sorted(submitted) == sorted(sd.queueDict)
+  assert not any(sd.submittingCEs.values())
+
+
+def test__submitPilotsToCEs_timeout(mocker):
+  """ Testing that SiteDirector()._submitPilotsToCEs() does not wait for a hanging CE
+  """
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule.__init__")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule", side_effect=mockAM)
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.SUBMISSION_POLLING_TIME", 0.1)
+  sd = SiteDirector()
+  sd.log = gLogger
+  sd.maxSubmissionThreads = 2
+  sd.ceSubmissionTimeout = 1
+  sd.queueDict = {'hangingQueue': {'CEName': 'hangingCE'},
+                  'queue': {'CEName': 'aCE'}}
+  hanging = threading.Event()
+
+  def submitPilotsPerQueue(queueName, *_args):
+    if queueName == 'hangingQueue':
+      hanging.wait(30)
+    return {'OK': True, 'Value': 1}
+
+  sd._submitPilotsPerQueue = submitPilotsPerQueue
+  start = time.time()
+  res = sd._submitPilotsToCEs([(queue, 3600, None, {}, 10, 0, False) for queue in sorted(sd.queueDict)])
+  assert res['OK'] is True
+  assert time.time() - start < 10
+  assert sd.failedCEs['hangingCE'] == 1
+  # The CE is skipped until its submission returns
+  assert sd._allowedToSubmitToCE('hangingCE') is False
+  hanging.set()
+
+
+def test__reserveTQPilots(mocker):
+  """ Testing SiteDirector()._reserveTQPilots() and SiteDirector()._releasePilots()
+  """
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule.__init__")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule", side_effect=mockAM)
+  sd = SiteDirector()
+  taskQueueDict = {1: {'Jobs': 10}}
+  assert sd._reserveTQPilots({}, 10, 10) == {}
+  assert sd._reserveTQPilots(taskQueueDict, 6, 8) == {1: 6}
+  assert sd._reserveTQPilots(taskQueueDict, 6, 8) == {1: 2}
+  assert sd._reserveTQPilots(taskQueueDict, 6, 8) == {1: 0}
+  sd._releasePilots(1, {1: 2})
+  assert sd._reserveTQPilots(taskQueueDict, 6, 8) == {1: 1}
+  # Pilots not limited by the jobs, e.g. to empty sites, still count
+  assert sd._reserveTQPilots(taskQueueDict, 3) == {1: 3}
+  assert sd.pilotsSubmittedToTQs[1] == 11
+
+  # The cycle budget is reserved at the same time
+  sd.pilotsLeftInCycle = 4
+  assert sd._reserveTQPilots({2: {'Jobs': 10}}, 6, 10) == {2: 4}
+  assert sd.pilotsLeftInCycle == 0
+
+
+@pytest.mark.parametrize("maxSubmissionThreads, failingQueue", [(1, 'queue0'), (4, None)])
+def test__submitPilotsPerQueue_sharedTQ(mocker, maxSubmissionThreads, failingQueue):
+  """ Testing that the queues of a cycle do not submit again the pilots of a TQ
+      submitted, or being submitted, to another queue
+  """
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule.__init__")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.AgentModule", side_effect=mockAM)
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.gProxyManager")
+  mocker.patch("DIRAC.WorkloadManagementSystem.Agent.SiteDirector.pilotAgentsDB")
+  sd = SiteDirector()
+  sd.log = gLogger
+  sd.maxSubmissionThreads = maxSubmissionThreads
+  sd.queueDict = dict(('queue%d' % i, {'CEName': 'CE%d' % i, 'CEType': 'SSH', 'Site': 'Site', 'QueueName': 'q'})
+                      for i in range(4))
+  sd.getQueueSlots = MagicMock(return_value=100)
+  submitted = []
+
+  def submitPilotsToQueue(pilotsToSubmit, _ce, queue):
+    time.sleep(0.1)
+    if queue == failingQueue:
+      return {'OK': False, 'Message': 'CE down'}
+    submitted.append((queue, pilotsToSubmit))
+    return {'OK': True, 'Value': (0, ['%s.%d' % (queue, i) for i in range(pilotsToSubmit)], {})}
+
+  sd._submitPilotsToQueue = submitPilotsToQueue
+  taskQueueDict = {1: {'Jobs': 10, 'Priority': 1}}
+  res = sd._submitPilotsToCEs([(queueName, 3600, MagicMock(), taskQueueDict, 10, 2, False)
+                               for queueName in sorted(sd.queueDict)])
+  assert res['OK'] is True
+  # The pilots of a failed submission are given back to the next queues
+  assert sum(pilots for _queue, pilots in submitted) == 8
+  assert sd.pilotsSubmittedToTQs[1] == 8
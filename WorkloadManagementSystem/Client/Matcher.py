@@ -143,6 +143,77 @@ class Matcher(object):
 
     return resultDict
 
+  def selectJobs(self, resourceDescription, credDict, numJobs):
+    """ Job selection function for several jobs at once, e.g. to fill the slots of a multi-core pilot.
+        The jobs are taken out of the task queues in a single query,
+        and their attributes, JDLs and optimizer parameters are fetched in bulk.
+
+        :param dict resourceDescription: description of the resource, as for selectJob
+        :param dict credDict: credentials of the pilot
+        :param int numJobs: maximum number of jobs to select
+        :return: list of dictionaries as returned by selectJob, one per matched job
+    """
+
+    startTime = time.time()
+
+    resourceDict = self._getResourceDict(resourceDescription, credDict)
+    self.log.info('Resource description for matching %s jobs' % numJobs, printDict(resourceDict))
+
+    negativeCond = self.limiter.getNegativeCondForSite(resourceDict['Site'])
+    result = self.tqDB.matchAndGetJobs(resourceDict, numJobs, negativeCond=negativeCond)
+
+    if not result['OK']:
+      raise RuntimeError(result['Message'])
+    result = result['Value']
+    if not result['matchFound']:
+      self.log.info("No match found")
+      return []
+
+    jobIDs = [jobID for jobID, _tqID in result['jobs']]
+    resAtt = self.jobDB.getAttributesForJobList(jobIDs, ['OwnerDN', 'OwnerGroup', 'Status'])
+    if not resAtt['OK']:
+      raise RuntimeError('Could not retrieve job attributes')
+    jobAttributes = resAtt['Value']
+    # The matched jobs are already out of the task queues
+    for jobID in jobIDs:
+      if jobAttributes.get(jobID, {}).get('Status') != 'Waiting':
+        self.log.error('Job matched by the TQ is not in Waiting state', str(jobID))
+    jobIDs = [jobID for jobID in jobIDs if jobAttributes.get(jobID, {}).get('Status') == 'Waiting']
+    if not jobIDs:
+      return []
+
+    self._reportStatus(resourceDict, jobIDs)
+
+    result = self.jobDB.getJobsJDL(jobIDs)
+    if not result['OK']:
+      raise RuntimeError("Failed to get the job JDLs")
+    jdls = result['Value']
+    resOpt = self.jobDB.getJobsOptParameters(jobIDs)
+    optParameters = resOpt['Value'] if resOpt['OK'] else {}
+
+    matchTime = time.time() - startTime
+    self.log.info("Match time", "[%s] for %s jobs" % (str(matchTime), len(jobIDs)))
+    gMonitor.addMark("matchTime", matchTime)
+
+    checkMatchingDelay = self.opsHelper.getValue("JobScheduling/CheckMatchingDelay", True)
+    if not resourceDict.get('PilotInfoReportedFlag', False):
+      self._updatePilotInfo(resourceDict)
+
+    resultList = []
+    for jobID in jobIDs:
+      if checkMatchingDelay:
+        self.limiter.updateDelayCounters(resourceDict['Site'], jobID)
+      self._updatePilotJobMapping(resourceDict, jobID)
+      resultDict = dict(optParameters.get(jobID, {}))
+      resultDict['JDL'] = jdls.get(jobID, '')
+      resultDict['JobID'] = jobID
+      resultDict['DN'] = jobAttributes[jobID]['OwnerDN']
+      resultDict['Group'] = jobAttributes[jobID]['OwnerGroup']
+      resultDict['PilotInfoReportedFlag'] = True
+      resultList.append(resultDict)
+
+    return resultList
+
   def _getResourceDict(self, resourceDescription, credDict):
     """ from resourceDescription to resourceDict (just various mods)
     """
@@ -223,7 +294,7 @@ class Matcher(object):
     return resourceDict
 
   def _reportStatus(self, resourceDict, jobID):
-    """ Reports the status of the matched job in jobDB and jobLoggingDB
+    """ Reports the status of the matched job (or list of jobs) in jobDB and jobLoggingDB
 
         Do not fail if errors happen here
     """
@@ -236,15 +307,16 @@ class Matcher(object):
     else:
       self.log.verbose("Set job attributes for jobID", jobID)
 
-    result = self.jlDB.addLoggingRecord(jobID,
-                                        status='Matched',
-                                        minor='Assigned',
-                                        source='Matcher')
-    if not result['OK']:
-      self.log.error("Problem reporting job status",
-                     "addLoggingRecord, jobID = %s: %s" % (jobID, result['Message']))
-    else:
-      self.log.verbose("Added logging record for jobID", jobID)
+    for jID in (jobID if isinstance(jobID, list) else [jobID]):
+      result = self.jlDB.addLoggingRecord(jID,
+                                          status='Matched',
+                                          minor='Assigned',
+                                          source='Matcher')
+      if not result['OK']:
+        self.log.error("Problem reporting job status",
+                       "addLoggingRecord, jobID = %s: %s" % (jID, result['Message']))
+      else:
+        self.log.verbose("Added logging record for jobID", jID)
 
   def _checkMask(self, resourceDict):
     """ Check the mask: are we allowed to run normal jobs?
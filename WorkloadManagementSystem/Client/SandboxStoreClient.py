@@ -7,7 +7,6 @@ __RCSID__ = "$Id$"
 import six
 import os
 import tarfile
-import hashlib
 import tempfile
 import re
 import StringIO
@@ -19,8 +18,9 @@ from DIRAC.Core.DISET.RPCClient import RPCClient
 from DIRAC.Core.Utilities.File import mkDir
 from DIRAC.Resources.Storage.StorageElement import StorageElement
 from DIRAC.Core.Utilities.ReturnValues import returnSingleResult
-from DIRAC.Core.Utilities.File import getGlobbedTotalSize
 from DIRAC.ConfigurationSystem.Client.Helpers.Registry import getVOForGroup
+from DIRAC.WorkloadManagementSystem.Utilities.SandboxPacker import SandboxPacker, chooseCodec, \
+    getContentKey
 
 
 class SandboxStoreClient(object):
@@ -44,6 +44,7 @@ class SandboxStoreClient(object):
     self.__transferClient = transferClient
     self.__kwargs = kwargs
     self.__vo = None
+    self.__packingOptions = None
     SandboxStoreClient.__smdb = smdb
     if 'delegatedGroup' in kwargs:
       self.__vo = getVOForGroup(kwargs['delegatedGroup'])
@@ -131,37 +132,55 @@ class SandboxStoreClient(object):
     if errorFiles:
       return S_ERROR("Failed to locate files: %s" % ", ".join(errorFiles))
 
+    # Ask the service which codecs it accepts, and whether it computes the sandbox checksum by itself
+    result = self.__getPackingOptions()
+    if result['OK']:
+      packingOptions = result['Value']
+      packer = SandboxPacker(chooseCodec(packingOptions.get('Codecs', [])), packingOptions.get('CompressionLevel', 0))
+    else:
+      packingOptions = {}
+      packer = SandboxPacker()
+
+    # Do not upload a sandbox whose files are already stored by the service
+    if packingOptions.get('ContentDeduplication'):
+      result = getContentKey(files2Upload)
+      if result['OK']:
+        result = self.__getRPCClient().getSandboxByContent(result['Value'], assignTo)
+      if result['OK'] and result['Value']:
+        return result
+      if not result['OK']:
+        gLogger.warn("Cannot check if the sandbox is already stored", result['Message'])
+
+    transferClient = self.__getTransferClient()
+
+    # Without size limit there is no need to keep a copy of the sandbox for a failover upload:
+    # stream it to the service, that computes the checksum from the received data
+    if packingOptions.get('StreamedUpload') and sizeLimit <= 0:
+      sbStream = packer.getStream(files2Upload)
+      try:
+        return transferClient.sendFile(sbStream, [".%s" % packer.getExtension(), assignTo])
+      finally:
+        sbStream.close()
+
     try:
       fd, tmpFilePath = tempfile.mkstemp(prefix="LDSB.")
       os.close(fd)
     except Exception as e:
       return S_ERROR("Cannot create temporary file: %s" % repr(e))
 
-    with tarfile.open(name=tmpFilePath, mode="w|bz2") as tf:
-      for sFile in files2Upload:
-        if isinstance(sFile, six.string_types):
-          tf.add(os.path.realpath(sFile), os.path.basename(sFile), recursive=True)
-        elif isinstance(sFile, StringIO.StringIO):
-          tarInfo = tarfile.TarInfo(name='jobDescription.xml')
-          tarInfo.size = len(sFile.buf)
-          tf.addfile(tarinfo=tarInfo, fileobj=sFile)
+    with open(tmpFilePath, "wb") as tmpFile:
+      result = packer.pack(files2Upload, tmpFile)
+    if not result['OK']:
+      return result
 
     if sizeLimit > 0:
       # Evaluate the compressed size of the sandbox
-      if getGlobbedTotalSize(tmpFilePath) > sizeLimit:
+      if packer.getSize() > sizeLimit:
         result = S_ERROR("Size over the limit")
         result['SandboxFileName'] = tmpFilePath
         return result
 
-    oMD5 = hashlib.md5()
-    with open(tmpFilePath, "rb") as fd:
-      bData = fd.read(10240)
-      while bData:
-        oMD5.update(bData)
-        bData = fd.read(10240)
-
-    transferClient = self.__getTransferClient()
-    result = transferClient.sendFile(tmpFilePath, ["%s.tar.bz2" % oMD5.hexdigest(), assignTo])
+    result = transferClient.sendFile(tmpFilePath, ["%s.%s" % (packer.getHash(), packer.getExtension()), assignTo])
     result['SandboxFileName'] = tmpFilePath
     try:
       if result['OK']:
@@ -170,6 +189,17 @@ class SandboxStoreClient(object):
       pass
     return result
 
+  def __getPackingOptions(self):
+    """ Get the sandbox packing options of the service, once per client
+    """
+    if self.__packingOptions is None:
+      result = self.__getRPCClient().getSandboxPackingOptions()
+      if not result['OK']:
+        # Services not knowing the method accept bz2 sandboxes with the checksum in the name
+        return result
+      self.__packingOptions = result['Value']
+    return S_OK(self.__packingOptions)
+
   ##############
   # Download sandbox
 
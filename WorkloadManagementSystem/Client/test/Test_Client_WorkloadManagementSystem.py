@@ -148,6 +148,36 @@ class MatcherTestCase(ClientsTestCase):
 
     self.assertEqual(res, resExpected)
 
+  def test_selectJobs(self):
+
+    self.opsHelperMock.getValue.return_value = False
+    self.matcher.siteClient = MagicMock()
+    self.matcher.siteClient.getUsableSites.return_value = S_OK(['DIRAC.Jenkins.ch'])
+    self.matcher.limiter = MagicMock()
+    self.matcher.limiter.getNegativeCondForSite.return_value = {}
+    self.tqDBMock.matchAndGetJobs.return_value = S_OK({'matchFound': True,
+                                                       'jobs': [(1, 10), (2, 10), (3, 11)],
+                                                       'tqMatch': {}})
+    self.jobDBMock.getAttributesForJobList.return_value = S_OK({
+        1: {'JobID': 1, 'OwnerDN': '/my/DN', 'OwnerGroup': 'myGroup', 'Status': 'Waiting'},
+        2: {'JobID': 2, 'OwnerDN': '/my/DN', 'OwnerGroup': 'myGroup', 'Status': 'Killed'},
+        3: {'JobID': 3, 'OwnerDN': '/my/DN', 'OwnerGroup': 'myGroup', 'Status': 'Waiting'}})
+    self.jobDBMock.getJobsJDL.return_value = S_OK({1: '[JDL1]', 3: '[JDL3]'})
+    self.jobDBMock.getJobsOptParameters.return_value = S_OK({1: {'CPUTime': '100'}, 3: {}})
+
+    res = self.matcher.selectJobs({'Setup': 'LHCb-Certification', 'CPUTime': 1080000,
+                                   'Site': 'DIRAC.Jenkins.ch', 'NumberOfProcessors': 4},
+                                  {'DN': '/my/DN', 'group': 'myGroup', 'properties': []}, 3)
+
+    self.assertEqual([jobDict['JobID'] for jobDict in res], [1, 3])
+    self.assertEqual(res[0]['JDL'], '[JDL1]')
+    self.assertEqual(res[0]['CPUTime'], '100')
+    self.assertEqual(res[1]['DN'], '/my/DN')
+    self.assertEqual(self.tqDBMock.matchAndGetJobs.call_args[0][1], 3)
+    # All the jobs are set to Matched at once
+    self.jobDBMock.setJobAttributes.assert_called_once()
+    self.assertEqual(self.jobDBMock.setJobAttributes.call_args[0][0], [1, 3])
+
 #############################################################################
 
 
@@ -27,6 +27,7 @@ from DIRAC.Core.Utilities import DErrno
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 from DIRAC.Core.Utilities import Time
+from DIRAC.Core.Utilities.List import breakListIntoChunks
 from DIRAC.Core.Utilities.DErrno import EWMSSUBM
 from DIRAC.Core.Utilities.Decorators import deprecated
 from DIRAC.Core.Utilities.ObjectLoader import ObjectLoader
@@ -467,6 +468,40 @@ class JobDB(DB):
     else:
       return S_ERROR('JobDB.getJobOptParameters: failed to retrieve parameters')
 
+#############################################################################
+  def getJobsOptParameters(self, jobIDList, paramList=None):
+    """ Get optimizer parameters for several jobs at once. If the list of parameter names is
+        empty, get all the parameters then
+
+        :param list jobIDList: list of job IDs
+        :param list paramList: names of the parameters to get
+        :return: S_OK({jobID: {name: value}}) / S_ERROR
+    """
+    if not jobIDList:
+      return S_OK({})
+    jobList = ','.join(str(int(jobID)) for jobID in jobIDList)
+    cmd = "SELECT JobID, Name, Value from OptimizerParameters WHERE JobID in (%s)" % jobList
+    if paramList:
+      paramNameList = []
+      for x in paramList:
+        ret = self._escapeString(x)
+        if not ret['OK']:
+          return ret
+        paramNameList.append(ret['Value'])
+      cmd += " and Name in (%s)" % ','.join(paramNameList)
+
+    result = self._query(cmd)
+    if not result['OK']:
+      return S_ERROR('JobDB.getJobsOptParameters: failed to retrieve parameters')
+    resultDict = dict((int(jobID), {}) for jobID in jobIDList)
+    for jobID, name, value in result['Value']:
+      try:
+        value = value.tostring()
+      except BaseException:
+        pass
+      resultDict[int(jobID)][name] = value
+    return S_OK(resultDict)
+
 #############################################################################
 
   def getInputData(self, jobID):
@@ -961,6 +996,25 @@ class JobDB(DB):
       return S_OK(self.__extractJDL(jdl[0][0]))
     return result
 
+#############################################################################
+  def getJobsJDL(self, jobIDList, original=False):
+    """ Get the JDLs of several jobs at once. By default the current job JDLs
+        are returned. If 'original' argument is True, original JDLs are returned
+
+        :param list jobIDList: list of job IDs
+        :param bool original: get the original JDLs
+        :return: S_OK({jobID: jdl}) / S_ERROR, jobs without JDL are not in the dictionary
+    """
+    if not jobIDList:
+      return S_OK({})
+    jdlField = 'OriginalJDL' if original else 'JDL'
+    cmd = "SELECT JobID, %s FROM JobJDLs WHERE JobID in (%s)" % (jdlField,
+                                                                 ','.join(str(int(jobID)) for jobID in jobIDList))
+    result = self._query(cmd)
+    if not result['OK']:
+      return result
+    return S_OK(dict((int(jobID), self.__extractJDL(jdl)) for jobID, jdl in result['Value']))
+
 #############################################################################
   def insertNewJobIntoDB(self, jdl, owner, ownerDN, ownerGroup, diracSetup,
                          initialStatus=JobStatus.RECEIVED,
@@ -1957,6 +2011,89 @@ class JobDB(DB):
       return S_OK()
     return S_ERROR('Failed to store some or all the parameters')
 
+#####################################################################################
+  def setHeartBeatDataBulk(self, heartBeats, chunkSize=1000):
+    """ Add the heart beat data of many jobs to the database, with one statement per table
+        for each chunk of jobs. All the statements can be executed again without side effect,
+        so the heart beats of a failed chunk can be written again later. The heart beats of
+        the jobs which do not exist any more are dropped. The status of the jobs is not changed,
+        as the heart beats may be written after the job has finished: the caller restores it.
+
+        :param dict heartBeats: { jobID : ( heart beat time, static data dict, dynamic data dict ) },
+                                the heart beat time being a UTC date time string
+        :param int chunkSize: maximum number of jobs per statement
+        :return: S_OK( { 'Successful' : [ jobIDs ], 'Failed' : { jobID : error message } } )
+    """
+    successful = []
+    failed = {}
+    for jobIDs in breakListIntoChunks(sorted(heartBeats), chunkSize):
+      result = self.__setHeartBeatDataChunk(heartBeats, jobIDs)
+      if not result['OK']:
+        self.log.error('Failed to write the heart beats', 'of %d jobs: %s' % (len(jobIDs), result['Message']))
+        failed.update((jobID, result['Message']) for jobID in jobIDs)
+        continue
+      successful.extend(result['Value'])
+    return S_OK({'Successful': successful, 'Failed': failed})
+
+  def __setHeartBeatDataChunk(self, heartBeats, jobIDs):
+    """ Add the heart beat data of a chunk of jobs, see setHeartBeatDataBulk
+
+        :return: S_OK( jobIDs written )/S_ERROR()
+    """
+    # The job parameters and the logging info of a deleted job would make the whole statement fail
+    req = "SELECT JobID FROM Jobs WHERE JobID IN (%s)" % ','.join(str(int(jobID)) for jobID in jobIDs)
+    result = self._query(req)
+    if not result['OK']:
+      return S_ERROR('Failed to get the jobs: ' + result['Message'])
+    existingJobIDs = set(int(row[0]) for row in result['Value'])
+    jobIDs = [jobID for jobID in jobIDs if int(jobID) in existingJobIDs]
+    if not jobIDs:
+      return S_OK([])
+
+    timeCases = []
+    parameterValues = []
+    loggingValues = []
+    for jobID in jobIDs:
+      heartBeatTime, staticDataDict, dynamicDataDict = heartBeats[jobID]
+      ret = self._escapeString(heartBeatTime)
+      if not ret['OK']:
+        return ret
+      e_heartBeatTime = ret['Value']
+      timeCases.append('WHEN %d THEN %s' % (int(jobID), e_heartBeatTime))
+      for values, dataDict, extraValue in ((parameterValues, staticDataDict, ''),
+                                           (loggingValues, dynamicDataDict, ',%s' % e_heartBeatTime)):
+        for key, value in dataDict.items():
+          ret = self._escapeString(key)
+          if not ret['OK']:
+            return ret
+          e_key = ret['Value']
+          ret = self._escapeString(value)
+          if not ret['OK']:
+            return ret
+          e_value = ret['Value']
+          values.append('(%d,%s,%s%s)' % (int(jobID), e_key, e_value, extraValue))
+
+    req = "UPDATE Jobs SET HeartBeatTime=CASE JobID %s END"
+    req += " WHERE JobID IN (%s)"
+    result = self._update(req % (' '.join(timeCases), ','.join(str(int(jobID)) for jobID in jobIDs)))
+    if not result['OK']:
+      return S_ERROR('Failed to set the heart beat time: ' + result['Message'])
+
+    # FIXME: as in setHeartBeatData, the static data are stored as job parameters
+    if parameterValues:
+      result = self._update('REPLACE JobParameters (JobID,Name,Value) VALUES %s' % ','.join(parameterValues))
+      if not result['OK']:
+        return S_ERROR('Failed to store the heart beat parameters: ' + result['Message'])
+
+    # A record with the same time stamp can only be the same heart beat, stored by a previous attempt
+    if loggingValues:
+      req = 'INSERT IGNORE INTO HeartBeatLoggingInfo (JobID,Name,Value,HeartBeatTime) VALUES %s'
+      result = self._update(req % ','.join(loggingValues))
+      if not result['OK']:
+        return S_ERROR('Failed to store the heart beat logging info: ' + result['Message'])
+
+    return S_OK(jobIDs)
+
 #####################################################################################
   def getHeartBeatData(self, jobID):
     """ Retrieve the job's heart beat data
@@ -67,6 +67,28 @@ class SandboxMetadataDB(DB):
                                              'UniqueIndexes': {'Mapping': ['SBId', 'EntitySetup', 'EntityId', 'Type']}
                                              }
 
+    # Sandbox contents stored once whatever the number of sandboxes, and so of owners, having them
+    self.__tablesDesc['sb_Blobs'] = {'Fields': {'BlobId': 'INTEGER(10) UNSIGNED AUTO_INCREMENT NOT NULL',
+                                                'Hash': 'VARCHAR(64) NOT NULL',
+                                                'ContentKey': 'VARCHAR(64) NOT NULL DEFAULT ""',
+                                                'SEName': 'VARCHAR(64) NOT NULL',
+                                                'SEPFN': 'VARCHAR(512) NOT NULL',
+                                                'Bytes': 'BIGINT(20) NOT NULL DEFAULT 0',
+                                                'RefCount': 'INTEGER(10) NOT NULL DEFAULT 0',
+                                                'RegistrationTime': 'DATETIME NOT NULL',
+                                                },
+                                     'PrimaryKey': 'BlobId',
+                                     'Indexes': {'ContentKey': ['ContentKey', 'SEName']},
+                                     'UniqueIndexes': {'BlobHash': ['Hash', 'SEName']}
+                                     }
+
+    self.__tablesDesc['sb_SandBoxBlobs'] = {'Fields': {'SBId': 'INTEGER(10) UNSIGNED NOT NULL',
+                                                       'BlobId': 'INTEGER(10) UNSIGNED NOT NULL',
+                                                       },
+                                            'PrimaryKey': 'SBId',
+                                            'Indexes': {'BlobIndex': ['BlobId']}
+                                            }
+
     for tableName in self.__tablesDesc:
       if tableName not in tablesInDB:
         tablesToCreate[tableName] = self.__tablesDesc[tableName]
@@ -309,16 +331,140 @@ class SandboxMetadataDB(DB):
 
   def deleteSandboxes(self, SBIdList):
     """
-    Delete sandboxes
+    Delete sandboxes, and release their references to the blobs
     """
     sqlSBList = ", ".join([str(sbid) for sbid in SBIdList])
-    for table in ('sb_SandBoxes', 'sb_EntityMapping'):
+    sqlCmd = "UPDATE `sb_Blobs` b, ( SELECT BlobId, COUNT(*) AS Refs FROM `sb_SandBoxBlobs` WHERE SBId IN ( %s )"
+    sqlCmd += " GROUP BY BlobId ) r SET b.RefCount = b.RefCount - r.Refs WHERE b.BlobId = r.BlobId"
+    result = self._update(sqlCmd % sqlSBList)
+    if not result['OK']:
+      return result
+    for table in ('sb_SandBoxBlobs', 'sb_SandBoxes', 'sb_EntityMapping'):
       sqlCmd = "DELETE FROM `%s` WHERE SBId IN ( %s )" % (table, sqlSBList)
       result = self._update(sqlCmd)
       if not result['OK']:
         return result
     return S_OK()
 
+  def __getBlob(self, sqlCond, requesterName=None, requesterGroup=None):
+    sqlTables = ["`sb_Blobs` b"]
+    if requesterGroup:
+      # Only the blobs of sandboxes the requester, or its group if it shares the jobs, already has
+      sqlTables.extend(["`sb_SandBoxBlobs` l", "`sb_SandBoxes` s", "`sb_Owners` o"])
+      sqlCond = sqlCond + ["l.BlobId = b.BlobId", "s.SBId = l.SBId", "s.OwnerId = o.OwnerId",
+                           "o.OwnerGroup = %s" % self._escapeString(requesterGroup)['Value']]
+      requesterProps = Registry.getPropertiesForEntity(requesterGroup, name=requesterName)
+      if Properties.JOB_SHARING not in requesterProps:
+        sqlCond.append("o.Owner = %s" % self._escapeString(requesterName)['Value'])
+    sqlCmd = "SELECT DISTINCT b.BlobId, b.SEPFN, b.Bytes FROM %s WHERE %s" % (", ".join(sqlTables),
+                                                                              " AND ".join(sqlCond))
+    result = self._query(sqlCmd)
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_OK(None)
+    return S_OK(tuple(result['Value'][0]))
+
+  def getBlobByHash(self, blobHash, SEName, requesterName=None, requesterGroup=None):
+    """
+    Get the blob with the given checksum
+
+    :param requesterName: if given with requesterGroup, only look at the blobs the requester already owns
+    :param requesterGroup: group of the requester
+    :return: S_OK with ( BlobId, SEPFN, Bytes ), or None if there is no such blob
+    """
+    return self.__getBlob(["b.Hash=%s" % self._escapeString(blobHash)['Value'],
+                           "b.SEName=%s" % self._escapeString(SEName)['Value']],
+                          requesterName, requesterGroup)
+
+  def getBlobByContentKey(self, contentKey, SEName, requesterName=None, requesterGroup=None):
+    """
+    Get a blob whose archive contains the files described by the content key
+
+    :param requesterName: if given with requesterGroup, only look at the blobs the requester already owns
+    :param requesterGroup: group of the requester
+    :return: S_OK with ( BlobId, SEPFN, Bytes ), or None if there is no such blob
+    """
+    if not contentKey:
+      return S_OK(None)
+    return self.__getBlob(["b.ContentKey=%s" % self._escapeString(contentKey)['Value'],
+                           "b.SEName=%s" % self._escapeString(SEName)['Value']],
+                          requesterName, requesterGroup)
+
+  def registerBlob(self, blobHash, contentKey, SEName, SEPFN, size=0):
+    """
+    Register a new blob, without any reference
+
+    :return: S_OK with ( BlobId, SEPFN, Bytes ) of the new or already existing blob
+    """
+    sqlCmd = "INSERT INTO `sb_Blobs` ( Hash, ContentKey, SEName, SEPFN, Bytes, RegistrationTime )"
+    sqlCmd = "%s VALUES ( %s, %s, %s, %s, %d, UTC_TIMESTAMP() )" % (sqlCmd,
+                                                                    self._escapeString(blobHash)['Value'],
+                                                                    self._escapeString(contentKey)['Value'],
+                                                                    self._escapeString(SEName)['Value'],
+                                                                    self._escapeString(SEPFN)['Value'],
+                                                                    size)
+    result = self._update(sqlCmd)
+    if not result['OK']:
+      if result['Message'].find("Duplicate entry") == -1:
+        return result
+      # Another upload registered the same content in the meantime
+      return self.getBlobByHash(blobHash, SEName)
+    if 'lastRowId' in result:
+      return S_OK((result['lastRowId'], SEPFN, size))
+    result = self._query("SELECT LAST_INSERT_ID()")
+    if not result['OK']:
+      return S_ERROR("Can't determine blob id after insertion")
+    return S_OK((result['Value'][0][0], SEPFN, size))
+
+  def linkSandboxToBlob(self, sbId, blobId):
+    """
+    Make a sandbox reference a blob
+    """
+    result = self._update("UPDATE `sb_Blobs` SET RefCount = RefCount + 1 WHERE BlobId = %d" % blobId)
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_ERROR("Blob %s does not exist anymore" % blobId)
+    result = self._update("INSERT INTO `sb_SandBoxBlobs` ( SBId, BlobId ) VALUES ( %d, %d )" % (sbId, blobId))
+    if not result['OK']:
+      self._update("UPDATE `sb_Blobs` SET RefCount = RefCount - 1 WHERE BlobId = %d" % blobId)
+      return result
+    return S_OK()
+
+  def getSandboxBlob(self, sbId):
+    """
+    Get the location of the blob of a sandbox
+
+    :return: S_OK with ( SEName, SEPFN ), or None for the sandboxes stored on their own
+    """
+    sqlCmd = "SELECT b.SEName, b.SEPFN FROM `sb_Blobs` b, `sb_SandBoxBlobs` l WHERE l.BlobId = b.BlobId"
+    result = self._query("%s AND l.SBId = %d" % (sqlCmd, sbId))
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_OK(None)
+    return S_OK(tuple(result['Value'][0]))
+
+  def getUnusedBlobs(self):
+    """
+    Get the blobs not referenced by any sandbox. Blobs just registered are left to the uploads linking them.
+    """
+    sqlCmd = "SELECT BlobId, SEName, SEPFN FROM `sb_Blobs` WHERE RefCount <= 0 AND"
+    sqlCmd += " TIMESTAMPDIFF( HOUR, RegistrationTime, UTC_TIMESTAMP() ) >= 1"
+    return self._query(sqlCmd)
+
+  def deleteBlob(self, blobId):
+    """
+    Delete a blob if it is still not referenced
+
+    :return: S_OK with True if the blob was deleted, in which case its file can be removed
+    """
+    result = self._update("DELETE FROM `sb_Blobs` WHERE BlobId = %d AND RefCount <= 0" % blobId)
+    if not result['OK']:
+      return result
+    return S_OK(bool(result['Value']))
+
   def getSandboxId(self, SEName, SEPFN, requesterName, requesterGroup, field='SBId', requesterDN=None):
     """
         Get the sandboxId if it exists
@@ -62,6 +62,7 @@ class TaskQueueDB(DB):
     self.__opsHelper = Operations()
     self.__ensureInsertionIsSingle = False
     self.__sharesCorrector = SharesCorrector(self.__opsHelper)
+    self.__tqIndex = None
     result = self.__initializeDB()
     if not result['OK']:
       raise Exception("Can't create tables: %s" % result['Message'])
@@ -79,6 +80,18 @@ class TaskQueueDB(DB):
       return result
     return S_OK([row[0] for row in result['Value']])
 
+  def setTaskQueueIndex(self, tqIndex):
+    """ Use an in memory index of the task queues to select the TQs matching the resources,
+        instead of querying the DB. The DB is still used when the index is not up to date
+
+        :param tqIndex: TaskQueueIndex object, or None to stop using it
+    """
+    self.__tqIndex = tqIndex
+
+  def __removeFromTaskQueueIndex(self, tqIdList):
+    if self.__tqIndex:
+      self.__tqIndex.removeTaskQueues(tqIdList)
+
   def isSharesCorrectionEnabled(self):
     return self.__getCSOption("EnableSharesCorrection", False)
 
@@ -317,6 +330,7 @@ class TaskQueueDB(DB):
         "DELETE FROM `tq_TaskQueues` WHERE TQId in ( %s )" % ','.join(orphanedTQs), conn=connObj)
     if not result['OK']:
       return result
+    self.__removeFromTaskQueueIndex([int(tqId) for tqId in orphanedTQs])
     return S_OK()
 
   def __setTaskQueueEnabled(self, tqId, enabled=True, connObj=False):
@@ -516,6 +530,7 @@ ORDER BY COUNT( `tq_Jobs`.JobID ) ASC" % (sqlCmd, result['Value'])
     if negativeCond is None:
       negativeCond = {}
     # Make a copy to avoid modification of original if escaping needs to be done
+    rawMatchDict = dict(tqMatchDict)
     tqMatchDict = dict(tqMatchDict)
     retVal = self._checkMatchDefinition(tqMatchDict)
     if not retVal['OK']:
@@ -534,17 +549,15 @@ WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
       noJobsFound = False
       if 'JobID' in tqMatchDict:
         # A certain JobID is required by the resource, so all TQ are to be considered
-        retVal = self.matchAndGetTaskQueue(tqMatchDict,
-                                           numQueuesToGet=0,
-                                           skipMatchDictDef=True,
-                                           connObj=connObj)
+        retVal = self.__matchTaskQueues(rawMatchDict, tqMatchDict,
+                                        numQueuesToGet=0,
+                                        connObj=connObj)
         preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % (preJobSQL, tqMatchDict['JobID'])
       else:
-        retVal = self.matchAndGetTaskQueue(tqMatchDict,
-                                           numQueuesToGet=numQueuesPerTry,
-                                           skipMatchDictDef=True,
-                                           negativeCond=negativeCond,
-                                           connObj=connObj)
+        retVal = self.__matchTaskQueues(rawMatchDict, tqMatchDict,
+                                        numQueuesToGet=numQueuesPerTry,
+                                        negativeCond=negativeCond,
+                                        connObj=connObj)
       if not retVal['OK']:
         return retVal
       tqList = retVal['Value']
@@ -588,6 +601,104 @@ WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
     self.log.info("Could not find a match after %s match retries" % self.__maxMatchRetry)
     return S_ERROR("Could not find a match after %s match retries" % self.__maxMatchRetry)
 
+  def matchAndGetJobs(self, tqMatchDict, numJobs, numQueuesPerTry=10, negativeCond=None):
+    """ Match several jobs at once, e.g. for the slots of a multi-core pilot.
+
+        The candidate jobs of all the matching TQs are selected with a single query,
+        ordered randomly according to the priorities of the TQs and of the jobs,
+        and then taken out of the TQs in a single transaction, so that concurrent
+        matches never get the same job.
+
+        :param dict tqMatchDict: dict for TQ matching, as for matchAndGetJob
+        :param int numJobs: maximum number of jobs to match
+        :param int numQueuesPerTry: number of TQs to consider at each try
+        :param dict negativeCond: TQ conditions to exclude
+        :returns: S_OK({'matchFound': bool, 'jobs': [(jobId, tqId), ...], 'tqMatch': tqMatchDict}) / S_ERROR
+    """
+    if negativeCond is None:
+      negativeCond = {}
+    if 'JobID' in tqMatchDict:
+      # A certain JobID is required by the resource, there is only one job to match
+      result = self.matchAndGetJob(tqMatchDict, negativeCond=negativeCond)
+      if not result['OK'] or not result['Value']['matchFound']:
+        return result
+      return S_OK({'matchFound': True,
+                   'jobs': [(result['Value']['jobId'], result['Value']['taskQueueId'])],
+                   'tqMatch': result['Value']['tqMatch']})
+    # Make a copy to avoid modification of original if escaping needs to be done
+    rawMatchDict = dict(tqMatchDict)
+    tqMatchDict = dict(tqMatchDict)
+    retVal = self._checkMatchDefinition(tqMatchDict)
+    if not retVal['OK']:
+      self.log.error("TQ match request check failed", retVal['Message'])
+      return retVal
+    if numJobs < 1:
+      return S_OK({'matchFound': False, 'jobs': [], 'tqMatch': tqMatchDict})
+    # Jobs of the same TQ may also be taken by concurrent matches, so get some more candidates
+    candidatesSQL = "SELECT j.JobId, j.TQId FROM `tq_Jobs` j, `tq_TaskQueues` tq \
+WHERE j.TQId = tq.TQId AND j.TQId IN ( %s ) ORDER BY RAND() / ( tq.Priority * j.RealPriority ) ASC LIMIT %s"
+    matchedJobs = []
+    for _ in xrange(self.__maxMatchRetry):
+      retVal = self.__matchTaskQueues(rawMatchDict, tqMatchDict,
+                                      numQueuesToGet=numQueuesPerTry,
+                                      negativeCond=negativeCond)
+      if not retVal['OK']:
+        return retVal
+      tqOwners = dict((tqId, (tqOwnerDN, tqOwnerGroup)) for tqId, tqOwnerDN, tqOwnerGroup in retVal['Value'])
+      if not tqOwners:
+        self.log.info("No TQ matches requirements")
+        break
+      numMissing = numJobs - len(matchedJobs)
+      retVal = self._query(candidatesSQL % (", ".join(str(tqId) for tqId in tqOwners), 2 * numMissing))
+      if not retVal['OK']:
+        return S_ERROR("Can't retrieve candidate jobs for matching: %s" % retVal['Message'])
+      candidates = [(row[0], row[1]) for row in retVal['Value']]
+      for tqId in set(tqOwners) - set(tqId for _jobId, tqId in candidates):
+        self.log.info("Task queue seems to be empty, triggering a cleaning of", tqId)
+        self.__deleteTQWithDelay.add(tqId, 300, (tqId,) + tqOwners[tqId])
+      if not candidates:
+        break
+      retVal = self.__takeJobs(candidates, numMissing)
+      if not retVal['OK']:
+        return retVal
+      for jobId, tqId in retVal['Value']:
+        self.__deleteTQWithDelay.add(tqId, 300, (tqId,) + tqOwners[tqId])
+      matchedJobs.extend(retVal['Value'])
+      if len(matchedJobs) >= numJobs:
+        break
+    self.log.info("Extracted jobs from TQs", "%s out of %s requested" % (len(matchedJobs), numJobs))
+    return S_OK({'matchFound': bool(matchedJobs), 'jobs': matchedJobs, 'tqMatch': tqMatchDict})
+
+  def __takeJobs(self, candidates, numJobs):
+    """ Take at most numJobs jobs out of the TQs, in the order of the candidates.
+        The candidates already taken by someone else are skipped.
+
+        :param list candidates: list of (jobId, tqId)
+        :param int numJobs: maximum number of jobs to take
+        :returns: S_OK([(jobId, tqId), ...]) / S_ERROR
+    """
+    jobIdsStr = ", ".join(str(jobId) for jobId, _tqId in candidates)
+    retVal = self.transactionStart()
+    if not retVal['OK']:
+      return S_ERROR("Can't begin transaction for matching jobs: %s" % retVal['Message'])
+    retVal = self._query("SELECT JobId FROM `tq_Jobs` WHERE JobId IN ( %s ) FOR UPDATE" % jobIdsStr)
+    if not retVal['OK']:
+      self.transactionRollback()
+      return S_ERROR("Can't lock jobs for matching: %s" % retVal['Message'])
+    available = set(row[0] for row in retVal['Value'])
+    takenJobs = [(jobId, tqId) for jobId, tqId in candidates if jobId in available][:numJobs]
+    if takenJobs:
+      retVal = self._update("DELETE FROM `tq_Jobs` WHERE JobId IN ( %s )" %
+                            ", ".join(str(jobId) for jobId, _tqId in takenJobs))
+      if not retVal['OK']:
+        self.transactionRollback()
+        return S_ERROR("Could not take jobs out from the TQs: %s" % retVal['Message'])
+    retVal = self.transactionCommit()
+    if not retVal['OK']:
+      self.transactionRollback()
+      return S_ERROR("Could not take jobs out from the TQs: %s" % retVal['Message'])
+    return S_OK(takenJobs)
+
   def matchAndGetTaskQueue(self, tqMatchDict, numQueuesToGet=1, skipMatchDictDef=False,
                            negativeCond=None, connObj=False):
     """ Get a queue that matches the requirements
@@ -597,9 +708,12 @@ WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
     # Make a copy to avoid modification of original if escaping needs to be done
     tqMatchDict = dict(tqMatchDict)
     if not skipMatchDictDef:
+      rawMatchDict = dict(tqMatchDict)
       retVal = self._checkMatchDefinition(tqMatchDict)
       if not retVal['OK']:
         return retVal
+      if self.__tqIndex and self.__tqIndex.isUpToDate():
+        return self.__tqIndex.match(rawMatchDict, numQueuesToGet=numQueuesToGet, negativeCond=negativeCond)
     retVal = self.__generateTQMatchSQL(tqMatchDict, numQueuesToGet=numQueuesToGet, negativeCond=negativeCond)
     if not retVal['OK']:
       return retVal
@@ -609,6 +723,21 @@ WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
       return retVal
     return S_OK([(row[0], row[1], row[2]) for row in retVal['Value']])
 
+  def __matchTaskQueues(self, rawMatchDict, tqMatchDict, numQueuesToGet=1, negativeCond=None, connObj=False):
+    """ Get the TQs matching the requirements from the task queue index if it is up to date,
+        otherwise from the DB
+
+        :param dict rawMatchDict: match definition, as given by the caller
+        :param dict tqMatchDict: same match definition, checked and escaped
+    """
+    if self.__tqIndex and self.__tqIndex.isUpToDate():
+      return self.__tqIndex.match(rawMatchDict, numQueuesToGet=numQueuesToGet, negativeCond=negativeCond)
+    return self.matchAndGetTaskQueue(tqMatchDict,
+                                     numQueuesToGet=numQueuesToGet,
+                                     skipMatchDictDef=True,
+                                     negativeCond=negativeCond,
+                                     connObj=connObj)
+
   @staticmethod
   def __generateSQLSubCond(sqlString, value, boolOp='OR'):
     if not isinstance(value, (list, tuple)):
@@ -1005,6 +1134,7 @@ WHERE j.JobId = %s AND t.TQId = j.TQId" %
       retVal = self._update("DELETE FROM `tq_TaskQueues` WHERE TQId = %s" % tqId, conn=connObj)
       if not retVal['OK']:
         return retVal
+      self.__removeFromTaskQueueIndex([tqId])
       self.recalculateTQSharesForEntity(tqOwnerDN, tqOwnerGroup, connObj=connObj)
       self.log.info("Deleted empty and enabled TQ", tqId)
       return S_OK()
@@ -1033,6 +1163,7 @@ WHERE j.JobId = %s AND t.TQId = j.TQId" %
     if not retVal['OK']:
       return S_ERROR("Could not delete task queue %s: %s" % (tqId, retVal['Message']))
     delTQ = retVal['Value']
+    self.__removeFromTaskQueueIndex([tqId])
     sqlCmd = "DELETE FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s" % tqId
     retVal = self._update(sqlCmd, conn=connObj)
     if not retVal['OK']:
@@ -1054,6 +1185,45 @@ WHERE j.JobId = %s AND t.TQId = j.TQId" %
       return result
     return self.retrieveTaskQueues([tqTuple[0] for tqTuple in result['Value']])
 
+  def getMatchingTaskQueuesBulk(self, tqMatchDicts, negativeConds=None):
+    """ Get the task queues that match each of several resources. The resources described identically
+        are matched once, and the info of all the matching task queues is retrieved at once
+
+        :param dict tqMatchDicts: {resource name: match definition}
+        :param dict negativeConds: {resource name: negative condition of the resource}
+        :return: S_OK({'Matches': {resource name: list of tqIds},
+                       'TaskQueues': {tqId: info, as given by retrieveTaskQueues},
+                       'Failed': {resource name: error message}}) / S_ERROR
+    """
+    if negativeConds is None:
+      negativeConds = {}
+    matches = {}
+    failed = {}
+    # Result of the match definitions already matched
+    matched = {}
+    for resourceName, tqMatchDict in tqMatchDicts.items():
+      negativeCond = negativeConds.get(resourceName) or {}
+      key = repr((sorted(tqMatchDict.items()), negativeCond))
+      if key not in matched:
+        matched[key] = self.matchAndGetTaskQueue(tqMatchDict, numQueuesToGet=0, negativeCond=negativeCond)
+      result = matched[key]
+      if result['OK']:
+        matches[resourceName] = [tqTuple[0] for tqTuple in result['Value']]
+      else:
+        failed[resourceName] = result['Message']
+
+    tqIdList = set()
+    for tqIds in matches.values():
+      tqIdList.update(tqIds)
+    result = self.retrieveTaskQueues(list(tqIdList))
+    if not result['OK']:
+      return result
+    tqData = result['Value']
+    # The task queues emptied meanwhile are not retrieved
+    for resourceName, tqIds in matches.items():
+      matches[resourceName] = [tqId for tqId in tqIds if tqId in tqData]
+    return S_OK({'Matches': matches, 'TaskQueues': tqData, 'Failed': failed})
+
   def getNumTaskQueues(self):
     """
      Get the number of task queues in the system
@@ -1064,6 +1234,35 @@ WHERE j.JobId = %s AND t.TQId = j.TQId" %
       return retVal
     return S_OK(retVal['Value'][0][0])
 
+  def getTaskQueuesAttributes(self):
+    """ Get the single value fields, the priority and the state of all the task queues
+
+        :return: S_OK({tqId: {field: value}}) / S_ERROR
+    """
+    fields = ('TQId', 'Priority', 'Enabled') + singleValueDefFields
+    retVal = self._query("SELECT %s FROM `tq_TaskQueues`" % ", ".join(fields))
+    if not retVal['OK']:
+      return retVal
+    return S_OK(dict((record[0], dict(zip(fields[1:], record[1:]))) for record in retVal['Value']))
+
+  def getTaskQueuesMultiValues(self, tqIdList):
+    """ Get the multi value fields of some task queues
+
+        :param list tqIdList: TQ IDs
+        :return: S_OK({tqId: {field: list of values}}) / S_ERROR
+    """
+    tqData = dict((tqId, dict((field, []) for field in multiValueDefFields)) for tqId in tqIdList)
+    if not tqIdList:
+      return S_OK(tqData)
+    for field in multiValueDefFields:
+      retVal = self._query("SELECT TQId, Value FROM `tq_TQTo%s` WHERE TQId IN ( %s )" %
+                           (field, ", ".join(str(tqId) for tqId in tqIdList)))
+      if not retVal['OK']:
+        return retVal
+      for tqId, value in retVal['Value']:
+        tqData[tqId][field].append(value)
+    return S_OK(tqData)
+
   def retrieveTaskQueues(self, tqIdList=None):
     """
     Get all the task queues
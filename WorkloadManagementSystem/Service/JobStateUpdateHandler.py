@@ -13,29 +13,49 @@ from six.moves import range
 
 __RCSID__ = "$Id$"
 
+import atexit
 import time
 
 from DIRAC import S_OK, S_ERROR
-from DIRAC.Core.DISET.RequestHandler import RequestHandler
+from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
 from DIRAC.Core.Utilities import Time
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
+from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.WorkloadManagementSystem.DB.JobDB import JobDB
 from DIRAC.WorkloadManagementSystem.DB.ElasticJobDB import ElasticJobDB
 from DIRAC.WorkloadManagementSystem.DB.JobLoggingDB import JobLoggingDB
 from DIRAC.WorkloadManagementSystem.Client import JobStatus
+from DIRAC.WorkloadManagementSystem.private.HeartBeatBuffer import HeartBeatBuffer
 
 # This is a global instance of the JobDB class
 jobDB = False
 logDB = False
 elasticJobDB = False
+heartBeatBuffer = None
 
 
 def initializeJobStateUpdateHandler(serviceInfo):
 
   global jobDB
   global logDB
+  global heartBeatBuffer
   jobDB = JobDB()
   logDB = JobLoggingDB()
+
+  # Write the heart beats in bulk every flush period rather than one by one
+  flushPeriod = getServiceOption(serviceInfo, 'HeartBeatFlushPeriod', 5)
+  if flushPeriod > 0:
+    gMonitor.registerActivity('heartBeatQueueDepth', "Buffered heart beats",
+                              'JobStateUpdate', "jobs", gMonitor.OP_MEAN, 300)
+    gMonitor.registerActivity('heartBeatFlushTime', "Heart beat flush time",
+                              'JobStateUpdate', "secs", gMonitor.OP_MEAN, 300)
+    gMonitor.registerActivity('heartBeatsFlushed', "Heart beats written",
+                              'JobStateUpdate', "jobs", gMonitor.OP_RATE, 300)
+    heartBeatBuffer = HeartBeatBuffer(jobDB, flushPeriod=flushPeriod,
+                                      maxSize=getServiceOption(serviceInfo, 'HeartBeatBufferSize', 10000),
+                                      chunkSize=getServiceOption(serviceInfo, 'HeartBeatChunkSize', 1000))
+    heartBeatBuffer.start()
+    atexit.register(heartBeatBuffer.stop)
   return S_OK()
 
 
@@ -355,9 +375,10 @@ class JobStateUpdateHandler(RequestHandler):
     """ Send a heart beat sign of life for a job jobID
     """
 
-    result = jobDB.setHeartBeatData(int(jobID), staticData, dynamicData)
-    if not result['OK']:
-      self.log.warn('Failed to set the heart beat data', 'for job %d ' % int(jobID))
+    if not heartBeatBuffer or not heartBeatBuffer.add(jobID, staticData, dynamicData):
+      result = jobDB.setHeartBeatData(int(jobID), staticData, dynamicData)
+      if not result['OK']:
+        self.log.warn('Failed to set the heart beat data', 'for job %d ' % int(jobID))
 
     # Restore the Running status if necessary
     result = jobDB.getJobAttributes(jobID, ['Status'])
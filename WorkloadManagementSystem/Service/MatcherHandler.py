@@ -11,7 +11,7 @@ from DIRAC import gLogger, S_OK, S_ERROR
 
 from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 from DIRAC.Core.Utilities.Decorators import deprecated
-from DIRAC.Core.DISET.RequestHandler import RequestHandler
+from DIRAC.Core.DISET.RequestHandler import RequestHandler, getServiceOption
 
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 
@@ -22,6 +22,7 @@ from DIRAC.WorkloadManagementSystem.DB.PilotAgentsDB import PilotAgentsDB
 
 from DIRAC.WorkloadManagementSystem.Client.Matcher import Matcher
 from DIRAC.WorkloadManagementSystem.Client.Limiter import Limiter
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 
 gJobDB = False
@@ -55,6 +56,16 @@ def initializeMatcherHandler(serviceInfo):
   gThreadScheduler.addPeriodicTask(120, gTaskQueueDB.recalculateTQSharesForAll)
   gThreadScheduler.addPeriodicTask(60, sendNumTaskQueues)
 
+  # Select the matching task queues in memory rather than in the DB
+  refreshPeriod = getServiceOption(serviceInfo, 'TaskQueueIndexRefreshPeriod', 10)
+  if refreshPeriod > 0:
+    tqIndex = TaskQueueIndex(gTaskQueueDB, refreshPeriod=refreshPeriod)
+    result = tqIndex.refresh()
+    if not result['OK']:
+      return result
+    gTaskQueueDB.setTaskQueueIndex(tqIndex)
+    gThreadScheduler.addPeriodicTask(refreshPeriod, tqIndex.refresh)
+
   sendNumTaskQueues()
 
   return S_OK()
@@ -104,6 +115,38 @@ class MatcherHandler(RequestHandler):
     # FIXME: This is correctly interpreted by the JobAgent, but DErrno should be used instead
     return S_ERROR("No match found")
 
+##############################################################################
+  types_requestJobs = [[basestring, dict], six.integer_types]
+
+  def export_requestJobs(self, resourceDescription, numJobs):
+    """ Serve up to numJobs jobs at once to the request of an agent, e.g. to fill
+        all the slots of a multi-core pilot. The jobs are the highest priority ones
+        matching the agent's site capacity.
+
+        :return: S_OK(list of dictionaries as returned by requestJob) / S_ERROR
+    """
+
+    resourceDescription['Setup'] = self.serviceInfoDict['clientSetup']
+    credDict = self.getRemoteCredentials()
+
+    try:
+      opsHelper = Operations(group=credDict['group'])
+      matcher = Matcher(pilotAgentsDB=pilotAgentsDB,
+                        jobDB=gJobDB,
+                        tqDB=gTaskQueueDB,
+                        jlDB=jlDB,
+                        opsHelper=opsHelper)
+      result = matcher.selectJobs(resourceDescription, credDict, numJobs)
+    except RuntimeError as rte:
+      self.log.error("Error requesting jobs: ", rte)
+      return S_ERROR("Error requesting jobs")
+
+    gMonitor.addMark("matchesDone")
+    if result:
+      gMonitor.addMark("matchesOK", len(result))
+      return S_OK(result)
+    return S_ERROR("No match found")
+
 ##############################################################################
   types_getActiveTaskQueues = []
 
@@ -131,6 +174,59 @@ class MatcherHandler(RequestHandler):
     return gTaskQueueDB.getMatchingTaskQueues(resourceDescriptionDict,
                                               negativeCond=negativeCond)
 
+##############################################################################
+  types_getMatchingTaskQueuesBulk = [dict, list]
+
+  def export_getMatchingTaskQueuesBulk(self, resourceDicts, pilotStatusList=None):
+    """ Return the task queues that match each of several resources, e.g. all the queues of a SiteDirector,
+        and the number of pilots in the given states for each resource. The negative conditions are
+        computed once per site, and the resources described identically are matched once.
+
+        :param dict resourceDicts: {resource name: resourceDict, as given to getMatchingTaskQueues}
+        :param list pilotStatusList: states of the pilots to count, e.g. the waiting ones. Not counted if empty
+        :return: S_OK({'Matches': {resource name: list of tqIds},
+                       'TaskQueues': {tqId: info, as returned by getMatchingTaskQueues},
+                       'Pilots': {resource name: number of pilots of the matching task queues},
+                       'Failed': {resource name: error message}}) / S_ERROR
+    """
+    matcher = Matcher(pilotAgentsDB=pilotAgentsDB,
+                      jobDB=gJobDB,
+                      tqDB=gTaskQueueDB,
+                      jlDB=jlDB)
+    negativeConds = {}
+    siteNegativeConds = {}
+    tqMatchDicts = {}
+    for resourceName, resourceDict in resourceDicts.items():
+      site = resourceDict.get('Site')
+      if not isinstance(site, six.string_types):
+        site = None
+      if site not in siteNegativeConds:
+        if site is None:
+          siteNegativeConds[site] = self.limiter.getNegativeCond()
+        else:
+          siteNegativeConds[site] = self.limiter.getNegativeCondForSite(site)
+      negativeConds[resourceName] = siteNegativeConds[site]
+      tqMatchDicts[resourceName] = matcher._processResourceDescription(resourceDict)
+
+    result = gTaskQueueDB.getMatchingTaskQueuesBulk(tqMatchDicts, negativeConds=negativeConds)
+    if not result['OK']:
+      return result
+    matching = result['Value']
+
+    matching['Pilots'] = {}
+    if pilotStatusList:
+      # One pilot is in a single task queue, so the pilots of a resource are the sum of the ones of its TQs
+      tqPilots = {}
+      if matching['TaskQueues']:
+        result = pilotAgentsDB.getCounters('PilotAgents', ['TaskQueueID'],
+                                           {'TaskQueueID': list(matching['TaskQueues']), 'Status': pilotStatusList})
+        if not result['OK']:
+          return result
+        tqPilots = dict((attrDict['TaskQueueID'], count) for attrDict, count in result['Value'])
+      for resourceName, tqIds in matching['Matches'].items():
+        matching['Pilots'][resourceName] = sum(tqPilots.get(tqId, 0) for tqId in tqIds)
+    return S_OK(matching)
+
 ##############################################################################
   types_matchAndGetTaskQueue = [dict]
 
@@ -5,6 +5,7 @@
 __RCSID__ = "$Id$"
 
 import os
+import six
 import time
 import threading
 import tempfile
@@ -21,6 +22,7 @@ from DIRAC.RequestManagementSystem.Client.Request import Request
 from DIRAC.RequestManagementSystem.Client.Operation import Operation
 from DIRAC.RequestManagementSystem.Client.File import File
 from DIRAC.Resources.Storage.StorageElement import StorageElement
+from DIRAC.WorkloadManagementSystem.Utilities.SandboxPacker import CODECS, getArchiveContentKey
 
 sandboxDB = False
 
@@ -41,6 +43,8 @@ class SandboxStoreHandler(RequestHandler):
     self.__backend = self.getCSOption("Backend", "local")
     self.__localSEName = self.getCSOption("LocalSE", "SandboxSE")
     self.__maxUploadBytes = self.getCSOption("MaxSandboxSizeMiB", 10) * 1048576
+    self.__codecs = [codec for codec in self.getCSOption("Codecs", ['gz', 'bz2']) if codec in CODECS]
+    self.__compressionLevel = self.getCSOption("CompressionLevel", 0)
     if self.__backend.lower() == "local" or self.__backend == self.__localSEName:
       self.__useLocalStorage = True
       self.__seNameToUse = self.__localSEName
@@ -97,6 +101,23 @@ class SandboxStoreHandler(RequestHandler):
     gLogger.info("Upload requested for %s [%s]" % (aHash, extension))
 
     credDict = self.getRemoteCredentials()
+    if self.__useLocalStorage and aHash:
+      # The requester may already have uploaded the same content. The checksum announced by the client
+      # is not a proof that it has the content, so the blobs of other owners are only reused once received
+      result = sandboxDB.getBlobByHash(aHash, self.__localSEName, credDict['username'], credDict['group'])
+      if not result['OK']:
+        return result
+      if result['Value']:
+        gLogger.info("Sandbox content already exists. Skipping upload")
+        fileHelper.markAsTransferred()
+        return self.__registerSandboxOnBlob(result['Value'], assignTo)
+
+    if not aHash:
+      # The client streams the sandbox while packing it, the checksum is only known at the end
+      if self.__useLocalStorage:
+        return self.__receiveBlob(aHash, extension, assignTo, fileHelper)
+      return self.__receiveStreamedSandbox(extension, assignTo, fileHelper)
+
     sbPath = self.__getSandboxPath("%s.%s" % (aHash, extension))
     # Generate the location
     result = self.__generateLocation(sbPath)
@@ -116,11 +137,10 @@ class SandboxStoreHandler(RequestHandler):
       return S_OK(sbURL)
 
     if self.__useLocalStorage:
-      hdPath = self.__sbToHDPath(sbPath)
-    else:
-      hdPath = False
+      return self.__receiveBlob(aHash, extension, assignTo, fileHelper)
+
     # Write to local file
-    result = self.__networkToFile(fileHelper, hdPath)
+    result = self.__networkToFile(fileHelper)
     if not result['OK']:
       gLogger.error("Error while receiving sandbox file", "%s" % result['Message'])
       return result
@@ -131,14 +151,13 @@ class SandboxStoreHandler(RequestHandler):
       self.__secureUnlinkFile(hdPath)
       gLogger.error("Hashes don't match! Client defined hash is different with received data hash!")
       return S_ERROR("Hashes don't match!")
-    # If using remote storage, copy there!
-    if not self.__useLocalStorage:
-      gLogger.info("Uploading sandbox to external storage")
-      result = self.__copyToExternalSE(hdPath, sbPath)
-      self.__secureUnlinkFile(hdPath)
-      if not result['OK']:
-        return result
-      sbPath = result['Value'][1]
+    # Copy to the remote storage
+    gLogger.info("Uploading sandbox to external storage")
+    result = self.__copyToExternalSE(hdPath, sbPath)
+    self.__secureUnlinkFile(hdPath)
+    if not result['OK']:
+      return result
+    sbPath = result['Value'][1]
     # Register!
     gLogger.info("Registering sandbox in the DB with", "SB:%s|%s" % (self.__seNameToUse, sbPath))
     result = sandboxDB.registerAndGetSandbox(credDict['username'], credDict['DN'], credDict['group'],
@@ -154,6 +173,127 @@ class SandboxStoreHandler(RequestHandler):
       return result
     return S_OK(sbURL)
 
+  def __getBlobPath(self, blobName):
+    """ Generate the path of a sandbox content, shared by all the sandboxes having it
+    """
+    return os.path.join("/", "SandBox", "Blobs", blobName[0:3], blobName[3:6], blobName)
+
+  def __receiveBlob(self, aHash, extension, assignTo, fileHelper):
+    """ Receive a sandbox in the local storage, where each content is stored once whatever its owners
+
+        :param str aHash: checksum announced by the client, empty if it streams the sandbox
+    """
+    # Stay on the file system of the sandboxes, so that the final move is a rename
+    result = self.__networkToFile(fileHelper, tmpDir=self.getCSOption("BasePath", "/opt/dirac/storage/sandboxes"))
+    if not result['OK']:
+      gLogger.error("Error while receiving sandbox file", "%s" % result['Message'])
+      return result
+    tmpFilePath = result['Value']
+    blobHash = fileHelper.getHash()
+    if aHash and blobHash != aHash:
+      self.__secureUnlinkFile(tmpFilePath)
+      gLogger.error("Hashes don't match! Client defined hash is different with received data hash!")
+      return S_ERROR("Hashes don't match!")
+
+    result = sandboxDB.getBlobByHash(blobHash, self.__localSEName)
+    if not result['OK']:
+      self.__secureUnlinkFile(tmpFilePath)
+      return result
+    blob = result['Value']
+    if blob:
+      gLogger.info("Sandbox content already exists. Dropping the received copy")
+      self.__secureUnlinkFile(tmpFilePath)
+    else:
+      # The content key lets the clients find this content before uploading it
+      result = getArchiveContentKey(tmpFilePath)
+      if not result['OK']:
+        gLogger.warn("Cannot compute the content key of the sandbox", result['Message'])
+      contentKey = result.get('Value', '')
+      blobPath = self.__getBlobPath("%s.%s" % (blobHash, extension))
+      result = self.__moveToFinalLocation(tmpFilePath, blobPath)
+      if os.path.exists(tmpFilePath):
+        self.__secureUnlinkFile(tmpFilePath)
+      if not result['OK']:
+        gLogger.error("Could not move sandbox to final destination", result['Message'])
+        return result
+      result = sandboxDB.registerBlob(blobHash, contentKey, self.__localSEName, blobPath,
+                                      fileHelper.getTransferedBytes())
+      if not result['OK']:
+        return result
+      blob = result['Value']
+    return self.__registerSandboxOnBlob(blob, assignTo)
+
+  def __registerSandboxOnBlob(self, blob, assignTo):
+    """ Register a sandbox of the requester with the content of a blob, and assign it
+
+        :param tuple blob: ( BlobId, SEPFN, Bytes ) as returned by the SandboxMetadataDB
+    """
+    blobId, blobPath, blobBytes = blob
+    credDict = self.getRemoteCredentials()
+    sbPath = self.__getSandboxPath(os.path.basename(blobPath))
+    gLogger.info("Registering sandbox in the DB with", "SB:%s|%s" % (self.__localSEName, sbPath))
+    result = sandboxDB.registerAndGetSandbox(credDict['username'], credDict['DN'], credDict['group'],
+                                             self.__localSEName, sbPath, blobBytes)
+    if not result['OK']:
+      return result
+    sbId, newSandbox = result['Value']
+    # Sandboxes registered before the blobs keep their own file
+    if newSandbox:
+      result = sandboxDB.linkSandboxToBlob(sbId, blobId)
+      if not result['OK']:
+        sandboxDB.deleteSandboxes([sbId])
+        return result
+
+    sbURL = "SB:%s|%s" % (self.__localSEName, sbPath)
+    assignTo = dict([(key, [(sbURL, assignTo[key])]) for key in assignTo])
+    result = self.export_assignSandboxesToEntities(assignTo)
+    if not result['OK']:
+      return result
+    return S_OK(sbURL)
+
+  def __receiveStreamedSandbox(self, extension, assignTo, fileHelper):
+    """ Receive a sandbox whose name is derived from the checksum of the received data
+    """
+    result = self.__networkToFile(fileHelper)
+    if not result['OK']:
+      gLogger.error("Error while receiving sandbox file", "%s" % result['Message'])
+      return result
+    tmpFilePath = result['Value']
+
+    credDict = self.getRemoteCredentials()
+    sbPath = self.__getSandboxPath("%s.%s" % (fileHelper.getHash(), extension))
+    result = self.__generateLocation(sbPath)
+    if not result['OK']:
+      self.__secureUnlinkFile(tmpFilePath)
+      return result
+    seName, sePFN = result['Value']
+
+    result = sandboxDB.getSandboxId(seName, sePFN, credDict['username'], credDict['group'])
+    if result['OK']:
+      gLogger.info("Sandbox already exists. Dropping the received copy")
+      self.__secureUnlinkFile(tmpFilePath)
+      sbURL = "SB:%s|%s" % (seName, sePFN)
+    else:
+      result = self.__moveToFinalLocation(tmpFilePath, sbPath)
+      if os.path.exists(tmpFilePath):
+        self.__secureUnlinkFile(tmpFilePath)
+      if not result['OK']:
+        gLogger.error("Could not move sandbox to final destination", result['Message'])
+        return result
+      sbPath = result['Value'][1]
+      gLogger.info("Registering sandbox in the DB with", "SB:%s|%s" % (self.__seNameToUse, sbPath))
+      result = sandboxDB.registerAndGetSandbox(credDict['username'], credDict['DN'], credDict['group'],
+                                               self.__seNameToUse, sbPath, fileHelper.getTransferedBytes())
+      if not result['OK']:
+        return result
+      sbURL = "SB:%s|%s" % (self.__seNameToUse, sbPath)
+
+    assignTo = dict([(key, [(sbURL, assignTo[key])]) for key in assignTo])
+    result = self.export_assignSandboxesToEntities(assignTo)
+    if not result['OK']:
+      return result
+    return S_OK(sbURL)
+
   def transfer_bulkFromClient(self, fileId, token, _fileSize, fileHelper):
     """ Receive files packed into a tar archive by the fileHelper logic.
         token is used for access rights confirmation.
@@ -225,15 +365,16 @@ class SandboxStoreHandler(RequestHandler):
     basePath = self.getCSOption("BasePath", "/opt/dirac/storage/sandboxes")
     return os.path.join(basePath, sbPath)
 
-  def __networkToFile(self, fileHelper, destFileName=False):
+  def __networkToFile(self, fileHelper, destFileName=False, tmpDir=None):
     """
     Dump incoming network data to temporal file
     """
-    tfd = None
     if not destFileName:
       try:
-        tfd, destFileName = tempfile.mkstemp(prefix="DSB.")
-        tfd.close()
+        if tmpDir:
+          mkDir(tmpDir)
+        tfd, destFileName = tempfile.mkstemp(prefix="DSB.", dir=tmpDir)
+        os.close(tfd)
       except Exception as e:
         gLogger.error("%s" % repr(e).replace(',)', ')'))
         return S_ERROR("Cannot create temporary file")
@@ -242,10 +383,7 @@ class SandboxStoreHandler(RequestHandler):
     mkDir(os.path.dirname(destFileName))
 
     try:
-      if tfd is not None:
-        fd = tfd
-      else:
-        fd = open(destFileName, "wb")
+      fd = open(destFileName, "wb")
       result = fileHelper.networkToDataSink(fd, maxFileSize=self.__maxUploadBytes)
       fd.close()
     except Exception as e:
@@ -304,6 +442,40 @@ class SandboxStoreHandler(RequestHandler):
       gLogger.error("Error while moving sandbox to SE", "%s" % repr(e).replace(',)', ')'))
       return S_ERROR("Error while moving sandbox to SE")
 
+  types_getSandboxPackingOptions = []
+
+  def export_getSandboxPackingOptions(self):
+    """ Get the compression codecs accepted for the sandboxes, in order of preference,
+        and whether the sandboxes can be uploaded without knowing their checksum beforehand
+    """
+    return S_OK({'Codecs': self.__codecs,
+                 'CompressionLevel': self.__compressionLevel,
+                 'StreamedUpload': True,
+                 'ContentDeduplication': self.__useLocalStorage})
+
+  types_getSandboxByContent = [six.string_types, dict]
+
+  def export_getSandboxByContent(self, contentKey, assignTo):
+    """ Check whether the requester, or its group if it shares the jobs, already stored a sandbox
+        with the given content key. If so, it is registered and assigned, so that the client does
+        not upload it.
+
+        :param str contentKey: content key of the files of the sandbox
+        :param dict assignTo: { 'Job:<jobid>' : '<sbType>', ... }
+
+        :return: S_OK with the sandbox URL, or an empty string if the content is unknown
+    """
+    if not self.__useLocalStorage:
+      return S_OK('')
+    credDict = self.getRemoteCredentials()
+    result = sandboxDB.getBlobByContentKey(contentKey, self.__localSEName, credDict['username'], credDict['group'])
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_OK('')
+    gLogger.info("Sandbox content already exists", "for content key %s" % contentKey)
+    return self.__registerSandboxOnBlob(result['Value'], assignTo)
+
   ##################
   # Assigning sbs to jobs
 
@@ -393,6 +565,12 @@ class SandboxStoreHandler(RequestHandler):
       return result
     sbId = result['Value']
     sandboxDB.accessedSandboxById(sbId)
+    # The content may be shared with other sandboxes
+    result = sandboxDB.getSandboxBlob(sbId)
+    if not result['OK']:
+      return result
+    if result['Value']:
+      filePath = result['Value'][1]
     # If it's a local file
     hdPath = self.__sbToHDPath(filePath)
     if not os.path.isfile(hdPath):
@@ -431,6 +609,21 @@ class SandboxStoreHandler(RequestHandler):
     for sbId, SEName, SEPFN in sbList:  # pylint: disable=invalid-name
       self.__purgeSandbox(sbId, SEName, SEPFN)
 
+    # Garbage collect the contents not referenced anymore by any sandbox
+    result = sandboxDB.getUnusedBlobs()
+    if not result['OK']:
+      gLogger.error("Error while retrieving sandbox contents to purge", result['Message'])
+    else:
+      gLogger.info("Got sandbox contents to purge", "(%d)" % len(result['Value']))
+      for blobId, SEName, SEPFN in result['Value']:  # pylint: disable=invalid-name
+        result = sandboxDB.deleteBlob(blobId)
+        if not result['OK']:
+          gLogger.error("Cannot delete sandbox content from DB", result['Message'])
+        elif result['Value']:
+          result = self.__deleteSandboxFromBackend(SEName, SEPFN)
+          if not result['OK']:
+            gLogger.error("Cannot delete sandbox content from backend", result['Message'])
+
     SandboxStoreHandler.__purgeWorking = False
     return S_OK()
 
@@ -0,0 +1,291 @@
+""" Packing of sandboxes.
+
+    The files are archived with tar, compressed and hashed in a single pass, while being written
+    to the destination, which can be a file or the write end of a pipe read by the transfer.
+    The compression codec and level are pluggable, so that the SandboxStore can advertise
+    the ones it accepts.
+
+    The content key of a sandbox describes the files it contains, whatever the codec and the owner.
+    It is computed by the clients from the files before packing them, and by the SandboxStore from
+    the archives it receives, so that a sandbox already stored is never uploaded again.
+"""
+
+from __future__ import absolute_import, division
+
+import bz2
+import hashlib
+import os
+import stat
+import tarfile
+import threading
+import zlib
+import six
+import StringIO
+
+try:
+  import lzma
+except ImportError:
+  lzma = None
+
+from DIRAC import S_OK, S_ERROR
+
+__RCSID__ = '$Id$'
+
+# Codec used when the SandboxStore does not advertise any
+DEFAULT_CODEC = 'bz2'
+
+
+def _gzipCompressor(level):
+  # 16 + MAX_WBITS produces a gzip stream, which tarfile can read
+  return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _bz2Compressor(level):
+  return bz2.BZ2Compressor(level)
+
+
+def _xzCompressor(level):
+  return lzma.LZMACompressor(preset=level)
+
+
+# { codec : ( file extension, compressor factory, default level ) }
+CODECS = {'gz': ('tar.gz', _gzipCompressor, 6),
+          'bz2': ('tar.bz2', _bz2Compressor, 9)}
+# The tarfile of python 2 cannot read xz archives, so the readers would not unpack them
+if lzma is not None and 'xz' in tarfile.TarFile.OPEN_METH:
+  CODECS['xz'] = ('tar.xz', _xzCompressor, 6)
+
+
+def getAvailableCodecs():
+  """ Get the codecs that can be used in this installation
+
+      :return: list of codec names
+  """
+  return sorted(CODECS)
+
+
+def chooseCodec(codecs):
+  """ Get the first of the given codecs available in this installation
+
+      :param list codecs: codec names in order of preference
+      :return: codec name, DEFAULT_CODEC if none of them is available
+  """
+  for codec in codecs:
+    if codec in CODECS:
+      return codec
+  return DEFAULT_CODEC
+
+
+def _digestEntries(entries):
+  """ Content key of a list of ( name, type, mode, payload ) entries, whatever their order
+  """
+  oMD5 = hashlib.md5()
+  for entry in sorted(entries):
+    oMD5.update("%s\0%s\0%o\0%s\n" % entry)
+  return oMD5.hexdigest()
+
+
+def _fileDigest(fileObj):
+  oMD5 = hashlib.md5()
+  data = fileObj.read(1048576)
+  while data:
+    oMD5.update(data)
+    data = fileObj.read(1048576)
+  return oMD5.hexdigest()
+
+
+def _pathEntries(path, arcname, entries):
+  """ Describe a path as tarfile.add would archive it
+  """
+  stInfo = os.lstat(path)
+  mode = stat.S_IMODE(stInfo.st_mode)
+  if stat.S_ISREG(stInfo.st_mode):
+    with open(path, 'rb') as fd:
+      entries.append((arcname, 'f', mode, _fileDigest(fd)))
+  elif stat.S_ISDIR(stInfo.st_mode):
+    entries.append((arcname, 'd', mode, ''))
+    for fileName in os.listdir(path):
+      _pathEntries(os.path.join(path, fileName), os.path.join(arcname, fileName), entries)
+  elif stat.S_ISLNK(stInfo.st_mode):
+    entries.append((arcname, 'l', mode, os.readlink(path)))
+  else:
+    entries.append((arcname, 'o', mode, ''))
+
+
+def getContentKey(fileList):
+  """ Get the content key of the sandbox that would be made of the files in fileList
+
+      :param list fileList: file names and StringIO objects, the latter is the job description
+      :return: S_OK(content key)/S_ERROR
+  """
+  entries = []
+  try:
+    for sFile in fileList:
+      if isinstance(sFile, six.string_types):
+        _pathEntries(os.path.realpath(sFile), os.path.basename(sFile), entries)
+      elif isinstance(sFile, StringIO.StringIO):
+        entries.append(('jobDescription.xml', 'f', 0o644, hashlib.md5(sFile.getvalue()).hexdigest()))
+  except (IOError, OSError) as e:
+    return S_ERROR("Cannot read the sandbox files: %s" % repr(e))
+  return S_OK(_digestEntries(entries))
+
+
+def getArchiveContentKey(archivePath):
+  """ Get the content key of a packed sandbox
+
+      :param str archivePath: path of the sandbox archive
+      :return: S_OK(content key)/S_ERROR
+  """
+  entries = []
+  try:
+    with tarfile.open(name=archivePath, mode='r') as tf:
+      for tarInfo in tf:
+        mode = tarInfo.mode & 0o7777
+        if tarInfo.isreg():
+          entries.append((tarInfo.name, 'f', mode, _fileDigest(tf.extractfile(tarInfo))))
+        elif tarInfo.isdir():
+          entries.append((tarInfo.name, 'd', mode, ''))
+        elif tarInfo.issym():
+          entries.append((tarInfo.name, 'l', mode, tarInfo.linkname))
+        elif tarInfo.islnk():
+          entries.append((tarInfo.name, 'h', mode, tarInfo.linkname))
+        else:
+          entries.append((tarInfo.name, 'o', mode, ''))
+  except Exception as e:  # pylint: disable=broad-except
+    return S_ERROR("Cannot read the sandbox archive: %s" % repr(e))
+  return S_OK(_digestEntries(entries))
+
+
+def _anonymousTarInfo(tarInfo):
+  """ Drop the owner of the files, so that the same files packed by different users give the same sandbox
+  """
+  tarInfo.uid = tarInfo.gid = 0
+  tarInfo.uname = tarInfo.gname = ''
+  return tarInfo
+
+
+class _CompressingWriter(object):
+  """ File like object compressing the data written in it before writing them to the output,
+      and computing the MD5 and the size of the compressed data
+  """
+
+  def __init__(self, output, compressor):
+    self.output = output
+    self.compressor = compressor
+    self.md5 = hashlib.md5()
+    self.size = 0
+
+  def __writeOutput(self, data):
+    if data:
+      self.md5.update(data)
+      self.size += len(data)
+      self.output.write(data)
+
+  def write(self, data):
+    self.__writeOutput(self.compressor.compress(data))
+
+  def close(self):
+    self.__writeOutput(self.compressor.flush())
+
+
+class SandboxPacker(object):
+  """ Tar, compress and hash a list of files in one pass
+  """
+
+  def __init__(self, codec=DEFAULT_CODEC, level=0):
+    """ c'tor
+
+        :param str codec: one of CODECS
+        :param int level: compression level, 0 for the default level of the codec
+    """
+    self.codec = codec
+    self.level = level
+    self.__hash = ''
+    self.__size = 0
+
+  def getExtension(self):
+    """ Get the extension of the sandbox file name, tar.gz, tar.bz2 or tar.xz
+    """
+    return CODECS[self.codec][0]
+
+  def getHash(self):
+    """ Get the MD5 of the last packed sandbox
+    """
+    return self.__hash
+
+  def getSize(self):
+    """ Get the compressed size of the last packed sandbox
+    """
+    return self.__size
+
+  def pack(self, fileList, output):
+    """ Write the sandbox made of the files in fileList to output
+
+        :param list fileList: file names and StringIO objects, the latter is the job description
+        :param output: object with a write method
+        :return: S_OK(size of the sandbox)/S_ERROR
+    """
+    if self.codec not in CODECS:
+      return S_ERROR("Unknown sandbox compression codec %s" % self.codec)
+    _extension, compressorFactory, defaultLevel = CODECS[self.codec]
+    try:
+      writer = _CompressingWriter(output, compressorFactory(self.level or defaultLevel))
+      with tarfile.open(name='Sandbox', mode='w|', fileobj=writer) as tf:
+        for sFile in fileList:
+          if isinstance(sFile, six.string_types):
+            tf.add(os.path.realpath(sFile), os.path.basename(sFile), recursive=True, filter=_anonymousTarInfo)
+          elif isinstance(sFile, StringIO.StringIO):
+            tarInfo = tarfile.TarInfo(name='jobDescription.xml')
+            tarInfo.size = len(sFile.buf)
+            sFile.seek(0)
+            tf.addfile(tarinfo=tarInfo, fileobj=sFile)
+      writer.close()
+    except Exception as e:  # pylint: disable=broad-except
+      return S_ERROR("Cannot pack the sandbox: %s" % repr(e))
+    self.__hash = writer.md5.hexdigest()
+    self.__size = writer.size
+    return S_OK(writer.size)
+
+  def getStream(self, fileList):
+    """ Get a file like object from which the sandbox can be read while it is being packed.
+        If the packing fails, reading the end of the stream raises an exception, so that
+        an incomplete sandbox is never sent completely.
+
+        :param list fileList: file names and StringIO objects
+        :return: SandboxStream
+    """
+    return SandboxStream(self, fileList)
+
+
+class SandboxStream(object):
+  """ Read end of a pipe filled by a SandboxPacker running in a thread
+  """
+
+  def __init__(self, packer, fileList):
+    self.__packResult = None
+    rPipe, wPipe = os.pipe()
+    self.__rFile = os.fdopen(rPipe, 'rb')
+    self.__thread = threading.Thread(target=self.__pack, args=(packer, fileList, os.fdopen(wPipe, 'wb')))
+    self.__thread.daemon = True
+    self.__thread.start()
+
+  def __pack(self, packer, fileList, wFile):
+    try:
+      self.__packResult = packer.pack(fileList, wFile)
+    finally:
+      try:
+        wFile.close()
+      except IOError as e:
+        self.__packResult = S_ERROR("Cannot write the sandbox: %s" % repr(e))
+
+  def read(self, size):
+    data = self.__rFile.read(size)
+    if not data:
+      self.__thread.join()
+      if not self.__packResult['OK']:
+        raise IOError(self.__packResult['Message'])
+    return data
+
+  def close(self):
+    self.__rFile.close()
+    self.__thread.join()
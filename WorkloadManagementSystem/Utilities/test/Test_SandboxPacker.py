@@ -0,0 +1,106 @@
+""" Test of the sandbox packer
+"""
+
+# pylint: disable=missing-docstring, invalid-name
+
+import hashlib
+import io
+import os
+import tarfile
+import StringIO
+
+import pytest
+
+from DIRAC.WorkloadManagementSystem.Utilities.SandboxPacker import SandboxPacker, getAvailableCodecs, chooseCodec, \
+    getContentKey, getArchiveContentKey, DEFAULT_CODEC
+
+__RCSID__ = '$Id$'
+
+
+@pytest.fixture
+def sandboxFiles(tmpdir):
+  fileList = []
+  for i in range(3):
+    filePath = tmpdir.join('file%d.txt' % i)
+    filePath.write('Line of file %d\n' % i * 1000)
+    fileList.append(str(filePath))
+  fileList.append(StringIO.StringIO('[ Executable = "echo"; ]'))
+  return fileList
+
+
+@pytest.mark.parametrize("codec", getAvailableCodecs())
+def test_pack(sandboxFiles, codec):
+  packer = SandboxPacker(codec)
+  output = io.BytesIO()
+  res = packer.pack(sandboxFiles, output)
+  assert res['OK'], res
+  data = output.getvalue()
+  assert res['Value'] == len(data) == packer.getSize()
+  assert packer.getHash() == hashlib.md5(data).hexdigest()
+  assert packer.getExtension() == 'tar.%s' % codec
+
+  with tarfile.open(fileobj=io.BytesIO(data), mode='r') as tf:
+    assert sorted(tf.getnames()) == ['file0.txt', 'file1.txt', 'file2.txt', 'jobDescription.xml']
+    assert tf.extractfile('file1.txt').read() == 'Line of file 1\n' * 1000
+    assert tf.extractfile('jobDescription.xml').read() == '[ Executable = "echo"; ]'
+
+
+def test_stream(sandboxFiles):
+  packer = SandboxPacker('gz')
+  stream = packer.getStream(sandboxFiles)
+  data = ''
+  chunk = stream.read(1024)
+  while chunk:
+    data += chunk
+    chunk = stream.read(1024)
+  stream.close()
+  assert packer.getHash() == hashlib.md5(data).hexdigest()
+
+  with tarfile.open(fileobj=io.BytesIO(data), mode='r') as tf:
+    assert len(tf.getnames()) == 4
+
+
+def test_streamError(sandboxFiles):
+  """ A failing packing raises at the end of the stream """
+  os.unlink(sandboxFiles[0])
+  stream = SandboxPacker('gz').getStream(sandboxFiles)
+  with pytest.raises(IOError):
+    while stream.read(1024):
+      pass
+  stream.close()
+
+
+def test_chooseCodec():
+  assert chooseCodec(['unknown', 'gz', 'bz2']) == 'gz'
+  assert chooseCodec(['unknown']) == DEFAULT_CODEC
+  assert chooseCodec([]) == DEFAULT_CODEC
+  assert not SandboxPacker('unknown').pack([], io.BytesIO())['OK']
+
+
+@pytest.mark.parametrize("codec", ['gz', 'bz2'])
+def test_contentKey(sandboxFiles, tmpdir, codec):
+  """ The content key computed from the files is the one of the archive """
+  archivePath = str(tmpdir.join('sandbox.tar.%s' % codec))
+  packer = SandboxPacker(codec)
+  with open(archivePath, 'wb') as archive:
+    assert packer.pack(sandboxFiles, archive)['OK']
+
+  res = getContentKey(sandboxFiles)
+  assert res['OK'], res
+  contentKey = res['Value']
+  res = getArchiveContentKey(archivePath)
+  assert res['OK'], res
+  assert res['Value'] == contentKey
+
+  # Packing again gives the same archive
+  output = io.BytesIO()
+  assert SandboxPacker(codec).pack(sandboxFiles, output)['OK']
+  assert hashlib.md5(output.getvalue()).hexdigest() == packer.getHash()
+
+  # Any change of the files changes the key
+  os.chmod(sandboxFiles[0], 0o755)
+  assert getContentKey(sandboxFiles)['Value'] != contentKey
+  os.chmod(sandboxFiles[0], 0o644)
+  with open(sandboxFiles[1], 'a') as fd:
+    fd.write('x')
+  assert getContentKey(sandboxFiles)['Value'] != contentKey
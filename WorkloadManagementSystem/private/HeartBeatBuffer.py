@@ -0,0 +1,167 @@
+""" Write behind buffer of the job heart beats, used by the JobStateUpdate service
+
+    The heart beats received during a flush period are coalesced per job: the time stamp and the
+    dynamic data of the last heart beat are kept, and the static data are merged. They are then
+    written by a single thread with one multi-row statement per table, instead of three statements
+    per heart beat.
+
+    The number of buffered jobs is bounded: when the buffer is full, the heart beats are written
+    synchronously by the caller, as without buffer. The statements of a flush can be replayed, so
+    the heart beats of the jobs whose writing failed are put back in the buffer, unless a newer heart
+    beat of the same job arrived meanwhile, and written again at the next flush. The heart beats of
+    the jobs which do not exist any more are dropped by the JobDB. The buffer is flushed when the
+    service stops, so that only a crash can lose the heart beats of one flush period, which the
+    jobs send again at their next heart beat.
+"""
+
+__RCSID__ = "$Id$"
+
+import threading
+import time
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Utilities import Time
+from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
+
+
+class HeartBeatBuffer(object):
+
+  def __init__(self, jobDB, flushPeriod=5, maxSize=10000, chunkSize=1000):
+    """ c'tor
+
+        :param jobDB: JobDB object
+        :param int flushPeriod: maximum number of seconds a heart beat stays in the buffer
+        :param int maxSize: maximum number of jobs in the buffer
+        :param int chunkSize: maximum number of jobs per statement
+    """
+    self.__jobDB = jobDB
+    self.flushPeriod = flushPeriod
+    self.maxSize = maxSize
+    self.chunkSize = chunkSize
+    self.__log = gLogger.getSubLogger("HeartBeatBuffer")
+    self.__lock = threading.Lock()
+    # Serializes the flushes, so that a retried flush never overwrites a newer one
+    self.__flushLock = threading.Lock()
+    self.__stopEvent = threading.Event()
+    self.__thread = None
+    # jobID -> ( heart beat time, static data dict, dynamic data dict )
+    self.__heartBeats = {}
+    self.__flushed = 0
+    self.__failedFlushes = 0
+    self.__lastFlushTime = 0.
+
+  def add(self, jobID, staticData, dynamicData):
+    """ Add the heart beat of a job to the buffer
+
+        :return: True if the heart beat is buffered, False if the buffer is full
+                 and the heart beat has to be written by the caller
+    """
+    jobID = int(jobID)
+    heartBeatTime = Time.toString()
+    with self.__lock:
+      previous = self.__heartBeats.get(jobID)
+      if previous is None:
+        if len(self.__heartBeats) >= self.maxSize:
+          return False
+        mergedStaticData = dict(staticData)
+      else:
+        mergedStaticData = dict(previous[1])
+        mergedStaticData.update(staticData)
+      self.__heartBeats[jobID] = (heartBeatTime, mergedStaticData, dict(dynamicData))
+    return True
+
+  def getQueueDepth(self):
+    """ Get the number of jobs with a heart beat in the buffer
+    """
+    return len(self.__heartBeats)
+
+  def flush(self):
+    """ Write the buffered heart beats to the JobDB
+
+        :return: S_OK(number of jobs written)/S_ERROR
+    """
+    with self.__flushLock:
+      with self.__lock:
+        heartBeats = self.__heartBeats
+        self.__heartBeats = {}
+      if not heartBeats:
+        return S_OK(0)
+
+      start = time.time()
+      result = self.__jobDB.setHeartBeatDataBulk(heartBeats, chunkSize=self.chunkSize)
+      self.__lastFlushTime = time.time() - start
+      gMonitor.addMark('heartBeatFlushTime', self.__lastFlushTime)
+      if not result['OK']:
+        self.__failedFlushes += 1
+        self.__log.error("Failed to write the heart beats", "of %d jobs: %s" % (len(heartBeats), result['Message']))
+        self.__requeue(heartBeats)
+        return result
+
+      written = len(result['Value']['Successful'])
+      self.__flushed += written
+      gMonitor.addMark('heartBeatsFlushed', written)
+      self.__log.verbose("Heart beats written", "for %d jobs in %.3f s" % (written, self.__lastFlushTime))
+      failed = result['Value']['Failed']
+      if failed:
+        self.__failedFlushes += 1
+        self.__requeue(dict((jobID, heartBeats[jobID]) for jobID in failed))
+        return S_ERROR("Failed to write the heart beats of %d jobs" % len(failed))
+      return S_OK(written)
+
+  def __requeue(self, heartBeats):
+    """ Put back in the buffer the heart beats not written by a flush, merged with the ones received since
+    """
+    dropped = 0
+    with self.__lock:
+      for jobID, (heartBeatTime, staticData, dynamicData) in heartBeats.items():
+        newer = self.__heartBeats.get(jobID)
+        if newer is not None:
+          mergedStaticData = dict(staticData)
+          mergedStaticData.update(newer[1])
+          self.__heartBeats[jobID] = (newer[0], mergedStaticData, newer[2])
+        elif len(self.__heartBeats) < self.maxSize:
+          self.__heartBeats[jobID] = (heartBeatTime, staticData, dynamicData)
+        else:
+          dropped += 1
+    if dropped:
+      self.__log.error("Buffer full, heart beats lost", "for %d jobs" % dropped)
+
+  def start(self):
+    """ Start the thread flushing the buffer every flush period
+    """
+    if self.__thread is None:
+      self.__stopEvent.clear()
+      self.__thread = threading.Thread(target=self.__flushLoop, name="HeartBeatBuffer")
+      self.__thread.daemon = True
+      self.__thread.start()
+    return S_OK()
+
+  def stop(self):
+    """ Stop the flushing thread and write what is still in the buffer
+    """
+    if self.__thread is not None:
+      self.__stopEvent.set()
+      self.__thread.join()
+      self.__thread = None
+    return self.flush()
+
+  def __flushLoop(self):
+    while not self.__stopEvent.wait(self.flushPeriod):
+      gMonitor.addMark('heartBeatQueueDepth', self.getQueueDepth())
+      try:
+        self.flush()
+      except Exception:  # pylint: disable=broad-except
+        self.__log.exception("Unexpected error while writing the heart beats")
+
+  def getStatistics(self):
+    """ Get the state of the buffer
+
+        :return: dictionary with QueueDepth, MaxSize, FlushPeriod, Flushed, FailedFlushes
+                 and LastFlushTime in seconds
+    """
+    return {'QueueDepth': self.getQueueDepth(),
+            'MaxSize': self.maxSize,
+            'FlushPeriod': self.flushPeriod,
+            'Flushed': self.__flushed,
+            'FailedFlushes': self.__failedFlushes,
+            'LastFlushTime': self.__lastFlushTime}
@@ -0,0 +1,267 @@
+""" In memory index of the task queues, used by the Matcher to select the task queues
+    matching a resource without querying the TaskQueueDB
+
+    The definition of a task queue never changes once it is created, so the index only has to
+    load the definitions of the new task queues, forget the deleted ones and follow the changes
+    of the priorities. For each field of the definitions, it keeps an inverted index giving the
+    task queues for each value of the field, and for the multi value fields the task queues which
+    do not restrict the field. The matching conditions are the same as the ones of the SQL query
+    generated by the TaskQueueDB.
+"""
+
+__RCSID__ = "$Id$"
+
+import heapq
+import random
+import string
+import threading
+import time
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Security import Properties
+from DIRAC.ConfigurationSystem.Client.Helpers import Registry
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import singleValueDefFields, multiValueDefFields, \
+    multiValueMatchFields, bannedJobMatchFields
+
+
+def _toList(value):
+  if isinstance(value, (list, tuple)):
+    return list(value)
+  return [value]
+
+
+def _key(value):
+  """ MySQL compares strings without taking into account the case and the trailing spaces
+  """
+  if isinstance(value, basestring):
+    return value.strip().lower()
+  return value
+
+
+def _isAny(values):
+  return any(''.join(c for c in value.lower() if c not in string.punctuation) == 'any'
+             for value in _toList(values))
+
+
+class TaskQueueIndex(object):
+
+  def __init__(self, tqDB, refreshPeriod=10):
+    """ c'tor
+
+        :param tqDB: TaskQueueDB object
+        :param int refreshPeriod: seconds between two refreshes of the index.
+                                  The index is not used any more if it could not be refreshed
+                                  during three periods
+    """
+    self.__tqDB = tqDB
+    self.__refreshPeriod = refreshPeriod
+    self.__log = gLogger.getSubLogger("TaskQueueIndex")
+    self.__lock = threading.RLock()
+    # tqId -> definition, with the multi value fields as sets of keys
+    self.__tqs = {}
+    # tqId -> priority
+    self.__priorities = {}
+    # field -> key -> set of tqIds
+    self.__index = dict((field, {}) for field in singleValueDefFields + multiValueDefFields)
+    # multi value field -> set of tqIds not restricting the field
+    self.__unrestricted = dict((field, set()) for field in multiValueDefFields)
+    self.__lastRefresh = 0
+
+  def isUpToDate(self):
+    """ Check that the index has been refreshed recently enough to be used
+    """
+    return time.time() - self.__lastRefresh < 3 * self.__refreshPeriod
+
+  def getNumTaskQueues(self):
+    return len(self.__tqs)
+
+  def refresh(self):
+    """ Load the new task queues, remove the deleted ones and update the priorities
+
+        :return: S_OK({'added': number of TQs added, 'removed': number of TQs removed}) / S_ERROR
+    """
+    result = self.__tqDB.getTaskQueuesAttributes()
+    if not result['OK']:
+      self.__log.error("Cannot refresh the task queue index", result['Message'])
+      return result
+    tqAttributes = result['Value']
+    # TQs are created disabled, and enabled once all their definition is inserted
+    newTQs = [tqId for tqId in tqAttributes
+              if tqId not in self.__tqs and tqAttributes[tqId]['Enabled'] > 0]
+    multiValues = {}
+    if newTQs:
+      result = self.__tqDB.getTaskQueuesMultiValues(newTQs)
+      if not result['OK']:
+        self.__log.error("Cannot refresh the task queue index", result['Message'])
+        return result
+      multiValues = result['Value']
+    with self.__lock:
+      removedTQs = [tqId for tqId in self.__tqs if tqId not in tqAttributes]
+      for tqId in removedTQs:
+        self.__remove(tqId)
+      for tqId in newTQs:
+        tqDef = dict(tqAttributes[tqId])
+        tqDef.update(multiValues.get(tqId, {}))
+        self.__add(tqId, tqDef)
+      for tqId in self.__tqs:
+        self.__priorities[tqId] = tqAttributes[tqId]['Priority']
+      self.__lastRefresh = time.time()
+    if newTQs or removedTQs:
+      self.__log.verbose("Task queue index refreshed",
+                         "%s TQs added, %s removed, %s in total" % (len(newTQs), len(removedTQs), len(self.__tqs)))
+    return S_OK({'added': len(newTQs), 'removed': len(removedTQs)})
+
+  def removeTaskQueues(self, tqIdList):
+    """ Forget task queues deleted from the DB
+
+        :param list tqIdList: TQ IDs
+    """
+    with self.__lock:
+      for tqId in tqIdList:
+        if tqId in self.__tqs:
+          self.__remove(tqId)
+
+  def __add(self, tqId, tqDef):
+    tqEntry = {}
+    for field in singleValueDefFields:
+      tqEntry[field] = tqDef[field]
+      self.__index[field].setdefault(_key(tqDef[field]), set()).add(tqId)
+    for field in multiValueDefFields:
+      keys = set(_key(value) for value in tqDef.get(field, []))
+      tqEntry[field] = keys
+      if not keys:
+        self.__unrestricted[field].add(tqId)
+      for key in keys:
+        self.__index[field].setdefault(key, set()).add(tqId)
+    self.__tqs[tqId] = tqEntry
+    self.__priorities[tqId] = tqDef['Priority']
+
+  def __remove(self, tqId):
+    tqEntry = self.__tqs.pop(tqId)
+    self.__priorities.pop(tqId, None)
+    for field in singleValueDefFields:
+      self.__discard(field, _key(tqEntry[field]), tqId)
+    for field in multiValueDefFields:
+      self.__unrestricted[field].discard(tqId)
+      for key in tqEntry[field]:
+        self.__discard(field, key, tqId)
+
+  def __discard(self, field, key, tqId):
+    tqIds = self.__index[field].get(key)
+    if tqIds is not None:
+      tqIds.discard(tqId)
+      if not tqIds:
+        del self.__index[field][key]
+
+  def __lookup(self, field, values):
+    """ TQs having any of the values for the field
+    """
+    tqIds = set()
+    for value in values:
+      tqIds.update(self.__index[field].get(_key(value), ()))
+    return tqIds
+
+  def match(self, tqMatchDict, numQueuesToGet=1, negativeCond=None):
+    """ Get the task queues matching the requirements, as TaskQueueDB.matchAndGetTaskQueue
+
+        :param dict tqMatchDict: match definition, with values not escaped for MySQL
+        :param int numQueuesToGet: maximum number of TQs to return, 0 for all of them
+        :param negativeCond: dict or list of dicts of TQ conditions to exclude
+        :return: S_OK([(tqId, ownerDN, ownerGroup), ...]) ordered randomly according to their priorities / S_ERROR
+    """
+    tagValues = tqMatchDict.get('Tag', [])
+    if 'Tag' not in tqMatchDict and 'RequiredTag' not in tqMatchDict:
+      tqMatchDict = dict(tqMatchDict, Tag=[])
+    requiredTags = _toList(tqMatchDict.get('RequiredTag', []))
+    if not requiredTags or _isAny(requiredTags):
+      requiredTags = []
+    elif not set(requiredTags).issubset(set(_toList(tagValues))):
+      return S_ERROR('Wrong conditions')
+
+    with self.__lock:
+      candidates = self.__selectCandidates(tqMatchDict)
+      matching = [tqId for tqId in candidates
+                  if self.__checkTaskQueue(self.__tqs[tqId], tqMatchDict, requiredTags, negativeCond)]
+      sortKeys = dict((tqId, random.random() / self.__priorities[tqId] if self.__priorities[tqId] > 0
+                       else float('inf')) for tqId in matching)
+      if numQueuesToGet:
+        matching = heapq.nsmallest(numQueuesToGet, matching, key=sortKeys.get)
+      else:
+        matching.sort(key=sortKeys.get)
+      return S_OK([(tqId, self.__tqs[tqId]['OwnerDN'], self.__tqs[tqId]['OwnerGroup']) for tqId in matching])
+
+  def __selectCandidates(self, tqMatchDict):
+    """ Select the TQs with the inverted indexes, the lock has to be held
+    """
+    candidates = set(self.__tqs)
+    # Owner conditions
+    if 'OwnerDN' in tqMatchDict and 'OwnerGroup' in tqMatchDict:
+      dnTQs = self.__lookup('OwnerDN', _toList(tqMatchDict['OwnerDN']))
+      ownerTQs = set()
+      for group in _toList(tqMatchDict['OwnerGroup']):
+        groupTQs = self.__lookup('OwnerGroup', [group])
+        if Properties.JOB_SHARING in Registry.getPropertiesForGroup(group):
+          ownerTQs.update(groupTQs)
+        else:
+          ownerTQs.update(groupTQs & dnTQs)
+      candidates &= ownerTQs
+    else:
+      for field in ('OwnerGroup', 'OwnerDN'):
+        if field in tqMatchDict:
+          candidates &= self.__lookup(field, _toList(tqMatchDict[field]))
+    if 'Setup' in tqMatchDict:
+      candidates &= self.__lookup('Setup', _toList(tqMatchDict['Setup']))
+    if 'CPUTime' in tqMatchDict:
+      maxCPUTime = max(_toList(tqMatchDict['CPUTime']))
+      candidates &= self.__lookup('CPUTime', [cpuTime for cpuTime in self.__index['CPUTime']
+                                              if cpuTime <= maxCPUTime])
+    # Multi value fields: the TQ does not restrict the field or accepts one of the values
+    for field in multiValueMatchFields:
+      values = tqMatchDict.get(field)
+      if field == 'Tag' or not values or _isAny(values):
+        continue
+      candidates &= self.__unrestricted['%ss' % field] | self.__lookup('%ss' % field, _toList(values))
+    return candidates
+
+  def __checkTaskQueue(self, tqEntry, tqMatchDict, requiredTags, negativeCond):
+    """ Check the conditions that the inverted indexes cannot express
+    """
+    # The site is not banned by the job
+    for field in bannedJobMatchFields:
+      values = tqMatchDict.get(field)
+      if not values or _isAny(values):
+        continue
+      if all(_key(value) in tqEntry['Banned%ss' % field] for value in _toList(values)):
+        return False
+    # All the tags of the TQ are provided by the resource
+    if 'Tag' in tqMatchDict and not _isAny(tqMatchDict['Tag']):
+      if not tqEntry['Tags'].issubset(set(_key(tag) for tag in _toList(tqMatchDict['Tag']))):
+        return False
+    # All the tags required by the resource are in the TQ
+    if requiredTags and not set(_key(tag) for tag in requiredTags).issubset(tqEntry['Tags']):
+      return False
+    # The resource does not ban all the values of the TQ
+    for field in multiValueMatchFields:
+      values = tqMatchDict.get('Banned%s' % field)
+      if not values or _isAny(values):
+        continue
+      if all(_key(value) in tqEntry['%ss' % field] for value in _toList(values)):
+        return False
+    if negativeCond:
+      condDicts = negativeCond if isinstance(negativeCond, (list, tuple)) else [negativeCond]
+      if not any(self.__checkNegativeCond(tqEntry, condDict) for condDict in condDicts):
+        return False
+    return True
+
+  @staticmethod
+  def __checkNegativeCond(tqEntry, condDict):
+    """ not ( cond1 and cond2 ) = ( not cond1 or not cond2 ), as in TaskQueueDB
+    """
+    for field, values in condDict.items():
+      if field in multiValueMatchFields:
+        if all(_key(value) not in tqEntry['%ss' % field] for value in _toList(values)):
+          return True
+      elif field in singleValueDefFields:
+        if any(_key(value) != _key(tqEntry[field]) for value in _toList(values)):
+          return True
+    return False
@@ -0,0 +1,102 @@
+""" Unit tests for the write behind buffer of the heart beats
+"""
+
+# imports
+from __future__ import absolute_import
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.WorkloadManagementSystem.private.HeartBeatBuffer import HeartBeatBuffer
+
+
+def writeAll(heartBeats, chunkSize):
+  """ JobDB.setHeartBeatDataBulk writing all the heart beats """
+  return S_OK({'Successful': list(heartBeats), 'Failed': {}})
+
+
+def test_coalesce():
+  """ The heart beats of a job are merged and written in a single call """
+  jobDB = MagicMock()
+  jobDB.setHeartBeatDataBulk.side_effect = writeAll
+  buf = HeartBeatBuffer(jobDB, chunkSize=10)
+
+  assert buf.add('1', {'CPUNormalizationFactor': '10'}, {'CPUConsumed': '10'})
+  assert buf.add(1, {'MemoryUsed': '2000'}, {'CPUConsumed': '20'})
+  assert buf.add(2, {}, {'CPUConsumed': '5'})
+  assert buf.getQueueDepth() == 2
+
+  assert buf.flush() == S_OK(2)
+  heartBeats = jobDB.setHeartBeatDataBulk.call_args[0][0]
+  assert jobDB.setHeartBeatDataBulk.call_args[1] == {'chunkSize': 10}
+  assert sorted(heartBeats) == [1, 2]
+  assert heartBeats[1][1] == {'CPUNormalizationFactor': '10', 'MemoryUsed': '2000'}
+  assert heartBeats[1][2] == {'CPUConsumed': '20'}
+
+  # Nothing left to write
+  assert buf.getQueueDepth() == 0
+  assert buf.flush() == S_OK(0)
+  assert jobDB.setHeartBeatDataBulk.call_count == 1
+  assert buf.getStatistics()['Flushed'] == 2
+
+
+def test_bounded():
+  """ A full buffer refuses the heart beats of new jobs, but still coalesces the buffered ones """
+  buf = HeartBeatBuffer(MagicMock(), maxSize=2)
+  assert buf.add(1, {}, {})
+  assert buf.add(2, {}, {})
+  assert not buf.add(3, {}, {})
+  assert buf.add(1, {}, {'CPUConsumed': '1'})
+  assert buf.getQueueDepth() == 2
+
+
+def test_failedFlush():
+  """ The heart beats of a failed flush are written again, the newer ones taking precedence """
+  jobDB = MagicMock()
+  buf = HeartBeatBuffer(jobDB)
+  buf.add(1, {'Old': '1', 'Common': 'old'}, {'CPUConsumed': '1'})
+  buf.add(2, {}, {'CPUConsumed': '2'})
+
+  def failingFlush(heartBeats, chunkSize):
+    # A heart beat arrives during the flush
+    buf.add(1, {'Common': 'new'}, {'CPUConsumed': '3'})
+    return S_ERROR('Connection lost')
+  jobDB.setHeartBeatDataBulk.side_effect = failingFlush
+  assert not buf.flush()['OK']
+  assert buf.getStatistics()['FailedFlushes'] == 1
+
+  jobDB.setHeartBeatDataBulk.side_effect = writeAll
+  assert buf.flush() == S_OK(2)
+  heartBeats = jobDB.setHeartBeatDataBulk.call_args[0][0]
+  assert heartBeats[1][1] == {'Old': '1', 'Common': 'new'}
+  assert heartBeats[1][2] == {'CPUConsumed': '3'}
+  assert heartBeats[2][2] == {'CPUConsumed': '2'}
+
+
+def test_partialFlush():
+  """ Only the heart beats of the jobs whose writing failed are written again, not the ones of deleted jobs """
+  jobDB = MagicMock()
+  buf = HeartBeatBuffer(jobDB)
+  for jobID in (1, 2, 3):
+    buf.add(jobID, {}, {'CPUConsumed': str(jobID)})
+
+  # Job 3 does not exist any more
+  jobDB.setHeartBeatDataBulk.return_value = S_OK({'Successful': [1], 'Failed': {2: 'Lock wait timeout'}})
+  assert not buf.flush()['OK']
+  assert buf.getQueueDepth() == 1
+  assert buf.getStatistics()['Flushed'] == 1
+
+  jobDB.setHeartBeatDataBulk.side_effect = writeAll
+  assert buf.flush() == S_OK(1)
+  assert sorted(jobDB.setHeartBeatDataBulk.call_args[0][0]) == [2]
+  assert buf.getQueueDepth() == 0
+
+
+def test_stop():
+  """ Stopping the buffer writes its content """
+  jobDB = MagicMock()
+  jobDB.setHeartBeatDataBulk.side_effect = writeAll
+  buf = HeartBeatBuffer(jobDB, flushPeriod=3600)
+  buf.start()
+  buf.add(1, {}, {'CPUConsumed': '1'})
+  assert buf.stop() == S_OK(1)
+  assert buf.getQueueDepth() == 0
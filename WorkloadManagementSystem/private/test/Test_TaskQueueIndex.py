@@ -0,0 +1,91 @@
+""" Unit tests for the in memory task queue index
+"""
+
+# imports
+from __future__ import absolute_import
+import pytest
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import multiValueDefFields
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
+
+OWNER = {'OwnerDN': '/DN/user', 'OwnerGroup': 'user_group', 'Setup': 'Test', 'Priority': 1., 'Enabled': 1}
+
+TASK_QUEUES = {1: dict(OWNER, CPUTime=3600),
+               2: dict(OWNER, CPUTime=86400, Sites=['Site.A'], Platforms=['centos7']),
+               3: dict(OWNER, CPUTime=3600, BannedSites=['Site.A'], Tags=['MultiProcessor']),
+               4: dict(OWNER, CPUTime=3600, OwnerDN='/DN/other', JobTypes=['MCSimulation']),
+               5: dict(OWNER, CPUTime=3600, Enabled=0)}
+
+
+@pytest.fixture
+def tqIndex(mocker):
+  """ Index of the TASK_QUEUES """
+  mocker.patch("DIRAC.WorkloadManagementSystem.private.TaskQueueIndex.Registry.getPropertiesForGroup",
+               return_value=[])
+  tqDB = MagicMock()
+  tqDB.getTaskQueuesAttributes.side_effect = lambda: S_OK(
+      dict((tqId, dict((field, value) for field, value in tqDef.items() if field not in multiValueDefFields))
+           for tqId, tqDef in TASK_QUEUES.items()))
+  tqDB.getTaskQueuesMultiValues.side_effect = lambda tqIdList: S_OK(
+      dict((tqId, dict((field, TASK_QUEUES[tqId].get(field, [])) for field in multiValueDefFields))
+           for tqId in tqIdList))
+  index = TaskQueueIndex(tqDB)
+  assert index.refresh()['Value'] == {'added': 4, 'removed': 0}
+  return index
+
+
+def matchedTQs(index, **kwargs):
+  negativeCond = kwargs.pop('negativeCond', None)
+  tqMatchDict = dict(Setup='Test', CPUTime=7200, OwnerDN='/DN/user', OwnerGroup='user_group')
+  tqMatchDict.update(kwargs)
+  result = index.match(tqMatchDict, numQueuesToGet=0, negativeCond=negativeCond)
+  assert result['OK']
+  return sorted(tqTuple[0] for tqTuple in result['Value'])
+
+
+def test_match(tqIndex):
+  """ Same conditions as the SQL match """
+  # Disabled TQs are still being created, TQ 2 needs more CPU time and TQ 4 is of another owner
+  assert matchedTQs(tqIndex) == [1]
+  assert matchedTQs(tqIndex, CPUTime=100000) == [1, 2]
+  assert matchedTQs(tqIndex, CPUTime=100000, Site='site.b') == [1]
+  assert matchedTQs(tqIndex, CPUTime=100000, Site='Site.A', Platform=['centos7', 'slc6']) == [1, 2]
+  assert matchedTQs(tqIndex, CPUTime=100000, Platform='slc6') == [1]
+  assert matchedTQs(tqIndex, CPUTime=100000, BannedSite=['Site.A']) == [1]
+  assert matchedTQs(tqIndex, Setup='Other') == []
+  # Tags
+  assert matchedTQs(tqIndex, Tag=['MultiProcessor']) == [1, 3]
+  assert matchedTQs(tqIndex, Tag=['MultiProcessor'], Site='Site.A') == [1]
+  assert matchedTQs(tqIndex, Tag=['MultiProcessor'], RequiredTag='MultiProcessor') == [3]
+  assert not tqIndex.match(dict(Setup='Test', CPUTime=7200, RequiredTag='GPU'))['OK']
+  # Owners
+  assert matchedTQs(tqIndex, OwnerDN='/DN/other') == [4]
+  assert matchedTQs(tqIndex, OwnerDN=['/DN/user', '/DN/other'], JobType='User') == [1]
+
+
+def test_negativeCond(tqIndex):
+  """ TQs matching all the conditions of a negative condition dict are excluded """
+  tqIndex.refresh()
+  matchDict = dict(OwnerDN=['/DN/user', '/DN/other'], Tag=['MultiProcessor'])
+  assert matchedTQs(tqIndex, negativeCond={'JobType': 'MCSimulation'}, **matchDict) == [1, 3]
+  assert matchedTQs(tqIndex, negativeCond={'OwnerDN': ['/DN/user']}, **matchDict) == [4]
+  assert matchedTQs(tqIndex, negativeCond=[{'OwnerDN': ['/DN/user']}, {'Tag': 'MultiProcessor'}],
+                    **matchDict) == [1, 4]
+
+
+def test_refresh(tqIndex):
+  """ New and deleted task queues are taken into account """
+  TASK_QUEUES[6] = dict(OWNER, CPUTime=60, Sites=['Site.B'])
+  removed = TASK_QUEUES.pop(1)
+  try:
+    assert tqIndex.refresh()['Value'] == {'added': 1, 'removed': 1}
+    assert matchedTQs(tqIndex, Site='Site.B') == [6]
+    tqIndex.removeTaskQueues([6])
+    assert matchedTQs(tqIndex, Site='Site.B') == []
+    assert tqIndex.getNumTaskQueues() == 3
+    assert tqIndex.isUpToDate()
+  finally:
+    TASK_QUEUES[1] = removed
+    del TASK_QUEUES[6]
@@ -219,6 +219,48 @@ class ReqDBMix(ReqDBTestCase):
     delete = db.deleteRequest(reqID)
     self.assertEqual(delete["OK"], True, delete['Message'] if 'Message' in delete else 'OK')
 
+  def test04Lease(self):
+    """ concurrent claims and lease expiration """
+    db = RequestDB()
+
+    reqIDs = []
+    for i in xrange(10):
+      request = Request({"RequestName": "lease-%d" % i})
+      op = Operation({"Type": "RemoveReplica", "TargetSE": "CERN-USER"})
+      op += File({"LFN": "/lhcb/user/c/cibak/foo"})
+      request += op
+      put = db.putRequest(request)
+      self.assertEqual(put["OK"], True, put['Message'] if 'Message' in put else 'OK')
+      reqIDs.append(put['Value'])
+
+    time.sleep(1)
+
+    # Two claims never get the same requests
+    first = db.getBulkRequests(6, True)
+    self.assertEqual(first["OK"], True, first['Message'] if 'Message' in first else 'OK')
+    second = db.getBulkRequests(6, True, leaseTime=0)
+    self.assertEqual(second["OK"], True, second['Message'] if 'Message' in second else 'OK')
+    self.assertEqual(len(first["Value"]), 6)
+    self.assertEqual(len(second["Value"]), 4)
+    self.assertFalse(set(first["Value"]) & set(second["Value"]))
+    self.assertEqual(sorted(set(first["Value"]) | set(second["Value"])), sorted(reqIDs))
+    for request in first["Value"].values():
+      self.assertEqual(len(request), 1)
+      self.assertEqual(len(request[0]), 1)
+
+    # Only the expired leases can be claimed again
+    time.sleep(1)
+    get = db.getBulkRequests(10, True)
+    self.assertEqual(get["OK"], True, get['Message'] if 'Message' in get else 'OK')
+    self.assertEqual(sorted(get["Value"]), sorted(second["Value"]))
+    get = db.getRequest()
+    self.assertEqual(get["OK"], True, get['Message'] if 'Message' in get else 'OK')
+    self.assertEqual(get["Value"], None)
+
+    for reqID in reqIDs:
+      delete = db.deleteRequest(reqID)
+      self.assertEqual(delete["OK"], True, delete['Message'] if 'Message' in delete else 'OK')
+
 
 if __name__ == '__main__':
   suite = unittest.defaultTestLoader.loadTestsFromTestCase(ReqDBTestCase)
@@ -156,6 +156,41 @@ def test_heartBeatLogging():
     assert res['OK'] is True, res['Message']
 
 
+def test_heartBeatBulk():
+
+  jobIDs = []
+  for _i in range(2):
+    res = jobDB.insertNewJobIntoDB(jdl, 'owner', '/DN/OF/owner', 'ownerGroup', 'someSetup')
+    assert res['OK'] is True, res['Message']
+    jobIDs.append(res['JobID'])
+  jobID, deletedJobID = jobIDs
+  res = jobDB.removeJobFromDB(deletedJobID)
+  assert res['OK'] is True, res['Message']
+  res = jobDB.setJobStatus(jobID, status='Done')
+  assert res['OK'] is True, res['Message']
+
+  # The heart beats of a deleted job do not prevent the others from being written
+  heartBeatTime = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+  res = jobDB.setHeartBeatDataBulk({jobID: (heartBeatTime, {'LoadAverage': '1.5'}, {'CPU': 2345}),
+                                    deletedJobID: (heartBeatTime, {'LoadAverage': '2.5'}, {'CPU': 10})})
+  assert res['OK'] is True, res['Message']
+  assert res['Value'] == {'Successful': [jobID], 'Failed': {}}, str(res)
+
+  res = jobDB.getHeartBeatData(jobID)
+  assert res['OK'] is True, res['Message']
+  assert [(name, value) for name, value, _hbt in res['Value']] == [('CPU', '2345.0')], str(res)
+  res = jobDB.getJobParameters(jobID)
+  assert res['OK'] is True, res['Message']
+  assert res['Value'][jobID]['LoadAverage'] == '1.5', str(res)
+  # The heart beats written after the end of the job do not change its status
+  res = jobDB.getJobAttribute(jobID, 'Status')
+  assert res['OK'] is True, res['Message']
+  assert res['Value'] == 'Done', str(res)
+
+  res = jobDB.removeJobFromDB(jobID)
+  assert res['OK'] is True, res['Message']
+
+
 def test_jobParameters():
   res = jobDB.insertNewJobIntoDB(jdl, 'owner', '/DN/OF/owner', 'ownerGroup', 'someSetup')
   assert res['OK'] is True, res['Message']
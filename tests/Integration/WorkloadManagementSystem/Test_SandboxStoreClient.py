@@ -69,3 +69,57 @@ def test_SSCChain(self):
   # # cleaning
   # res = smDB.deleteSandboxes(SBIdList)
   # assert res['OK'] is True
+
+
+def test_blobs():
+  """ reference counting of the sandbox contents shared by several sandboxes
+  """
+  smDB = SandboxMetadataDB()
+
+  blobPath = '/SandBox/Blobs/012/345/0123456789abcdef0123456789abcdef.tar.gz'
+  res = smDB.registerBlob('0123456789abcdef0123456789abcdef', 'aContentKey', 'SandboxSE', blobPath, 10)
+  assert res['OK'] is True
+  blobId = res['Value'][0]
+  res = smDB.getBlobByContentKey('aContentKey', 'SandboxSE')
+  assert res['OK'] is True
+  assert res['Value'] == (blobId, blobPath, 10)
+
+  sbIds = []
+  for owner in ('user1', 'user2'):
+    sbPath = '/SandBox/%s/%s.group/012/345/0123456789abcdef0123456789abcdef.tar.gz' % (owner[0], owner)
+    res = smDB.registerAndGetSandbox(owner, '/DN/%s' % owner, 'group', 'SandboxSE', sbPath, 10)
+    assert res['OK'] is True
+    sbIds.append(res['Value'][0])
+    res = smDB.linkSandboxToBlob(res['Value'][0], blobId)
+    assert res['OK'] is True
+
+  res = smDB.getSandboxBlob(sbIds[0])
+  assert res['OK'] is True
+  assert res['Value'] == ('SandboxSE', blobPath)
+
+  # Only the owners of the content can skip its upload
+  res = smDB.getBlobByContentKey('aContentKey', 'SandboxSE', 'user1', 'group')
+  assert res['OK'] is True
+  assert res['Value'] == (blobId, blobPath, 10)
+  res = smDB.getBlobByHash('0123456789abcdef0123456789abcdef', 'SandboxSE', 'user3', 'group')
+  assert res['OK'] is True
+  assert res['Value'] is None
+  res = smDB.getBlobByContentKey('aContentKey', 'SandboxSE', 'user1', 'otherGroup')
+  assert res['OK'] is True
+  assert res['Value'] is None
+
+  # Still referenced by the second sandbox
+  res = smDB.deleteSandboxes(sbIds[:1])
+  assert res['OK'] is True
+  res = smDB.deleteBlob(blobId)
+  assert res['OK'] is True
+  assert res['Value'] is False
+
+  res = smDB.deleteSandboxes(sbIds[1:])
+  assert res['OK'] is True
+  res = smDB.getSandboxBlob(sbIds[1])
+  assert res['OK'] is True
+  assert res['Value'] is None
+  res = smDB.deleteBlob(blobId)
+  assert res['OK'] is True
+  assert res['Value'] is True
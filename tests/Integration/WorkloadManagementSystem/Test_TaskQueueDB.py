@@ -17,6 +17,7 @@ from DIRAC.Core.Base.Script import parseCommandLine
 parseCommandLine()
 
 from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import TaskQueueDB
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
 
 
 gLogger.setLevel('DEBUG')
@@ -985,3 +986,107 @@ def test_TQ():
 
   result = tqDB.deleteTaskQueueIfEmpty(tq)
   assert result['OK'] is True
+
+
+def test_matchAndGetJobs():
+  """ matching several jobs at once
+  """
+  tqDefDict = {'OwnerDN': '/my/DN', 'OwnerGroup': 'myGroup',
+               'Setup': 'aSetup', 'CPUTime': 50000}
+  for jobId in xrange(201, 206):
+    result = tqDB.insertJob(jobId, tqDefDict, 10)
+    assert result['OK'] is True
+
+  result = tqDB.matchAndGetJobs({'Setup': 'aSetup', 'CPUTime': 300000}, 3)
+  assert result['OK'] is True
+  assert result['Value']['matchFound'] is True
+  matchedJobs = [jobId for jobId, _tqId in result['Value']['jobs']]
+  assert len(matchedJobs) == 3
+  assert set(matchedJobs) <= set(xrange(201, 206))
+
+  # Only the remaining jobs can be matched
+  result = tqDB.matchAndGetJobs({'Setup': 'aSetup', 'CPUTime': 300000}, 10)
+  assert result['OK'] is True
+  remainingJobs = [jobId for jobId, _tqId in result['Value']['jobs']]
+  assert sorted(matchedJobs + remainingJobs) == list(xrange(201, 206))
+
+  result = tqDB.matchAndGetJobs({'Setup': 'aSetup', 'CPUTime': 300000}, 10)
+  assert result['OK'] is True
+  assert result['Value']['matchFound'] is False
+
+  result = tqDB.cleanOrphanedTaskQueues()
+  assert result['OK'] is True
+
+
+def test_taskQueueIndex():
+  """ the in memory index matches the same TQs as the DB
+  """
+  tqDefDicts = [{'Sites': ['Site_1', 'Site_2'], 'Platforms': ['centos7']},
+                {'Sites': ['Site_1'], 'BannedSites': ['Site_2'], 'Tags': ['MultiProcessor']},
+                {'BannedSites': ['Site_1'], 'JobTypes': ['User'], 'Tags': ['MultiProcessor', 'GPU']},
+                {'Platforms': ['slc6', 'centos7'], 'Tags': ['MultiProcessor']}]
+  for jobId, tqDefDict in enumerate(tqDefDicts, 301):
+    tqDefDict.update({'OwnerDN': '/my/DN', 'OwnerGroup': 'myGroup', 'Setup': 'aSetup', 'CPUTime': 5000})
+    result = tqDB.insertJob(jobId, tqDefDict, 10)
+    assert result['OK'] is True
+
+  tqIndex = TaskQueueIndex(tqDB)
+  result = tqIndex.refresh()
+  assert result['OK'] is True
+  assert result['Value']['added'] == len(tqDefDicts)
+
+  for tqMatchDict in ({},
+                      {'Site': 'Site_2'},
+                      {'Site': ['Any', 'Site_1'], 'Tag': ['MultiProcessor']},
+                      {'Platform': 'slc6', 'Tag': ['MultiProcessor', 'GPU']},
+                      {'Tag': ['MultiProcessor', 'GPU'], 'RequiredTag': 'GPU'},
+                      {'BannedSite': ['Site_1'], 'JobType': 'User', 'Tag': 'Any'}):
+    tqMatchDict.update({'Setup': 'aSetup', 'CPUTime': 9999999, 'OwnerGroup': 'myGroup'})
+    result = tqDB.matchAndGetTaskQueue(tqMatchDict, numQueuesToGet=0)
+    assert result['OK'] is True
+    fromDB = sorted(result['Value'])
+    result = tqIndex.match(tqMatchDict, numQueuesToGet=0)
+    assert result['OK'] is True
+    assert sorted(result['Value']) == fromDB
+
+  for jobId in xrange(301, 301 + len(tqDefDicts)):
+    result = tqDB.deleteJob(jobId)
+    assert result['OK'] is True
+  result = tqDB.cleanOrphanedTaskQueues()
+  assert result['OK'] is True
+
+
+def test_getMatchingTaskQueuesBulk():
+  """ matching several resources at once gives the same TQs as matching them one by one
+  """
+  tqDefDicts = [{'Sites': ['Site_1']},
+                {'Sites': ['Site_2']},
+                {}]
+  for jobId, tqDefDict in enumerate(tqDefDicts, 401):
+    tqDefDict.update({'OwnerDN': '/my/DN', 'OwnerGroup': 'myGroup', 'Setup': 'aSetup', 'CPUTime': 5000})
+    result = tqDB.insertJob(jobId, tqDefDict, 10)
+    assert result['OK'] is True
+
+  tqMatchDicts = {'queue1': {'Site': 'Site_1'},
+                  'queue2': {'Site': 'Site_2'},
+                  'queue3': {'Site': 'Site_1'},
+                  'queue4': {'Site': 'Site_3'}}
+  for tqMatchDict in tqMatchDicts.values():
+    tqMatchDict.update({'Setup': 'aSetup', 'CPUTime': 9999999, 'OwnerGroup': 'myGroup'})
+  result = tqDB.getMatchingTaskQueuesBulk(tqMatchDicts)
+  assert result['OK'] is True
+  assert result['Value']['Failed'] == {}
+  for queue, tqMatchDict in tqMatchDicts.items():
+    res = tqDB.getMatchingTaskQueues(tqMatchDict)
+    assert res['OK'] is True
+    assert sorted(result['Value']['Matches'][queue]) == sorted(res['Value'])
+    for tqId in res['Value']:
+      assert result['Value']['TaskQueues'][tqId] == res['Value'][tqId]
+  assert len(result['Value']['Matches']['queue1']) == 2
+  assert len(result['Value']['Matches']['queue4']) == 1
+
+  for jobId in xrange(401, 401 + len(tqDefDicts)):
+    result = tqDB.deleteJob(jobId)
+    assert result['OK'] is True
+  result = tqDB.cleanOrphanedTaskQueues()
+  assert result['OK'] is True
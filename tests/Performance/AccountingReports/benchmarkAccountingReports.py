@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Benchmark of the generation of large Job accounting reports.
+
+It feeds the JobPlotter with the buckets a busy installation has for a report grouped by site:
+hourly buckets for the last 8 days and daily buckets before, rebinned to the daily granularity of
+the report. Each report is generated with the TimeSeries arrays and with the dictionaries of the
+previous implementation, whose results are compared, and the time of each is printed. The DB is
+not involved, only the transformation of its rows into the report data is measured.
+
+Usage::
+
+  python benchmarkAccountingReports.py [--sites N] [--days D] [--repeat R]
+"""
+
+# pylint: disable=protected-access
+
+from __future__ import print_function
+
+import argparse
+import functools
+import random
+import time
+
+from DIRAC import S_OK
+from DIRAC.AccountingSystem.Client.Types.Job import Job
+from DIRAC.AccountingSystem.private.TimeSeries import TimeSeries
+from DIRAC.AccountingSystem.private.Plotters.JobPlotter import JobPlotter
+
+REPORTS = ['CPUEfficiency', 'CPUUsed', 'CPUUsage', 'RunningJobs', 'NumberOfJobs', 'CumulativeNumberOfJobs']
+
+
+class FakeAccountingDB(object):
+  """ Generate the buckets of the Job type instead of selecting them, the same ones for each implementation """
+
+  def __init__(self, sites, now):
+    self.sites = ['LCG.Site%04d.org' % iSite for iSite in range(sites)]
+    self.now = now
+    self.bucketsLength = Job().bucketsLength
+    self.rows = {}
+
+  def calculateBucketLengthForTime(self, _setup, _typeName, now, when):
+    for maxAge, bucketLength in self.bucketsLength:
+      if max(0, now - now % bucketLength - when) <= maxAge:
+        return bucketLength
+    return self.bucketsLength[-1][1]
+
+  def retrieveBucketedData(self, _setup, _typeName, startTime, endTime, selectFields, *_args):
+    numValues = selectFields[0].count(',') - 2
+    keys = ['Total'] if selectFields[0].startswith("'Total'") else self.sites
+    if (startTime, numValues, len(keys)) in self.rows:
+      return S_OK(list(self.rows[(startTime, numValues, len(keys))]))
+    rand = random.Random(0)
+    rows = []
+    bucketStart = startTime - startTime % 86400
+    while bucketStart < endTime:
+      bucketLength = self.calculateBucketLengthForTime(None, None, self.now, bucketStart)
+      bucketStart -= bucketStart % bucketLength
+      for key in keys:
+        rows.append((key, bucketStart, bucketLength) +
+                    tuple(rand.random() * bucketLength * 100 for _ in range(numValues)))
+      bucketStart += bucketLength
+    self.rows[(startTime, numValues, len(keys))] = rows
+    return S_OK(list(rows))
+
+
+def generateReport(reporter, reportName, reportRequest):
+  """ Report data as returned to the clients """
+  result = getattr(reporter, '_report%s' % reportName)(dict(reportRequest))
+  reportData = result['Value']
+  for key, value in reportData.items():
+    if isinstance(value, TimeSeries):
+      reportData[key] = value.toDict()
+  return reportData
+
+
+def compareReports(seriesData, dictData):
+  """ Check that both implementations give the same report, up to the rounding """
+  for field in ('data', 'graphDataDict'):
+    if field not in dictData:
+      continue
+    assert sorted(seriesData[field]) == sorted(dictData[field]), field
+    for key, buckets in dictData[field].items():
+      assert sorted(seriesData[field][key]) == sorted(buckets), (field, key)
+      for epoch, value in buckets.items():
+        assert abs(seriesData[field][key][epoch] - value) <= 1e-9 * max(1., abs(value)), (field, key, epoch)
+
+
+def timeIt(func, repeat):
+  """ Best wall clock time of repeat calls to func(), and the result of the last one """
+  best = None
+  for _ in range(repeat):
+    start = time.time()
+    result = func()
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best, result
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--sites', type=int, default=500, help='number of sites, i.e. of keys of the report')
+  parser.add_argument('--days', type=int, default=30, help='time span of the report')
+  parser.add_argument('--repeat', type=int, default=3, help='number of repetitions, the best one is kept')
+  args = parser.parse_args()
+
+  now = int(time.time())
+  reporter = JobPlotter(FakeAccountingDB(args.sites, now), 'Benchmark')
+  reportRequest = {'startTime': now - args.days * 86400, 'endTime': now, 'condDict': {},
+                   'grouping': 'Site', 'groupingFields': reporter._translateGrouping('Site')}
+  print('%-24s %12s %12s %10s' % ('report', 'dicts (s)', 'series (s)', 'speedup'))
+  for reportName in REPORTS:
+    times = {}
+    results = {}
+    for asSeries in (False, True):
+      reporter._TIMED_DATA_AS_SERIES = asSeries
+      times[asSeries], results[asSeries] = timeIt(functools.partial(generateReport, reporter, reportName,
+                                                                    reportRequest), args.repeat)
+    compareReports(results[True], results[False])
+    print('%-24s %12.3f %12.3f %10.1f' % (reportName, times[False], times[True], times[False] / times[True]))
+
+
+if __name__ == '__main__':
+  main()
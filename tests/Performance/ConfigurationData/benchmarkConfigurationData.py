@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Micro benchmark of the ConfigurationData lookups.
+
+It builds a configuration shaped like the one of a production installation, and measures
+the number of lookups per second in the merged configuration, served by the path index,
+and in a copy of it, which goes through the sections walk and the danger zones as all the
+lookups did before the index. The lookups are done by several threads at the same time,
+as in a service.
+
+Usage::
+
+  python benchmarkConfigurationData.py [--sites S] [--threads T] [--lookups N] [--repeat R]
+"""
+
+from __future__ import print_function
+
+import argparse
+import threading
+import time
+
+from diraccfg import CFG
+
+from DIRAC.ConfigurationSystem.private.ConfigurationData import ConfigurationData
+
+SYSTEMS = ['Accounting', 'Configuration', 'DataManagement', 'Framework', 'RequestManagement',
+           'ResourceStatus', 'StorageManagement', 'Transformation', 'WorkloadManagement']
+
+
+class BenchmarkCFG(CFG):
+  """ CFG creating the missing sections of the options set """
+
+  def setOption(self, path, value):
+    levelList = [level for level in path.split('/') if level]
+    cfg = self
+    for section in levelList[:-1]:
+      if not cfg.isSection(section):
+        cfg.createNewSection(section)
+      cfg = cfg[section]
+    CFG.setOption(cfg, levelList[-1], value)
+
+
+def buildCFG(numSites):
+  """ Configuration with services, sites, users and operations sections """
+  cfg = BenchmarkCFG()
+  cfg.setOption('/DIRAC/Setup', 'Production')
+  for system in SYSTEMS:
+    cfg.setOption('/DIRAC/Setups/Production/%s' % system, 'Production')
+    for i in range(10):
+      service = '%sService%d' % (system, i)
+      cfg.setOption('/Systems/%s/Production/URLs/%s' % (system, service),
+                    'dips://%s.example.org:9%03d/%s/%s' % (system.lower(), i, system, service))
+      cfg.setOption('/Systems/%s/Production/Services/%s/Port' % (system, service), str(9000 + i))
+      cfg.setOption('/Systems/%s/Production/Services/%s/MaxThreads' % (system, service), '20')
+  for i in range(numSites):
+    site = 'LCG.Site%04d.org' % i
+    cfg.setOption('/Resources/Sites/LCG/%s/Name' % site, 'Site%04d' % i)
+    cfg.setOption('/Resources/Sites/LCG/%s/SE' % site, 'Site%04d-DISK, Site%04d-TAPE' % (i, i))
+    cfg.setOption('/Resources/Sites/LCG/%s/CEs/ce%04d.org/Queues/long/maxCPUTime' % (site, i), '2880')
+  for i in range(numSites * 5):
+    cfg.setOption('/Registry/Users/user%05d/DN' % i, '/O=Grid/CN=user%05d' % i)
+    cfg.setOption('/Registry/Users/user%05d/Email' % i, 'user%05d@example.org' % i)
+  cfg.setOption('/Operations/Defaults/JobScheduling/EnableSharesCorrection', 'False')
+  return cfg
+
+
+def lookupPaths(numSites):
+  """ Mix of the paths looked up when serving a call: URLs, setup, options of services,
+      sites and users, and options which are not defined
+  """
+  paths = ['/DIRAC/Setup', '/DIRAC/Setups/Production/WorkloadManagement',
+           '/Operations/Defaults/JobScheduling/EnableSharesCorrection',
+           '/Operations/Production/JobScheduling/EnableSharesCorrection']
+  for i in range(0, 10, 3):
+    paths.append('/Systems/WorkloadManagement/Production/URLs/WorkloadManagementService%d' % i)
+    paths.append('/Systems/Framework/Production/Services/FrameworkService%d/MaxThreads' % i)
+  for i in range(0, numSites, numSites // 4):
+    paths.append('/Resources/Sites/LCG/LCG.Site%04d.org/SE' % i)
+    paths.append('/Registry/Users/user%05d/DN' % i)
+  return paths
+
+
+def lookupRate(lookupFunc, paths, numThreads, numLookups):
+  """ Lookups per second of numThreads threads doing numLookups lookups each """
+  def worker():
+    for i in range(numLookups):
+      lookupFunc(paths[i % len(paths)])
+
+  threads = [threading.Thread(target=worker) for _ in range(numThreads)]
+  start = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return numThreads * numLookups / (time.time() - start)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--sites', type=int, default=200, help='number of sites of the configuration')
+  parser.add_argument('--threads', type=int, default=4, help='number of threads doing lookups')
+  parser.add_argument('--lookups', type=int, default=50000, help='number of lookups per thread')
+  parser.add_argument('--repeat', type=int, default=3, help='number of repetitions, the best one is kept')
+  args = parser.parse_args()
+
+  confData = ConfigurationData(loadDefaultCFG=False)
+  confData.mergeWithLocal(buildCFG(args.sites))
+  # Lookups in another CFG than the merged one are not served by the index
+  walkedCFG = confData.mergedCFG.clone()
+  paths = lookupPaths(args.sites)
+
+  start = time.time()
+  confData.sync()
+  print('Configuration merged and indexed in %.3f s' % (time.time() - start))
+
+  implementations = [('walk', lambda path: confData.extractOptionFromCFG(path, walkedCFG)),
+                     ('index', confData.extractOptionFromCFG)]
+  for path in paths:
+    assert implementations[0][1](path) == implementations[1][1](path)
+  assert sum(1 for path in paths if confData.extractOptionFromCFG(path) is None) == 1
+
+  print('%-10s %8s %16s' % ('impl', 'threads', 'lookups/s'))
+  for implName, lookupFunc in implementations:
+    rate = max(lookupRate(lookupFunc, paths, args.threads, args.lookups) for _ in range(args.repeat))
+    print('%-10s %8d %16.0f' % (implName, args.threads, rate))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Micro benchmark of the DEncode implementations.
+
+It encodes and decodes payloads shaped like the typical bulk replies of DIRAC services
+with the per type dispatch implementation and with the fast one, and prints the throughput
+of each, so that it can be compared across releases.
+
+Usage::
+
+  python benchmarkDEncode.py [--size N] [--repeat R]
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import time
+
+from DIRAC.Core.Utilities.DEncode import dispatchEncode, dispatchDecode, fastEncode, fastDecode
+
+
+def replicasPayload(size):
+  """ Reply of FileCatalog getReplicas for size LFNs with 3 replicas each """
+  successful = {}
+  for i in range(size):
+    lfn = '/vo/data/run%06d/file_%08d.raw' % (i // 1000, i)
+    successful[lfn] = dict(('SE-%d' % se, 'root://se%d.example.org//storage%s' % (se, lfn))
+                           for se in range(3))
+  return {'OK': True, 'Value': {'Successful': successful, 'Failed': {}}}
+
+
+def jobsSummaryPayload(size):
+  """ Reply of JobMonitoring getJobsSummary for size jobs """
+  now = datetime.datetime.utcnow()
+  summary = {}
+  for jobID in range(size):
+    summary[jobID] = {'Status': 'Running', 'MinorStatus': 'Application', 'Site': 'LCG.Example.org',
+                      'Owner': 'user%d' % (jobID % 50), 'OwnerGroup': 'vo_user', 'JobGroup': '00001234',
+                      'JobName': u'job_%d' % jobID, 'SubmissionTime': str(now), 'RescheduleCounter': '0',
+                      'LastUpdateTime': str(now), 'CPUTime': float(jobID)}
+  return {'OK': True, 'Value': summary}
+
+
+def sqlRowsPayload(size):
+  """ Tuple of rows, as returned by the DB layer and sent back by many handlers """
+  now = datetime.datetime.utcnow()
+  return {'OK': True,
+          'Value': tuple((i, 'Waiting', 'Assigned', now, 12345678901234567890 + i, None, True)
+                         for i in range(size))}
+
+
+def rpcProposalPayload(_size):
+  """ Small RPC call, dominated by the per call overhead """
+  return (('Framework/SystemAdministrator', 'echo'), ('simple test', {'key': [1, 2.5, None]}))
+
+
+PAYLOADS = [('getReplicas', replicasPayload),
+            ('getJobsSummary', jobsSummaryPayload),
+            ('sqlRows', sqlRowsPayload),
+            ('rpcProposal', rpcProposalPayload)]
+
+IMPLEMENTATIONS = [('dispatch', dispatchEncode, dispatchDecode),
+                   ('fast', fastEncode, fastDecode)]
+
+
+def timeIt(func, arg, repeat):
+  """ Best wall clock time of repeat calls to func(arg) """
+  best = None
+  for _ in range(repeat):
+    start = time.time()
+    func(arg)
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--size', type=int, default=100000, help='number of entries of the bulk payloads')
+  parser.add_argument('--repeat', type=int, default=5, help='number of repetitions, the best one is kept')
+  args = parser.parse_args()
+
+  print('%-16s %-10s %12s %12s %12s %12s' % ('payload', 'impl', 'size (MB)', 'enc (MB/s)', 'dec (MB/s)',
+                                             'calls/s'))
+  for payloadName, payloadFunc in PAYLOADS:
+    payload = payloadFunc(args.size)
+    encoded = fastEncode(payload)
+    sizeMB = len(encoded) / 1024. / 1024.
+    # Small payloads are measured over many calls
+    loops = 1 if len(encoded) > 1024 * 1024 else 10000
+    for implName, encodeFunc, decodeFunc in IMPLEMENTATIONS:
+      assert encodeFunc(payload) == encoded
+      encTime = timeIt(lambda obj: [encodeFunc(obj) for _ in range(loops)], payload, args.repeat) / loops
+      decTime = timeIt(lambda data: [decodeFunc(data) for _ in range(loops)], encoded, args.repeat) / loops
+      print('%-16s %-10s %12.3f %12.1f %12.1f %12.1f' % (payloadName, implName, sizeMB, sizeMB / encTime,
+                                                         sizeMB / decTime, 1. / (encTime + decTime)))
+
+
+if __name__ == '__main__':
+  main()
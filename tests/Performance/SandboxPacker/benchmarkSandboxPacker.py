@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Micro benchmark of the sandbox packing.
+
+It generates a sandbox made of text files, as log files, and of random binary files, as
+already compressed outputs, and measures the packing throughput and the compression ratio of:
+
+  * the historical packing: a w|bz2 tarball written to a temporary file, read again to compute its MD5
+  * the SandboxPacker, for each available codec and the given compression levels, in one pass
+
+Usage::
+
+  python benchmarkSandboxPacker.py [--size MB] [--binary FRACTION] [--levels L1,L2] [--repeat R]
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import time
+
+from DIRAC.WorkloadManagementSystem.Utilities.SandboxPacker import SandboxPacker, getAvailableCodecs
+
+
+def createSandboxFiles(directory, sizeMB, binaryFraction):
+  """ Create text and binary files for a total of sizeMB """
+  fileList = []
+  words = ['INFO', 'ERROR', 'event', 'processed', 'JobWrapper', 'Application', 'finished', 'with', 'status']
+  textSize = int(sizeMB * (1 - binaryFraction) * 1048576)
+  binarySize = int(sizeMB * binaryFraction * 1048576)
+  for i, size in enumerate([textSize // 4] * 4):
+    filePath = os.path.join(directory, 'std%d.log' % i)
+    with open(filePath, 'w') as fd:
+      written = 0
+      while written < size:
+        line = '%.3f %s\n' % (random.random() * 1e5, ' '.join(random.choice(words) for _ in range(12)))
+        fd.write(line)
+        written += len(line)
+    fileList.append(filePath)
+  if binarySize:
+    filePath = os.path.join(directory, 'output.root')
+    with open(filePath, 'wb') as fd:
+      fd.write(os.urandom(binarySize))
+    fileList.append(filePath)
+  return fileList
+
+
+def legacyPacking(fileList):
+  """ Packing as done by SandboxStoreClient before the SandboxPacker """
+  fd, tmpFilePath = tempfile.mkstemp(prefix="LDSB.")
+  os.close(fd)
+  with tarfile.open(name=tmpFilePath, mode="w|bz2") as tf:
+    for sFile in fileList:
+      tf.add(os.path.realpath(sFile), os.path.basename(sFile), recursive=True)
+  oMD5 = hashlib.md5()
+  with open(tmpFilePath, "rb") as fd:
+    bData = fd.read(10240)
+    while bData:
+      oMD5.update(bData)
+      bData = fd.read(10240)
+  size = os.path.getsize(tmpFilePath)
+  os.unlink(tmpFilePath)
+  return size
+
+
+class NullOutput(object):
+  """ Output discarding the data, as the network would take them """
+
+  def write(self, data):
+    pass
+
+
+def packerPacking(fileList, codec, level):
+  result = SandboxPacker(codec, level).pack(fileList, NullOutput())
+  if not result['OK']:
+    raise RuntimeError(result['Message'])
+  return result['Value']
+
+
+def measure(function, repeat, *args):
+  """ Best time of repeat runs, and the result of the function """
+  bestTime = None
+  for _ in range(repeat):
+    start = time.time()
+    result = function(*args)
+    elapsed = time.time() - start
+    if bestTime is None or elapsed < bestTime:
+      bestTime = elapsed
+  return bestTime, result
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--size', type=float, default=50, help='Size of the sandbox in MB')
+  parser.add_argument('--binary', type=float, default=0.2, help='Fraction of incompressible data')
+  parser.add_argument('--levels', default='1,6,9', help='Compression levels to test')
+  parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the best one is kept')
+  args = parser.parse_args()
+
+  directory = tempfile.mkdtemp(prefix='benchmarkSandboxPacker.')
+  try:
+    fileList = createSandboxFiles(directory, args.size, args.binary)
+    totalMB = sum(os.path.getsize(fileName) for fileName in fileList) / 1048576.
+
+    print('%-22s %10s %10s %8s' % ('Packing', 'Time (s)', 'MB/s', 'Ratio'))
+    elapsed, size = measure(legacyPacking, args.repeat, fileList)
+    print('%-22s %10.2f %10.1f %8.2f' % ('legacy bz2 + re-read', elapsed, totalMB / elapsed, totalMB * 1048576 / size))
+    for codec in getAvailableCodecs():
+      for level in [int(level) for level in args.levels.split(',')]:
+        elapsed, size = measure(packerPacking, args.repeat, fileList, codec, level)
+        print('%-22s %10.2f %10.1f %8.2f' % ('%s level %d' % (codec, level), elapsed, totalMB / elapsed,
+                                             totalMB * 1048576 / size))
+  finally:
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Micro benchmark of the concurrent execution of the storage plugins.
+
+It creates files on a local or mounted file system, and measures the time taken by the
+FileStorage plugin to run exists, getFileMetadata and removeFile on all of them for the
+given values of MaxConcurrency. The gain is small on a local disk, where the calls hardly
+wait, and grows with the latency of the file system, as for remote storages.
+
+Usage::
+
+  python benchmarkFileStorage.py [--files N] [--size BYTES] [--concurrency C1,C2] [--directory DIR]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from DIRAC.Resources.Storage.FileStorage import FileStorage
+
+
+def createFiles(directory, numberOfFiles, size):
+  """ Create the files, spread over sub directories as in a storage element """
+  urls = []
+  data = os.urandom(size)
+  for i in range(numberOfFiles):
+    subDirectory = os.path.join(directory, '%03d' % (i % 100))
+    if not os.path.isdir(subDirectory):
+      os.makedirs(subDirectory)
+    url = os.path.join(subDirectory, 'file%06d' % i)
+    with open(url, 'wb') as fd:
+      fd.write(data)
+    urls.append(url)
+  return urls
+
+
+def measure(storage, method, urls):
+  start = time.time()
+  res = getattr(storage, method)(urls)
+  elapsed = time.time() - start
+  if not res['OK'] or res['Value']['Failed']:
+    raise RuntimeError("%s failed: %s" % (method, res))
+  return elapsed
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--files', type=int, default=5000, help='Number of files')
+  parser.add_argument('--size', type=int, default=4096, help='Size of the files in bytes')
+  parser.add_argument('--concurrency', default='1,4,16', help='Values of MaxConcurrency to test')
+  parser.add_argument('--directory', default=None, help='Where to create the files, by default in /tmp')
+  args = parser.parse_args()
+
+  print('%-12s %15s %15s %15s' % ('Concurrency', 'exists (s)', 'metadata (s)', 'remove (s)'))
+  for concurrency in [int(value) for value in args.concurrency.split(',')]:
+    directory = tempfile.mkdtemp(prefix='benchmarkFileStorage.', dir=args.directory)
+    try:
+      urls = createFiles(directory, args.files, args.size)
+      storage = FileStorage('Benchmark', {'Protocol': 'file', 'Path': directory, 'Host': '', 'Port': '',
+                                          'SpaceToken': '', 'WSUrl': '', 'MaxConcurrency': concurrency})
+      print('%-12d %15.2f %15.2f %15.2f' % (concurrency,
+                                            measure(storage, 'exists', urls),
+                                            measure(storage, 'getFileMetadata', urls),
+                                            measure(storage, 'removeFile', urls)))
+    finally:
+      shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+  main()